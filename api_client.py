@@ -0,0 +1,106 @@
+"""
+服务模式客户端
+连接 server.py 提供的 /v1/turns 接口，把SSE事件还原为 streaming.StreamEvent，
+使 Streamlit 界面可以在"本地运行计算图"与"作为服务的瘦客户端"之间切换而不改动渲染代码。
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from langchain_core.messages import BaseMessage, messages_from_dict
+
+from streaming import StreamEvent, event_from_dict
+
+
+class AgentServerError(Exception):
+    """服务返回错误；status 为 429/503 时 retry_after 为建议的等待秒数。"""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AgentServerClient:
+    """
+    server.py 的同步客户端（复用同一个 httpx.Client 连接池）。
+
+    Args:
+        base_url: 服务地址，如 http://127.0.0.1:8000。
+        timeout: 读取超时（秒）；服务端每隔 heartbeat_seconds 发送心跳，因此只需大于心跳间隔。
+    """
+
+    def __init__(self, base_url: str, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.Client(timeout=httpx.Timeout(timeout, connect=10.0))
+
+    def stream_turn(
+        self,
+        thread_id: str,
+        message: str,
+        uploaded_file_paths: Optional[List[Dict[str, Any]]] = None,
+        model: Optional[str] = None,
+        execution_mode: Optional[str] = None,
+        tenant: Optional[str] = None,
+        budget: Optional[Dict[str, float]] = None,
+    ) -> Iterator[StreamEvent]:
+        """发起一轮对话并逐个产出 StreamEvent；服务端返回 error 事件时抛出 AgentServerError。"""
+        body = {
+            "thread_id": thread_id,
+            "message": message,
+            "uploaded_file_paths": uploaded_file_paths or [],
+            "model": model,
+            "execution_mode": execution_mode,
+            "tenant": tenant,
+            "budget": budget,
+        }
+        with self._client.stream("POST", f"{self.base_url}/v1/turns", json=body) as response:
+            if response.status_code != 200:
+                response.read()
+                retry_after = response.headers.get("retry-after")
+                try:
+                    error = response.json().get("error")
+                except ValueError:
+                    error = response.text
+                raise AgentServerError(response.status_code, error, float(retry_after) if retry_after else None)
+            for line in response.iter_lines():
+                if not line.startswith("data: "):
+                    continue  # 心跳注释与空行
+                event = event_from_dict(json.loads(line[len("data: "):]))
+                if event.kind == "error":
+                    raise AgentServerError(event.data.get("status", 500), event.data.get("error", ""))
+                yield event
+                if event.kind == "done":
+                    return
+
+    def list_threads(self, tenant: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """按最近活动时间分页列出服务端记录的、属于 tenant 的会话。"""
+        response = self._client.get(
+            f"{self.base_url}/v1/threads", params={"limit": limit, "offset": offset}, headers={"X-Tenant-Id": tenant},
+        )
+        response.raise_for_status()
+        return response.json()["threads"]
+
+    def get_history(self, thread_id: str, turns: int, tenant: Optional[str] = None) -> Tuple[int, List[BaseMessage]]:
+        """
+        读取会话最近 turns 轮消息，返回 (更早的轮次数, 消息列表)，与 message_store.load_history 一致。
+        会话不存在或不属于 tenant 时抛出 AgentServerError(404)。
+        """
+        response = self._client.get(
+            f"{self.base_url}/v1/threads/{thread_id}/messages", params={"turns": turns},
+            headers={"X-Tenant-Id": tenant} if tenant else None,
+        )
+        if response.status_code == 404:
+            raise AgentServerError(404, response.json().get("error"))
+        response.raise_for_status()
+        data = response.json()
+        return data["unloaded_turns"], messages_from_dict(data["messages"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        response = self._client.get(f"{self.base_url}/v1/stats")
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self._client.close()
@@ -0,0 +1,186 @@
+"""
+端到端Agent基准测试（完全离线）
+启动本地假 Chat Completions 服务（benchmarks/fake_llm_server.py）并使用假搜索后端（tools/fake_search.py），
+通过 create_agent_workflow 构建真实的计算图，按UI的方式（stream_agent_turn）逐轮驱动，报告：
+  - 单轮延迟（p50/p95）与首token时延；
+  - 每轮的LLM步骤数；
+  - N 个并发线程下的吞吐（轮/秒）；
+  - 内存增长（进程RSS，以及检查点后端的统计）。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_agent
+    python -m benchmarks.bench_agent --threads 1 4 16 --turns 10 --inject-finish-reason length --inject-rate 0.1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+
+from benchmarks.fake_llm_server import FakeLLMServer, FakeLLMSettings
+
+
+def _rss_mb() -> float:
+    """当前进程的常驻内存（MB）；非Linux平台退化为峰值RSS。"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _run_turn(workflow, thread_id: str, question: str) -> dict:
+    from langchain_core.messages import HumanMessage
+    from streaming import stream_agent_turn
+
+    agent_input = {"messages": [HumanMessage(content=question)], "uploaded_file_paths": {"uploaded_file_paths": []}}
+    config = {"configurable": {"thread_id": thread_id}}
+    start = time.perf_counter()
+    try:
+        metrics = None
+        for event in stream_agent_turn(workflow, agent_input, config):
+            if event.kind == "done":
+                metrics = event.data
+        return {
+            "latency": time.perf_counter() - start,
+            "ttft": metrics.time_to_first_token,
+            "steps": metrics.llm_steps,
+            "error": None,
+        }
+    except Exception as e:
+        return {"latency": time.perf_counter() - start, "ttft": None, "steps": 0, "error": repr(e)}
+
+
+def _run_load(workflow, threads: int, turns: int) -> dict:
+    """threads 个会话并发，每个会话连续进行 turns 轮对话。"""
+    results = []
+    lock = threading.Lock()
+
+    def worker(worker_id: int):
+        thread_id = f"bench-{worker_id}-{uuid.uuid4().hex[:8]}"
+        for turn in range(turns):
+            result = _run_turn(workflow, thread_id, f"会话{worker_id}的第{turn}个问题：LangGraph 的检查点机制如何工作？")
+            with lock:
+                results.append(result)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r["error"] is None]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    errors = [r["error"] for r in results if r["error"] is not None]
+    return {
+        "turns": len(results),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed": elapsed,
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "p50": _percentile(latencies, 0.5),
+        "p95": _percentile(latencies, 0.95),
+        "ttft_p50": _percentile(ttfts, 0.5),
+        "steps": statistics.mean(r["steps"] for r in ok) if ok else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端Agent离线基准测试")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8], help="并发会话数（可给多个值）")
+    parser.add_argument("--turns", type=int, default=5, help="每个会话的对话轮数")
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--script", help="JSON文件，假模型的响应脚本（格式见 fake_llm_server.py）")
+    parser.add_argument("--inject-finish-reason", default=None)
+    parser.add_argument("--inject-rate", type=float, default=0.0)
+    parser.add_argument("--search-cache", action="store_true", help="启用搜索缓存（默认关闭以测量原始路径）")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    # 必须在构建计算图之前设置：搜索后端与缓存在第一次获取搜索工具时按环境变量创建
+    os.environ["SEARCH_BACKEND"] = "fake"
+    os.environ.setdefault("SEARCH_CACHE_ENABLED", "true" if args.search_cache else "false")
+    os.environ.setdefault("CHECKPOINTER_BACKEND", "memory")
+
+    settings = FakeLLMSettings(
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second,
+        inject_finish_reason=args.inject_finish_reason,
+        inject_rate=args.inject_rate,
+    )
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            settings.script = json.load(f)
+
+    rss_start = _rss_mb()
+    with FakeLLMServer(settings) as server:
+        from configs import ConfigManager
+        from graph import create_agent_workflow
+        from tools import web_search
+
+        web_search.get_search_backend().latency_seconds = args.search_latency
+        model_config = ConfigManager().get_current_config()
+        model_config.update({"model": "fake-model", "base_url": server.base_url, "api_key": "fake"})
+        workflow = create_agent_workflow(model_config)
+
+        # 预热：首轮包含模块导入、连接建立等一次性开销
+        _run_turn(workflow, "warmup", "预热")
+        rss_warm = _rss_mb()
+
+        rows = []
+        for threads in args.threads:
+            result = _run_load(workflow, threads, args.turns)
+            result.update(threads=threads, rss_mb=_rss_mb())
+            rows.append(result)
+
+        checkpointer = workflow.checkpointer
+        checkpointer_stats = checkpointer.stats() if hasattr(checkpointer, "stats") else {}
+        server_stats = dict(server.stats)
+
+    summary = {
+        "rss_start_mb": rss_start,
+        "rss_after_warmup_mb": rss_warm,
+        "rss_end_mb": rows[-1]["rss_mb"] if rows else rss_warm,
+        "llm_server": server_stats,
+        "checkpointer": checkpointer_stats,
+    }
+    if args.json:
+        print(json.dumps({"runs": rows, "summary": summary}, ensure_ascii=False, indent=2, default=str))
+        return
+
+    print(f"{'threads':>8}{'turns':>7}{'errors':>8}{'turns/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}{'ttft p50':>10}{'steps':>7}{'RSS (MB)':>10}")
+    for r in rows:
+        print(
+            f"{r['threads']:>8}{r['turns']:>7}{r['errors']:>8}{r['throughput']:>10.2f}{r['p50']:>10.3f}"
+            f"{r['p95']:>10.3f}{r['ttft_p50']:>10.3f}{r['steps']:>7.2f}{r['rss_mb']:>10.1f}"
+        )
+    for r in rows:
+        if r["first_error"]:
+            print(f"threads={r['threads']} 的首个错误: {r['first_error']}")
+    print(f"\n内存: 启动 {rss_start:.1f} MB → 预热后 {rss_warm:.1f} MB → 结束 {summary['rss_end_mb']:.1f} MB")
+    print(f"假模型服务: {server_stats}")
+    if checkpointer_stats:
+        print(f"检查点后端: {checkpointer_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+模型级联基准测试（完全离线）
+两个假模型服务分别扮演小模型（首token快、生成快、单价低）与大模型，在一组固定任务上比较三种配置：
+  - large  ：只使用大模型（未配置级联时的行为）；
+  - small  ：只使用小模型（质量下限参考）；
+  - cascade：小模型先处理，按 model_cascade.py 的策略升级到大模型。
+
+固定任务集（每类任务的问题中带有类别标记，两个假模型按类别给出不同的回复）：
+  - 简单：直接回答，小模型即可答对；
+  - 检索：一次检索后回答，小模型即可答对；
+  - 疑难：小模型回复中带有不确定表述（低置信度），大模型答对；
+  - 多源：小模型一次发起过多检索（工具复杂度），大模型按步骤完成；
+  - 陷阱：小模型自信地答错——级联无法识别，用于如实反映质量损失。
+质量按最终答复是否包含正确结论计算；token 与费用取自会话状态中累计的 usage（升级时小模型的用量同样计入）。
+子Agent调用经由同一个级联（models.get_subagent_model），其收益与"简单"类任务相同，这里不单独测量。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_cascade
+    python -m benchmarks.bench_cascade --repeat 3 --large-tokens-per-second 30
+    python -m benchmarks.bench_cascade --json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import uuid
+
+from benchmarks.fake_llm_server import FakeLLMServer, FakeLLMSettings
+
+# 类别 -> 任务数
+TASKS = {"简单": 6, "检索": 3, "疑难": 2, "多源": 2, "陷阱": 1}
+
+_ANSWER = "结论：{question}。" + "这是一段用于基准测试的模拟答复。" * 3
+_WRONG = "结论：该问题的答案是否定的。" + "这是一段用于基准测试的模拟答复。" * 3
+_SEARCH = {"tool_calls": [{"name": "tavily_search", "args": {"query": "{question}"}}]}
+_MULTI_SEARCH = {"tool_calls": [{"name": "tavily_search", "args": {"query": f"{{question}} 方面{i + 1}"}} for i in range(4)]}
+
+
+def _answer(content: str) -> dict:
+    return {"content": content, "finish_reason": "stop"}
+
+
+def _scripts(tier: str) -> dict:
+    """每类任务在小模型/大模型上的响应脚本。"""
+    small = tier == "small"
+    return {
+        "[简单]": [_answer(_ANSWER)],
+        "[检索]": [_SEARCH, _answer(_ANSWER)],
+        "[疑难]": [_answer("我不确定这个问题的答案，可能需要更多信息。" if small else _ANSWER)],
+        "[多源]": [_MULTI_SEARCH, _answer(_ANSWER)] if small else [_SEARCH, _SEARCH, _answer(_ANSWER)],
+        "[陷阱]": [_answer(_WRONG if small else _ANSWER)],
+    }
+
+
+def _task_set() -> list:
+    return [f"[{category}] 第{i + 1}题" for category, count in TASKS.items() for i in range(count)]
+
+
+def _run_task(workflow, question: str) -> dict:
+    from langchain_core.messages import HumanMessage
+    from streaming import stream_agent_turn
+
+    agent_input = {"messages": [HumanMessage(content=question)], "uploaded_file_paths": {"uploaded_file_paths": []}}
+    config = {"configurable": {"thread_id": f"bench-cascade-{uuid.uuid4().hex[:8]}"}}
+    start = time.perf_counter()
+    metrics = None
+    for event in stream_agent_turn(workflow, agent_input, config):
+        if event.kind == "done":
+            metrics = event.data
+    seconds = time.perf_counter() - start
+    values = workflow.get_state(config).values
+    usage = values.get("usage") or {}
+    return {
+        "seconds": seconds,
+        "ttft": metrics.time_to_first_token or 0.0,
+        "tokens": usage.get("total_tokens", 0),
+        "cost": usage.get("cost", 0.0),
+        "llm_steps": metrics.llm_steps,
+        "escalated": metrics.llm_steps_escalated,
+        "correct": f"结论：{question}" in str(values["messages"][-1].content),
+    }
+
+
+def _summarize(mode: str, runs: list, repeat: int) -> dict:
+    llm_steps = sum(r["llm_steps"] for r in runs)
+    return {
+        "mode": mode,
+        "tasks": len(runs) // repeat,
+        "mean_seconds": statistics.mean(r["seconds"] for r in runs),
+        "p95_seconds": sorted(r["seconds"] for r in runs)[min(len(runs) - 1, int(0.95 * len(runs)))],
+        "mean_ttft": statistics.mean(r["ttft"] for r in runs),
+        "tokens": sum(r["tokens"] for r in runs) / repeat,
+        "cost": sum(r["cost"] for r in runs) / repeat,
+        "quality": sum(r["correct"] for r in runs) / len(runs),
+        "escalation_rate": sum(r["escalated"] for r in runs) / llm_steps if llm_steps else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型级联基准测试")
+    parser.add_argument("--repeat", type=int, default=2, help="整个任务集重复的次数")
+    parser.add_argument("--small-first-token-latency", type=float, default=0.08)
+    parser.add_argument("--small-tokens-per-second", type=float, default=250.0)
+    parser.add_argument("--large-first-token-latency", type=float, default=0.35)
+    parser.add_argument("--large-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--small-price", type=float, nargs=2, default=[0.3, 0.6], metavar=("INPUT", "OUTPUT"), help="小模型每百万token单价")
+    parser.add_argument("--large-price", type=float, nargs=2, default=[2.0, 8.0], metavar=("INPUT", "OUTPUT"), help="大模型每百万token单价")
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    # 必须在构建计算图之前设置：搜索后端与缓存在第一次获取搜索工具时按环境变量创建
+    os.environ["SEARCH_BACKEND"] = "fake"
+    os.environ["SEARCH_CACHE_ENABLED"] = "false"
+    os.environ["TOOL_MEMO_ENABLED"] = "false"
+    os.environ.setdefault("CHECKPOINTER_BACKEND", "memory")
+
+    small_settings = FakeLLMSettings(
+        first_token_latency=args.small_first_token_latency, tokens_per_second=args.small_tokens_per_second, scripts=_scripts("small"),
+    )
+    large_settings = FakeLLMSettings(
+        first_token_latency=args.large_first_token_latency, tokens_per_second=args.large_tokens_per_second, scripts=_scripts("large"),
+    )
+    small_pricing = {"input_per_million": args.small_price[0], "output_per_million": args.small_price[1]}
+    large_pricing = {"input_per_million": args.large_price[0], "output_per_million": args.large_price[1]}
+    tasks = _task_set()
+    rows = []
+    with FakeLLMServer(small_settings) as small_server, FakeLLMServer(large_settings) as large_server:
+        from configs import ConfigManager
+        from graph import create_agent_workflow
+        from tools import web_search
+
+        web_search.get_search_backend().latency_seconds = args.search_latency
+        base = ConfigManager().get_current_config()
+        small = {"model": "fake-small", "base_url": small_server.base_url, "api_key": "fake", "pricing": small_pricing}
+        large = {"model": "fake-large", "base_url": large_server.base_url, "api_key": "fake", "pricing": large_pricing}
+        workflows = {
+            "large": create_agent_workflow({**base, **large}),
+            "small": create_agent_workflow({**base, **small}),
+            "cascade": create_agent_workflow({
+                **base, **large,
+                "cascade": {"small": {"model_name": "fake-small", "base_url": small_server.base_url, "pricing": small_pricing}},
+            }),
+        }
+        for workflow in workflows.values():
+            _run_task(workflow, "[简单] 预热")
+
+        for mode, workflow in workflows.items():
+            runs = [_run_task(workflow, question) for _ in range(args.repeat) for question in tasks]
+            rows.append(_summarize(mode, runs, args.repeat))
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+
+    baseline = next(row for row in rows if row["mode"] == "large")
+    print(
+        f"{'mode':>8}{'tasks':>7}{'mean (s)':>10}{'p95 (s)':>9}{'TTFT (s)':>10}{'tokens':>9}{'cost':>11}"
+        f"{'quality':>9}{'escalated':>11}{'latency':>9}{'cost':>8}"
+    )
+    for row in rows:
+        latency_saving = 1 - row["mean_seconds"] / baseline["mean_seconds"] if baseline["mean_seconds"] else 0.0
+        cost_saving = 1 - row["cost"] / baseline["cost"] if baseline["cost"] else 0.0
+        print(
+            f"{row['mode']:>8}{row['tasks']:>7}{row['mean_seconds']:>10.3f}{row['p95_seconds']:>9.3f}{row['mean_ttft']:>10.3f}"
+            f"{row['tokens']:>9.0f}{row['cost']:>11.6f}{row['quality']:>8.0%} {row['escalation_rate']:>10.0%}"
+            f"{latency_saving:>8.0%}{cost_saving:>8.0%}"
+        )
+    print("latency / cost 两列为相对 large 的节省比例；quality 为答对的任务比例，escalated 为升级到大模型的LLM调用比例。")
+
+
+if __name__ == "__main__":
+    main()
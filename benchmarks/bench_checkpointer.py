@@ -0,0 +1,86 @@
+"""
+检查点读写延迟基准测试
+比较 MemorySaver、BoundedMemorySaver 与 SQLiteCheckpointSaver 在不同对话历史长度下
+单次 put（写检查点）和 get_tuple（读最新检查点）的平均延迟。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_checkpointer
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+
+from checkpointer import BoundedMemorySaver, SQLiteCheckpointSaver
+
+
+def _make_history(length: int) -> list:
+    """构造一段接近真实形态的对话历史：用户提问、工具调用、较大的工具结果和最终答复交替出现。"""
+    messages = []
+    for i in range(length):
+        kind = i % 4
+        if kind == 0:
+            messages.append(HumanMessage(content=f"问题 {i}: 请帮我检索相关资料并总结。", id=str(uuid.uuid4())))
+        elif kind == 1:
+            messages.append(AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": f"q{i}"}, "id": f"call_{i}"}], id=str(uuid.uuid4())))
+        elif kind == 2:
+            messages.append(ToolMessage(content="搜索结果 " * 400, tool_call_id=f"call_{i - 1}", name="tavily_search", id=str(uuid.uuid4())))
+        else:
+            messages.append(AIMessage(content="总结 " * 100, id=str(uuid.uuid4())))
+    return messages
+
+
+def _bench_saver(saver, history_length: int, steps: int) -> dict:
+    thread_id = str(uuid.uuid4())
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    history = _make_history(history_length)
+    version = None
+    put_time = get_time = 0.0
+
+    for step in range(steps):
+        checkpoint = empty_checkpoint()
+        version = saver.get_next_version(version, None)
+        # 模拟 add_messages 的追加语义：每一步历史增长一条
+        checkpoint["channel_values"] = {"messages": history + history[: step % 4]}
+        checkpoint["channel_versions"] = {"messages": version}
+
+        start = time.perf_counter()
+        config = saver.put(config, checkpoint, {"source": "loop", "step": step}, {"messages": version})
+        put_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        saver.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+        get_time += time.perf_counter() - start
+
+    return {"put_ms": put_time / steps * 1000, "get_ms": get_time / steps * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查点读写延迟基准测试")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    parser.add_argument("--steps", type=int, default=30, help="每个历史长度写入的检查点数")
+    parser.add_argument("--keep", type=int, default=20, help="有界后端每线程保留的检查点数")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_ckpt_")
+    backends = {
+        "MemorySaver": lambda: MemorySaver(),
+        "BoundedMemorySaver": lambda: BoundedMemorySaver(max_checkpoints_per_thread=args.keep),
+        "SQLite(WAL)": lambda: SQLiteCheckpointSaver(os.path.join(tmpdir, f"{uuid.uuid4()}.sqlite"), max_checkpoints_per_thread=args.keep),
+    }
+
+    print(f"{'backend':<20}{'history':>8}{'put (ms)':>12}{'get (ms)':>12}")
+    for name, factory in backends.items():
+        for length in args.lengths:
+            result = _bench_saver(factory(), length, args.steps)
+            print(f"{name:<20}{length:>8}{result['put_ms']:>12.3f}{result['get_ms']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
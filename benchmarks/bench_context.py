@@ -0,0 +1,80 @@
+"""
+上下文窗口管理基准测试
+模拟一段50轮、每轮都带大体积搜索结果的会话，逐轮比较：
+  - 不做管理时（发送全部历史）的 prompt token 数；
+  - 使用 ContextWindowManager（旧工具结果截断 + 滚动摘要 + 预算裁剪）后的 prompt token 数；
+以及提示词构造耗时和按预填充速度估算的模型延迟。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_context --turns 50
+"""
+
+import argparse
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from context_manager import ContextWindowManager, TokenCounter
+from prompts import AGENT_SYSTEM_PROMPT
+
+
+def _turn_messages(turn: int, tool_result_chars: int) -> list:
+    call_id = f"call_{turn}"
+    return [
+        HumanMessage(content=f"第{turn}个问题：请检索关于主题{turn}的最新进展。", id=str(uuid.uuid4())),
+        AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": f"topic {turn}"}, "id": call_id}], id=str(uuid.uuid4())),
+        ToolMessage(content=("search result content " * (tool_result_chars // 22)), tool_call_id=call_id, name="tavily_search", id=str(uuid.uuid4())),
+        AIMessage(content=f"关于主题{turn}的总结：" + "要点 " * 150, id=str(uuid.uuid4())),
+    ]
+
+
+def _fake_summarize(manager: ContextWindowManager, previous: str, to_summarize: list) -> str:
+    """离线摘要替身：截取摘要提示词中的要点，长度限制在 summary_max_tokens 左右。"""
+    prompt = manager.build_summary_prompt(previous, to_summarize)
+    return prompt[-manager.settings["summary_max_tokens"] * 3:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上下文窗口管理基准测试")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--tool-result-chars", type=int, default=12000)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40.0, help="估算模型延迟：每1k prompt token的预填充耗时")
+    args = parser.parse_args()
+
+    counter = TokenCounter()
+    manager = ContextWindowManager(counter=counter)
+    system = SystemMessage(content=AGENT_SYSTEM_PROMPT)
+    messages, summary, cutoff_id = [], None, None
+    naive_total = managed_total = 0
+
+    print(f"{'turn':>5}{'naive tokens':>15}{'managed tokens':>16}{'build (ms)':>12}{'est. latency naive/managed (ms)':>34}")
+    for turn in range(1, args.turns + 1):
+        messages.extend(_turn_messages(turn, args.tool_result_chars))
+
+        start = time.perf_counter()
+        # 与 manage_context 节点相同的逻辑
+        if manager.needs_summary(messages, cutoff_id):
+            to_summarize, new_cutoff = manager.split_for_summary(messages, cutoff_id)
+            if to_summarize:
+                summary, cutoff_id = _fake_summarize(manager, summary, to_summarize), new_cutoff
+        prompt = manager.build_prompt(system, messages, summary=summary, cutoff_id=cutoff_id)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        naive = counter.count_all([system] + messages)
+        managed = manager.prompt_tokens(prompt)
+        naive_total += naive
+        managed_total += managed
+        if turn % 5 == 0 or turn == 1:
+            print(
+                f"{turn:>5}{naive:>15}{managed:>16}{build_ms:>12.2f}"
+                f"{naive * args.prefill_ms_per_1k / 1000:>20.0f} / {managed * args.prefill_ms_per_1k / 1000:<10.0f}"
+            )
+
+    print(f"\n累计 prompt tokens: 不管理 {naive_total}, 管理后 {managed_total} "
+          f"(节省 {100 * (1 - managed_total / max(naive_total, 1)):.1f}%)")
+    print(f"token计数缓存: 命中 {counter.hits}, 未命中 {counter.misses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+冷启动（导入耗时）基准测试
+在全新的子进程中以 `python -X importtime` 导入各入口模块，重复多次取中位数，报告：
+  - 每个模块的导入总耗时，以及是否超出冷启动预算（COLD_START_BUDGET_MS）；
+  - 单次导入中累计耗时最多的若干依赖（与 -X importtime 的 cumulative 列一致），便于定位新的慢导入。
+
+任一模块超出预算时以非零状态码退出，可直接用于CI。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --modules graph --repeat 5 --top 20
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# 各入口模块的冷启动预算（毫秒）。graph 必须导入 LangGraph，其余模块不应再连带导入模型客户端与搜索SDK。
+COLD_START_BUDGET_MS = {
+    "configs": 100,
+    "registry": 800,
+    "server": 1500,
+    "graph": 1500,
+}
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def _measure(module: str) -> dict:
+    """在新进程中导入模块，返回总耗时与 -X importtime 的逐模块记录（微秒）。"""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "0"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=os.getcwd(),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+    records = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us), "depth": len(indent) // 2})
+    top_level = next((r for r in reversed(records) if r["module"] == module), None)
+    total_us = top_level["cumulative_us"] if top_level else sum(r["self_us"] for r in records)
+    return {"total_ms": total_us / 1000, "records": records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入口模块冷启动（导入耗时）基准测试")
+    parser.add_argument("--modules", nargs="+", default=list(COLD_START_BUDGET_MS), help="要测量的模块")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块重复测量的次数（取中位数）")
+    parser.add_argument("--top", type=int, default=10, help="列出累计耗时最多的依赖数")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    # 与 bench_agent 一致使用离线搜索后端，避免因缺少 TAVILY_API_KEY 而失败
+    os.environ.setdefault("SEARCH_BACKEND", "fake")
+
+    rows = []
+    for module in args.modules:
+        runs = [_measure(module) for _ in range(max(1, args.repeat))]
+        median_ms = statistics.median(r["total_ms"] for r in runs)
+        # 依赖明细取耗时中位的那一次
+        sample = sorted(runs, key=lambda r: r["total_ms"])[len(runs) // 2]
+        heaviest = sorted(
+            (r for r in sample["records"] if r["module"] != module and r["depth"] <= 2),
+            key=lambda r: r["cumulative_us"], reverse=True,
+        )[:args.top]
+        budget = COLD_START_BUDGET_MS.get(module)
+        rows.append({
+            "module": module,
+            "median_ms": median_ms,
+            "budget_ms": budget,
+            "over_budget": budget is not None and median_ms > budget,
+            "heaviest": [{"module": r["module"], "cumulative_ms": r["cumulative_us"] / 1000} for r in heaviest],
+        })
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'module':<12}{'median (ms)':>14}{'budget (ms)':>14}  status")
+        for row in rows:
+            budget = f"{row['budget_ms']}" if row["budget_ms"] is not None else "-"
+            status = "超出预算" if row["over_budget"] else "ok"
+            print(f"{row['module']:<12}{row['median_ms']:>14.1f}{budget:>14}  {status}")
+        for row in rows:
+            print(f"\n{row['module']} 中累计耗时最多的依赖:")
+            for dep in row["heaviest"]:
+                print(f"  {dep['cumulative_ms']:>9.1f} ms  {dep['module']}")
+    sys.exit(1 if any(row["over_budget"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
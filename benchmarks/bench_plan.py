@@ -0,0 +1,114 @@
+"""
+规划-并行执行 vs ReAct 基准测试（完全离线）
+同一个需要 N 次检索的任务分别用两种执行模式运行（见 graph.AgentWorkflow 与 planner.py）：
+  - react：假模型每步只发出一次搜索，N 次检索需要 N + 1 次模型调用，检索串行执行；
+  - plan ：规划器一次提交 N 个互不依赖的步骤（经 Send 并行执行），再由汇总节点回答，共 2 次模型调用。
+报告每轮的模型调用次数、工具结果数与墙钟时间（取 --repeat 次的中位数）。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_plan
+    python -m benchmarks.bench_plan --searches 2 8 16 --search-latency 0.3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import uuid
+
+from benchmarks.fake_llm_server import FakeLLMServer, FakeLLMSettings
+
+
+def _script(searches: int) -> list:
+    """ReAct 脚本：每一步检索一个不同的子问题，最后给出答复。"""
+    steps = [
+        {"tool_calls": [{"name": "tavily_search", "args": {"query": f"{{question}} 方面{i + 1}"}}]}
+        for i in range(searches)
+    ]
+    steps.append({"content": "综合各方面的检索结果，结论如下：" + "这是一段用于基准测试的模拟答复。" * 8, "finish_reason": "stop"})
+    return steps
+
+
+def _run_turn(workflow, server: FakeLLMServer, mode: str, question: str) -> dict:
+    from langchain_core.messages import HumanMessage
+    from streaming import stream_agent_turn
+
+    agent_input = {
+        "messages": [HumanMessage(content=question)],
+        "uploaded_file_paths": {"uploaded_file_paths": []},
+        "execution_mode": mode,
+    }
+    config = {"configurable": {"thread_id": f"bench-plan-{uuid.uuid4().hex[:8]}"}}
+    requests_before = server.stats["requests"]
+    start = time.perf_counter()
+    metrics = None
+    for event in stream_agent_turn(workflow, agent_input, config):
+        if event.kind == "done":
+            metrics = event.data
+    return {
+        "seconds": time.perf_counter() - start,
+        "model_calls": server.stats["requests"] - requests_before,
+        "tool_results": metrics.tool_results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规划-并行执行 vs ReAct 基准测试")
+    parser.add_argument("--searches", type=int, nargs="+", default=[1, 4, 8], help="任务需要的检索次数（可给多个值）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    # 必须在构建计算图之前设置：搜索后端与缓存在第一次获取搜索工具时按环境变量创建
+    os.environ["SEARCH_BACKEND"] = "fake"
+    os.environ["SEARCH_CACHE_ENABLED"] = "false"
+    os.environ.setdefault("CHECKPOINTER_BACKEND", "memory")
+
+    settings = FakeLLMSettings(first_token_latency=args.first_token_latency, tokens_per_second=args.tokens_per_second)
+    rows = []
+    with FakeLLMServer(settings) as server:
+        from configs import ConfigManager
+        from graph import create_agent_workflow
+        from tools import web_search
+
+        web_search.get_search_backend().latency_seconds = args.search_latency
+        model_config = ConfigManager().get_current_config()
+        model_config.update({"model": "fake-model", "base_url": server.base_url, "api_key": "fake"})
+        workflow = create_agent_workflow(model_config)
+        _run_turn(workflow, server, "react", "预热")
+
+        for searches in args.searches:
+            # 假模型服务每次请求都读取当前脚本，规划器默认把脚本中的全部检索作为并行步骤提交
+            settings.script = _script(searches)
+            for mode in ("react", "plan"):
+                runs = [_run_turn(workflow, server, mode, f"第{i}个研究任务") for i in range(args.repeat)]
+                rows.append({
+                    "searches": searches,
+                    "mode": mode,
+                    "model_calls": statistics.median(r["model_calls"] for r in runs),
+                    "tool_results": statistics.median(r["tool_results"] for r in runs),
+                    "seconds": statistics.median(r["seconds"] for r in runs),
+                })
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'searches':>9}{'mode':>7}{'model calls':>13}{'tool results':>14}{'wall (s)':>10}{'speedup':>9}")
+    baseline = {}
+    for row in rows:
+        if row["mode"] == "react":
+            baseline[row["searches"]] = row["seconds"]
+        speedup = baseline.get(row["searches"], row["seconds"]) / row["seconds"] if row["seconds"] else float("nan")
+        print(
+            f"{row['searches']:>9}{row['mode']:>7}{row['model_calls']:>13.0f}{row['tool_results']:>14.0f}"
+            f"{row['seconds']:>10.3f}{speedup:>8.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+工具预取基准测试（完全离线）
+同一个 ReAct 任务分别在关闭/开启工具预取（见 tool_prefetch.py）时运行：假模型在一条消息中依次流式输出
+--calls 个检索调用（每个调用的参数需要若干token生成），随后给出最终答复。
+  - off：整条消息生成完毕后 tools 节点才开始执行检索；
+  - on ：每个调用的参数一完整就开始检索，与后续调用参数的生成重叠。
+报告每轮墙钟时间、首token时间，以及预取的工具执行与模型生成重叠的时间（取 --repeat 次的中位数）。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_prefetch
+    python -m benchmarks.bench_prefetch --calls 1 3 6 --search-latency 0.5 --tokens-per-second 100
+    python -m benchmarks.bench_prefetch --max-tool-concurrency 1
+
+同一条消息中的多个调用本来就会并发执行，关键路径是最后一个调用，而它的参数完整时消息也基本结束了；
+预取的收益主要来自调用数超过每轮并发上限时（每条消息最多预取该上限个调用），提前开始的那部分调用。
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import uuid
+
+from benchmarks.fake_llm_server import FakeLLMServer, FakeLLMSettings
+
+
+def _script(calls: int, query_chars: int) -> list:
+    """一条消息包含 calls 个检索调用（查询足够长，使参数的生成本身需要一定时间），随后给出答复。"""
+    padding = "相关背景资料与最新进展" * max(1, query_chars // 10)
+    return [
+        {"tool_calls": [
+            {"name": "tavily_search", "args": {"query": f"{{question}} 方面{i + 1} {padding}"}}
+            for i in range(calls)
+        ]},
+        {"content": "综合各方面的检索结果，结论如下：" + "这是一段用于基准测试的模拟答复。" * 4, "finish_reason": "stop"},
+    ]
+
+
+def _saved_seconds() -> float:
+    from instrumentation import instrumentation
+
+    counters = instrumentation.export_json(max_spans=0)["counters"]
+    return sum(sample["value"] for sample in counters.get("agent_tool_prefetch_saved_seconds_total", []))
+
+
+def _run_turn(workflow, question: str) -> dict:
+    from langchain_core.messages import HumanMessage
+    from streaming import stream_agent_turn
+
+    agent_input = {"messages": [HumanMessage(content=question)], "uploaded_file_paths": {"uploaded_file_paths": []}}
+    config = {"configurable": {"thread_id": f"bench-prefetch-{uuid.uuid4().hex[:8]}"}}
+    saved_before = _saved_seconds()
+    start = time.perf_counter()
+    metrics = None
+    for event in stream_agent_turn(workflow, agent_input, config):
+        if event.kind == "done":
+            metrics = event.data
+    return {
+        "seconds": time.perf_counter() - start,
+        "ttft": metrics.time_to_first_token or 0.0,
+        "tool_results": metrics.tool_results,
+        "overlap": _saved_seconds() - saved_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工具预取基准测试")
+    parser.add_argument("--calls", type=int, nargs="+", default=[1, 3, 5], help="单条消息中的工具调用数（可给多个值）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--query-chars", type=int, default=60, help="每个检索查询的大致字符数（决定参数的生成时间）")
+    parser.add_argument("--search-latency", type=float, default=0.4)
+    parser.add_argument("--max-tool-concurrency", type=int, default=None, help="每轮工具并发上限（默认使用配置值）")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    # 必须在构建计算图之前设置：搜索后端与缓存在第一次获取搜索工具时按环境变量创建
+    os.environ["SEARCH_BACKEND"] = "fake"
+    os.environ["SEARCH_CACHE_ENABLED"] = "false"
+    os.environ["TOOL_MEMO_ENABLED"] = "false"
+    os.environ.setdefault("CHECKPOINTER_BACKEND", "memory")
+
+    settings = FakeLLMSettings(first_token_latency=args.first_token_latency, tokens_per_second=args.tokens_per_second)
+    rows = []
+    with FakeLLMServer(settings) as server:
+        from configs import ConfigManager
+        from graph import create_agent_workflow
+        from tools import web_search
+
+        web_search.get_search_backend().latency_seconds = args.search_latency
+        model_config = ConfigManager().get_current_config()
+        model_config.update({"model": "fake-model", "base_url": server.base_url, "api_key": "fake"})
+        if args.max_tool_concurrency:
+            model_config["max_tool_concurrency"] = args.max_tool_concurrency
+        workflows = {
+            mode: create_agent_workflow({**model_config, "tool_prefetch": {"enabled": mode == "on"}})
+            for mode in ("off", "on")
+        }
+        for workflow in workflows.values():
+            _run_turn(workflow, "预热")
+
+        for calls in args.calls:
+            settings.script = _script(calls, args.query_chars)
+            for mode, workflow in workflows.items():
+                runs = [_run_turn(workflow, f"第{i}个任务") for i in range(args.repeat)]
+                rows.append({
+                    "calls": calls,
+                    "prefetch": mode,
+                    "tool_results": statistics.median(r["tool_results"] for r in runs),
+                    "ttft": statistics.median(r["ttft"] for r in runs),
+                    "overlap": statistics.median(r["overlap"] for r in runs),
+                    "seconds": statistics.median(r["seconds"] for r in runs),
+                })
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'calls':>6}{'prefetch':>10}{'tool results':>14}{'TTFT (s)':>10}{'overlap (s)':>13}{'wall (s)':>10}{'speedup':>9}")
+    baseline = {}
+    for row in rows:
+        if row["prefetch"] == "off":
+            baseline[row["calls"]] = row["seconds"]
+        speedup = baseline.get(row["calls"], row["seconds"]) / row["seconds"] if row["seconds"] else float("nan")
+        print(
+            f"{row['calls']:>6}{row['prefetch']:>10}{row['tool_results']:>14.0f}{row['ttft']:>10.3f}"
+            f"{row['overlap']:>13.3f}{row['seconds']:>10.3f}{speedup:>8.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
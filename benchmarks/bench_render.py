@@ -0,0 +1,85 @@
+"""
+UI历史渲染基准测试
+在不启动Streamlit的情况下，模拟每次rerun中与历史长度相关的开销，比较：
+  - 旧方案：列表存储，`msg not in messages` 去重，每次rerun对全部工具结果执行 json.loads 并渲染全部消息；
+  - 新方案：MessageStore（id去重、解析缓存），只渲染最近 K 轮。
+结果中的 "rendered" 为需要调用 st.* 渲染的元素数，它决定了真实rerun中前端的主要开销。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_render
+"""
+
+import argparse
+import json
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from message_store import MessageStore
+
+
+def _turn(i: int) -> list:
+    call_id = f"call_{i}"
+    payload = json.dumps({"query": f"q{i}", "results": [{"title": f"t{j}", "content": "内容 " * 200} for j in range(5)]}, ensure_ascii=False)
+    return [
+        HumanMessage(content=f"问题 {i}"),
+        AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": f"q{i}"}, "id": call_id}]),
+        ToolMessage(content=payload, tool_call_id=call_id, name="tavily_search"),
+        AIMessage(content=f"回答 {i} " * 50),
+    ]
+
+
+def _legacy_rerun(messages: list, new_messages: list) -> int:
+    for msg in new_messages:
+        if msg not in messages:
+            messages.append(msg)
+    rendered = 0
+    for msg in messages:
+        if isinstance(msg, ToolMessage):
+            json.loads(msg.content)
+        rendered += 1
+    return rendered
+
+
+def _store_rerun(store: MessageStore, new_messages: list, visible_turns: int) -> int:
+    store.extend(new_messages)
+    rendered = 0
+    _, turns = store.split_turns(visible_turns)
+    for turn in turns:
+        for msg in turn:
+            if isinstance(msg, ToolMessage):
+                store.tool_payload(msg)
+            rendered += 1
+    return rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UI历史渲染基准测试")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--visible-turns", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'turns':>6}{'legacy (ms)':>14}{'rendered':>10}{'store (ms)':>14}{'rendered':>10}")
+    for n in args.turns:
+        history = [m for i in range(n) for m in _turn(i)]
+        new_turn = _turn(n)
+        for m in history + new_turn:
+            m.id = m.id or str(id(m))
+
+        legacy = list(history)
+        start = time.perf_counter()
+        legacy_rendered = _legacy_rerun(legacy, new_turn)
+        legacy_ms = (time.perf_counter() - start) * 1000
+
+        store = MessageStore()
+        store.extend(history)
+        _store_rerun(store, [], args.visible_turns)  # 预热解析缓存，等同于此前的rerun
+        start = time.perf_counter()
+        store_rendered = _store_rerun(store, new_turn, args.visible_turns)
+        store_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{n:>6}{legacy_ms:>14.2f}{legacy_rendered:>10}{store_ms:>14.2f}{store_rendered:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+会话恢复基准测试
+用 SQLiteCheckpointSaver 写入不同长度的会话，模拟页面刷新/服务重启后按 session_id 恢复会话，比较：
+  - 旧方案：读取最新检查点后把全部消息复制进界面的消息列表（界面与检查点各保存一份完整历史）；
+  - 新方案：message_store.load_history 只读取 messages 通道、只构造最近 --window 轮的消息并放进 MessageStore
+    （历史以检查点为准；整段通道仍要读出并解析，耗时随历史长度缓慢增长）。
+报告恢复耗时、界面一侧保留的内存（tracemalloc），以及"检查点序列化大小 + 界面内存"的每会话总占用。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_resume
+    python -m benchmarks.bench_resume --turns 20 100 400 --window 10
+"""
+
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+from checkpointer import SQLiteCheckpointSaver
+from message_store import MessageStore, load_history
+
+
+def _turn(i: int) -> list:
+    call_id = f"call_{i}"
+    payload = json.dumps({"query": f"q{i}", "results": [{"title": f"t{j}", "content": "内容 " * 150} for j in range(5)]}, ensure_ascii=False)
+    return [
+        HumanMessage(content=f"问题 {i}: 请帮我检索相关资料并总结。", id=str(uuid.uuid4())),
+        AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": f"q{i}"}, "id": call_id}], id=str(uuid.uuid4())),
+        ToolMessage(content=payload, tool_call_id=call_id, name="tavily_search", id=str(uuid.uuid4())),
+        AIMessage(content=f"回答 {i} " * 80, id=str(uuid.uuid4())),
+    ]
+
+
+def _write_session(saver: SQLiteCheckpointSaver, thread_id: str, turns: int) -> int:
+    """每轮写一个检查点（与真实会话一样，消息通道有多个历史版本），返回最新检查点的序列化字节数。"""
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    history, version = [], None
+    for i in range(turns):
+        history.extend(_turn(i))
+        checkpoint = empty_checkpoint()
+        version = saver.get_next_version(version, None)
+        checkpoint["channel_values"] = {"messages": list(history)}
+        checkpoint["channel_versions"] = {"messages": version}
+        config = saver.put(config, checkpoint, {"source": "loop", "step": i}, {"messages": version})
+    return len(saver.serde.dumps_typed(history)[1])
+
+
+def _legacy_resume(saver, thread_id: str, window: int) -> MessageStore:
+    checkpoint_tuple = saver.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+    store = MessageStore()
+    store.extend(checkpoint_tuple.checkpoint["channel_values"]["messages"])
+    return store
+
+
+def _window_resume(saver, thread_id: str, window: int) -> MessageStore:
+    unloaded_turns, messages = load_history(saver, thread_id, window)
+    return MessageStore.from_history(messages, unloaded_turns, max_turns=window)
+
+
+def _measure(resume, saver, thread_id: str, window: int, repeat: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        resume(saver, thread_id, window)
+    elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = resume(saver, thread_id, window)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {"ms": elapsed_ms, "ui_bytes": retained, "messages": len(store)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话恢复基准测试")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--window", type=int, default=10, help="恢复时加载的最近轮次数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'turns':>6}{'ckpt (KB)':>11}{'legacy ms':>11}{'window ms':>11}{'legacy UI KB':>14}{'window UI KB':>14}{'session total':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = SQLiteCheckpointSaver(os.path.join(tmp, "bench.sqlite"), max_checkpoints_per_thread=20)
+        for turns in args.turns:
+            thread_id = str(uuid.uuid4())
+            checkpoint_bytes = _write_session(saver, thread_id, turns)
+            legacy = _measure(_legacy_resume, saver, thread_id, args.window, args.repeat)
+            window = _measure(_window_resume, saver, thread_id, args.window, args.repeat)
+            # 每会话总占用：检查点（内存后端时即为常驻内存）+ 界面保留的消息
+            ratio = (checkpoint_bytes + window["ui_bytes"]) / (checkpoint_bytes + legacy["ui_bytes"])
+            print(
+                f"{turns:>6}{checkpoint_bytes / 1024:>11.1f}{legacy['ms']:>11.2f}{window['ms']:>11.2f}"
+                f"{legacy['ui_bytes'] / 1024:>14.1f}{window['ui_bytes'] / 1024:>14.1f}{ratio:>14.0%}"
+            )
+        saver.close()
+
+
+if __name__ == "__main__":
+    main()
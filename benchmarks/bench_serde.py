@@ -0,0 +1,213 @@
+"""
+检查点序列化格式基准测试
+模拟一段只追加的对话（每轮：用户提问 → 带推理内容的工具调用 → 工具结果 → 带推理内容的最终答复，
+工具结果从少量固定内容中重复选取，消息带有 token_usage / logprobs 等 response_metadata），
+每个超步写入一个检查点，比较三种配置：
+  - default      ：langgraph 默认的 JsonPlusSerializer，每次写入完整消息历史；
+  - compact      ：checkpoint_serde.CompactSerializer（字符串去重、只保存非默认字段、丢弃 logprobs），完整历史；
+  - compact+delta：compact 加消息增量，只写入新追加的消息。
+报告每个检查点写入的平均字节数、线程最终占用的字节数、put / get_tuple 的平均耗时，
+以及对完整历史单独调用 dumps_typed / loads_typed 的耗时与大小。
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_serde
+    python -m benchmarks.bench_serde --turns 50 --backend sqlite
+    python -m benchmarks.bench_serde --json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from checkpoint_serde import CompactSerializer
+from checkpointer import BoundedMemorySaver, SQLiteCheckpointSaver
+
+# 工具结果从这几份内容中循环选取，模拟同一会话中反复检索到相同的网页
+_TOOL_PAYLOADS = [
+    json.dumps(
+        [{"title": f"资料{k}-{j}", "url": f"https://example.com/article/{k}/{j}", "content": f"第{k}份资料的第{j}段摘要。" * 12}
+         for j in range(5)],
+        ensure_ascii=False,
+    )
+    for k in range(3)
+]
+
+
+def _metadata(turn: int, finish_reason: str, logprob_tokens: int) -> dict:
+    return {
+        "token_usage": {
+            "completion_tokens": 120 + turn, "prompt_tokens": 2000 + 300 * turn, "total_tokens": 2120 + 301 * turn,
+            "completion_tokens_details": {"reasoning_tokens": 80}, "prompt_tokens_details": {"cached_tokens": 1024},
+        },
+        "model_name": "qwen-plus-2025-07-28",
+        "system_fingerprint": "fp_0123456789abcdef",
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "service_tier": "default",
+        "finish_reason": finish_reason,
+        "logprobs": {"content": [{"token": "的", "logprob": -0.01 * t, "bytes": [231, 154, 132], "top_logprobs": []} for t in range(logprob_tokens)]},
+    }
+
+
+def _make_turn(turn: int, logprob_tokens: int) -> list:
+    """一轮对话追加的四条消息。"""
+    call_id = f"call_{uuid.uuid4().hex[:24]}"
+    usage = {"input_tokens": 2000 + 300 * turn, "output_tokens": 120 + turn, "total_tokens": 2120 + 301 * turn}
+    return [
+        HumanMessage(content=f"问题 {turn}: 请帮我检索相关资料并总结其中的要点。", id=str(uuid.uuid4())),
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "tavily_search", "args": {"query": f"第{turn}个问题的相关资料"}, "id": call_id}],
+            additional_kwargs={"reasoning_content": f"用户询问第{turn}个问题，需要先检索资料。" * 20},
+            response_metadata=_metadata(turn, "tool_calls", logprob_tokens),
+            usage_metadata=usage,
+            id=f"run-{uuid.uuid4()}",
+        ),
+        ToolMessage(content=_TOOL_PAYLOADS[turn % len(_TOOL_PAYLOADS)], tool_call_id=call_id, name="tavily_search", id=str(uuid.uuid4())),
+        AIMessage(
+            content=f"第{turn}个问题的总结：" + "根据检索到的资料，要点如下。" * 30,
+            additional_kwargs={"reasoning_content": "整理检索结果中的要点并组织答复。" * 30},
+            response_metadata=_metadata(turn, "stop", logprob_tokens),
+            usage_metadata=usage,
+            id=f"run-{uuid.uuid4()}",
+        ),
+    ]
+
+
+def _written_bytes(saver, thread_id: str, checkpoint_id: str, new_versions: dict) -> int:
+    """本次 put 新写入的检查点与blob的字节数。"""
+    if isinstance(saver, BoundedMemorySaver):
+        size = len(saver.storage[thread_id][""][checkpoint_id][0][1])
+        return size + sum(len(saver.blobs[(thread_id, "", k, v)][1]) for k, v in new_versions.items())
+    size = saver.conn.execute(
+        "SELECT length(checkpoint) FROM checkpoints WHERE thread_id = ? AND checkpoint_id = ?", (thread_id, checkpoint_id),
+    ).fetchone()[0]
+    for k, v in new_versions.items():
+        size += saver.conn.execute(
+            "SELECT coalesce(length(blob), 0) FROM blobs WHERE thread_id = ? AND channel = ? AND version = ?", (thread_id, k, v),
+        ).fetchone()[0]
+    return size
+
+
+def _stored_bytes(saver, thread_id: str) -> int:
+    if isinstance(saver, BoundedMemorySaver):
+        return saver.stats()["total_bytes"]
+    row = saver.conn.execute(
+        "SELECT (SELECT coalesce(sum(length(checkpoint) + length(metadata)), 0) FROM checkpoints WHERE thread_id = ?)"
+        " + (SELECT coalesce(sum(length(blob)), 0) FROM blobs WHERE thread_id = ?)",
+        (thread_id, thread_id),
+    ).fetchone()
+    return row[0]
+
+
+def _simulate(saver, turns: int, logprob_tokens: int) -> dict:
+    """逐个超步写入检查点：每轮的四条消息各自触发一次 messages 通道的新版本，并读取一次最新检查点。"""
+    thread_id = str(uuid.uuid4())
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    messages, versions = [], {}
+    written = put_time = get_time = 0.0
+    steps = 0
+    for turn in range(turns):
+        for message in _make_turn(turn, logprob_tokens):
+            messages = messages + [message]
+            new_versions = {"messages": saver.get_next_version(versions.get("messages"), None)}
+            if message.type == "ai":
+                new_versions["usage"] = saver.get_next_version(versions.get("usage"), None)
+            versions.update(new_versions)
+            checkpoint = empty_checkpoint()
+            checkpoint["channel_values"] = {"messages": messages, "usage": {"total_tokens": 2120 * (turn + 1)}}
+            checkpoint["channel_versions"] = dict(versions)
+
+            start = time.perf_counter()
+            config = saver.put(config, checkpoint, {"source": "loop", "step": steps}, new_versions)
+            put_time += time.perf_counter() - start
+            written += _written_bytes(saver, thread_id, config["configurable"]["checkpoint_id"], new_versions)
+
+            start = time.perf_counter()
+            restored = saver.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+            get_time += time.perf_counter() - start
+            steps += 1
+    assert len(restored.checkpoint["channel_values"]["messages"]) == len(messages)
+    return {
+        "checkpoints": steps,
+        "bytes_per_checkpoint": written / steps,
+        "stored_bytes": _stored_bytes(saver, thread_id),
+        "put_ms": put_time / steps * 1000,
+        "get_ms": get_time / steps * 1000,
+    }
+
+
+def _bench_full_history(serde, messages: list, repeat: int) -> dict:
+    """对完整历史单独序列化/反序列化（不含存储开销）。"""
+    typed = serde.dumps_typed(messages)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        serde.dumps_typed(messages)
+    dumps_ms = (time.perf_counter() - start) / repeat * 1000
+    start = time.perf_counter()
+    for _ in range(repeat):
+        serde.loads_typed(typed)
+    loads_ms = (time.perf_counter() - start) / repeat * 1000
+    return {"history_bytes": len(typed[1]), "dumps_ms": dumps_ms, "loads_ms": loads_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查点序列化格式基准测试")
+    parser.add_argument("--turns", type=int, default=30, help="模拟的对话轮数（每轮四个检查点）")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--keep", type=int, default=20, help="每线程保留的检查点数")
+    parser.add_argument("--delta-max-chain", type=int, default=8)
+    parser.add_argument("--logprob-tokens", type=int, default=20, help="每条AI消息 response_metadata 中 logprobs 的条目数，0 表示不带")
+    parser.add_argument("--repeat", type=int, default=20, help="完整历史序列化计时的重复次数")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_serde_")
+    modes = {
+        "default": (lambda: JsonPlusSerializer(), 0),
+        "compact": (lambda: CompactSerializer(), 0),
+        "compact+delta": (lambda: CompactSerializer(), args.delta_max_chain),
+    }
+    history = [m for turn in range(args.turns) for m in _make_turn(turn, args.logprob_tokens)]
+
+    rows = []
+    for mode, (make_serde, max_delta_chain) in modes.items():
+        if args.backend == "memory":
+            saver = BoundedMemorySaver(max_checkpoints_per_thread=args.keep, max_bytes=None, serde=make_serde(), max_delta_chain=max_delta_chain)
+        else:
+            saver = SQLiteCheckpointSaver(
+                os.path.join(tmpdir, f"{uuid.uuid4()}.sqlite"),
+                max_checkpoints_per_thread=args.keep, serde=make_serde(), max_delta_chain=max_delta_chain,
+            )
+        row = {"mode": mode, **_simulate(saver, args.turns, args.logprob_tokens)}
+        row.update(_bench_full_history(make_serde(), history, args.repeat))
+        rows.append(row)
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+
+    baseline = rows[0]
+    print(f"backend={args.backend}  turns={args.turns}  checkpoints={baseline['checkpoints']}  messages={len(history)}")
+    print(
+        f"{'mode':>14}{'B/ckpt':>10}{'stored KB':>11}{'put (ms)':>10}{'get (ms)':>10}"
+        f"{'history KB':>12}{'dumps (ms)':>12}{'loads (ms)':>12}{'B/ckpt':>8}"
+    )
+    for row in rows:
+        ratio = row["bytes_per_checkpoint"] / baseline["bytes_per_checkpoint"]
+        print(
+            f"{row['mode']:>14}{row['bytes_per_checkpoint']:>10.0f}{row['stored_bytes'] / 1024:>11.1f}"
+            f"{row['put_ms']:>10.3f}{row['get_ms']:>10.3f}{row['history_bytes'] / 1024:>12.1f}"
+            f"{row['dumps_ms']:>12.3f}{row['loads_ms']:>12.3f}{ratio:>8.0%}"
+        )
+    print("最后一列为每个检查点写入字节数相对 default 的比例；history / dumps / loads 为完整历史单独序列化的大小与耗时。")
+
+
+if __name__ == "__main__":
+    main()
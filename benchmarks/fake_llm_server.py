@@ -0,0 +1,305 @@
+"""
+本地假 Chat Completions 服务
+实现 OpenAI 兼容的 `POST /v1/chat/completions`（流式SSE与非流式），供基准测试在不访问真实模型的情况下驱动整个计算图。
+
+可配置项（FakeLLMSettings）：
+  - first_token_latency：收到请求到第一个token的延迟（秒）；
+  - tokens_per_second：之后的token输出速率（0 表示不限速）；
+  - script：一轮对话内每次LLM调用的响应脚本，第 k 次调用使用第 k 步（超出时使用最后一步），
+            每一步可以是工具调用 {"tool_calls": [{"name", "args"}]} 或文本 {"content", "finish_reason"}；
+  - scripts：按问题选择脚本 {关键字: 脚本}，本轮用户问题包含某个关键字时使用对应脚本，否则使用 script；
+  - inject_finish_reason / inject_rate：以给定概率把文本响应的 finish_reason 替换为指定值（如 "length"），
+            用于测量重试路径；
+  - plan：规划器（请求的工具中包含 submit_plan，见 planner.py）返回的步骤列表，不设置时把脚本中的全部工具调用
+            作为互不依赖的步骤一次性提交。
+
+服务本身是无状态的：通过请求中"最后一条用户消息之后已有多少条assistant消息"确定当前是第几步，
+因此可以被任意多个线程/会话并发调用。请求不带 tools 时：消息中已有工具结果的（规划模式的汇总）返回脚本中的
+最终答复，否则（如上下文摘要）返回一段固定的摘要文本。
+
+独立运行（可把 OPENAI_API_BASE 指向它来离线调试UI）:
+    python -m benchmarks.fake_llm_server --port 8001
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# 默认脚本：先调用一次搜索，再给出最终答复
+DEFAULT_SCRIPT = [
+    {"tool_calls": [{"name": "tavily_search", "args": {"query": "{question}"}}]},
+    {"content": "根据检索结果，关于「{question}」的结论如下：" + "这是一段用于基准测试的模拟答复。" * 8, "finish_reason": "stop"},
+]
+
+
+@dataclass
+class FakeLLMSettings:
+    first_token_latency: float = 0.2
+    tokens_per_second: float = 200.0
+    chars_per_token: int = 4
+    script: List[Dict[str, Any]] = field(default_factory=lambda: list(DEFAULT_SCRIPT))
+    scripts: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    inject_finish_reason: Optional[str] = None
+    inject_rate: float = 0.0
+    seed: int = 0
+    plan: Optional[List[Dict[str, Any]]] = None
+
+
+def _last_user_text(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return str(content or "")
+    return ""
+
+
+def _step_index(messages: List[Dict[str, Any]]) -> int:
+    """最后一条用户消息之后的assistant消息数，即本轮已经完成的LLM调用次数。"""
+    count = 0
+    for message in reversed(messages):
+        role = message.get("role")
+        if role == "user":
+            break
+        if role == "assistant":
+            count += 1
+    return count
+
+
+def _fill(value: Any, question: str) -> Any:
+    """把脚本中的 {question} 占位符替换为本轮用户问题。"""
+    if isinstance(value, str):
+        return value.replace("{question}", question[:80])
+    if isinstance(value, dict):
+        return {k: _fill(v, question) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, question) for v in value]
+    return value
+
+
+class FakeLLMServer:
+    """在后台线程中运行的假模型服务，记录收到的请求数以便基准测试核对。"""
+
+    def __init__(self, settings: Optional[FakeLLMSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or FakeLLMSettings()
+        self._random = random.Random(self.settings.seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "stream_requests": 0, "injected": 0, "completion_tokens": 0}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # --- 响应构造 ---
+
+    def plan_response(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """根据请求决定本次响应：{"content", "tool_calls", "finish_reason"}。"""
+        messages = body.get("messages") or []
+        question = _last_user_text(messages)
+        script = next((s for key, s in self.settings.scripts.items() if key in question), self.settings.script)
+        if not body.get("tools"):
+            if any(m.get("role") == "tool" for m in messages):
+                final = next((step for step in reversed(script) if not step.get("tool_calls")), DEFAULT_SCRIPT[-1])
+                return {"content": _fill(final.get("content", ""), question), "tool_calls": [], "finish_reason": "stop"}
+            return {"content": "摘要：此前的对话围绕用户问题展开检索与回答。", "tool_calls": [], "finish_reason": "stop"}
+
+        tool_names = {t.get("function", {}).get("name") for t in body["tools"]}
+        if "submit_plan" in tool_names:
+            plan = self.settings.plan or [
+                {"id": f"s{i + 1}", "tool": tc["name"], "args": tc.get("args", {})}
+                for i, tc in enumerate(tc for step in script for tc in step.get("tool_calls", []))
+            ]
+            arguments = json.dumps({"steps": _fill(plan, question)}, ensure_ascii=False)
+            return {"content": "", "tool_calls": [{"id": f"call_{uuid.uuid4().hex[:12]}", "name": "submit_plan", "arguments": arguments}], "finish_reason": "tool_calls"}
+
+        step = dict(script[min(_step_index(messages), len(script) - 1)])
+        step = _fill(step, question)
+        tool_calls = [
+            {"id": f"call_{uuid.uuid4().hex[:12]}", "name": tc["name"], "arguments": json.dumps(tc.get("args", {}), ensure_ascii=False)}
+            for tc in step.get("tool_calls", [])
+        ]
+        finish_reason = "tool_calls" if tool_calls else step.get("finish_reason", "stop")
+        if not tool_calls and self.settings.inject_finish_reason:
+            with self._lock:
+                inject = self._random.random() < self.settings.inject_rate
+                if inject:
+                    self.stats["injected"] += 1
+            if inject:
+                finish_reason = self.settings.inject_finish_reason
+        return {"content": step.get("content", ""), "tool_calls": tool_calls, "finish_reason": finish_reason}
+
+    def _pieces(self, text: str) -> List[str]:
+        size = max(1, self.settings.chars_per_token)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _usage(self, body: Dict[str, Any], completion_tokens: int) -> Dict[str, int]:
+        prompt_chars = len(json.dumps(body.get("messages") or [], ensure_ascii=False))
+        prompt_tokens = prompt_chars // max(1, self.settings.chars_per_token)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def _make_handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                plan = server.plan_response(body)
+                with server._lock:
+                    server.stats["requests"] += 1
+                    if body.get("stream"):
+                        server.stats["stream_requests"] += 1
+                try:
+                    if body.get("stream"):
+                        self._stream(body, plan)
+                    else:
+                        self._complete(body, plan)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端提前断开（例如对冲请求落败后被取消）
+                    self.close_connection = True
+
+            # 非流式：等待完整生成时间后一次性返回
+            def _complete(self, body, plan):
+                settings = server.settings
+                pieces = server._pieces(plan["content"]) + [tc["arguments"] for tc in plan["tool_calls"]]
+                delay = settings.first_token_latency
+                if settings.tokens_per_second > 0:
+                    delay += len(pieces) / settings.tokens_per_second
+                time.sleep(delay)
+                message = {"role": "assistant", "content": plan["content"] or None}
+                if plan["tool_calls"]:
+                    message["tool_calls"] = [
+                        {"id": tc["id"], "type": "function", "function": {"name": tc["name"], "arguments": tc["arguments"]}}
+                        for tc in plan["tool_calls"]
+                    ]
+                with server._lock:
+                    server.stats["completion_tokens"] += len(pieces)
+                payload = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model") or "fake",
+                    "choices": [{"index": 0, "message": message, "finish_reason": plan["finish_reason"]}],
+                    "usage": server._usage(body, len(pieces)),
+                }
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            # 流式：按 tokens_per_second 逐块输出SSE
+            def _stream(self, body, plan):
+                settings = server.settings
+                interval = 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+                chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                created = int(time.time())
+                model = body.get("model") or "fake"
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                def send(choices, usage=None):
+                    payload = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": choices}
+                    if usage is not None:
+                        payload["usage"] = usage
+                    self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                time.sleep(settings.first_token_latency)
+                tokens = 0
+                send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+                for piece in server._pieces(plan["content"]):
+                    send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                    tokens += 1
+                    if interval:
+                        time.sleep(interval)
+                for index, tc in enumerate(plan["tool_calls"]):
+                    send([{"index": 0, "delta": {"tool_calls": [
+                        {"index": index, "id": tc["id"], "type": "function", "function": {"name": tc["name"], "arguments": ""}}
+                    ]}, "finish_reason": None}])
+                    for piece in server._pieces(tc["arguments"]):
+                        send([{"index": 0, "delta": {"tool_calls": [{"index": index, "function": {"arguments": piece}}]}, "finish_reason": None}])
+                        tokens += 1
+                        if interval:
+                            time.sleep(interval)
+                send([{"index": 0, "delta": {}, "finish_reason": plan["finish_reason"]}])
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    send([], usage=server._usage(body, tokens))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                with server._lock:
+                    server.stats["completion_tokens"] += tokens
+                self.close_connection = True
+
+        return _Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假 Chat Completions 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--script", help="JSON文件，内容为响应步骤列表（格式见模块说明）")
+    parser.add_argument("--inject-finish-reason", default=None, help="例如 length 或 content_filter")
+    parser.add_argument("--inject-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    settings = FakeLLMSettings(
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second,
+        inject_finish_reason=args.inject_finish_reason,
+        inject_rate=args.inject_rate,
+    )
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            settings.script = json.load(f)
+    server = FakeLLMServer(settings, host=args.host, port=args.port)
+    print(f"假模型服务已启动: {server.base_url}（Ctrl+C 退出）")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+检查点紧凑序列化模块
+默认的 JsonPlusSerializer 把每条消息编码为完整的 pydantic 模型（类路径 + model_dump() 的全部字段），
+而 "messages" 通道每个新版本都要重新写入整段历史。本模块为 checkpointer.py 中的两种后端提供：
+
+  - CompactSerializer：msgpack（ormsgpack）编码。
+      * 消息只保存类型编号与非默认值字段，可选地丢弃 response_metadata 中的大字段（默认 "logprobs"）；
+      * 同一次写入中长度不小于 min_intern_length 的字符串只保存一次（字符串表 + 引用），
+        重复的工具结果、工具调用id、模型名、通道版本号等不再重复存储；
+      * 无法紧凑编码的值（如 Send、元组、自定义对象）整体交给默认序列化器，读取时按类型自动分派，
+        因此已有的检查点（类型为 "msgpack" 等）仍可读取。
+  - MessageDeltaEncoder：add_messages 通常只在末尾追加消息，新版本与上一次写入的列表前缀相同时，
+    只写入追加的消息与上一版本的引用（类型 "delta:<上一版本>"），每 max_chain 个增量写入一次完整列表；
+    读取时沿引用链拼接。前缀不同（删除、按id替换了较早的消息、进程重启后的第一次写入）时写入完整列表。
+  - LazyMessage：loads(..., lazy_messages=True) 时消息只读出类型编号、暂不构造，
+    恢复会话时按用户消息切分轮次后只构造窗口内的消息（见 message_store.load_history）。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import ormsgpack
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    ChatMessage,
+    FunctionMessage,
+    HumanMessage,
+    HumanMessageChunk,
+    RemoveMessage,
+    SystemMessage,
+    SystemMessageChunk,
+    ToolMessage,
+    ToolMessageChunk,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+COMPACT_TYPE = "compact"
+DELTA_TYPE_PREFIX = "delta:"
+
+_EXT_TABLE = 1
+_EXT_REF = 2
+_EXT_MESSAGE = 3
+
+# 消息类型编号写入了存储，只能追加，不能调整顺序
+_MESSAGE_CLASSES = (
+    None, HumanMessage, AIMessage, ToolMessage, SystemMessage, RemoveMessage, ChatMessage, FunctionMessage,
+    AIMessageChunk, HumanMessageChunk, ToolMessageChunk, SystemMessageChunk,
+)
+
+
+def _field_defaults(cls) -> Dict[str, Any]:
+    return {
+        name: field.get_default(call_default_factory=True)
+        for name, field in cls.model_fields.items()
+        if not field.is_required()
+    }
+
+
+# {消息类: (编号, {字段名: 默认值})}
+_MESSAGE_SPECS = {cls: (code, _field_defaults(cls)) for code, cls in enumerate(_MESSAGE_CLASSES) if cls is not None}
+
+
+def _construct(cls, fields: Dict[str, Any]) -> BaseMessage:
+    """
+    不经校验地构造消息。省略的字段在这里用默认值补齐（可变默认值每次新建）：
+    交给 model_construct 补齐时，每个带 default_factory 的字段都会检查一次工厂函数的签名，比解码本身还慢。
+    """
+    values = {
+        name: default.copy() if isinstance(default, (dict, list)) else default
+        for name, default in _MESSAGE_SPECS[cls][1].items()
+    }
+    values.update(fields)
+    return cls.model_construct(_fields_set=set(fields), **values)
+
+
+def _peek_code(data: bytes) -> int:
+    """读出消息扩展数据中的类型编号（数组的第一个元素，是正 fixint），不解码其余字段。"""
+    head = data[0]
+    offset = 1 if head <= 0x9f else 3 if head == 0xdc else 5
+    return data[offset]
+
+
+class LazyMessage:
+    """尚未构造的消息：message_class 为消息类型，decode() 时才解码字段并构造消息。"""
+
+    __slots__ = ("message_class", "_data", "_hook")
+
+    def __init__(self, message_class, data: bytes, hook: Callable[[int, bytes], Any]):
+        self.message_class = message_class
+        self._data = data
+        self._hook = hook
+
+    def decode(self) -> BaseMessage:
+        return _decode_message(self._data, self._hook)
+
+
+def _decode_message(data: bytes, hook: Callable[[int, bytes], Any]) -> BaseMessage:
+    items = ormsgpack.unpackb(data, ext_hook=hook)
+    fields = dict(zip(items[1::2], items[2::2]))
+    return _construct(_MESSAGE_CLASSES[items[0]], fields)
+
+
+class _Unsupported(Exception):
+    """值中含有无法紧凑编码的对象，整体交给默认序列化器。"""
+
+
+class MessagesDelta:
+    """消息通道的增量：base_version 版本的列表之后追加 messages。full 为完整列表，只在写入时使用。"""
+
+    __slots__ = ("base_version", "messages", "full")
+
+    def __init__(self, base_version: str, messages: List[BaseMessage], full: Optional[List[BaseMessage]] = None):
+        self.base_version = base_version
+        self.messages = messages
+        self.full = full
+
+
+def delta_base(type_: str) -> Optional[str]:
+    """增量blob所引用的上一版本（由类型字符串给出，无需解码）；不是增量时返回 None。"""
+    return type_[len(DELTA_TYPE_PREFIX):] if type_.startswith(DELTA_TYPE_PREFIX) else None
+
+
+def _ref(index: int) -> ormsgpack.Ext:
+    size = 1 if index < 0x100 else 2 if index < 0x10000 else 4
+    return ormsgpack.Ext(_EXT_REF, index.to_bytes(size, "little"))
+
+
+class CompactSerializer:
+    """
+    检查点的紧凑序列化器（实现 SerializerProtocol 的 dumps_typed / loads_typed）。
+
+    Args:
+        fallback: 无法紧凑编码的值使用的序列化器，默认 JsonPlusSerializer。
+        min_intern_length: 参与字符串去重的最短长度，更短的字符串原样写入。
+        drop_metadata_keys: 写入时从消息的 response_metadata 中丢弃的字段。
+    """
+
+    def __init__(self, fallback=None, min_intern_length: int = 8, drop_metadata_keys: Sequence[str] = ("logprobs",)):
+        self.fallback = fallback or JsonPlusSerializer()
+        self.min_intern_length = min_intern_length
+        self.drop_metadata_keys = frozenset(drop_metadata_keys or ())
+
+    # --- SerializerProtocol ---
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if isinstance(obj, MessagesDelta):
+            try:
+                return DELTA_TYPE_PREFIX + str(obj.base_version), self.dumps(obj.messages)
+            except _Unsupported:
+                return self.dumps_typed(obj.full)
+        if obj is None or isinstance(obj, (bytes, bytearray)):
+            return self.fallback.dumps_typed(obj)
+        try:
+            return COMPACT_TYPE, self.dumps(obj)
+        except _Unsupported:
+            return self.fallback.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes], lazy_messages: bool = False) -> Any:
+        """lazy_messages 见 loads；交给默认序列化器的值总是完整解码。"""
+        type_, payload = data
+        if type_ == COMPACT_TYPE:
+            return self.loads(payload, lazy_messages)
+        base = delta_base(type_)
+        if base is not None:
+            return MessagesDelta(base, self.loads(payload, lazy_messages))
+        return self.fallback.loads_typed(data)
+
+    # --- 编码 ---
+
+    def dumps(self, obj: Any) -> bytes:
+        """紧凑编码；值中含有不支持的对象时抛出 _Unsupported。"""
+        table: Dict[str, int] = {}
+        try:
+            body = self._encode(obj, table)
+            return ormsgpack.packb([ormsgpack.Ext(_EXT_TABLE, ormsgpack.packb(list(table))), body])
+        except (ormsgpack.MsgpackEncodeError, OverflowError) as e:
+            raise _Unsupported from e
+
+    def _encode(self, value: Any, table: Dict[str, int]) -> Any:
+        kind = type(value)
+        if kind is str:
+            if len(value) < self.min_intern_length:
+                return value
+            index = table.get(value)
+            if index is None:
+                index = table[value] = len(table)
+            return _ref(index)
+        if value is None or kind is int or kind is float or kind is bool:
+            return value
+        if kind is dict:
+            encoded = {}
+            for key, item in value.items():
+                if type(key) is not str:
+                    raise _Unsupported
+                encoded[key] = self._encode(item, table)
+            return encoded
+        if kind is list:
+            return [self._encode(item, table) for item in value]
+        spec = _MESSAGE_SPECS.get(kind)
+        if spec is not None:
+            return self._encode_message(value, spec, table)
+        raise _Unsupported
+
+    def _encode_message(self, message: BaseMessage, spec, table: Dict[str, int]) -> ormsgpack.Ext:
+        if message.__pydantic_extra__:
+            raise _Unsupported
+        code, defaults = spec
+        items: List[Any] = [code]
+        for name, value in message.__dict__.items():
+            if name in defaults and value == defaults[name]:
+                continue
+            if name == "response_metadata" and self.drop_metadata_keys:
+                value = {k: v for k, v in value.items() if k not in self.drop_metadata_keys}
+            items.append(self._encode(name, table))
+            items.append(self._encode(value, table))
+        return ormsgpack.Ext(_EXT_MESSAGE, ormsgpack.packb(items))
+
+    # --- 解码 ---
+
+    @staticmethod
+    def loads(payload: bytes, lazy_messages: bool = False) -> Any:
+        """解码；lazy_messages 为 True 时消息解码为 LazyMessage，只在调用 decode() 时构造。"""
+        table: List[str] = []
+
+        def hook(code: int, data: bytes):
+            if code == _EXT_REF:
+                return table[int.from_bytes(data, "little")]
+            if code == _EXT_MESSAGE:
+                if lazy_messages:
+                    return LazyMessage(_MESSAGE_CLASSES[_peek_code(data)], data, eager_hook)
+                return _decode_message(data, hook)
+            if code == _EXT_TABLE:
+                # 字符串表是第一个元素，解析正文中的引用之前就已就绪
+                table.extend(ormsgpack.unpackb(data))
+                return None
+            raise ValueError(f"未知的紧凑编码扩展类型: {code}")
+
+        def eager_hook(code: int, data: bytes):
+            # LazyMessage.decode() 时使用：字段中的引用仍指向本次解码的字符串表
+            return _decode_message(data, eager_hook) if code == _EXT_MESSAGE else hook(code, data)
+
+        return ormsgpack.unpackb(payload, ext_hook=hook)[1]
+
+
+class MessageDeltaEncoder:
+    """
+    记住每个 (thread_id, checkpoint_ns, 通道) 最近一次写入的消息列表，新版本只是在其后追加时返回 MessagesDelta。
+    只保存最近 max_threads 个键（LRU），被淘汰或进程重启后的第一次写入为完整列表。
+
+    Args:
+        channels: 使用增量编码的通道（值为消息列表、由 add_messages 合并）。
+        max_chain: 连续增量的最大数量，达到后写入一次完整列表，限制读取时的拼接深度。
+        max_threads: 记住的键的数量上限。
+    """
+
+    def __init__(self, channels: Iterable[str] = ("messages",), max_chain: int = 8, max_threads: int = 256):
+        self.channels = frozenset(channels)
+        self.max_chain = max_chain
+        self.max_threads = max_threads
+        self._last: "OrderedDict[tuple, Tuple[str, tuple, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, thread_id: str, checkpoint_ns: str, channel: str, version: Any, value: Any) -> Any:
+        """返回写入存储的值：MessagesDelta 或原值。"""
+        if channel not in self.channels or type(value) is not list:
+            return value
+        key = (thread_id, checkpoint_ns, channel)
+        with self._lock:
+            last = self._last.get(key)
+        result, depth = value, 0
+        if last is not None:
+            base_version, previous, base_depth = last
+            if base_depth < self.max_chain and len(value) >= len(previous) and all(
+                a is b or a == b for a, b in zip(previous, value)
+            ):
+                result, depth = MessagesDelta(base_version, value[len(previous):], value), base_depth + 1
+        with self._lock:
+            self._last[key] = (str(version), tuple(value), depth)
+            self._last.move_to_end(key)
+            while len(self._last) > self.max_threads:
+                self._last.popitem(last=False)
+        return result
+
+    def forget(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._last if k[0] == thread_id]:
+                del self._last[key]
+
+
+def resolve_deltas(values: Dict[str, Any], load_base: Callable[[str, str], Any]) -> Dict[str, Any]:
+    """
+    把通道值中的 MessagesDelta 还原为完整的消息列表。
+    load_base(通道, 版本) 返回该版本的blob解码后的值（可能仍是增量），不存在时返回 None。
+    """
+    for channel, value in values.items():
+        if not isinstance(value, MessagesDelta):
+            continue
+        tails = []
+        while isinstance(value, MessagesDelta):
+            tails.append(value.messages)
+            base_version = value.base_version
+            value = load_base(channel, base_version)
+            if value is None:
+                raise ValueError(f"检查点通道 {channel} 的增量所引用的版本 {base_version} 不存在")
+        messages = list(value)
+        for tail in reversed(tails):
+            messages.extend(tail)
+        values[channel] = messages
+    return values
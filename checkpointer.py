@@ -0,0 +1,685 @@
+"""
+检查点后端模块
+为计算图提供可插拔、有界的检查点存储，替代无上限增长的 MemorySaver。
+
+提供两种后端（通过 ConfigManager.runtime_configs["checkpointer"] 选择）：
+  - "memory": BoundedMemorySaver —— 内存存储，带每线程保留条数、空闲TTL淘汰和内存上限；
+  - "sqlite": SQLiteCheckpointSaver —— 本地SQLite文件存储（WAL模式），进程重启后对话可恢复，
+              每次写入在单个事务内批量完成，同样支持保留条数与TTL淘汰。
+
+默认使用 checkpoint_serde.CompactSerializer 紧凑编码，并对 "messages" 通道做增量写入（只写入新追加的消息），
+"serde": "default" 时使用 langgraph 默认的序列化器且不做增量。
+
+两种后端都提供 get_channel_value：只读取最新检查点中一个通道的值（不解码其他通道与待写入），
+恢复会话时与 CompactSerializer 的 lazy_messages 配合，只构造窗口内的消息（见 message_store.load_history）。
+"""
+
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from checkpoint_serde import CompactSerializer, MessageDeltaEncoder, delta_base, resolve_deltas
+
+
+def _delta_encoder(serde, max_delta_chain: int) -> Optional[MessageDeltaEncoder]:
+    """只有紧凑序列化器能写入增量；max_delta_chain 为 0 时不做增量。"""
+    if max_delta_chain and isinstance(serde, CompactSerializer):
+        return MessageDeltaEncoder(max_chain=max_delta_chain)
+    return None
+
+
+def _encode_deltas(delta: Optional[MessageDeltaEncoder], config: RunnableConfig, checkpoint: Checkpoint, new_versions: ChannelVersions) -> Checkpoint:
+    """把检查点中有新版本的消息通道替换为增量（不修改传入的检查点）。"""
+    if delta is None:
+        return checkpoint
+    thread_id = config["configurable"]["thread_id"]
+    checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+    values = checkpoint["channel_values"]
+    encoded = {
+        k: delta.encode(thread_id, checkpoint_ns, k, v, values[k])
+        for k, v in new_versions.items() if k in delta.channels and k in values
+    }
+    return {**checkpoint, "channel_values": {**values, **encoded}} if encoded else checkpoint
+
+
+def _channel_value(serde, load_blob, channel: str, version: Any, lazy_messages: bool) -> Any:
+    """
+    解码一个通道版本的值并沿增量链还原。load_blob(通道, 版本) 返回 (类型, 字节) 或 None；
+    lazy_messages 只对紧凑编码的blob生效（见 CompactSerializer.loads）。
+    """
+    def load(channel, version):
+        blob = load_blob(channel, version)
+        if blob is None or blob[0] == "empty":
+            return None
+        return serde.loads_typed(blob, lazy_messages=True) if lazy_messages else serde.loads_typed(blob)
+
+    if version is None:
+        return None
+    lazy_messages = lazy_messages and isinstance(serde, CompactSerializer)
+    value = load(channel, version)
+    return resolve_deltas({channel: value}, load)[channel] if value is not None else None
+
+
+def _next_version(current: Optional[str]) -> str:
+    """与 InMemorySaver 相同的版本号格式：单调递增的整数前缀 + 随机后缀。"""
+    if current is None:
+        current_v = 0
+    elif isinstance(current, int):
+        current_v = current
+    else:
+        current_v = int(current.split(".")[0])
+    return f"{current_v + 1:032}.{random.random():016}"
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    有界的内存检查点存储。
+
+    Args:
+        max_checkpoints_per_thread: 每个线程（每个命名空间）保留的最近检查点数量，None表示不限制。
+        idle_ttl_seconds: 线程空闲超过该时间后被整体淘汰，None表示不淘汰。
+        max_bytes: 所有线程序列化后的总字节上限，超过时按最久未访问的顺序淘汰线程，None表示不限制。
+        sweep_interval_seconds: TTL扫描的最小间隔，避免每次写入都遍历所有线程。
+        serde: 序列化器，默认 CompactSerializer。
+        max_delta_chain: 消息通道连续增量的最大数量（见 checkpoint_serde.MessageDeltaEncoder），0 表示每次写入完整列表。
+    """
+
+    def __init__(
+        self,
+        *,
+        max_checkpoints_per_thread: Optional[int] = 20,
+        idle_ttl_seconds: Optional[float] = 6 * 3600,
+        max_bytes: Optional[int] = 256 * 1024 * 1024,
+        sweep_interval_seconds: float = 60.0,
+        serde=None,
+        max_delta_chain: int = 8,
+    ):
+        super().__init__(serde=serde or CompactSerializer())
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._lock = threading.RLock()
+        # 每个线程的辅助索引，使裁剪和淘汰只需访问该线程自己的数据
+        self._last_access: Dict[str, float] = {}
+        self._thread_bytes: Dict[str, int] = defaultdict(int)
+        self._blob_keys: Dict[str, Set[tuple]] = defaultdict(set)
+        self._write_keys: Dict[str, Set[tuple]] = defaultdict(set)
+        self._last_sweep = time.monotonic()
+        self._delta = _delta_encoder(self.serde, max_delta_chain)
+
+    # --- 统计 ---
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._thread_bytes.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threads": len(self.storage),
+            "total_bytes": self.total_bytes,
+            "blobs": len(self.blobs),
+        }
+
+    # --- 读写 ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id in self.storage:
+                self._last_access[thread_id] = time.monotonic()
+            return super().get_tuple(config)
+
+    def get_channel_value(self, config: RunnableConfig, channel: str, lazy_messages: bool = False) -> Any:
+        """只读取最新（或 config 指定的）检查点中 channel 的值；检查点或通道不存在时返回 None。"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            checkpoints = self.storage.get(thread_id, {}).get(checkpoint_ns)
+            if not checkpoints:
+                return None
+            checkpoint_id = get_checkpoint_id(config) or max(checkpoints)
+            if checkpoint_id not in checkpoints:
+                return None
+            self._last_access[thread_id] = time.monotonic()
+            versions = self.serde.loads_typed(checkpoints[checkpoint_id][0]).get("channel_versions", {})
+            return _channel_value(
+                self.serde, lambda ch, v: self.blobs.get((thread_id, checkpoint_ns, ch, v)),
+                channel, versions.get(channel), lazy_messages,
+            )
+
+    def list(self, config, *, filter=None, before=None, limit=None) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            # 先物化结果，避免在迭代期间被并发的裁剪修改
+            items = list(super().list(config, filter=filter, before=before, limit=limit))
+        return iter(items)
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        def load_base(channel, version):
+            blob = self.blobs.get((thread_id, checkpoint_ns, channel, version))
+            return self.serde.loads_typed(blob) if blob is not None and blob[0] != "empty" else None
+
+        return resolve_deltas(super()._load_blobs(thread_id, checkpoint_ns, versions), load_base)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        with self._lock:
+            checkpoint = _encode_deltas(self._delta, config, checkpoint, new_versions)
+            result = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            for k, v in new_versions.items():
+                self._blob_keys[thread_id].add((thread_id, checkpoint_ns, k, v))
+            self._last_access[thread_id] = time.monotonic()
+            self._prune_thread(thread_id)
+            self._enforce_limits(exclude=thread_id)
+            return result
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+            outer_key = (thread_id, checkpoint_ns, config["configurable"]["checkpoint_id"])
+            self._write_keys[thread_id].add(outer_key)
+            # 写入字节数在下次 put 时统一重新计算，这里仅做近似累加
+            self._thread_bytes[thread_id] += sum(
+                len(v[2][1]) for v in self.writes.get(outer_key, {}).values() if v[0] == task_id
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in self._write_keys.pop(thread_id, set()):
+                self.writes.pop(key, None)
+            for key in self._blob_keys.pop(thread_id, set()):
+                self.blobs.pop(key, None)
+            self._thread_bytes.pop(thread_id, None)
+            self._last_access.pop(thread_id, None)
+            if self._delta is not None:
+                self._delta.forget(thread_id)
+
+    # --- 裁剪与淘汰 ---
+
+    def _prune_thread(self, thread_id: str):
+        """只保留最近的 N 个检查点，删除被裁掉检查点的写入记录和不再被引用的blob，并重新计算线程占用。"""
+        size = 0
+        referenced: Set[tuple] = set()
+        for checkpoint_ns, checkpoints in self.storage.get(thread_id, {}).items():
+            ordered = sorted(checkpoints)
+            if self.max_checkpoints_per_thread and len(ordered) > self.max_checkpoints_per_thread:
+                for checkpoint_id in ordered[: len(ordered) - self.max_checkpoints_per_thread]:
+                    del checkpoints[checkpoint_id]
+                    key = (thread_id, checkpoint_ns, checkpoint_id)
+                    self.writes.pop(key, None)
+                    self._write_keys[thread_id].discard(key)
+            for saved_checkpoint, saved_metadata, _ in checkpoints.values():
+                size += len(saved_checkpoint[1]) + len(saved_metadata[1])
+                versions = self.serde.loads_typed(saved_checkpoint).get("channel_versions", {})
+                referenced.update((thread_id, checkpoint_ns, k, v) for k, v in versions.items())
+
+        # 增量所引用的上一版本同样需要保留（沿引用链直到完整列表）
+        pending = list(referenced)
+        while pending:
+            key = pending.pop()
+            base = delta_base(self.blobs[key][0]) if key in self.blobs else None
+            if base is not None:
+                base_key = (*key[:3], base)
+                if base_key not in referenced:
+                    referenced.add(base_key)
+                    pending.append(base_key)
+        for key in list(self._blob_keys[thread_id]):
+            if key not in referenced:
+                self.blobs.pop(key, None)
+                self._blob_keys[thread_id].discard(key)
+            elif key in self.blobs:
+                size += len(self.blobs[key][1])
+        for key in self._write_keys[thread_id]:
+            size += sum(len(v[2][1]) for v in self.writes.get(key, {}).values())
+        self._thread_bytes[thread_id] = size
+
+    def _enforce_limits(self, exclude: Optional[str] = None):
+        now = time.monotonic()
+        if self.idle_ttl_seconds and now - self._last_sweep >= self.sweep_interval_seconds:
+            self._last_sweep = now
+            for thread_id, last in list(self._last_access.items()):
+                if thread_id != exclude and now - last > self.idle_ttl_seconds:
+                    self.delete_thread(thread_id)
+
+        if self.max_bytes:
+            # 按最久未访问的顺序淘汰，当前正在写入的线程最后才考虑
+            for thread_id, _ in sorted(self._last_access.items(), key=lambda item: item[1]):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if thread_id != exclude:
+                    self.delete_thread(thread_id)
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    基于SQLite的检查点存储。
+
+    - 使用WAL日志模式与 synchronous=NORMAL，读写互不阻塞，适合单机多会话；
+    - 每次 put / put_writes 的所有语句在同一事务中通过 executemany 批量写入；
+    - 支持每线程保留最近 N 个检查点，以及按空闲时间淘汰整个线程。
+
+    Args:
+        path: 数据库文件路径，":memory:" 表示内存数据库（仅用于测试）。
+        max_checkpoints_per_thread: 每个线程（每个命名空间）保留的最近检查点数量，None表示不限制。
+        idle_ttl_seconds: 线程空闲超过该时间后被整体删除，None表示不删除。
+        sweep_interval_seconds: TTL扫描的最小间隔。
+        serde: 序列化器，默认 CompactSerializer。
+        max_delta_chain: 消息通道连续增量的最大数量，0 表示每次写入完整列表。
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        checkpoint_id TEXT NOT NULL,
+        parent_checkpoint_id TEXT,
+        type TEXT,
+        checkpoint BLOB,
+        metadata_type TEXT,
+        metadata BLOB,
+        channel_versions TEXT,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+    );
+    CREATE TABLE IF NOT EXISTS blobs (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        channel TEXT NOT NULL,
+        version TEXT NOT NULL,
+        type TEXT NOT NULL,
+        blob BLOB,
+        PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+    );
+    CREATE TABLE IF NOT EXISTS writes (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        checkpoint_id TEXT NOT NULL,
+        task_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        type TEXT,
+        blob BLOB,
+        task_path TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+    );
+    CREATE TABLE IF NOT EXISTS threads (
+        thread_id TEXT PRIMARY KEY,
+        last_access REAL NOT NULL
+    );
+    """
+
+    def __init__(
+        self,
+        path: str = "checkpoints.sqlite",
+        *,
+        max_checkpoints_per_thread: Optional[int] = 20,
+        idle_ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        sweep_interval_seconds: float = 300.0,
+        serde=None,
+        max_delta_chain: int = 8,
+    ):
+        super().__init__(serde=serde or CompactSerializer())
+        self.path = path
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._lock = threading.RLock()
+        self._last_sweep = 0.0
+        self._delta = _delta_encoder(self.serde, max_delta_chain)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self._SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # --- 内部工具 ---
+
+    def _transaction(self):
+        """返回一个在锁内执行 BEGIN/COMMIT 的上下文管理器。"""
+        saver = self
+
+        class _Tx:
+            def __enter__(self):
+                saver._lock.acquire()
+                saver.conn.execute("BEGIN IMMEDIATE")
+                return saver.conn
+
+            def __exit__(self, exc_type, exc, tb):
+                try:
+                    saver.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+                finally:
+                    saver._lock.release()
+
+        return _Tx()
+
+    def _touch(self, conn, thread_id: str):
+        conn.execute(
+            "INSERT INTO threads (thread_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access",
+            (thread_id, time.time()),
+        )
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        if not versions:
+            return {}
+        # 按主键只读取该检查点引用的版本，不扫描线程的全部历史blob
+        def load(channel, version):
+            row = self.conn.execute(
+                "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            return self.serde.loads_typed((row[0], row[1])) if row is not None and row[0] != "empty" else None
+
+        result = {}
+        for channel, version in versions.items():
+            value = load(channel, version)
+            if value is not None:
+                result[channel] = value
+        return resolve_deltas(result, load)
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> List[tuple]:
+        rows = self.conn.execute(
+            "SELECT task_id, channel, type, blob FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self.serde.loads_typed((type_, blob))) for task_id, channel, type_, blob in rows]
+
+    def _row_to_tuple(self, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint_b, metadata_type, metadata_b = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    _SELECT = (
+        "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+        "FROM checkpoints"
+    )
+
+    # --- BaseCheckpointSaver 接口 ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    self._SELECT + " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    self._SELECT + " WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._row_to_tuple(row)
+
+    def get_channel_value(self, config: RunnableConfig, channel: str, lazy_messages: bool = False) -> Any:
+        """只读取最新（或 config 指定的）检查点中 channel 的值；检查点或通道不存在时返回 None。"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+
+        def load_blob(channel, version):
+            return self.conn.execute(
+                "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            versions = self.serde.loads_typed((row[0], row[1])).get("channel_versions", {})
+            return _channel_value(self.serde, load_blob, channel, versions.get(channel), lazy_messages)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        query = self._SELECT + (" WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            results = []
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                item = self._row_to_tuple(row)
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(item)
+        return iter(results)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        c = _encode_deltas(self._delta, config, checkpoint, new_versions).copy()
+        values: Dict[str, Any] = c.pop("channel_values")  # type: ignore[misc]
+        blob_rows = []
+        for k, v in new_versions.items():
+            type_, blob = self.serde.dumps_typed(values[k]) if k in values else ("empty", b"")
+            blob_rows.append((thread_id, checkpoint_ns, k, v, type_, blob))
+        type_, checkpoint_b = self.serde.dumps_typed(c)
+        metadata_type, metadata_b = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blob_rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                    type_, checkpoint_b, metadata_type, metadata_b, json.dumps(c.get("channel_versions", {})),
+                ),
+            )
+            self._touch(conn, thread_id)
+            self._prune(conn, thread_id, checkpoint_ns)
+        self._maybe_sweep()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # 特殊通道（如错误、中断）使用负数下标并允许覆盖；普通写入已存在时保持不变，与 InMemorySaver 语义一致
+        replace_rows, insert_rows = [], []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, write_idx, channel, type_, blob, task_path)
+            (replace_rows if write_idx < 0 else insert_rows).append(row)
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", replace_rows)
+            conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", insert_rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._transaction() as conn:
+            for table in ("checkpoints", "blobs", "writes", "threads"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        if self._delta is not None:
+            self._delta.forget(thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return _next_version(current)
+
+    # --- 裁剪与淘汰 ---
+
+    def _prune(self, conn, thread_id: str, checkpoint_ns: str):
+        if not self.max_checkpoints_per_thread:
+            return
+        stale = conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.max_checkpoints_per_thread),
+        ).fetchall()
+        if not stale:
+            return
+        conn.executemany(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            [(thread_id, checkpoint_ns, cid) for (cid,) in stale],
+        )
+        conn.executemany(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            [(thread_id, checkpoint_ns, cid) for (cid,) in stale],
+        )
+        # 删除不再被任何保留检查点引用的blob
+        referenced = set()
+        for (versions,) in conn.execute(
+            "SELECT channel_versions FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ):
+            referenced.update((ch, str(ver)) for ch, ver in json.loads(versions or "{}").items())
+        existing = conn.execute(
+            "SELECT channel, version, type FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        # 增量所引用的上一版本同样需要保留（沿引用链直到完整列表）
+        bases = {(ch, ver): (ch, base) for ch, ver, type_ in existing if (base := delta_base(type_)) is not None}
+        pending = [key for key in referenced if key in bases]
+        while pending:
+            base_key = bases[pending.pop()]
+            if base_key not in referenced:
+                referenced.add(base_key)
+                if base_key in bases:
+                    pending.append(base_key)
+        conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            [(thread_id, checkpoint_ns, ch, ver) for ch, ver, _ in existing if (ch, ver) not in referenced],
+        )
+
+    def _maybe_sweep(self):
+        if not self.idle_ttl_seconds:
+            return
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval_seconds:
+            return
+        self._last_sweep = now
+        with self._lock:
+            expired = [
+                tid for (tid,) in self.conn.execute(
+                    "SELECT thread_id FROM threads WHERE last_access < ?", (now - self.idle_ttl_seconds,)
+                )
+            ]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+
+    # --- 异步接口：在线程池中执行，避免阻塞事件循环 ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def create_checkpointer(settings: Optional[Dict[str, Any]] = None) -> BaseCheckpointSaver:
+    """
+    检查点工厂函数：根据 ConfigManager.runtime_configs["checkpointer"] 创建检查点后端。
+    """
+    settings = dict(settings or {})
+    backend = settings.pop("backend", "memory").lower()
+    max_checkpoints = settings.get("max_checkpoints_per_thread")
+    idle_ttl = settings.get("idle_ttl_seconds")
+    serde_name = (settings.get("serde") or "compact").lower()
+    if serde_name == "compact":
+        serde = CompactSerializer(drop_metadata_keys=settings.get("drop_metadata_keys", ("logprobs",)))
+    elif serde_name == "default":
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+        serde = JsonPlusSerializer()
+    else:
+        raise ValueError(f"不支持的检查点序列化格式: {serde_name}")
+    max_delta_chain = settings.get("delta_max_chain", 8)
+
+    if backend == "memory":
+        max_memory_mb = settings.get("max_memory_mb")
+        return BoundedMemorySaver(
+            max_checkpoints_per_thread=max_checkpoints,
+            idle_ttl_seconds=idle_ttl,
+            max_bytes=int(max_memory_mb * 1024 * 1024) if max_memory_mb else None,
+            serde=serde,
+            max_delta_chain=max_delta_chain,
+        )
+    elif backend == "sqlite":
+        return SQLiteCheckpointSaver(
+            settings.get("path", "checkpoints.sqlite"),
+            max_checkpoints_per_thread=max_checkpoints,
+            idle_ttl_seconds=idle_ttl,
+            serde=serde,
+            max_delta_chain=max_delta_chain,
+        )
+    else:
+        raise ValueError(f"不支持的检查点后端: {backend}")
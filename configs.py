@@ -6,8 +6,14 @@
 """
 
 from typing import Dict, Any
+import json
 import os
 
+from dotenv import load_dotenv
+
+# 整个进程只在这里加载一次 .env：所有模块都通过 ConfigManager 读取配置，因此导入本模块即保证环境变量已就绪
+load_dotenv()
+
 class ConfigManager:
     """
     配置管理类，用于处理和切换不同大模型的配置。
@@ -24,18 +30,42 @@ class ConfigManager:
         #   "base_url": 对应模型的API基础URL。
         #   "thinking": (可选) 一个自定义字段，用于标记该模型是否支持特殊的"思考"或"推理"模式。
         #               您可以在 agent_workflow.py 中读取这个值来执行不同的逻辑。
+        #   "context_window": (可选) 该模型的上下文预算，字段含义见 context_manager.DEFAULT_CONTEXT_WINDOW。
+        #   "backends": (可选) 同一逻辑模型的多个后端列表，配置后由 llm_router.LLMRouter 在它们之间做延迟感知路由、
+        #               对冲请求与故障转移。每个后端可覆盖 provider/base_url/api_key/model_name，并可设置
+        #               "name"、"max_concurrency"（并发上限）、"rate_limit_per_second"（每秒请求数上限）。
+        #   "router": (可选) 覆盖 runtime_configs["llm_router"] 中的路由参数（对冲阈值、熔断等）。
+        #   "retry_policy": (可选) 覆盖 runtime_configs["retry"] 中的重试参数（退避、续写次数等）。
+        #   "tools": (可选) 该模型可用的工具名称列表，默认为 tools.DEFAULT_AGENT_TOOLS；工具在首次使用时才加载（见 tools/__init__.py）。
+        #   "execution_mode": (可选) 该模型的默认执行模式，"react" 或 "plan"（规划-并行执行），请求中指定时以请求为准。
+        #   "pricing": (可选) {"input_per_million": 单价, "output_per_million": 单价}，用于累计会话费用（见 quota.py）。
+        #   "budget": (可选) {"tokens": 上限, "cost": 上限}，覆盖 runtime_configs["quotas"] 中的会话预算默认值。
+        #   "tool_prefetch": (可选) 覆盖 runtime_configs["tool_prefetch"]，例如 {"enabled": True} 只为该模型开启工具预取。
+        #   "cascade": (可选) 模型级联（见 model_cascade.py）：{"small": {小模型配置}, 策略字段...}。每次调用先交给小模型，
+        #               低置信度、工具调用复杂或失败时升级到本模型；子Agent同样先交给小模型。小模型配置继承本配置中
+        #               未覆盖的字段，可设置自己的 "pricing"；策略字段覆盖 runtime_configs["model_cascade"]。
         self.model_configs = {
             "qwen3-coder-30b-a3b-instruct": {
                 "provider": "openai",
                 "display_name": "Qwen3-Coder30B",
                 "api_key": os.getenv("OPENAI_API_KEY"),  # 从环境变量读取
                 "base_url": os.getenv("OPENAI_API_BASE"),
+                "context_window": {
+                    "max_prompt_tokens": 24000,
+                    "summarize_trigger_tokens": 16000,
+                    "keep_recent_messages": 8,
+                    "tool_result_max_tokens": 1500,
+                },
             },
             "qwen-turbo": {
-                "provider": "qwen", # 您需要在 agent_workflow.py 的工厂函数中添加对 'qwen' 的支持
+                "provider": "qwen", # DashScope 的 OpenAI 兼容接口，见 models._create_chat_model
                 "display_name": "通义千问-Turbo",
-                "api_key": os.getenv("OPENAI_API_KEY", "sk-YOUR_QWEN_API_KEY"), # 从环境变量读取
+                "api_key": os.getenv("DASHSCOPE_API_KEY") or os.getenv("OPENAI_API_KEY"), # 从环境变量读取
                 "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",
+                "context_window": {
+                    "max_prompt_tokens": 100000,
+                    "summarize_trigger_tokens": 64000,
+                },
             },
             # --- 您可以在此添加更多模型配置 ---
             # "your-custom-model": {
@@ -44,6 +74,228 @@ class ConfigManager:
             #     "api_key": "...",
             #     "base_url": "...",
             # }
+            #
+            # 多后端路由示例：同一个模型部署在两个端点，主端点变慢或报错时自动对冲/切换
+            # "qwen-plus-ha": {
+            #     "provider": "qwen",
+            #     "display_name": "通义千问-Plus（多后端）",
+            #     "backends": [
+            #         {"name": "dashscope", "max_concurrency": 32, "rate_limit_per_second": 10},
+            #         {"name": "self-hosted", "provider": "openai", "base_url": "http://10.0.0.8:8000/v1",
+            #          "api_key": "EMPTY", "max_concurrency": 8},
+            #     ],
+            #     "router": {"hedge_after_seconds": 3.0},
+            # }
+            #
+            # 模型级联示例：简单回答、摘要与子任务由 qwen-turbo 处理，必要时升级到 qwen-plus
+            # "qwen-plus": {
+            #     "provider": "qwen",
+            #     "display_name": "通义千问-Plus（级联）",
+            #     "pricing": {"input_per_million": 0.8, "output_per_million": 2.0},
+            #     "cascade": {
+            #         "small": {"model_name": "qwen-turbo", "pricing": {"input_per_million": 0.3, "output_per_million": 0.6}},
+            #         "max_tool_calls": 1,
+            #         "large_tools": ["sub_agent_executor_tool"],
+            #     },
+            # }
+        }
+
+        # 运行时配置：与具体模型无关、在整个进程范围内生效的设置，按功能分组。
+        self.runtime_configs = {
+            # 工具并发执行的上限（见 tool_executor.py）
+            "concurrency": {
+                "max_tool_calls_per_turn": int(os.getenv("MAX_TOOL_CALLS_PER_TURN", "4")),
+                "max_tool_calls_per_process": int(os.getenv("MAX_TOOL_CALLS_PER_PROCESS", "16")),
+            },
+            # LLM HTTP连接池（见 models.get_http_clients），同一 base_url 的所有会话共享
+            "http_pool": {
+                "max_connections": int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100")),
+                "max_keepalive_connections": int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20")),
+                "keepalive_expiry": float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30")),
+                "timeout": float(os.getenv("HTTP_POOL_TIMEOUT", "120")),
+            },
+            # 搜索结果缓存（见 tools/search_cache.py）
+            #   "path": SQLite缓存文件，设为 None 则只使用内存
+            #   "semantic": 是否启用近似查询命中
+            #   "max_disk_entries" / "purge_interval_seconds": 磁盘条目数上限与过期清理的间隔
+            "search_cache": {
+                "enabled": os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true",
+                "ttl_seconds": float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+                "max_entries": int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2048")),
+                "path": os.getenv("SEARCH_CACHE_PATH", "search_cache.sqlite"),
+                "semantic": os.getenv("SEARCH_CACHE_SEMANTIC", "false").lower() == "true",
+                "similarity_threshold": float(os.getenv("SEARCH_CACHE_SIMILARITY", "0.92")),
+                "max_disk_entries": int(os.getenv("SEARCH_CACHE_MAX_DISK_ENTRIES", "20000")),
+                "purge_interval_seconds": float(os.getenv("SEARCH_CACHE_PURGE_INTERVAL", "300")),
+            },
+            # 上传文件存储（见 upload_store.py）：内容寻址、跨会话去重、配额与TTL回收
+            "upload_store": {
+                "root": os.getenv("UPLOAD_STORE_ROOT", "temp_uploads"),
+                "chunk_size_kb": int(os.getenv("UPLOAD_CHUNK_SIZE_KB", "1024")),
+                "max_file_mb": float(os.getenv("UPLOAD_MAX_FILE_MB", "50")),
+                "session_quota_mb": float(os.getenv("UPLOAD_SESSION_QUOTA_MB", "200")),
+                "total_quota_mb": float(os.getenv("UPLOAD_TOTAL_QUOTA_MB", "2048")),
+                "ttl_seconds": float(os.getenv("UPLOAD_TTL_SECONDS", str(7 * 24 * 3600))),
+                "gc_interval_seconds": float(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", "600")),
+            },
+            # 上传文档检索（见 tools/document_tools.py）：惰性切块、持久化索引、BM25 + 可选向量
+            "documents": {
+                "index_path": os.getenv("DOCUMENT_INDEX_PATH", "temp_uploads/doc_index.sqlite"),
+                "chunk_chars": int(os.getenv("DOCUMENT_CHUNK_CHARS", "1200")),
+                "chunk_overlap": int(os.getenv("DOCUMENT_CHUNK_OVERLAP", "150")),
+                "embeddings": os.getenv("DOCUMENT_EMBEDDINGS", "true").lower() == "true",
+                "embedding_weight": float(os.getenv("DOCUMENT_EMBEDDING_WEIGHT", "0.3")),
+                "cache_docs": int(os.getenv("DOCUMENT_CACHE_DOCS", "32")),
+                "max_top_k": int(os.getenv("DOCUMENT_MAX_TOP_K", "20")),
+                "max_read_chunks": int(os.getenv("DOCUMENT_MAX_READ_CHUNKS", "5")),
+            },
+            # 无界面服务模式（见 server.py）；设置 AGENT_SERVER_URL 后 Streamlit 界面改为该服务的瘦客户端
+            "server": {
+                "host": os.getenv("AGENT_SERVER_HOST", "127.0.0.1"),
+                "port": int(os.getenv("AGENT_SERVER_PORT", "8000")),
+                "url": os.getenv("AGENT_SERVER_URL"),
+                "workers": int(os.getenv("AGENT_SERVER_WORKERS", "8")),
+                "max_queue": int(os.getenv("AGENT_SERVER_MAX_QUEUE", "64")),
+                "max_pending_per_thread": int(os.getenv("AGENT_SERVER_MAX_PENDING_PER_THREAD", "2")),
+                "queue_timeout_seconds": float(os.getenv("AGENT_SERVER_QUEUE_TIMEOUT", "60")),
+                "stream_buffer": int(os.getenv("AGENT_SERVER_STREAM_BUFFER", "256")),
+                "stall_timeout_seconds": float(os.getenv("AGENT_SERVER_STALL_TIMEOUT", "30")),
+            },
+            # 配额与公平调度（见 quota.py），所有限额为 0 表示不限制
+            #   租户：服务模式请求中的 "tenant"（或 X-Tenant-Id 请求头），界面为浏览器会话，未指定时为 thread_id
+            #   "tenant_weights": 服务模式公平排队的租户权重，如 QUOTA_TENANT_WEIGHTS='{"team-a": 2}'
+            #   "thread_token_budget" / "thread_cost_budget": 每个会话累计用量上限，可被模型配置的 "budget" 覆盖，请求的 "budget" 只能收紧
+            "quotas": {
+                "enabled": os.getenv("QUOTA_ENABLED", "true").lower() == "true",
+                "tenant_turns_per_minute": float(os.getenv("QUOTA_TENANT_TURNS_PER_MINUTE", "0")),
+                "tenant_llm_tokens_per_minute": float(os.getenv("QUOTA_TENANT_LLM_TOKENS_PER_MINUTE", "0")),
+                "llm_tokens_per_minute": float(os.getenv("QUOTA_LLM_TOKENS_PER_MINUTE", "0")),
+                "upstream_calls_per_minute": {"search": float(os.getenv("QUOTA_SEARCH_CALLS_PER_MINUTE", "0"))},
+                "max_wait_seconds": float(os.getenv("QUOTA_MAX_WAIT", "30")),
+                "tenant_weights": json.loads(os.getenv("QUOTA_TENANT_WEIGHTS", "{}")),
+                "thread_token_budget": int(os.getenv("THREAD_TOKEN_BUDGET", "0")),
+                "thread_cost_budget": float(os.getenv("THREAD_COST_BUDGET", "0")),
+            },
+            # 会话恢复（见 session_index.py 与 message_store.load_history）
+            #   "index_path": 会话索引文件；对话内容本身保存在检查点中，进程重启后恢复需使用 sqlite 检查点后端
+            #   "history_window_turns": 恢复会话时从检查点加载、界面中保留的最近轮次数
+            #   "list_page_size": 侧边栏每页列出的历史会话数
+            "sessions": {
+                "index_path": os.getenv("SESSION_INDEX_PATH", "sessions.sqlite"),
+                "history_window_turns": int(os.getenv("SESSION_HISTORY_WINDOW", "10")),
+                "list_page_size": int(os.getenv("SESSION_LIST_PAGE_SIZE", "10")),
+                "title_chars": int(os.getenv("SESSION_TITLE_CHARS", "40")),
+            },
+            # 工具结果压缩（见 tool_compaction.py）：进入消息历史前去样板字段、限长、去重
+            "tool_compaction": {
+                "enabled": os.getenv("TOOL_COMPACTION_ENABLED", "true").lower() == "true",
+                "max_chars": int(os.getenv("TOOL_COMPACTION_MAX_CHARS", "4000")),
+                "max_items": int(os.getenv("TOOL_COMPACTION_MAX_ITEMS", "5")),
+                "item_max_chars": int(os.getenv("TOOL_COMPACTION_ITEM_MAX_CHARS", "800")),
+                "dedupe": os.getenv("TOOL_COMPACTION_DEDUPE", "true").lower() == "true",
+                "store_max_entries": int(os.getenv("TOOL_COMPACTION_STORE_MAX_ENTRIES", "2048")),
+                # 完整结果的 SQLite 文件路径；使用 sqlite 检查点后端时默认开启，使检查点中的引用在重启后仍可取回
+                "store_path": os.getenv(
+                    "TOOL_COMPACTION_STORE_PATH",
+                    "tool_payloads.sqlite" if os.getenv("CHECKPOINTER_BACKEND", "memory") == "sqlite" else "",
+                ),
+            },
+            # 规划-并行执行模式（见 planner.py）；每次请求可通过输入中的 "execution_mode" 选择 "react" 或 "plan"，
+            # 模型配置中的 "execution_mode" 字段可为该模型设置默认值
+            "planner": {
+                "default_execution_mode": os.getenv("AGENT_EXECUTION_MODE", "react"),
+                "max_steps": int(os.getenv("PLANNER_MAX_STEPS", "8")),
+                "max_result_chars": int(os.getenv("PLANNER_MAX_RESULT_CHARS", "2000")),
+            },
+            # 工具调用记账（见 tool_ledger.py）：会话内相同的工具调用在TTL内直接重放结果
+            #   "include": 只对这些工具记账（逗号分隔，不设置表示全部）；"exclude": 从不记账的工具
+            #   工具也可在自身的 metadata 中声明 {"memoize": False} 或 {"memoize_ttl_seconds": 秒数}
+            "tool_memo": {
+                "enabled": os.getenv("TOOL_MEMO_ENABLED", "true").lower() == "true",
+                "ttl_seconds": float(os.getenv("TOOL_MEMO_TTL", "600")),
+                "max_entries": int(os.getenv("TOOL_MEMO_MAX_ENTRIES", "128")),
+                "include": [t.strip() for t in os.environ["TOOL_MEMO_INCLUDE"].split(",") if t.strip()] if os.getenv("TOOL_MEMO_INCLUDE") else None,
+                "exclude": [t.strip() for t in os.getenv("TOOL_MEMO_EXCLUDE", "").split(",") if t.strip()],
+            },
+            # 工具预取（见 tool_prefetch.py）：模型仍在生成时就开始执行参数已完整的工具调用，与生成时间重叠；
+            # 默认关闭，"tools" 中只应列出幂等的工具（最终消息与流不一致时结果被丢弃）。模型配置中的 "tool_prefetch" 可覆盖
+            "tool_prefetch": {
+                "enabled": os.getenv("TOOL_PREFETCH_ENABLED", "false").lower() == "true",
+                "tools": [t.strip() for t in os.getenv("TOOL_PREFETCH_TOOLS", "tavily_search").split(",") if t.strip()],
+                "max_workers": int(os.getenv("TOOL_PREFETCH_MAX_WORKERS", "4")),
+                "max_age_seconds": float(os.getenv("TOOL_PREFETCH_MAX_AGE", "120")),
+            },
+            # Sub-Agent子系统（见 tools/sub_agent_tool.py）
+            "sub_agent": {
+                "cache_ttl_seconds": float(os.getenv("SUB_AGENT_CACHE_TTL", "3600")),
+                "cache_max_entries": int(os.getenv("SUB_AGENT_CACHE_MAX_ENTRIES", "512")),
+                "max_concurrency": int(os.getenv("SUB_AGENT_MAX_CONCURRENCY", "4")),
+                "stream": os.getenv("SUB_AGENT_STREAM", "true").lower() == "true",
+            },
+            # 多后端LLM路由的默认参数（见 llm_router.py），仅对配置了 "backends" 的模型生效
+            #   "hedge_after_seconds": 固定的对冲阈值；不设置时使用主后端的 p95 延迟
+            #   "failure_threshold" / "cooldown_seconds": 连续失败多少次后熔断、熔断多久
+            "llm_router": {
+                "hedge_after_seconds": float(os.environ["LLM_HEDGE_AFTER_SECONDS"]) if os.getenv("LLM_HEDGE_AFTER_SECONDS") else None,
+                "hedge_quantile": float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+                "max_attempts": int(os.getenv("LLM_ROUTER_MAX_ATTEMPTS", "3")),
+                "failure_threshold": int(os.getenv("LLM_ROUTER_FAILURE_THRESHOLD", "3")),
+                "cooldown_seconds": float(os.getenv("LLM_ROUTER_COOLDOWN", "30")),
+            },
+            # 模型级联的默认策略（见 model_cascade.py），仅对配置了 "cascade" 的模型生效，模型配置中的同名字段优先
+            #   "min_confidence": 文本回复置信度低于该值时升级到大模型
+            #   "max_tool_calls": 小模型一次最多可发起的工具调用数，超过时升级
+            #   "large_tools": 只交给大模型调用的工具
+            "model_cascade": {
+                "enabled": os.getenv("MODEL_CASCADE_ENABLED", "true").lower() == "true",
+                "min_confidence": float(os.getenv("MODEL_CASCADE_MIN_CONFIDENCE", "0.6")),
+                "max_tool_calls": int(os.getenv("MODEL_CASCADE_MAX_TOOL_CALLS", "2")),
+                "large_tools": [t.strip() for t in os.getenv("MODEL_CASCADE_LARGE_TOOLS", "").split(",") if t.strip()],
+                "max_prompt_chars": int(os.getenv("MODEL_CASCADE_MAX_PROMPT_CHARS", "0")),
+                "logprobs": os.getenv("MODEL_CASCADE_LOGPROBS", "false").lower() == "true",
+                "subagents": os.getenv("MODEL_CASCADE_SUBAGENTS", "true").lower() == "true",
+            },
+            # LLM调用的重试策略（见 retry_policy.py），可在模型配置的 "retry_policy" 字段中按模型覆盖
+            #   "base_delay" / "multiplier" / "max_delay": 带抖动的指数退避参数（秒）
+            #   "max_continuations": finish_reason 为 length 时最多续写的次数
+            "retry": {
+                "max_retries": int(os.getenv("LLM_MAX_RETRIES", "3")),
+                "base_delay": float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+                "multiplier": float(os.getenv("LLM_RETRY_MULTIPLIER", "2")),
+                "max_delay": float(os.getenv("LLM_RETRY_MAX_DELAY", "20")),
+                "jitter": os.getenv("LLM_RETRY_JITTER", "true").lower() == "true",
+                "max_continuations": int(os.getenv("LLM_MAX_CONTINUATIONS", "2")),
+                "respect_retry_after": os.getenv("LLM_RESPECT_RETRY_AFTER", "true").lower() == "true",
+                "max_retry_after": float(os.getenv("LLM_MAX_RETRY_AFTER", "60")),
+            },
+            # 运行指标与追踪（见 instrumentation.py）
+            #   "enabled": 关闭后所有埋点退化为空操作
+            #   "trace_path": 可选的JSONL追踪文件，每个span追加一行
+            #   "metrics_port": 可选的 Prometheus /metrics 端口，设置后在后台线程中启动HTTP端点
+            "instrumentation": {
+                "enabled": os.getenv("INSTRUMENTATION_ENABLED", "true").lower() == "true",
+                "max_spans": int(os.getenv("INSTRUMENTATION_MAX_SPANS", "2000")),
+                "trace_path": os.getenv("INSTRUMENTATION_TRACE_PATH") or None,
+                "metrics_port": int(os.getenv("METRICS_PORT", "0")) or None,
+            },
+            # 检查点后端（见 checkpointer.py）
+            #   "backend": "memory"（有界内存存储）或 "sqlite"（本地文件，重启后可恢复）
+            #   "max_checkpoints_per_thread": 每个线程保留的最近检查点数量
+            #   "idle_ttl_seconds": 线程空闲多久后被淘汰
+            #   "max_memory_mb": 内存后端的总容量上限
+            #   "serde": "compact"（紧凑编码，见 checkpoint_serde.py）或 "default"（langgraph 默认序列化器）
+            #   "delta_max_chain": 消息历史连续增量写入的最大数量，0 表示每次写入完整历史
+            #   "drop_metadata_keys": 写入检查点时从消息 response_metadata 中丢弃的字段
+            "checkpointer": {
+                "backend": os.getenv("CHECKPOINTER_BACKEND", "memory"),
+                "path": os.getenv("CHECKPOINTER_PATH", "checkpoints.sqlite"),
+                "max_checkpoints_per_thread": int(os.getenv("CHECKPOINTER_MAX_PER_THREAD", "20")),
+                "idle_ttl_seconds": float(os.getenv("CHECKPOINTER_IDLE_TTL", str(24 * 3600))),
+                "max_memory_mb": float(os.getenv("CHECKPOINTER_MAX_MEMORY_MB", "512")),
+                "serde": os.getenv("CHECKPOINTER_SERDE", "compact"),
+                "delta_max_chain": int(os.getenv("CHECKPOINTER_DELTA_MAX_CHAIN", "8")),
+                "drop_metadata_keys": [k.strip() for k in os.getenv("CHECKPOINTER_DROP_METADATA_KEYS", "logprobs").split(",") if k.strip()],
+            },
         }
 
         # 当前激活的模型名称，默认为配置列表中的第一个模型。
@@ -91,4 +343,10 @@ class ConfigManager:
         """
         获取当前激活的模型的技术名称。
         """
-        return self._current_model
\ No newline at end of file
+        return self._current_model
+
+    def get_runtime_config(self, section: str) -> Dict[str, Any]:
+        """
+        获取某一组运行时配置的副本（例如 "concurrency"）。
+        """
+        return dict(self.runtime_configs.get(section, {}))
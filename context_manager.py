@@ -0,0 +1,255 @@
+"""
+上下文窗口管理模块
+控制每次LLM调用的提示词规模，避免长对话中 prompt token 随轮数持续膨胀。
+
+三个层次的手段（按代价从低到高）：
+  1. 旧工具结果截断：不在最近窗口内的 ToolMessage 只保留开头部分；
+  2. 滚动摘要：历史超过阈值时，把较早的轮次增量地压缩进一段摘要（存入状态的 context_summary）；
+  3. 预算裁剪：若仍超出 max_prompt_tokens，则按完整轮次丢弃最早的消息。
+
+每条消息的token数按消息id缓存，同一条消息在后续每个ReAct步骤中不会被重复计数。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+# 默认的上下文预算，可在 ConfigManager.model_configs 的 "context_window" 字段中按模型覆盖
+DEFAULT_CONTEXT_WINDOW = {
+    "max_prompt_tokens": 24000,        # 发送给模型的提示词上限（不含输出）
+    "summarize_trigger_tokens": 16000, # 未摘要历史超过该值时触发滚动摘要
+    "keep_recent_messages": 8,         # 摘要与截断时始终原样保留的最近消息数
+    "tool_result_max_tokens": 1500,    # 最近窗口之外的工具结果最多保留的token数
+    "summary_max_tokens": 800,         # 摘要的目标长度
+}
+
+SUMMARY_PROMPT = """请将以下对话内容压缩为一段简洁的中文摘要，保留用户的目标、已确认的事实、工具检索得到的关键数据和尚未完成的事项。
+摘要不超过 {max_tokens} 个token，不要编造内容。
+
+已有摘要：
+{previous_summary}
+
+需要并入摘要的新对话：
+{transcript}
+"""
+
+
+# --- token计数 ---
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """懒加载 tiktoken 编码；不可用（未安装或无法下载词表）时返回 None 并退化为估算。"""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encoding = None
+        return _encoding
+
+
+def count_text_tokens(text: str) -> int:
+    """统计文本的token数。无 tiktoken 时按 CJK 字符每字1个token、其他字符每4个1个token估算。"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    text = str(content or "")
+    if isinstance(message, AIMessage) and message.tool_calls:
+        text += "".join(f"{tc['name']}{tc['args']}" for tc in message.tool_calls)
+    return text
+
+
+class TokenCounter:
+    """
+    带缓存的消息token计数器。
+    以 (消息id, 内容长度) 为键缓存结果，内容被替换（例如截断后的副本）时会重新计数。
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, message: BaseMessage) -> int:
+        # 每条消息固定约4个token的格式开销（角色、分隔符等）
+        if not message.id:
+            return count_text_tokens(_message_text(message)) + 4
+        key = (message.id, len(str(message.content)))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+        tokens = count_text_tokens(_message_text(message)) + 4
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = tokens
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_all(self, messages: Sequence[BaseMessage]) -> int:
+        return sum(self.count(m) for m in messages)
+
+
+token_counter = TokenCounter()
+
+
+# --- 上下文管理 ---
+
+class ContextWindowManager:
+    """
+    根据模型的上下文预算构造提示词，并决定何时需要滚动摘要。
+    本类不修改传入的消息对象，截断时返回新的消息副本。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, counter: TokenCounter = token_counter):
+        self.settings = {**DEFAULT_CONTEXT_WINDOW, **(settings or {})}
+        self.counter = counter
+
+    # --- 辅助方法 ---
+
+    @staticmethod
+    def messages_after_cutoff(messages: Sequence[BaseMessage], cutoff_id: Optional[str]) -> List[BaseMessage]:
+        """返回摘要截止点（含）之后的消息；截止点为空或已不存在时返回全部消息。"""
+        history = [m for m in messages if not isinstance(m, SystemMessage)]
+        if not cutoff_id:
+            return history
+        for i, message in enumerate(history):
+            if message.id == cutoff_id:
+                return history[i:]
+        return history
+
+    @staticmethod
+    def _turn_start(messages: Sequence[BaseMessage], index: int) -> int:
+        """把切分位置调整到一个 HumanMessage 上，保证工具调用与其结果不会被拆开。"""
+        for i in range(index, len(messages)):
+            if isinstance(messages[i], HumanMessage):
+                return i
+        return len(messages)
+
+    def _truncate_tool_message(self, message: ToolMessage) -> ToolMessage:
+        limit = self.settings["tool_result_max_tokens"]
+        if self.counter.count(message) <= limit:
+            return message
+        text = str(message.content)
+        # 按比例估算需要保留的字符数
+        keep_chars = max(200, int(len(text) * limit / max(self.counter.count(message), 1)))
+        elided = text[:keep_chars] + f"\n...[已省略 {len(text) - keep_chars} 个字符的旧工具结果]"
+        return message.model_copy(update={"content": elided})
+
+    # --- 公开接口 ---
+
+    def needs_summary(self, messages: Sequence[BaseMessage], cutoff_id: Optional[str]) -> bool:
+        recent = self.messages_after_cutoff(messages, cutoff_id)
+        if len(recent) <= self.settings["keep_recent_messages"]:
+            return False
+        return self.counter.count_all(recent) > self.settings["summarize_trigger_tokens"]
+
+    def split_for_summary(self, messages: Sequence[BaseMessage], cutoff_id: Optional[str]):
+        """
+        计算需要并入摘要的消息和新的截止点。
+
+        Returns:
+            (to_summarize, new_cutoff_id)；没有可摘要的完整轮次时返回 ([], cutoff_id)。
+        """
+        recent = self.messages_after_cutoff(messages, cutoff_id)
+        split = self._turn_start(recent, max(0, len(recent) - self.settings["keep_recent_messages"]))
+        if split == 0 or split >= len(recent):
+            # 最近窗口内只有一个（很长的）轮次，无法在轮次边界切分
+            return [], cutoff_id
+        return recent[:split], recent[split].id
+
+    def build_summary_prompt(self, previous_summary: Optional[str], to_summarize: Sequence[BaseMessage]) -> str:
+        lines = []
+        for message in to_summarize:
+            text = _message_text(self._truncate_tool_message(message) if isinstance(message, ToolMessage) else message)
+            lines.append(f"[{message.type}] {text}")
+        return SUMMARY_PROMPT.format(
+            max_tokens=self.settings["summary_max_tokens"],
+            previous_summary=previous_summary or "（无）",
+            transcript="\n".join(lines),
+        )
+
+    def build_prompt(
+        self,
+        system_message: SystemMessage,
+        messages: Sequence[BaseMessage],
+        summary: Optional[str] = None,
+        cutoff_id: Optional[str] = None,
+    ) -> List[BaseMessage]:
+        """构造本次调用实际发送的消息列表：系统提示词 + 摘要 + 截止点之后的历史（旧工具结果截断，必要时按轮次丢弃）。"""
+        recent = self.messages_after_cutoff(messages, cutoff_id)
+        keep = self.settings["keep_recent_messages"]
+        boundary = len(recent) - keep
+        history = [
+            self._truncate_tool_message(m) if i < boundary and isinstance(m, ToolMessage) else m
+            for i, m in enumerate(recent)
+        ]
+
+        prefix: List[BaseMessage] = [system_message]
+        if summary:
+            # 摘要只在滚动摘要发生时变化，以内容哈希作为id，使其token计数可以被缓存
+            summary_id = "context-summary-" + hashlib.sha1(summary.encode("utf-8")).hexdigest()[:16]
+            prefix.append(SystemMessage(content=f"# 早期对话摘要\n{summary}", id=summary_id))
+
+        budget = self.settings["max_prompt_tokens"] - self.counter.count_all(prefix)
+        start = 0
+        while True:
+            sent = self._expand_duplicates(history[start:], messages, boundary - start)
+            if self.counter.count_all(sent) <= budget or start >= len(history) - 1:
+                break
+            # 丢弃最早的一整个轮次
+            next_start = self._turn_start(history, start + 1)
+            if next_start >= len(history):
+                break
+            start = next_start
+        return prefix + sent
+
+    def _expand_duplicates(self, sent: List[BaseMessage], messages: Sequence[BaseMessage], boundary: int) -> List[BaseMessage]:
+        """
+        工具结果去重（见 tool_compaction.py）只保留对之前 tool_call_id 的引用。被引用的结果没有原样出现在本次发送的消息中
+        （已并入摘要、按轮次丢弃或作为旧结果被截断）时，把引用换回原结果的内容，引用不会指向模型看不到的结果。
+        boundary 之前的消息与旧工具结果一样截断。原结果保存在状态的消息中，不依赖进程内的 PayloadStore。
+        """
+        if not any(isinstance(m, ToolMessage) and m.additional_kwargs.get("duplicate_of") for m in sent):
+            return sent
+        originals = {
+            m.tool_call_id: m for m in messages
+            if isinstance(m, ToolMessage) and not m.additional_kwargs.get("duplicate_of")
+        }
+        intact = {m.tool_call_id for m in sent if isinstance(m, ToolMessage) and originals.get(m.tool_call_id) is m}
+        expanded = list(sent)
+        for i, message in enumerate(sent):
+            ref = message.additional_kwargs.get("duplicate_of") if isinstance(message, ToolMessage) else None
+            if ref is None or ref in intact or ref not in originals:
+                continue
+            copy = message.model_copy(update={"content": originals[ref].content})
+            expanded[i] = self._truncate_tool_message(copy) if i < boundary else copy
+        return expanded
+
+    def prompt_tokens(self, prompt: Sequence[BaseMessage]) -> int:
+        return self.counter.count_all(prompt)
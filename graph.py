@@ -1,91 +1,236 @@
-import json
+import logging
 import uuid
-from dotenv import load_dotenv
 from typing import cast
-# --- 加载环境变量 ---
-load_dotenv()
 
-from langchain_core.messages import ToolMessage, SystemMessage, HumanMessage, AIMessage
+import asyncio
+import time
+
+from langchain_core.messages import ToolMessage, SystemMessage, HumanMessage, AIMessage, RemoveMessage, message_chunk_to_message
 from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Send
+from langchain_core.runnables import RunnableLambda
 
 # --- 模板特定组件 ---
 from state import AgentState
-from prompts import AGENT_SYSTEM_PROMPT
+from prompts import SYNTHESIZE_PROMPT, render_agent_system_prompt, render_planner_system_prompt
 from configs import ConfigManager
 # 模板提供了示例工具，您可以按需导入或替换。
-from tools.web_search import tavily_tool
-from tools.sub_agent_tool import sub_agent_executor_tool
+from tools import DEFAULT_AGENT_TOOLS, get_tools
 from models import get_agent_model
+from tool_executor import ToolExecutor
+from tool_compaction import ToolResultCompactor
+from tool_ledger import ToolCallLedger
+from checkpointer import create_checkpointer
+from context_manager import ContextWindowManager
+from instrumentation import instrumentation
+from quota import budget_exceeded, effective_budget, get_quota_manager, tenant_of, usage_of
+from planner import (
+    DEFAULT_PLANNER_SETTINGS,
+    PLAN_TOOL,
+    PLAN_TOOL_NAME,
+    PlanError,
+    parse_plan,
+    ready_steps,
+    resolve_args,
+)
+from retry_policy import (
+    CONTINUE_PROMPT,
+    RETRY_FINISH_REASONS,
+    RetryPolicy,
+    is_retryable_error,
+    retry_after_from_error,
+)
 
+logger = logging.getLogger(__name__)
 
-# --- 常量定义：增强Agent的鲁棒性 ---
-MAX_EMPTY_RETRIES = 3      # 对于模型返回空内容的最多重试次数
 
-def route_after_llm_call(state: AgentState):
+def route_after_llm_call(state: AgentState, policy: RetryPolicy = None):
     """
     路由函数：在LLM调用后，根据其输出决定下一步走向。
-    这是ReAct循环的核心，包含了关键的异常处理逻辑。
+    这是ReAct循环的核心，包含了关键的异常处理逻辑（重试次数、续写次数由 policy 决定，见 retry_policy.py）。
     """
+    policy = policy or RetryPolicy()
     last_message = state["messages"][-1]
     finish_reason = state.get('finish_reason')
-    
-    print(f"--- 路由 --- 完成原因: '{finish_reason}'")
+    logger.debug("路由: 完成原因 %r", finish_reason)
 
-    # 1. 检查是否为需要续写的可恢复错误（如内容被截断）-->continue_generation
+    # 1. 内容被截断（length）：在不含工具调用时保留已生成的内容并续写 -->continue_generation
     is_empty_response = isinstance(last_message, AIMessage) and not last_message.tool_calls and not last_message.content
-    is_error_finish = finish_reason in ["length", "content_filter", "null"]
-            
-    # 2. 检查是否为空回复 -->discard_and_retry
+    if finish_reason == "length" and not is_empty_response:
+        continuable = isinstance(last_message, AIMessage) and not last_message.tool_calls and not last_message.invalid_tool_calls
+        if continuable:
+            if (state.get("continuation_count") or 0) < policy.max_continuations:
+                instrumentation.inc("agent_route_total", target="continue_generation")
+                return "continue_generation"
+            # 续写次数用尽：保留已有内容结束，而不是丢弃
+            logger.warning("已达到最大续写次数 (%d)，返回截断的内容", policy.max_continuations)
+            instrumentation.inc("agent_route_total", target="truncated_end")
+            return END
+
+    # 2. 空回复、内容过滤、可重试的调用异常，或无法续写的截断 -->discard_and_retry
+    is_error_finish = finish_reason in RETRY_FINISH_REASONS or finish_reason == "length"
     if is_error_finish or is_empty_response:
-        retry_count = state.get('retry_count')
-        if retry_count < MAX_EMPTY_RETRIES:
-            print(f"--- 路由 --- 检测到空回复，将进入重试流程。(第 {retry_count + 1} 次)")
+        retry_count = state.get('retry_count') or 0
+        reason = "empty" if is_empty_response else finish_reason
+        if retry_count < policy.max_retries:
+            logger.info("路由: 检测到空回复或异常结束(%s)，进入第 %d 次重试", reason, retry_count + 1)
+            instrumentation.inc("agent_retries_total", reason=reason)
+            instrumentation.inc("agent_route_total", target="discard_and_retry")
             return "discard_and_retry"
         else:
-            print(f">>> 已达到最大空回复重试次数 ({MAX_EMPTY_RETRIES})，流程终止。")
+            logger.warning("已达到最大重试次数 (%d)，流程终止", policy.max_retries)
+            instrumentation.inc("agent_route_total", target="give_up")
             return END
 
     # 3. 默认逻辑：若有工具调用，则执行工具；否则，流程结束。
     if last_message.tool_calls:
+        instrumentation.inc("agent_route_total", target="tools")
         return "tools"
-    
+
+    instrumentation.inc("agent_route_total", target="end")
     return END
 
 class AgentWorkflow:
     """
     管理Agent的工作流，包括计算图、LLM实例和工具集。
     """
-    def __init__(self, model_config: dict):
-        import langchain
-        langchain.debug = True
+    def __init__(self, model_config: dict, runtime_config: dict = None, checkpointer=None):
+        # 进程级运行时配置（并发上限、检查点后端等），由 create_agent_workflow 从 ConfigManager 读取
+        self.runtime_config = runtime_config or {}
+        # 可由外部传入共享的检查点实例（见 registry.py），未传入时按配置新建
+        self.checkpointer = checkpointer or create_checkpointer(self.runtime_config.get("checkpointer"))
         self.llm = get_agent_model(model_config)
+        # 上下文窗口管理：按模型的token预算裁剪历史并维护滚动摘要
+        self.context_manager = ContextWindowManager(model_config.get("context_window"))
+        # 重试策略：退避、限流等待与截断续写（见 retry_policy.py）
+        self.retry_policy = RetryPolicy(model_config.get("retry_policy"))
         
         # --- 工具定义 ---
-        self.tools = [
-            tavily_tool,
-            sub_agent_executor_tool,
-        ]
+        # 按名称从工具注册表加载（首次使用时才导入对应模块并构建工具）
+        self.tools = get_tools(model_config.get("tools") or DEFAULT_AGENT_TOOLS)
+        # 进程级限流与会话预算（见 quota.py）：模型上游按 model_name 限流，费用按模型配置中的 "pricing" 计算
+        self.quota = get_quota_manager(self.runtime_config.get("quotas"))
+        self.model_key = model_config.get("model_name") or "default"
+        self.pricing = model_config.get("pricing") or {}
+        self.default_budget = {**self.quota.default_budget(), **(model_config.get("budget") or {})}
         self.llm_with_tools = self.llm.bind_tools(self.tools)
-        self.tool_node = ToolNode(self.tools) # 使用LangGraph预置的ToolNode简化工具执行
+        # 并发执行同一条AIMessage中的多个工具调用（同时支持同步与异步执行）
+        concurrency = self.runtime_config.get("concurrency", {})
+        self.tool_node = ToolExecutor(
+            self.tools,
+            max_per_turn=model_config.get("max_tool_concurrency", concurrency.get("max_tool_calls_per_turn", 4)),
+            max_per_process=concurrency.get("max_tool_calls_per_process", 16),
+            # 工具结果进入消息历史前先压缩，完整结果保存在进程内（见 tool_compaction.py）
+            result_processor=ToolResultCompactor(self.runtime_config.get("tool_compaction")),
+            # 会话内相同的工具调用直接重放记录的结果（见 tool_ledger.py）
+            ledger=ToolCallLedger(
+                self.runtime_config.get("tool_memo"),
+                tool_metadata={t.name: t.metadata for t in self.tools},
+            ),
+            # 推测执行：模型仍在生成时就开始执行参数已完整的工具调用（默认关闭，见 tool_prefetch.py）
+            prefetch_settings={**(self.runtime_config.get("tool_prefetch") or {}), **(model_config.get("tool_prefetch") or {})},
+            quota=self.quota,
+            # 子Agent等工具按本工作流的模型配置选择模型、限流键与单价（见 tools/sub_agent_tool.py）
+            tool_configurable={"model_config": model_config},
+        )
         # --- 工具定义结束 ---
 
+        # 规划-并行执行模式（见 planner.py）：规划器只绑定 submit_plan，汇总节点使用不绑定工具的模型
+        self.planner_settings = {**DEFAULT_PLANNER_SETTINGS, **(self.runtime_config.get("planner") or {})}
+        self.default_execution_mode = model_config.get("execution_mode") or self.planner_settings["default_execution_mode"]
+        self.llm_planner = self.llm.bind_tools([PLAN_TOOL])
+        self.tool_catalog = [{"name": t.name, "description": t.description, "args": t.args} for t in self.tools]
+
         self.graph = self._create_graph()
 
-    def _discard_and_retry(self, state: AgentState):
+    def _route_after_llm_call(self, state: AgentState):
+        route = route_after_llm_call(state, self.retry_policy)
+        if route != END and self._budget_reason(state):
+            # 会话预算用尽：不再执行工具、重试或续写，由 budget_exhausted 节点正常结束本轮
+            instrumentation.inc("agent_route_total", target="budget_exhausted")
+            return "budget_exhausted"
+        return route
+
+    # --- 配额与会话预算（见 quota.py） ---
+
+    def _budget_reason(self, state: AgentState):
+        # 请求输入中的 budget 只能收紧配置的预算
+        return budget_exceeded(state.get("usage"), effective_budget(self.default_budget, state.get("budget")))
+
+    def _usage(self, response: AIMessage) -> dict:
+        """本次调用的用量，合并进 AgentState.usage（按会话累计）。"""
+        return usage_of(response, self.pricing)
+
+    def _invoke_llm(self, llm, messages: list, config=None) -> AIMessage:
+        """调用模型：先等待租户与模型上游的 token 额度，结束后按实际用量扣除。"""
+        tenant = tenant_of(config)
+        self.quota.acquire_llm(tenant, self.model_key)
+        response = cast(AIMessage, llm.invoke(messages))
+        self.quota.record_llm(tenant, self.model_key, (response.usage_metadata or {}).get("total_tokens", 0))
+        return response
+
+    async def _ainvoke_llm(self, llm, messages: list, config=None) -> AIMessage:
+        """调用模型的异步版本。"""
+        tenant = tenant_of(config)
+        await self.quota.aacquire_llm(tenant, self.model_key)
+        response = cast(AIMessage, await llm.ainvoke(messages))
+        self.quota.record_llm(tenant, self.model_key, (response.usage_metadata or {}).get("total_tokens", 0))
+        return response
+
+    def _budget_exhausted(self, state: AgentState):
         """
-        丢弃重试节点：处理LLM返回空AIMessage的情况；此节点会移除上一条空消息，并增加重试计数器。
+        预算用尽节点：为尚未执行的工具调用补上"未执行"的结果（保持历史合法），并追加一条说明后结束本轮。
+        之后该会话的每一轮都会直接进入本节点（请求输入中的 "budget" 只能收紧预算，不能调高）。
         """
-        retry_count = state.get('retry_count', 0) + 1
-         
-        messages = list(state['messages'])
-        messages.pop()# 移除上一条失败的空消息，这是打破无限循环的关键
+        reason = self._budget_reason(state) or "token"
+        notice = f"本会话的{reason}预算已用尽，未继续执行。如需继续，请开启新会话。"
+        messages = []
+        last_message = state["messages"][-1] if state["messages"] else None
+        if isinstance(last_message, AIMessage):
+            messages.extend(
+                ToolMessage(content=notice, name=call["name"], tool_call_id=call["id"], status="error")
+                for call in last_message.tool_calls
+            )
+        messages.append(AIMessage(content=notice, id=str(uuid.uuid4())))
+        instrumentation.inc("agent_budget_exhausted_total", reason=reason)
+        return {"messages": messages, "finish_reason": "budget_exhausted"}
 
-        return {
-            "messages": messages,
-            "retry_count": retry_count
+    def _retry_update(self, state: AgentState):
+        """计算本次重试的退避时间，并生成移除失败消息、增加重试计数器的状态更新。"""
+        retry_count = state.get('retry_count') or 0
+        delay = self.retry_policy.delay(retry_count, state.get("retry_after"))
+        instrumentation.observe("agent_retry_backoff_seconds", delay)
+        update = {
+            # 只删除上一条失败的消息（按id），这是打破无限循环的关键；不再复制整个消息列表
+            "messages": [RemoveMessage(id=state["messages"][-1].id)],
+            "retry_count": retry_count + 1,
+            "retry_after": None,
         }
+        return delay, update
+
+    def _discard_and_retry(self, state: AgentState):
+        """
+        丢弃重试节点：处理LLM返回空AIMessage、内容被过滤或调用失败的情况；
+        按重试策略等待（带抖动的指数退避，限流时遵循响应头），然后移除上一条失败消息并增加重试计数器。
+        """
+        delay, update = self._retry_update(state)
+        if delay > 0:
+            time.sleep(delay)
+        return update
+
+    async def _adiscard_and_retry(self, state: AgentState):
+        """丢弃重试节点的异步版本，退避期间不阻塞事件循环。"""
+        delay, update = self._retry_update(state)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return update
+
+    def _continue_generation(self, state: AgentState):
+        """
+        续写节点：上一条回复因 length 被截断。保留已生成的内容，下一次 agent 调用会要求模型从中断处继续，
+        并把新内容合并到同一条消息中（见 _merge_continuation）。
+        """
+        return {"continuation_count": (state.get("continuation_count") or 0) + 1}
 
     def _create_graph(self) -> StateGraph:
         """
@@ -94,80 +239,432 @@ class AgentWorkflow:
         graph_builder = StateGraph(AgentState)
         
         # 注册所有节点
-        graph_builder.add_node("agent", self._call_model)
-        graph_builder.add_node("tools", self.tool_node)
-        graph_builder.add_node("discard_and_retry", self._discard_and_retry)
+        # agent/tools 节点同时提供同步与异步实现：invoke/stream 走同步路径，ainvoke/astream 走异步路径；
+        # 每个节点都经过 instrumentation.wrap_node 包装以记录耗时（关闭指标时为原函数）
+        def node(name, func, afunc=None):
+            wrap = instrumentation.wrap_node
+            if afunc is None:
+                return RunnableLambda(wrap(name, func), name=name)
+            return RunnableLambda(wrap(name, func), afunc=wrap(name, afunc), name=name)
+
+        graph_builder.add_node("agent", node("agent", self._call_model, self._acall_model))
+        graph_builder.add_node("tools", node("tools", self.tool_node.execute, self.tool_node.aexecute))
+        graph_builder.add_node("discard_and_retry", node("discard_and_retry", self._discard_and_retry, self._adiscard_and_retry))
+        graph_builder.add_node("continue_generation", node("continue_generation", self._continue_generation))
+        graph_builder.add_node("manage_context", node("manage_context", self._manage_context, self._amanage_context))
+        # 规划-并行执行模式的节点：planner 生成步骤DAG，execute_step 经 Send 并行执行，join 汇合每一波，synthesize 汇总答复
+        graph_builder.add_node("planner", node("planner", self._plan, self._aplan))
+        graph_builder.add_node("execute_step", node("execute_step", self._execute_step, self._aexecute_step))
+        graph_builder.add_node("join", node("join", self._join))
+        graph_builder.add_node("synthesize", node("synthesize", self._synthesize, self._asynthesize))
+        graph_builder.add_node("budget_exhausted", node("budget_exhausted", self._budget_exhausted))
         
-        # 设置入口点
-        graph_builder.add_edge(START, "agent")
+        # 设置入口点：每次调用LLM前先检查上下文预算，再按本轮的 execution_mode 进入 ReAct 循环或规划器
+        graph_builder.add_edge(START, "manage_context")
+        graph_builder.add_conditional_edges(
+            "manage_context", self._route_execution_mode, {"agent": "agent", "planner": "planner", "budget_exhausted": "budget_exhausted"}
+        )
         
         # 设置核心的条件路由
         graph_builder.add_conditional_edges(
             "agent",
-            route_after_llm_call,
+            self._route_after_llm_call,
             {
                 "tools": "tools",
                 "discard_and_retry": "discard_and_retry",
+                "continue_generation": "continue_generation",
+                "budget_exhausted": "budget_exhausted",
                 END: END
             }
         )
         
         # 添加常规边，将工具执行和异常处理节点的输出导回Agent节点
-        graph_builder.add_edge("tools", "agent")
+        graph_builder.add_edge("tools", "manage_context")
         graph_builder.add_edge("discard_and_retry", "agent")
+        graph_builder.add_edge("continue_generation", "agent")
+        graph_builder.add_edge("budget_exhausted", END)
+
+        # 规划-并行执行：规划失败时回退到 agent；规划器直接回答时与 agent 使用相同的路由（重试、续写）
+        llm_routes = ["tools", "discard_and_retry", "continue_generation", "budget_exhausted", END]
+        graph_builder.add_conditional_edges("planner", self._route_after_plan, ["execute_step", "synthesize", "agent", *llm_routes])
+        graph_builder.add_edge("execute_step", "join")
+        graph_builder.add_conditional_edges("join", self._dispatch_steps, ["execute_step", "synthesize"])
+        graph_builder.add_conditional_edges("synthesize", self._route_after_llm_call, llm_routes)
         
         # 编译计算图，并设置检查点以实现持久化
-        # MemorySaver是简单的内存检查点，适用于开发和测试。
-        return graph_builder.compile(checkpointer=MemorySaver())
+        # 检查点后端由 ConfigManager.runtime_configs["checkpointer"] 决定（有界内存或SQLite文件），见 checkpointer.py
+        return graph_builder.compile(checkpointer=self.checkpointer)
     
-    def _call_model(self, state: AgentState):
+    def _prepare_messages(self, state: AgentState, system_message: SystemMessage = None) -> list:
         """
-        核心Agent节点：调用LLM，并处理动态提示词的注入。
+        构造发送给LLM的消息列表：注入动态系统提示词（默认为主Agent的提示词），并按上下文预算加入摘要、截断旧工具结果。
         """
-        messages = state["messages"]
-            
         # --- 动态提示词注入 ---
-        uploaded_file_paths_content = state.get("uploaded_file_paths")
-        dynamic_system_prompt = AGENT_SYSTEM_PROMPT.replace(
-            "{{uploaded_file_paths}}",
-            f"```json\n{json.dumps(uploaded_file_paths_content, indent=2, ensure_ascii=False)}\n```"
-        )
-        
-        current_messages = list(messages)
-        if current_messages and current_messages[0].type == "system":
-            current_messages[0].content = dynamic_system_prompt
-        else:
-            current_messages.insert(0, SystemMessage(content=dynamic_system_prompt))
+        # 渲染结果按输入哈希缓存，系统消息在各步骤之间逐字节稳定，便于服务端前缀缓存命中；
+        # 状态中的历史消息不会被复制或修改。
+        if system_message is None:
+            system_message = render_agent_system_prompt(state.get("uploaded_file_paths"))
         # --- 动态提示词注入结束 ---
 
+        prompt = self.context_manager.build_prompt(
+            system_message,
+            state["messages"],
+            summary=state.get("context_summary"),
+            cutoff_id=state.get("context_cutoff_id"),
+        )
+        if self._partial_message(state) is not None:
+            # 续写：历史最后是被截断的回复，追加一条指令让模型从中断处继续（不写入状态）
+            prompt.append(HumanMessage(content=CONTINUE_PROMPT))
+        return prompt
+
+    def _summary_request(self, state: AgentState):
+        """判断是否需要滚动摘要；需要时返回 (摘要提示词, 新截止点)，否则返回 None。"""
+        messages = state["messages"]
+        cutoff_id = state.get("context_cutoff_id")
+        if not self.context_manager.needs_summary(messages, cutoff_id):
+            return None
+        to_summarize, new_cutoff_id = self.context_manager.split_for_summary(messages, cutoff_id)
+        if not to_summarize:
+            return None
+        prompt = self.context_manager.build_summary_prompt(state.get("context_summary"), to_summarize)
+        return prompt, new_cutoff_id
+
+    @staticmethod
+    def _reset_counters(state: AgentState) -> dict:
+        """新的用户输入或工具结果之后，上一次调用的重试/续写计数不再适用（例如上一轮以放弃重试结束）。"""
+        if state.get("retry_count") or state.get("continuation_count"):
+            return {"retry_count": 0, "continuation_count": 0, "retry_after": None}
+        return {}
+
+    def _manage_context(self, state: AgentState, config=None):
+        """
+        上下文管理节点：未摘要的历史超过阈值时，把较早的轮次增量并入摘要并前移截止点。
+        原始消息仍保留在状态中（供UI展示），只是不再发送给模型。
+        摘要调用与 agent 节点一样经过限流，用量计入会话预算。
+        """
+        update = self._reset_counters(state)
+        request = self._summary_request(state)
+        if request is None:
+            return update
+        prompt, new_cutoff_id = request
+        try:
+            response = self._invoke_llm(self.llm, [HumanMessage(content=prompt)], config)
+        except Exception as e:
+            logger.warning("上下文摘要失败，本轮保持原样: %s", e)
+            return update
+        return {**update, "context_summary": response.content, "context_cutoff_id": new_cutoff_id, "usage": self._usage(response)}
+
+    async def _amanage_context(self, state: AgentState, config=None):
+        """上下文管理节点的异步版本。"""
+        update = self._reset_counters(state)
+        request = self._summary_request(state)
+        if request is None:
+            return update
+        prompt, new_cutoff_id = request
         try:
-            # 调用绑定了工具的LLM
-            response = cast(AIMessage, self.llm_with_tools.invoke(current_messages))
-            finish_reason = response.response_metadata.get("finish_reason", "unknown")
+            response = await self._ainvoke_llm(self.llm, [HumanMessage(content=prompt)], config)
         except Exception as e:
-            print(f">>> LLM调用异常: {e}")
-            return {
-                "messages": [AIMessage(content="LLM调用异常："+str(e))], # 返回异常信息
-                "finish_reason": "error"
-            }
-            
-        result = {
+            logger.warning("上下文摘要失败，本轮保持原样: %s", e)
+            return update
+        return {**update, "context_summary": response.content, "context_cutoff_id": new_cutoff_id, "usage": self._usage(response)}
+
+    @staticmethod
+    def _partial_message(state: AgentState):
+        """续写模式下返回被截断的回复：只有 continue_generation 节点之后，历史的最后一条才会是AIMessage。"""
+        last_message = state["messages"][-1] if state["messages"] else None
+        if isinstance(last_message, AIMessage) and state.get("continuation_count"):
+            return last_message
+        return None
+
+    @staticmethod
+    def _merge_continuation(partial: AIMessage, response: AIMessage) -> AIMessage:
+        """把续写内容拼接到被截断的回复上；沿用原消息id，add_messages 会原地替换该消息。"""
+        return AIMessage(
+            content=str(partial.content or "") + str(response.content or ""),
+            tool_calls=response.tool_calls,
+            additional_kwargs=response.additional_kwargs,
+            response_metadata=response.response_metadata,
+            usage_metadata=response.usage_metadata,
+            id=partial.id,
+        )
+
+    def _handle_response(self, response: AIMessage, state: AgentState):
+        finish_reason = response.response_metadata.get("finish_reason", "unknown")
+        partial = self._partial_message(state)
+        if partial is not None:
+            response = self._merge_continuation(partial, response)
+        update = {
             "messages": [response],
             "finish_reason": finish_reason,
+            "usage": self._usage(response),
+        }
+        if finish_reason != "length" and (response.content or response.tool_calls):
+            # 得到正常的回复后重置计数器，避免计数在多轮对话之间累积
+            update.update(retry_count=0, continuation_count=0, retry_after=None)
+        return update
+
+    @staticmethod
+    def _handle_error(e: Exception):
+        retryable = is_retryable_error(e)
+        logger.error("LLM调用异常%s: %s", "（可重试）" if retryable else "", e)
+        return {
+            "messages": [AIMessage(content="LLM调用异常："+str(e), id=str(uuid.uuid4()))], # 返回异常信息
+            # 超时、限流、5xx 等错误交给重试节点处理，并记录服务端建议的等待时间
+            "finish_reason": "retryable_error" if retryable else "error",
+            "retry_after": retry_after_from_error(e) if retryable else None,
         }
-            
-        return result
+
+    def _call_model(self, state: AgentState, config=None):
+        """
+        核心Agent节点：调用LLM，并处理动态提示词的注入。
+        模型以流式模式创建，计算图以 stream_mode="messages" 运行时，此处产生的token会被实时转发（见 streaming.py）。
+        """
+        current_messages = self._prepare_messages(state)
+        if self.tool_node.prefetcher is not None:
+            return self._call_model_with_prefetch(state, current_messages, config)
+        try:
+            # 调用绑定了工具的LLM
+            response = self._invoke_llm(self.llm_with_tools, current_messages, config)
+        except Exception as e:
+            return self._handle_error(e)
+        return self._handle_response(response, state)
+
+    async def _acall_model(self, state: AgentState, config=None):
+        """
+        核心Agent节点的异步版本，供 ainvoke/astream 使用。
+        """
+        current_messages = self._prepare_messages(state)
+        if self.tool_node.prefetcher is not None:
+            return await self._acall_model_with_prefetch(state, current_messages, config)
+        try:
+            response = await self._ainvoke_llm(self.llm_with_tools, current_messages, config)
+        except Exception as e:
+            return self._handle_error(e)
+        return self._handle_response(response, state)
+
+    # --- 工具预取（见 tool_prefetch.py） ---
+
+    def _settle_prefetch(self, tracker, update: dict) -> dict:
+        """只有会路由到 tools 节点的回复才保留预取，出错、需要重试或续写时全部丢弃。"""
+        response = update["messages"][-1]
+        finish_reason = update.get("finish_reason")
+        keep = finish_reason not in (*RETRY_FINISH_REASONS, "length", "error")
+        tracker.settle(response.tool_calls if keep else None)
+        return update
+
+    def _call_model_with_prefetch(self, state: AgentState, current_messages: list, config=None):
+        """以流式方式调用模型，工具调用参数一旦完整就开始预取；token 仍经回调转发给 stream_mode="messages"。"""
+        tracker = self.tool_node.prefetcher.track(state.get("tool_ledger"), config)
+        tenant = tenant_of(config)
+        try:
+            self.quota.acquire_llm(tenant, self.model_key)
+            response = None
+            for chunk in self.llm_with_tools.stream(current_messages):
+                response = chunk if response is None else response + chunk
+                tracker.feed(chunk)
+            response = message_chunk_to_message(response)
+            self.quota.record_llm(tenant, self.model_key, (response.usage_metadata or {}).get("total_tokens", 0))
+            update = self._handle_response(response, state)
+        except Exception as e:
+            update = self._handle_error(e)
+        return self._settle_prefetch(tracker, update)
+
+    async def _acall_model_with_prefetch(self, state: AgentState, current_messages: list, config=None):
+        """预取模式的异步版本。"""
+        tracker = self.tool_node.prefetcher.track(state.get("tool_ledger"), config)
+        tenant = tenant_of(config)
+        try:
+            await self.quota.aacquire_llm(tenant, self.model_key)
+            response = None
+            async for chunk in self.llm_with_tools.astream(current_messages):
+                response = chunk if response is None else response + chunk
+                tracker.feed(chunk)
+            response = message_chunk_to_message(response)
+            self.quota.record_llm(tenant, self.model_key, (response.usage_metadata or {}).get("total_tokens", 0))
+            update = self._handle_response(response, state)
+        except Exception as e:
+            update = self._handle_error(e)
+        return self._settle_prefetch(tracker, update)
+
+    # --- 规划-并行执行模式 ---
+
+    def _route_execution_mode(self, state: AgentState):
+        """入口路由：会话预算已用尽时直接结束；plan 模式下新的用户输入先交给规划器；工具结果、重试之后仍走 ReAct 循环。"""
+        if self._budget_reason(state):
+            instrumentation.inc("agent_route_total", target="budget_exhausted")
+            return "budget_exhausted"
+        mode = state.get("execution_mode") or self.default_execution_mode
+        if mode == "plan" and isinstance(state["messages"][-1], HumanMessage):
+            instrumentation.inc("agent_route_total", target="planner")
+            return "planner"
+        return "agent"
+
+    def _plan_update(self, response: AIMessage, state: AgentState):
+        """
+        把规划器的回复转换为状态更新：submit_plan 的参数被校验为步骤DAG，并改写成一条以各步骤为工具调用的AIMessage，
+        使后续的 ToolMessage 与之配对，历史在之后的 ReAct 轮次中依然合法。
+        """
+        plan_call = next((tc for tc in response.tool_calls if tc["name"] == PLAN_TOOL_NAME), None)
+        if plan_call is None:
+            # 不需要工具：规划器直接给出了答复（空回复、截断等由 route_after_llm_call 按 ReAct 的规则处理）
+            return {**self._handle_response(response, state), "plan": []}
+        try:
+            plan = parse_plan(plan_call["args"], self.tool_node.tools_by_name, self.planner_settings["max_steps"])
+        except PlanError as e:
+            logger.warning("计划不合法，回退到ReAct循环: %s", e)
+            instrumentation.inc("agent_plans_total", status="invalid")
+            return {"plan": [], "usage": self._usage(response)}
+
+        prefix = f"plan_{uuid.uuid4().hex[:8]}"
+        for step in plan:
+            step["call_id"] = f"{prefix}_{step['id']}"
+        instrumentation.inc("agent_plans_total", status="ok")
+        instrumentation.inc("agent_plan_steps_total", len(plan))
+        message = AIMessage(
+            content=response.content,
+            tool_calls=[{"name": step["tool"], "args": step["args"], "id": step["call_id"]} for step in plan],
+            additional_kwargs={k: v for k, v in response.additional_kwargs.items() if k != "tool_calls"},
+            response_metadata=response.response_metadata,
+            usage_metadata=response.usage_metadata,
+            id=response.id,
+        )
+        return {"messages": [message], "plan": plan, "step_results": None, "finish_reason": "tool_calls", "usage": self._usage(response)}
+
+    def _planner_prompt(self, state: AgentState) -> list:
+        return self._prepare_messages(state, render_planner_system_prompt(self.tool_catalog, state.get("uploaded_file_paths")))
+
+    def _plan(self, state: AgentState, config=None):
+        """规划节点：让模型一次性提交全部工具步骤（或在不需要工具时直接回答）。"""
+        try:
+            response = self._invoke_llm(self.llm_planner, self._planner_prompt(state), config)
+        except Exception as e:
+            return self._handle_error(e)
+        return self._plan_update(response, state)
+
+    async def _aplan(self, state: AgentState, config=None):
+        """规划节点的异步版本。"""
+        try:
+            response = await self._ainvoke_llm(self.llm_planner, self._planner_prompt(state), config)
+        except Exception as e:
+            return self._handle_error(e)
+        return self._plan_update(response, state)
+
+    def _route_after_plan(self, state: AgentState):
+        last_message = state["messages"][-1]
+        if isinstance(last_message, AIMessage) and last_message.tool_calls and state.get("plan"):
+            if self._budget_reason(state):
+                instrumentation.inc("agent_route_total", target="budget_exhausted")
+                return "budget_exhausted"
+            return self._dispatch_steps(state)
+        if isinstance(last_message, AIMessage):
+            return self._route_after_llm_call(state)
+        instrumentation.inc("agent_route_total", target="agent")
+        return "agent"
+
+    def _dispatch_steps(self, state: AgentState):
+        """把依赖已满足的步骤通过 Send 并行分发给 execute_step；全部完成后进入 synthesize。"""
+        results = state.get("step_results") or {}
+        ready = ready_steps(state.get("plan") or [], results)
+        if not ready:
+            instrumentation.inc("agent_route_total", target="synthesize")
+            return "synthesize"
+        instrumentation.inc("agent_route_total", target="execute_step")
+        # Send 的负载会写入检查点，因此只携带解析好参数的调用及其命中的记账记录，不携带消息历史
+        sends = []
+        for step in ready:
+            call = self._step_call(step, results)
+            sends.append(Send("execute_step", {"step": step, "call": call, "tool_ledger": self._ledger_entry(state, call)}))
+        return sends
+
+    def _step_call(self, step: dict, results: dict) -> dict:
+        args = resolve_args(step, results, self.planner_settings["max_result_chars"])
+        return {"name": step["tool"], "args": args, "id": step["call_id"]}
+
+    def _ledger_entry(self, state: AgentState, call: dict) -> dict:
+        """该调用在工具记账中的有效记录（{记账键: 记录}），没有时为空。"""
+        if self.tool_node.ledger is None:
+            return {}
+        found = self.tool_node.ledger.lookup(state.get("tool_ledger"), call)
+        return dict([found]) if found else {}
+
+    @staticmethod
+    def _step_state(payload: dict) -> dict:
+        return {"messages": [AIMessage(content="", tool_calls=[payload["call"]])], "tool_ledger": payload.get("tool_ledger")}
+
+    @staticmethod
+    def _step_update(step: dict, update: dict) -> dict:
+        messages = update["messages"]
+        return {**update, "step_results": {step["id"]: messages[0].content if messages else ""}}
+
+    def _execute_step(self, payload: dict, config=None):
+        """执行计划中的一个步骤（经由 ToolExecutor，沿用进程级并发上限、结果压缩、工具记账与指标）。"""
+        update = self.tool_node.execute(self._step_state(payload), config)
+        return self._step_update(payload["step"], update)
+
+    async def _aexecute_step(self, payload: dict, config=None):
+        """执行步骤的异步版本。"""
+        update = await self.tool_node.aexecute(self._step_state(payload), config)
+        return self._step_update(payload["step"], update)
+
+    @staticmethod
+    def _join(state: AgentState):
+        """汇合节点：同一波的所有 execute_step 完成后才会执行，随后由 _dispatch_steps 决定下一波或进入汇总。"""
+        return {}
+
+    def _synthesis_prompt(self, state: AgentState) -> list:
+        return self._prepare_messages(state) + [HumanMessage(content=SYNTHESIZE_PROMPT)]
+
+    def _synthesize(self, state: AgentState, config=None):
+        """汇总节点：基于各步骤结果生成最终答复（不绑定工具，确保一次调用即结束）。"""
+        try:
+            response = self._invoke_llm(self.llm, self._synthesis_prompt(state), config)
+        except Exception as e:
+            return self._handle_error(e)
+        return self._handle_response(response, state)
+
+    async def _asynthesize(self, state: AgentState, config=None):
+        """汇总节点的异步版本。"""
+        try:
+            response = await self._ainvoke_llm(self.llm, self._synthesis_prompt(state), config)
+        except Exception as e:
+            return self._handle_error(e)
+        return self._handle_response(response, state)
 
 # --- 工厂函数，方便在其他模块中创建Agent实例 ---
-def create_agent_workflow(model_config: dict) -> StateGraph:
+def create_agent_workflow(model_config: dict, checkpointer=None) -> StateGraph:
     """
     创建并返回一个新的Agent工作流实例（已编译的计算图）。
+    多会话场景请优先使用 registry.get_shared_workflow，以复用已编译的计算图和HTTP连接池。
     """
     config_with_model_name = model_config.copy()
     if "model" in config_with_model_name:
          config_with_model_name["model_name"] = config_with_model_name.pop("model")
 
-    agent_workflow = AgentWorkflow(model_config=config_with_model_name)
+    config_manager = ConfigManager()
+    runtime_config = {
+        section: config_manager.get_runtime_config(section)
+        for section in ("concurrency", "checkpointer", "tool_compaction", "planner", "tool_memo", "tool_prefetch", "quotas")
+    }
+    config_with_model_name.setdefault("http_pool", config_manager.get_runtime_config("http_pool"))
+    config_with_model_name["retry_policy"] = {
+        **config_manager.get_runtime_config("retry"),
+        **(config_with_model_name.get("retry_policy") or {}),
+    }
+    if config_with_model_name.get("cascade"):
+        config_with_model_name["cascade"] = {
+            **config_manager.get_runtime_config("model_cascade"),
+            **config_with_model_name["cascade"],
+        }
+    if config_with_model_name.get("backends"):
+        config_with_model_name["router"] = {
+            **config_manager.get_runtime_config("llm_router"),
+            **(config_with_model_name.get("router") or {}),
+        }
+    agent_workflow = AgentWorkflow(
+        model_config=config_with_model_name,
+        runtime_config=runtime_config,
+        checkpointer=checkpointer,
+    )
     return agent_workflow.graph
 
 # --- 主程序入口：用于独立测试和调试 ---
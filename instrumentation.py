@@ -0,0 +1,459 @@
+"""
+运行指标与追踪模块
+替代散落的 print 与全局 `langchain.debug = True`，以结构化的方式记录ReAct计算图的性能数据：
+  - 节点耗时：agent / tools / manage_context / discard_and_retry 等节点每次执行的时长；
+  - LLM调用：每次调用的提示词/补全token数、首token时延（TTFT）与总耗时；
+  - 工具调用：按工具名统计的时延直方图与失败次数；
+  - 重试与路由：空回复/截断重试次数、路由去向。
+
+数据以两种形式导出：
+  - Prometheus 文本格式（export_prometheus，可选地通过 metrics_port 启动一个只读HTTP端点）；
+  - JSON（export_json），包含指标快照与最近的追踪span，span也可逐条追加写入 trace_path（JSONL）。
+
+关闭（enabled=False）时，节点包装直接返回原函数、span返回空上下文、记录函数在第一行返回，开销接近于零。
+"""
+
+import contextvars
+import inspect
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from configs import ConfigManager
+
+logger = logging.getLogger(__name__)
+
+# 时延直方图的默认桶（秒），覆盖从缓存命中到慢速LLM调用的范围
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 指标说明，用于 Prometheus 的 HELP 行
+METRIC_HELP = {
+    "agent_node_seconds": "计算图节点单次执行耗时",
+    "agent_node_errors_total": "计算图节点抛出异常的次数",
+    "agent_llm_seconds": "单次LLM调用总耗时",
+    "agent_llm_ttft_seconds": "单次LLM调用的首token时延",
+    "agent_llm_calls_total": "LLM调用次数",
+    "agent_llm_errors_total": "LLM调用失败次数",
+    "agent_llm_prompt_tokens_total": "提示词token总数",
+    "agent_llm_completion_tokens_total": "补全token总数",
+    "agent_tool_seconds": "单次工具调用耗时",
+    "agent_tool_calls_total": "工具调用次数",
+    "agent_tool_memo_hits_total": "从工具调用记账中重放（未实际执行）的工具调用次数",
+    "agent_tool_memo_saved_seconds_total": "重放工具调用节省的执行时间（按原调用耗时计）",
+    "agent_quota_wait_seconds": "因租户或上游限流而等待的时间",
+    "agent_quota_wait_capped_total": "限流等待超过 max_wait_seconds 而被截断的次数",
+    "agent_quota_rejected_total": "因租户轮次限额被拒绝的请求数",
+    "agent_budget_exhausted_total": "因会话预算用尽而结束的轮次数",
+    "agent_tool_prefetch_total": "工具预取的结果（started/used/discarded）",
+    "agent_tool_prefetch_saved_seconds_total": "预取的工具执行与模型生成重叠的时间",
+    "agent_cascade_total": "模型级联的调用结果（tier=small 为小模型回复被接受，tier=large 为升级及其原因）",
+    "agent_cascade_wasted_seconds_total": "升级前被丢弃的小模型调用耗时",
+    "agent_retries_total": "因空回复或异常结束原因触发的重试次数",
+    "agent_route_total": "LLM调用后的路由去向",
+    "agent_turn_seconds": "单轮对话的总耗时",
+    "agent_turn_ttft_seconds": "单轮对话的首token时延",
+    "agent_tool_result_bytes_saved_total": "工具结果压缩节省的字节数",
+    "agent_tool_result_tokens_saved_total": "工具结果压缩节省的token数",
+    "agent_tool_result_duplicates_total": "与会话中已有结果重复的工具结果数",
+    "agent_plans_total": "规划-并行执行模式下生成的计划数（按是否合法）",
+    "agent_plan_steps_total": "计划中的步骤总数",
+    "agent_server_queue_seconds": "服务模式下轮次的排队时间",
+    "agent_server_turns_total": "服务模式下轮次的结束状态",
+    "agent_server_rejected_total": "服务模式下未被准入的请求数",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape_label_value(value: str) -> str:
+    """Prometheus 文本格式的标签值转义：反斜杠、双引号与换行。"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    """固定分桶的直方图（非累积计数，导出时再累加）。"""
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶上界估算分位数（落在最后一个桶时返回 +Inf 之前的最大上界）。"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts[:-1]):
+            seen += c
+            if seen >= target:
+                return self.buckets[i]
+        return self.buckets[-1]
+
+
+class _NullSpan:
+    """关闭时使用的空span。"""
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """一段被计时的执行过程，结束时写入追踪缓冲区。"""
+
+    __slots__ = ("name", "span_id", "parent_id", "attrs", "start", "duration")
+
+    def __init__(self, name: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration: Optional[float] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attrs": self.attrs,
+        }
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    LangChain回调：记录每次聊天模型调用的耗时、首token时延与token用量。
+    作为模型的构造参数 callbacks 传入（见 models.py），因此主Agent、上下文摘要和子Agent的调用都会被统计。
+    """
+
+    def __init__(self, instrumentation: "Instrumentation"):
+        self.instrumentation = instrumentation
+        # run_id -> [开始时间, 是否已收到首token, 标签]
+        self._runs: Dict[Any, list] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        metadata = kwargs.get("metadata") or {}
+        return {"model": metadata.get("ls_model_name"), "node": metadata.get("langgraph_node")}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        if not self.instrumentation.enabled:
+            return
+        with self._lock:
+            self._runs[run_id] = [time.perf_counter(), False, self._labels(kwargs)]
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is None or run[1]:
+            return
+        run[1] = True
+        self.instrumentation.observe("agent_llm_ttft_seconds", time.perf_counter() - run[0], **run[2])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        inst = self.instrumentation
+        labels = run[2]
+        inst.observe("agent_llm_seconds", time.perf_counter() - run[0], **labels)
+        inst.inc("agent_llm_calls_total", **labels)
+
+        usage = None
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError):
+            pass
+        if not usage:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            usage = {
+                "input_tokens": token_usage.get("prompt_tokens", 0),
+                "output_tokens": token_usage.get("completion_tokens", 0),
+            }
+        inst.inc("agent_llm_prompt_tokens_total", usage.get("input_tokens", 0) or 0, **labels)
+        inst.inc("agent_llm_completion_tokens_total", usage.get("output_tokens", 0) or 0, **labels)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        self.instrumentation.inc("agent_llm_errors_total", error=type(error).__name__, **run[2])
+
+
+class Instrumentation:
+    """
+    进程级的指标与追踪记录器（线程安全）。
+
+    Args:
+        enabled: 是否记录；关闭后所有接口退化为空操作。
+        max_spans: 内存中保留的最近span数量。
+        trace_path: 可选的JSONL文件路径，每个span结束时追加一行。
+        latency_buckets: 时延直方图的分桶上界（秒）。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_spans: int = 2000,
+        trace_path: Optional[str] = None,
+        latency_buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.latency_buckets = tuple(latency_buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._spans: deque = deque(maxlen=max_spans)
+        # 当前span按执行上下文保存：协程（每个 asyncio 任务有自己的上下文副本）与线程各自关联正确的父span
+        self._current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(f"current_span_{id(self)}", default=None)
+        self.llm_callback = LLMMetricsCallback(self)
+        self._metrics_server = None
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "Instrumentation":
+        settings = settings or {}
+        return cls(
+            enabled=settings.get("enabled", True),
+            max_spans=settings.get("max_spans", 2000),
+            trace_path=settings.get("trace_path"),
+        )
+
+    # --- 指标 ---
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """计数器加 value。"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """向直方图记录一个观测值。"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(self.latency_buckets)
+            hist.observe(value)
+
+    def llm_callbacks(self) -> List[BaseCallbackHandler]:
+        """供模型构造时使用的回调列表；关闭时为空列表，不会给LLM调用增加任何回调开销。"""
+        return [self.llm_callback] if self.enabled else []
+
+    # --- 追踪 ---
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """记录一个span；嵌套调用时自动关联父span（同一执行上下文内，即同一线程或同一 asyncio 任务）。"""
+        if not self.enabled:
+            yield _NULL_SPAN
+            return
+        parent = self._current_span.get()
+        span = Span(name, parent.span_id if parent is not None else None, attrs)
+        token = self._current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            self._current_span.reset(token)
+            self._finish_span(span)
+
+    def _finish_span(self, span: Span):
+        record = span.as_dict()
+        with self._lock:
+            self._spans.append(record)
+            if self.trace_path:
+                try:
+                    with open(self.trace_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                except OSError as e:
+                    logger.warning("写入追踪文件失败: %s", e)
+
+    def wrap_node(self, name: str, func: Callable) -> Callable:
+        """
+        包装计算图节点函数（同步或异步），记录耗时直方图、异常次数与span。
+        包装后的函数始终接受 config 参数（用于在span中记录 thread_id），仅在原函数声明了 config 时才向下传递。
+        关闭时原样返回 func。
+        """
+        if not self.enabled:
+            return func
+        passes_config = "config" in inspect.signature(func).parameters
+
+        def _thread_id(config) -> Optional[str]:
+            return ((config or {}).get("configurable") or {}).get("thread_id")
+
+        if inspect.iscoroutinefunction(func):
+            async def async_wrapper(state, config=None):
+                if not self.enabled:
+                    return await (func(state, config=config) if passes_config else func(state))
+                with self.span(f"node.{name}", node=name, thread_id=_thread_id(config)):
+                    started = time.perf_counter()
+                    try:
+                        return await (func(state, config=config) if passes_config else func(state))
+                    except Exception:
+                        self.inc("agent_node_errors_total", node=name)
+                        raise
+                    finally:
+                        self.observe("agent_node_seconds", time.perf_counter() - started, node=name)
+            return async_wrapper
+
+        def wrapper(state, config=None):
+            if not self.enabled:
+                return func(state, config=config) if passes_config else func(state)
+            with self.span(f"node.{name}", node=name, thread_id=_thread_id(config)):
+                started = time.perf_counter()
+                try:
+                    return func(state, config=config) if passes_config else func(state)
+                except Exception:
+                    self.inc("agent_node_errors_total", node=name)
+                    raise
+                finally:
+                    self.observe("agent_node_seconds", time.perf_counter() - started, node=name)
+        return wrapper
+
+    # --- 导出 ---
+
+    def export_json(self, max_spans: Optional[int] = None) -> Dict[str, Any]:
+        """导出指标快照（计数器与直方图摘要）和最近的span。"""
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "count": hist.count,
+                        "sum": hist.total,
+                        "avg": hist.total / hist.count if hist.count else None,
+                        "p50": hist.quantile(0.5),
+                        "p95": hist.quantile(0.95),
+                    }
+                    for key, hist in series.items()
+                ]
+                for name, series in self._histograms.items()
+            }
+            spans = list(self._spans)
+        if max_spans is not None:
+            spans = spans[-max_spans:] if max_spans > 0 else []
+        return {"enabled": self.enabled, "counters": counters, "histograms": histograms, "spans": spans}
+
+    def export_prometheus(self) -> str:
+        """以 Prometheus 文本格式导出全部指标。"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.total}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def start_metrics_server(self, port: int, host: str = "127.0.0.1"):
+        """在后台线程中启动一个只读的 /metrics HTTP端点，供 Prometheus 抓取（重复调用不会重复启动）。"""
+        if self._metrics_server is not None:
+            return self._metrics_server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        instrumentation = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics":
+                    body, content_type = instrumentation.export_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+                elif self.path.split("?")[0] == "/trace":
+                    body, content_type = json.dumps(instrumentation.export_json(), ensure_ascii=False, default=str).encode("utf-8"), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        self._metrics_server = server
+        return server
+
+    def reset(self):
+        """清空全部指标与span（主要用于基准测试）。"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._spans.clear()
+
+
+_settings = ConfigManager().get_runtime_config("instrumentation")
+instrumentation = Instrumentation.from_settings(_settings)
+if instrumentation.enabled and _settings.get("metrics_port"):
+    instrumentation.start_metrics_server(_settings["metrics_port"])
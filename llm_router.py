@@ -0,0 +1,558 @@
+"""
+多后端LLM路由模块
+同一个逻辑模型可以配置多个后端（不同的 base_url / 供应商 / 密钥），由 LLMRouter 统一对外提供 ChatModel 接口：
+  - 延迟感知：每个后端维护滚动窗口内的 p50/p95 延迟与错误率，请求优先发往得分最好的后端；
+  - 对冲请求：主请求在 hedge_after_seconds（或主后端的 p95）内仍未产生首个结果时，向次优后端再发一份，先返回者胜出；
+    流式调用以首个增量为准，使用首个增量时延的分位数，非流式调用使用完整响应时延的分位数；
+  - 故障转移：后端报错时（且尚未向调用方输出任何token）自动切换到下一个后端，连续失败的后端会被熔断一段时间；
+  - 限流：每个后端有独立的并发上限与每秒请求数上限（令牌桶）。
+
+LLMRouter 继承 BaseChatModel，因此 bind_tools / invoke / ainvoke / stream 与单个 ChatOpenAI 的用法完全一致，
+计算图中的流式token转发（stream_mode="messages"）同样有效。
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict, Field
+
+from instrumentation import instrumentation
+from process_limiter import ProcessLimiter
+
+# 默认的路由参数，可在 ConfigManager.runtime_configs["llm_router"] 中全局覆盖，或在模型配置的 "router" 字段中按模型覆盖
+DEFAULT_ROUTER_SETTINGS = {
+    "window": 200,                  # 滚动统计窗口（最近N次调用）
+    "hedge_after_seconds": None,    # 固定的对冲阈值；为 None 时使用主后端的 hedge_quantile 分位延迟
+    "hedge_quantile": 0.95,
+    "min_hedge_seconds": 1.0,       # 自适应阈值的下限，避免样本很少时过早对冲
+    "max_attempts": 3,              # 单次请求最多尝试的后端数（含对冲）
+    "failure_threshold": 3,         # 连续失败多少次后熔断
+    "cooldown_seconds": 30.0,       # 熔断时长
+}
+
+# 滚动窗口中没有样本时假定的延迟（秒），保证新后端也有机会被选中
+_UNKNOWN_LATENCY = 1.0
+
+# 后端模型调用不继承外层的回调：异步路径中后端的流在 ensure_future 创建的任务里读取，会继承外层运行的回调，
+# token 会被后端与路由各转发一次（stream_mode="messages" 中重复）；只由路由自身的运行转发。
+# 模型实例上的回调（instrumentation.llm_callbacks）不受影响，每个后端的调用仍被分别记录
+_INNER_CONFIG = {"callbacks": []}
+
+
+class RollingStats:
+    """滚动窗口内的延迟与成功率统计（线程安全）。"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+
+class RateLimiter:
+    """令牌桶限流器：平均每秒 rate 个请求，允许 burst 个突发。"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RouterBackend:
+    """
+    路由中的一个后端。
+
+    Args:
+        name: 后端名称（用于统计与日志）。
+        model: 实际的 ChatModel 实例（如 ChatOpenAI）。
+        max_concurrency: 该后端同时进行中的请求上限。
+        rate_limit_per_second: 每秒请求数上限，None 表示不限。
+        window: 滚动统计窗口大小。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: BaseChatModel,
+        max_concurrency: int = 16,
+        rate_limit_per_second: Optional[float] = None,
+        window: int = 200,
+    ):
+        self.name = name
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = ProcessLimiter(self.max_concurrency)
+        self.rate_limiter = RateLimiter(rate_limit_per_second) if rate_limit_per_second else None
+        self.stats = RollingStats(window)
+        # 流式调用的首个增量时延：流式对冲只等待首个增量，不能使用完整响应的时延
+        self.first_chunk_stats = RollingStats(window)
+        self.inflight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.counters = {"requests": 0, "errors": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def score(self) -> float:
+        """越小越好：p50延迟按错误率加权，并按当前负载放大。"""
+        p50 = self.stats.quantile(0.5) or _UNKNOWN_LATENCY
+        load = self.inflight / self.max_concurrency
+        return p50 * (1 + 4 * self.stats.error_rate) * (1 + load)
+
+    def begin(self):
+        with self._lock:
+            self.inflight += 1
+            self.counters["requests"] += 1
+
+    def end(self, latency: float, ok: bool, failure_threshold: int, cooldown_seconds: float):
+        with self._lock:
+            self.inflight -= 1
+            if ok:
+                self.consecutive_failures = 0
+            else:
+                self.counters["errors"] += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= failure_threshold:
+                    self.open_until = time.monotonic() + cooldown_seconds
+        self.stats.record(latency, ok)
+
+    def cancel(self):
+        """对冲落败被取消的请求：只释放计数，不计入延迟统计。"""
+        with self._lock:
+            self.inflight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "inflight": self.inflight,
+            "p50": self.stats.quantile(0.5),
+            "p95": self.stats.quantile(0.95),
+            "first_chunk_p95": self.first_chunk_stats.quantile(0.95),
+            "error_rate": self.stats.error_rate,
+            "samples": self.stats.count,
+            "circuit_open": not self.available,
+        }
+
+
+# 同步对冲与流式读取使用的共享线程池
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-router")
+
+
+class LLMRouter(BaseChatModel):
+    """
+    在多个后端之间路由的聊天模型。后端按 score() 排序，熔断中的后端被跳过（全部熔断时仍会尝试得分最好的一个）。
+    对冲发出的重复请求在落败后会被丢弃（同步路径中已发出的HTTP请求无法中止，只会停止读取其流）。
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    backends: List[Any]
+    settings: Dict[str, Any] = Field(default_factory=lambda: dict(DEFAULT_ROUTER_SETTINGS))
+    streaming: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"backends": [b.name for b in self.backends]}
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[Any] = None, **kwargs):
+        """与 ChatOpenAI.bind_tools 相同：工具定义以 OpenAI 格式作为调用参数传给各后端。"""
+        formatted = [convert_to_openai_tool(tool) for tool in tools]
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return self.bind(tools=formatted, **kwargs)
+
+    # --- 后端选择 ---
+
+    def _candidates(self) -> List[RouterBackend]:
+        ranked = sorted(self.backends, key=lambda b: b.score())
+        available = [b for b in ranked if b.available]
+        return (available or ranked[:1])[: self.settings["max_attempts"]]
+
+    def _hedge_delay(self, backend: RouterBackend, streaming: bool = False) -> Optional[float]:
+        """对冲阈值：流式调用按首个增量时延的分位数，非流式调用按完整响应时延的分位数。"""
+        fixed = self.settings.get("hedge_after_seconds")
+        if fixed is not None:
+            return fixed
+        if len(self.backends) < 2:
+            return None
+        stats = backend.first_chunk_stats if streaming else backend.stats
+        estimate = stats.quantile(self.settings["hedge_quantile"])
+        if estimate is None:
+            return None
+        return max(self.settings["min_hedge_seconds"], estimate)
+
+    def _finish(self, backend: RouterBackend, started: float, ok: bool):
+        backend.end(time.perf_counter() - started, ok, self.settings["failure_threshold"], self.settings["cooldown_seconds"])
+
+    # --- 同步路径 ---
+
+    def _call(self, backend: RouterBackend, fn: Callable[[BaseChatModel], Any]) -> Any:
+        with backend.limiter:
+            if backend.rate_limiter:
+                backend.rate_limiter.acquire()
+            backend.begin()
+            started = time.perf_counter()
+            try:
+                result = fn(backend.model)
+            except Exception:
+                self._finish(backend, started, False)
+                raise
+            self._finish(backend, started, True)
+            return result
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        candidates = self._candidates()
+        call = lambda model: model.invoke(messages, config=_INNER_CONFIG, stop=stop, **kwargs)
+        pending = {}
+        hedges = set()
+        next_index = 0
+        last_error: Optional[Exception] = None
+
+        def launch():
+            nonlocal next_index
+            backend = candidates[next_index]
+            next_index += 1
+            pending[_executor.submit(self._call, backend, call)] = backend
+            return backend
+
+        primary = launch()
+        hedge_delay = self._hedge_delay(primary)
+        while pending:
+            can_hedge = next_index == 1 and next_index < len(candidates) and hedge_delay is not None
+            done, _ = wait(list(pending), timeout=hedge_delay if can_hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # 主请求超过阈值仍未返回：向次优后端发出对冲请求
+                hedge = launch()
+                hedge.counters["hedges"] += 1
+                hedges.add(hedge.name)
+                instrumentation.inc("agent_llm_router_hedges_total", backend=hedge.name)
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    message = future.result()
+                except Exception as e:
+                    last_error = e
+                    if not pending and next_index < len(candidates):
+                        # 故障转移：没有其他进行中的请求时启动下一个后端
+                        candidates[next_index].counters["failovers"] += 1
+                        instrumentation.inc("agent_llm_router_failovers_total", backend=candidates[next_index].name)
+                        launch()
+                    continue
+                if backend.name in hedges:
+                    backend.counters["hedge_wins"] += 1
+                message.response_metadata = {**message.response_metadata, "router_backend": backend.name}
+                return ChatResult(generations=[ChatGeneration(message=message)])
+        raise last_error or RuntimeError("没有可用的LLM后端")
+
+    def _stream_attempt(self, attempt_id: int, backend: RouterBackend, messages, stop, kwargs, events: "queue.Queue", cancelled: threading.Event):
+        """在线程中读取某个后端的流，把 (attempt_id, 类型, 数据) 放入共享队列。"""
+        try:
+            with backend.limiter:
+                if backend.rate_limiter:
+                    backend.rate_limiter.acquire()
+                backend.begin()
+                started = time.perf_counter()
+                outcome = False
+                first = True
+                try:
+                    for chunk in backend.model.stream(messages, config=_INNER_CONFIG, stop=stop, **kwargs):
+                        if cancelled.is_set():
+                            outcome = None
+                            return
+                        if first:
+                            backend.first_chunk_stats.record(time.perf_counter() - started, True)
+                            first = False
+                        events.put((attempt_id, "chunk", chunk))
+                    outcome = True
+                    events.put((attempt_id, "end", None))
+                finally:
+                    if outcome is None:
+                        backend.cancel()
+                    else:
+                        self._finish(backend, started, outcome)
+        except Exception as e:
+            events.put((attempt_id, "error", e))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        candidates = self._candidates()
+        events: "queue.Queue" = queue.Queue()
+        attempts: List[tuple] = []  # (backend, cancelled)
+        running = set()
+        hedge_attempts = set()
+        last_error: Optional[Exception] = None
+
+        def launch():
+            backend = candidates[len(attempts)]
+            cancelled = threading.Event()
+            attempt_id = len(attempts)
+            attempts.append((backend, cancelled))
+            running.add(attempt_id)
+            _executor.submit(self._stream_attempt, attempt_id, backend, messages, stop, kwargs, events, cancelled)
+            return backend
+
+        primary = launch()
+        hedge_delay = self._hedge_delay(primary, streaming=True)
+        winner = None
+        try:
+            while True:
+                can_hedge = winner is None and len(attempts) == 1 and len(candidates) > 1 and hedge_delay is not None
+                try:
+                    attempt_id, kind, data = events.get(timeout=hedge_delay if can_hedge else None)
+                except queue.Empty:
+                    hedge = launch()
+                    hedge.counters["hedges"] += 1
+                    hedge_attempts.add(len(attempts) - 1)
+                    instrumentation.inc("agent_llm_router_hedges_total", backend=hedge.name)
+                    continue
+                if winner is not None and attempt_id != winner:
+                    continue
+                if kind == "error":
+                    running.discard(attempt_id)
+                    if winner is not None:
+                        # 已经向调用方输出了部分内容，无法无缝切换
+                        raise data
+                    last_error = data
+                    if not running:
+                        if len(attempts) >= len(candidates):
+                            raise last_error
+                        candidates[len(attempts)].counters["failovers"] += 1
+                        instrumentation.inc("agent_llm_router_failovers_total", backend=candidates[len(attempts)].name)
+                        launch()
+                    continue
+                if kind == "end":
+                    return
+                if winner is None:
+                    # 首个产生内容的请求胜出，其余请求停止读取
+                    winner = attempt_id
+                    for other_id, (_, cancelled) in enumerate(attempts):
+                        if other_id != winner:
+                            cancelled.set()
+                    if winner in hedge_attempts:
+                        attempts[winner][0].counters["hedge_wins"] += 1
+                yield self._as_generation_chunk(data, attempts[winner][0])
+        finally:
+            # 调用方提前停止读取（或出错）时，通知所有仍在运行的请求停止
+            for _, cancelled in attempts:
+                cancelled.set()
+
+    @staticmethod
+    def _as_generation_chunk(chunk: AIMessageChunk, backend: RouterBackend) -> ChatGenerationChunk:
+        # 由路由自身的运行id作为消息id，保证同一次调用的所有增量属于同一条消息
+        chunk.id = None
+        if chunk.response_metadata.get("finish_reason"):
+            chunk.response_metadata = {**chunk.response_metadata, "router_backend": backend.name}
+        return ChatGenerationChunk(message=chunk)
+
+    # --- 异步路径 ---
+
+    async def _acall(self, backend: RouterBackend, fn):
+        async with backend.limiter:
+            if backend.rate_limiter:
+                await backend.rate_limiter.aacquire()
+            backend.begin()
+            started = time.perf_counter()
+            try:
+                result = await fn(backend.model)
+            except Exception:
+                self._finish(backend, started, False)
+                raise
+            self._finish(backend, started, True)
+            return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        candidates = self._candidates()
+        call = lambda model: model.ainvoke(messages, config=_INNER_CONFIG, stop=stop, **kwargs)
+        pending: Dict[asyncio.Task, RouterBackend] = {}
+        hedges = set()
+        next_index = 0
+        last_error: Optional[Exception] = None
+
+        def launch():
+            nonlocal next_index
+            backend = candidates[next_index]
+            next_index += 1
+            pending[asyncio.ensure_future(self._acall(backend, call))] = backend
+            return backend
+
+        primary = launch()
+        hedge_delay = self._hedge_delay(primary)
+        try:
+            while pending:
+                can_hedge = next_index == 1 and next_index < len(candidates) and hedge_delay is not None
+                done, _ = await asyncio.wait(list(pending), timeout=hedge_delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge = launch()
+                    hedge.counters["hedges"] += 1
+                    hedges.add(hedge.name)
+                    instrumentation.inc("agent_llm_router_hedges_total", backend=hedge.name)
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    try:
+                        message = task.result()
+                    except Exception as e:
+                        last_error = e
+                        if not pending and next_index < len(candidates):
+                            candidates[next_index].counters["failovers"] += 1
+                            instrumentation.inc("agent_llm_router_failovers_total", backend=candidates[next_index].name)
+                            launch()
+                        continue
+                    if backend.name in hedges:
+                        backend.counters["hedge_wins"] += 1
+                    message.response_metadata = {**message.response_metadata, "router_backend": backend.name}
+                    return ChatResult(generations=[ChatGeneration(message=message)])
+        finally:
+            # 异步路径可以真正取消落败的请求
+            for task in pending:
+                task.cancel()
+        raise last_error or RuntimeError("没有可用的LLM后端")
+
+    async def _astream_attempt(self, attempt_id: int, backend: RouterBackend, messages, stop, kwargs, events: asyncio.Queue):
+        try:
+            async with backend.limiter:
+                if backend.rate_limiter:
+                    await backend.rate_limiter.aacquire()
+                backend.begin()
+                started = time.perf_counter()
+                outcome = False
+                first = True
+                try:
+                    async for chunk in backend.model.astream(messages, config=_INNER_CONFIG, stop=stop, **kwargs):
+                        if first:
+                            backend.first_chunk_stats.record(time.perf_counter() - started, True)
+                            first = False
+                        await events.put((attempt_id, "chunk", chunk))
+                    outcome = True
+                    await events.put((attempt_id, "end", None))
+                except asyncio.CancelledError:
+                    outcome = None
+                    raise
+                finally:
+                    if outcome is None:
+                        backend.cancel()
+                    else:
+                        self._finish(backend, started, outcome)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await events.put((attempt_id, "error", e))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        candidates = self._candidates()
+        events: asyncio.Queue = asyncio.Queue()
+        attempts: List[tuple] = []  # (backend, task)
+        running = set()
+        hedge_attempts = set()
+        last_error: Optional[Exception] = None
+
+        def launch():
+            backend = candidates[len(attempts)]
+            attempt_id = len(attempts)
+            task = asyncio.ensure_future(self._astream_attempt(attempt_id, backend, messages, stop, kwargs, events))
+            attempts.append((backend, task))
+            running.add(attempt_id)
+            return backend
+
+        primary = launch()
+        hedge_delay = self._hedge_delay(primary, streaming=True)
+        winner = None
+        try:
+            while True:
+                can_hedge = winner is None and len(attempts) == 1 and len(candidates) > 1 and hedge_delay is not None
+                try:
+                    attempt_id, kind, data = await asyncio.wait_for(events.get(), timeout=hedge_delay if can_hedge else None)
+                except asyncio.TimeoutError:
+                    hedge = launch()
+                    hedge.counters["hedges"] += 1
+                    hedge_attempts.add(len(attempts) - 1)
+                    instrumentation.inc("agent_llm_router_hedges_total", backend=hedge.name)
+                    continue
+                if winner is not None and attempt_id != winner:
+                    continue
+                if kind == "error":
+                    running.discard(attempt_id)
+                    if winner is not None:
+                        raise data
+                    last_error = data
+                    if not running:
+                        if len(attempts) >= len(candidates):
+                            raise last_error
+                        candidates[len(attempts)].counters["failovers"] += 1
+                        instrumentation.inc("agent_llm_router_failovers_total", backend=candidates[len(attempts)].name)
+                        launch()
+                    continue
+                if kind == "end":
+                    return
+                if winner is None:
+                    winner = attempt_id
+                    for other_id, (_, task) in enumerate(attempts):
+                        if other_id != winner:
+                            task.cancel()
+                    if winner in hedge_attempts:
+                        attempts[winner][0].counters["hedge_wins"] += 1
+                yield self._as_generation_chunk(data, attempts[winner][0])
+        finally:
+            for _, task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {b.name: b.get_stats() for b in self.backends}
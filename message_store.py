@@ -0,0 +1,166 @@
+"""
+UI消息存储模块
+为Streamlit会话提供按id索引的消息存储，替代 `st.session_state.messages` 列表：
+  - 去重为O(1)的id查找，不再对 BaseMessage 做逐条相等比较；
+  - 工具结果的JSON只解析一次并按消息id缓存；
+  - 按轮次（以用户消息开始）分组，UI只渲染最近的若干轮，较早的轮次按需展开；
+  - 只保存一个窗口：会话历史以检查点为准（load_history 从最新检查点读取最近若干轮），
+    超出 max_turns 的较早轮次从存储中移除，只记录数量（unloaded_turns），需要时再从检查点加载。
+    使用紧凑序列化的检查点时，load_history 只读取 messages 通道并只构造窗口内的消息；
+    整段通道的字节仍要读出并由 msgpack 解析一遍，所以恢复耗时并非与历史长度无关，只是不再随之构造全部消息对象。
+"""
+
+import json
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+
+from checkpoint_serde import LazyMessage
+from tool_compaction import full_tool_content
+
+_NOT_JSON = object()
+_MISSING = object()
+
+
+def _is_human(message) -> bool:
+    if isinstance(message, LazyMessage):
+        return issubclass(message.message_class, HumanMessage)
+    return isinstance(message, HumanMessage)
+
+
+def split_history(messages: Sequence[BaseMessage], turns: int) -> Tuple[int, List[BaseMessage]]:
+    """把完整历史切分为 (更早的轮次数, 最近 turns 轮的消息)；messages 中可以有 LazyMessage。"""
+    starts = [i for i, m in enumerate(messages) if _is_human(m)]
+    if messages and (not starts or starts[0] != 0):
+        starts.insert(0, 0)
+    if len(starts) <= turns:
+        return 0, list(messages)
+    cut = starts[-turns] if turns > 0 else len(messages)
+    return len(starts) - max(turns, 0), list(messages[cut:])
+
+
+def load_history(checkpointer, thread_id: str, turns: int) -> Tuple[int, List[BaseMessage]]:
+    """
+    从会话的最新检查点读取最近 turns 轮消息，返回 (更早的轮次数, 窗口内的消息)；会话不存在时返回 (0, [])。
+    检查点后端提供 get_channel_value（见 checkpointer.py）时只读取 messages 通道，窗口之外的消息不构造。
+    """
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    if hasattr(checkpointer, "get_channel_value"):
+        messages = checkpointer.get_channel_value(config, "messages", lazy_messages=True) or []
+    else:
+        checkpoint_tuple = checkpointer.get_tuple(config)
+        messages = (checkpoint_tuple.checkpoint["channel_values"].get("messages") or []) if checkpoint_tuple else []
+    unloaded_turns, window = split_history(messages, turns)
+    return unloaded_turns, [m.decode() if isinstance(m, LazyMessage) else m for m in window]
+
+
+class MessageStore:
+    """
+    按插入顺序保存消息、以消息id索引的存储。
+
+    Args:
+        max_turns: 最多保留的轮次数，新轮次超出时移除最早的一轮；None表示不限制。
+    """
+
+    def __init__(self, max_turns: Optional[int] = None):
+        self.max_turns = max_turns
+        self._order: List[str] = []
+        self._by_id: Dict[str, BaseMessage] = {}
+        # 每一轮第一条消息在 _order 中的下标，用于O(1)定位最近的K轮
+        self._turn_starts: List[int] = []
+        self._payload_cache: Dict[str, Any] = {}
+        # 检查点中存在、但不在本窗口中的较早轮次数
+        self.unloaded_turns = 0
+
+    @classmethod
+    def from_history(cls, messages: Sequence[BaseMessage], unloaded_turns: int = 0, max_turns: Optional[int] = None) -> "MessageStore":
+        """用 load_history 读取的窗口构建存储。"""
+        store = cls(max_turns=max_turns)
+        store.extend(messages)
+        store.unloaded_turns += unloaded_turns
+        return store
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __iter__(self) -> Iterator[BaseMessage]:
+        return (self._by_id[mid] for mid in self._order)
+
+    def __contains__(self, message: BaseMessage) -> bool:
+        return bool(message.id) and message.id in self._by_id
+
+    def add(self, message: BaseMessage) -> bool:
+        """追加一条消息；同id的消息已存在时原地替换并返回 False。"""
+        if not message.id:
+            message.id = str(uuid.uuid4())
+        if message.id in self._by_id:
+            self._by_id[message.id] = message
+            self._payload_cache.pop(message.id, None)
+            return False
+        if isinstance(message, HumanMessage) or not self._turn_starts:
+            self._turn_starts.append(len(self._order))
+            if self.max_turns and len(self._turn_starts) > self.max_turns:
+                self._drop_oldest_turn()
+        self._order.append(message.id)
+        self._by_id[message.id] = message
+        return True
+
+    def _drop_oldest_turn(self):
+        """移除最早的一轮（仍保存在检查点中，可通过 load_history 重新加载）。"""
+        end = self._turn_starts[1]
+        for mid in self._order[:end]:
+            self._by_id.pop(mid, None)
+            self._payload_cache.pop(mid, None)
+        del self._order[:end]
+        self._turn_starts = [start - end for start in self._turn_starts[1:]]
+        self.unloaded_turns += 1
+
+    def extend(self, messages) -> int:
+        return sum(1 for m in messages if self.add(m))
+
+    def get(self, message_id: str) -> Optional[BaseMessage]:
+        return self._by_id.get(message_id)
+
+    # --- 轮次视图 ---
+
+    @property
+    def turn_count(self) -> int:
+        """窗口中的轮次数（不含 unloaded_turns）。"""
+        return len(self._turn_starts)
+
+    @property
+    def total_turns(self) -> int:
+        return self.unloaded_turns + len(self._turn_starts)
+
+    def turns(self, last: Optional[int] = None) -> List[List[BaseMessage]]:
+        """返回最近 last 轮（None表示全部）的消息，每一轮是一个列表。"""
+        starts = self._turn_starts if last is None else self._turn_starts[-last:] if last > 0 else []
+        result = []
+        for i, start in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else len(self._order)
+            result.append([self._by_id[mid] for mid in self._order[start:end]])
+        return result
+
+    def split_turns(self, visible: int) -> Tuple[int, List[List[BaseMessage]]]:
+        """返回 (被折叠的较早轮次数，含未加载的轮次, 最近 visible 轮)。"""
+        hidden = max(0, self.total_turns - visible)
+        return hidden, self.turns(last=visible)
+
+    # --- 工具结果解析缓存 ---
+
+    def tool_payload(self, message: ToolMessage) -> Tuple[bool, Any]:
+        """返回 (是否为JSON, 解析结果或原文)；压缩过的结果取回完整原文，解析结果按消息id缓存。"""
+        key = message.id or ""
+        cached = self._payload_cache.get(key, _MISSING)
+        if cached is _MISSING:
+            content = full_tool_content(message)
+            try:
+                cached = json.loads(content)
+            except (json.JSONDecodeError, TypeError):
+                cached = _NOT_JSON
+            if key:
+                self._payload_cache[key] = cached
+        if cached is _NOT_JSON:
+            return False, full_tool_content(message)
+        return True, cached
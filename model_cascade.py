@@ -0,0 +1,295 @@
+"""
+模型级联模块
+同一个逻辑模型可以配置一个小而快的模型（"small"）作为第一级：每次调用先交给小模型，
+只有在以下情况才升级到大模型（模型配置本身），ModelCascade 对外仍是一个普通的 ChatModel：
+  - 调用前（不调用小模型，直接使用大模型）：
+      * tool_error：上一批工具结果中有失败的调用，由大模型处理失败后的决策；
+      * long_context：提示超过 max_prompt_chars；
+  - 小模型的回复不可接受：
+      * error：小模型调用异常；
+      * invalid：空回复、被截断/过滤，或工具调用参数无法解析；
+      * tool_complexity：一次请求的工具调用超过 max_tool_calls，或调用了 large_tools 中的工具；
+      * low_confidence：不含工具调用的文本回复置信度低于 min_confidence。
+
+置信度优先使用小模型返回的 logprobs（设置 "logprobs": True 时请求，取token平均概率），
+供应商不支持时退化为关键词规则：回复中出现 uncertain_markers 中的表述视为低置信度。
+升级时小模型的用量仍计入回复的 usage_metadata，response_metadata["cascade"] 记录本次使用的层级、原因与按各自单价计算的费用。
+
+流式调用时小模型的输出先在内部缓冲，判定可以接受后再一次性转发，否则转发大模型的流式输出；
+因此小模型回复的首token时延约等于其完整生成时间（小模型通常足够快，且升级时调用方不会看到被丢弃的内容）。
+"""
+
+import logging
+import math
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.messages.ai import add_usage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict, Field
+
+from instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# 默认的级联策略，可在 ConfigManager.runtime_configs["model_cascade"] 中全局覆盖，或在模型配置的 "cascade" 字段中按模型覆盖
+DEFAULT_CASCADE_SETTINGS = {
+    "min_confidence": 0.6,          # 文本回复的置信度低于该值时升级
+    "max_tool_calls": 2,            # 小模型一次最多可以发起的工具调用数，超过时升级
+    "large_tools": [],              # 只交给大模型调用的工具（小模型调用它们时升级）
+    "max_prompt_chars": 0,          # 提示超过该字符数时直接使用大模型，0 表示不限
+    "escalate_after_tool_error": True,
+    "logprobs": False,              # 是否向小模型请求 logprobs 以计算置信度
+    "uncertain_markers": ["不确定", "无法确定", "我不知道", "无法回答", "I'm not sure", "I don't know", "not certain"],
+    "subagents": True,              # 子Agent（sub_agent_executor_tool）是否同样先交给小模型
+}
+
+# 小模型回复中这些结束原因表示内容不完整或被过滤
+_INVALID_FINISH_REASONS = ("length", "content_filter", "error")
+
+# 内层模型调用不继承外层的回调：token 只经由 ModelCascade 自身的运行转发一次（stream_mode="messages"）；
+# 模型实例上的回调（instrumentation.llm_callbacks）不受影响，每一层的调用仍被分别记录
+_INNER_CONFIG = {"callbacks": []}
+
+
+def response_confidence(message: BaseMessage, markers: Sequence[str] = ()) -> float:
+    """回复的置信度（0~1）：有 logprobs 时为token平均概率，否则出现不确定表述时为 0、其余为 1。"""
+    logprobs = ((message.response_metadata or {}).get("logprobs") or {}).get("content") or []
+    values = [item["logprob"] for item in logprobs if isinstance(item, dict) and item.get("logprob") is not None]
+    if values:
+        return math.exp(sum(values) / len(values))
+    text = str(message.content or "").lower()
+    return 0.0 if any(marker.lower() in text for marker in markers) else 1.0
+
+
+def response_cost(usage: Optional[Dict[str, Any]], pricing: Optional[Dict[str, float]]) -> float:
+    """按模型配置中的 "pricing"（每百万token单价）计算一次调用的费用。"""
+    usage, pricing = usage or {}, pricing or {}
+    return (
+        (usage.get("input_tokens") or 0) * pricing.get("input_per_million", 0.0)
+        + (usage.get("output_tokens") or 0) * pricing.get("output_per_million", 0.0)
+    ) / 1e6
+
+
+class ModelCascade(BaseChatModel):
+    """
+    先小后大的两级级联聊天模型。bind_tools / invoke / ainvoke / stream 与单个 ChatOpenAI 的用法一致。
+
+    Args:
+        small: 第一级模型。
+        large: 升级时使用的模型（可以是 LLMRouter）。
+        settings: 覆盖 DEFAULT_CASCADE_SETTINGS 中的字段。
+        small_pricing / large_pricing: 两级模型的单价，用于 response_metadata["cascade"]["cost"]。
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    small: Any
+    large: Any
+    settings: Dict[str, Any] = Field(default_factory=lambda: dict(DEFAULT_CASCADE_SETTINGS))
+    small_pricing: Dict[str, float] = Field(default_factory=dict)
+    large_pricing: Dict[str, float] = Field(default_factory=dict)
+    model_name: str = "cascade"
+    streaming: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "model-cascade"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[Any] = None, **kwargs):
+        """与 ChatOpenAI.bind_tools 相同：工具定义以 OpenAI 格式作为调用参数传给两级模型。"""
+        formatted = [convert_to_openai_tool(tool) for tool in tools]
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return self.bind(tools=formatted, **kwargs)
+
+    # --- 升级判定 ---
+
+    def _pre_route(self, messages: List[BaseMessage]) -> Optional[str]:
+        """不调用小模型、直接使用大模型的原因。"""
+        if self.settings["escalate_after_tool_error"]:
+            # 上一批工具结果：最后一条 AIMessage 之后的 ToolMessage
+            for message in reversed(messages):
+                if not isinstance(message, ToolMessage):
+                    break
+                if message.status == "error":
+                    return "tool_error"
+        limit = self.settings["max_prompt_chars"]
+        if limit and sum(len(str(m.content or "")) for m in messages) > limit:
+            return "long_context"
+        return None
+
+    def escalation_reason(self, response: BaseMessage) -> Optional[str]:
+        """小模型的回复需要升级的原因，可以接受时返回 None。"""
+        finish_reason = (response.response_metadata or {}).get("finish_reason")
+        tool_calls = getattr(response, "tool_calls", None) or []
+        if finish_reason in _INVALID_FINISH_REASONS or getattr(response, "invalid_tool_calls", None):
+            return "invalid"
+        if not tool_calls and not response.content:
+            return "invalid"
+        if tool_calls:
+            large_tools = set(self.settings["large_tools"] or ())
+            if len(tool_calls) > self.settings["max_tool_calls"] or any(call["name"] in large_tools for call in tool_calls):
+                return "tool_complexity"
+            return None
+        if response_confidence(response, self.settings["uncertain_markers"]) < self.settings["min_confidence"]:
+            return "low_confidence"
+        return None
+
+    def _small_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {**kwargs, "logprobs": True} if self.settings["logprobs"] else kwargs
+
+    def _record(self, tier: str, reason: str, small_seconds: float = 0.0):
+        instrumentation.inc("agent_cascade_total", tier=tier, reason=reason)
+        if tier == "large":
+            logger.debug("模型级联升级到大模型: %s", reason)
+            if small_seconds:
+                # 被丢弃的小模型调用耗时（升级的额外代价）
+                instrumentation.inc("agent_cascade_wasted_seconds_total", small_seconds, reason=reason)
+
+    def _metadata(self, tier: str, reason: str, small_usage, large_usage) -> Dict[str, Any]:
+        cost = response_cost(small_usage, self.small_pricing) + response_cost(large_usage, self.large_pricing)
+        return {"tier": tier, "reason": reason, "cost": cost}
+
+    def _result(self, message: BaseMessage, tier: str, reason: str, small_usage=None) -> ChatResult:
+        if tier == "small":
+            metadata = self._metadata(tier, reason, message.usage_metadata, None)
+        else:
+            metadata = self._metadata(tier, reason, small_usage, message.usage_metadata)
+            if small_usage:
+                message.usage_metadata = add_usage(small_usage, message.usage_metadata)
+        message.response_metadata = {**message.response_metadata, "cascade": metadata}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _trailer(self, tier: str, reason: str, small_usage, large_usage) -> ChatGenerationChunk:
+        """流式输出的最后一个增量：携带级联信息，升级时补上小模型的用量。"""
+        chunk = AIMessageChunk(content="", response_metadata={"cascade": self._metadata(tier, reason, small_usage, large_usage)})
+        if tier == "large" and small_usage:
+            chunk.usage_metadata = small_usage
+        return ChatGenerationChunk(message=chunk)
+
+    @staticmethod
+    def _aggregate(buffered: List[AIMessageChunk]) -> Optional[AIMessageChunk]:
+        return sum(buffered[1:], buffered[0]) if buffered else None
+
+    @staticmethod
+    def _as_generation_chunk(chunk: AIMessageChunk) -> ChatGenerationChunk:
+        # 由级联自身的运行id作为消息id，保证两级模型的增量都属于同一条消息
+        chunk.id = None
+        return ChatGenerationChunk(message=chunk)
+
+    # --- 同步路径 ---
+
+    def _try_small(self, messages, stop, kwargs):
+        """调用小模型，返回 (回复, 升级原因, 耗时)。"""
+        started = time.perf_counter()
+        try:
+            response = self.small.invoke(messages, config=_INNER_CONFIG, stop=stop, **self._small_kwargs(kwargs))
+        except Exception as e:
+            logger.warning("小模型调用失败，升级到大模型: %s", e)
+            return None, "error", time.perf_counter() - started
+        return response, self.escalation_reason(response), time.perf_counter() - started
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        reason = self._pre_route(messages)
+        response, small_seconds = None, 0.0
+        if reason is None:
+            response, reason, small_seconds = self._try_small(messages, stop, kwargs)
+            if reason is None:
+                self._record("small", "accepted")
+                return self._result(response, "small", "accepted")
+        self._record("large", reason, small_seconds)
+        message = self.large.invoke(messages, config=_INNER_CONFIG, stop=stop, **kwargs)
+        return self._result(message, "large", reason, getattr(response, "usage_metadata", None))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        reason = self._pre_route(messages)
+        small_usage, small_seconds = None, 0.0
+        if reason is None:
+            started = time.perf_counter()
+            buffered: List[AIMessageChunk] = []
+            aggregate = None
+            try:
+                for chunk in self.small.stream(messages, config=_INNER_CONFIG, stop=stop, **self._small_kwargs(kwargs)):
+                    buffered.append(chunk)
+                aggregate = self._aggregate(buffered)
+                reason = self.escalation_reason(aggregate) if aggregate is not None else "invalid"
+            except Exception as e:
+                logger.warning("小模型调用失败，升级到大模型: %s", e)
+                reason = "error"
+            small_seconds = time.perf_counter() - started
+            if reason is None:
+                self._record("small", "accepted")
+                for chunk in buffered:
+                    yield self._as_generation_chunk(chunk)
+                yield self._trailer("small", "accepted", aggregate.usage_metadata, None)
+                return
+            small_usage = aggregate.usage_metadata if aggregate is not None else None
+        self._record("large", reason, small_seconds)
+        large_usage = None
+        for chunk in self.large.stream(messages, config=_INNER_CONFIG, stop=stop, **kwargs):
+            if chunk.usage_metadata:
+                large_usage = add_usage(large_usage, chunk.usage_metadata)
+            yield self._as_generation_chunk(chunk)
+        yield self._trailer("large", reason, small_usage, large_usage)
+
+    # --- 异步路径 ---
+
+    async def _atry_small(self, messages, stop, kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.small.ainvoke(messages, config=_INNER_CONFIG, stop=stop, **self._small_kwargs(kwargs))
+        except Exception as e:
+            logger.warning("小模型调用失败，升级到大模型: %s", e)
+            return None, "error", time.perf_counter() - started
+        return response, self.escalation_reason(response), time.perf_counter() - started
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        reason = self._pre_route(messages)
+        response, small_seconds = None, 0.0
+        if reason is None:
+            response, reason, small_seconds = await self._atry_small(messages, stop, kwargs)
+            if reason is None:
+                self._record("small", "accepted")
+                return self._result(response, "small", "accepted")
+        self._record("large", reason, small_seconds)
+        message = await self.large.ainvoke(messages, config=_INNER_CONFIG, stop=stop, **kwargs)
+        return self._result(message, "large", reason, getattr(response, "usage_metadata", None))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        reason = self._pre_route(messages)
+        small_usage, small_seconds = None, 0.0
+        if reason is None:
+            started = time.perf_counter()
+            buffered: List[AIMessageChunk] = []
+            aggregate = None
+            try:
+                async for chunk in self.small.astream(messages, config=_INNER_CONFIG, stop=stop, **self._small_kwargs(kwargs)):
+                    buffered.append(chunk)
+                aggregate = self._aggregate(buffered)
+                reason = self.escalation_reason(aggregate) if aggregate is not None else "invalid"
+            except Exception as e:
+                logger.warning("小模型调用失败，升级到大模型: %s", e)
+                reason = "error"
+            small_seconds = time.perf_counter() - started
+            if reason is None:
+                self._record("small", "accepted")
+                for chunk in buffered:
+                    yield self._as_generation_chunk(chunk)
+                yield self._trailer("small", "accepted", aggregate.usage_metadata, None)
+                return
+            small_usage = aggregate.usage_metadata if aggregate is not None else None
+        self._record("large", reason, small_seconds)
+        large_usage = None
+        async for chunk in self.large.astream(messages, config=_INNER_CONFIG, stop=stop, **kwargs):
+            if chunk.usage_metadata:
+                large_usage = add_usage(large_usage, chunk.usage_metadata)
+            yield self._as_generation_chunk(chunk)
+        yield self._trailer("large", reason, small_usage, large_usage)
@@ -1,33 +1,205 @@
 import os
-from langchain_openai import ChatOpenAI
-# --- 加载环境变量 ---
-from dotenv import load_dotenv
-load_dotenv()
+import threading
+import weakref
+import httpx
+from configs import ConfigManager  # noqa: F401  导入即加载 .env
+from instrumentation import instrumentation
 
-def get_agent_model(model_config: dict):
+# --- 进程级共享的HTTP连接池 ---
+# 同一个 base_url 的所有 ChatOpenAI 实例共享一对 httpx 客户端（同步/异步），
+# 避免每个会话各自建立连接池，并通过 keep-alive 复用TCP/TLS连接。
+_http_clients = {}
+_http_clients_lock = threading.Lock()
+_http_pool_stats = {"clients_created": 0, "clients_reused": 0, "requests": 0}
+
+
+def _count_request(request):
+    _http_pool_stats["requests"] += 1
+
+
+async def _acount_request(request):
+    _http_pool_stats["requests"] += 1
+
+
+def get_http_clients(base_url: str = None, pool_config: dict = None):
     """
-    LLM工厂函数：根据配置动态创建LLM实例。
-    这是一个为模板设计的简化版本，您可以轻松扩展以支持更多模型。
+    获取（或创建）指定 base_url 共享的 (httpx.Client, httpx.AsyncClient)。
+
+    pool_config 可包含:
+        max_connections: 连接池最大连接数
+        max_keepalive_connections: 最大保活连接数
+        keepalive_expiry: 空闲连接保活时间（秒）
+        timeout: 请求超时时间（秒）
     """
+    pool_config = pool_config or {}
+    key = base_url or "default"
+    with _http_clients_lock:
+        if key in _http_clients:
+            _http_pool_stats["clients_reused"] += 1
+            return _http_clients[key]
+
+        limits = httpx.Limits(
+            max_connections=pool_config.get("max_connections", 100),
+            max_keepalive_connections=pool_config.get("max_keepalive_connections", 20),
+            keepalive_expiry=pool_config.get("keepalive_expiry", 30.0),
+        )
+        timeout = httpx.Timeout(pool_config.get("timeout", 120.0), connect=10.0)
+        clients = (
+            httpx.Client(limits=limits, timeout=timeout, event_hooks={"request": [_count_request]}),
+            httpx.AsyncClient(limits=limits, timeout=timeout, event_hooks={"request": [_acount_request]}),
+        )
+        _http_clients[key] = clients
+        _http_pool_stats["clients_created"] += 1
+        return clients
+
+
+def get_http_pool_stats() -> dict:
+    """返回HTTP连接池的复用统计，包括每个客户端当前持有的连接数。"""
+    stats = dict(_http_pool_stats)
+    connections = {}
+    with _http_clients_lock:
+        for key, (client, _) in _http_clients.items():
+            pool = getattr(client._transport, "_pool", None)
+            connections[key] = len(getattr(pool, "connections", []) or [])
+    stats["open_connections"] = connections
+    return stats
+
+
+# 各供应商的默认 base_url（OpenAI兼容接口）
+_PROVIDER_BASE_URLS = {
+    "qwen": "https://dashscope.aliyuncs.com/compatible-mode/v1",
+}
+
+# 已创建的路由实例，用于在侧边栏/注册表中展示各后端的延迟统计
+_routers = []
+
+
+def _create_chat_model(model_config: dict):
+    """根据单个后端的配置创建 ChatModel 实例。"""
     provider = model_config.get("provider", "openai").lower()
-    
-    # 您可以在此处添加更多供应商，如Anthropic, Google, Qwen等。
-    if provider == "openai":
+
+    # 您可以在此处添加更多供应商，如Anthropic, Google等。
+    # qwen（DashScope）提供 OpenAI 兼容接口，因此与 openai 共用 ChatOpenAI，只是默认 base_url 与密钥不同。
+    if provider in ("openai", "qwen"):
+        base_url = model_config.get("base_url") or _PROVIDER_BASE_URLS.get(provider)
+        api_key = model_config.get("api_key")
+        if provider == "qwen":
+            api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+        # langchain_openai 导入较慢（约1秒），推迟到第一次创建模型时
+        from langchain_openai import ChatOpenAI
+        http_client, http_async_client = get_http_clients(base_url, model_config.get("http_pool"))
         return ChatOpenAI(
             model=model_config.get("model_name"),
             temperature=model_config.get("temperature", 0.1),
-            api_key=model_config.get("api_key"),
-            base_url=model_config.get("base_url"),
-            streaming=False,
+            api_key=api_key,
+            base_url=base_url,
+            # 开启流式输出：计算图以 stream_mode="messages" 运行时，token会被逐个转发给UI
+            streaming=model_config.get("streaming", True),
+            stream_usage=True,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            # 记录每次调用的耗时、首token时延与token用量（指标关闭时为空列表）
+            callbacks=instrumentation.llm_callbacks(),
         )
     else:
         raise ValueError(f"不支持的LLM供应商: {provider}")
-    
-def get_subagent_model():
+
+
+def get_agent_model(model_config: dict):
+    """
+    LLM工厂函数：根据配置动态创建LLM实例。
+    配置中包含 "cascade" 时，返回先由小模型处理、必要时升级到该模型本身的 ModelCascade（见 model_cascade.py）；
+    配置中包含 "backends" 列表时，返回在这些后端之间做延迟感知路由、对冲与故障转移的 LLMRouter（见 llm_router.py）；
+    每个后端的配置会继承顶层配置中未覆盖的字段。
+    """
+    cascade = model_config.get("cascade")
+    if cascade and cascade.get("enabled", True):
+        return _create_cascade(model_config)
+    backends = model_config.get("backends")
+    if not backends:
+        return _create_chat_model(model_config)
+
+    from llm_router import DEFAULT_ROUTER_SETTINGS, LLMRouter, RouterBackend
+
+    settings = {**DEFAULT_ROUTER_SETTINGS, **(model_config.get("router") or {})}
+    base = {k: v for k, v in model_config.items() if k not in ("backends", "router")}
+    router_backends = []
+    for i, backend_config in enumerate(backends):
+        merged = {**base, **backend_config}
+        router_backends.append(RouterBackend(
+            name=backend_config.get("name") or f"{merged.get('provider', 'openai')}-{i}",
+            model=_create_chat_model(merged),
+            max_concurrency=backend_config.get("max_concurrency", 16),
+            rate_limit_per_second=backend_config.get("rate_limit_per_second"),
+            window=settings["window"],
+        ))
+    router = LLMRouter(backends=router_backends, settings=settings, streaming=True)
+    _routers[:] = [ref for ref in _routers if ref() is not None] + [weakref.ref(router)]
+    return router
+
+
+def _create_cascade(model_config: dict):
+    """
+    创建两级级联模型：大模型即去掉 "cascade" 字段后的配置（仍可配置 "backends"），
+    小模型的配置为 cascade["small"]，继承顶层配置中未覆盖的字段（多后端与路由参数除外）。
+    """
+    from model_cascade import DEFAULT_CASCADE_SETTINGS, ModelCascade
+
+    cascade = model_config["cascade"]
+    settings = {**DEFAULT_CASCADE_SETTINGS, **{k: v for k, v in cascade.items() if k not in ("small", "enabled")}}
+    large_config = {k: v for k, v in model_config.items() if k != "cascade"}
+    small_config = {
+        **{k: v for k, v in large_config.items() if k not in ("backends", "router", "pricing")},
+        **(cascade.get("small") or {}),
+    }
+    return ModelCascade(
+        small=get_agent_model(small_config),
+        large=get_agent_model(large_config),
+        settings=settings,
+        small_pricing=small_config.get("pricing") or {},
+        large_pricing=large_config.get("pricing") or {},
+        model_name=f"{small_config.get('model_name')}>{large_config.get('model_name')}",
+        streaming=large_config.get("streaming", True),
+    )
+
+
+def get_router_stats() -> dict:
+    """返回所有LLM路由中各后端的请求数、p50/p95延迟、错误率与熔断状态。"""
+    routers = [ref() for ref in list(_routers)]
+    return {
+        ",".join(b.name for b in router.backends): router.get_stats()
+        for router in routers if router is not None
+    }
+
+def get_subagent_model(model_config: dict = None):
+    """
+    子Agent使用的模型（非流式）。当前模型配置了 "cascade"（且未设置 "subagents": False）时使用同样的级联，
+    子任务先交给小模型；否则沿用环境变量 MODEL_NAME / OPENAI_API_BASE 指定的模型。
+    """
+    config_manager = ConfigManager()
+    if model_config is None:
+        model_config = config_manager.get_current_config()
+    cascade = model_config.get("cascade")
+    if cascade:
+        cascade = {**config_manager.get_runtime_config("model_cascade"), **cascade}
+    if cascade and cascade.get("enabled", True) and cascade.get("subagents", True):
+        config = dict(model_config)
+        if "model" in config:
+            config["model_name"] = config.pop("model")
+        config["cascade"] = cascade
+        config.setdefault("http_pool", config_manager.get_runtime_config("http_pool"))
+        config["streaming"] = False
+        return get_agent_model(config)
+
+    from langchain_openai import ChatOpenAI
+    http_client, http_async_client = get_http_clients(os.getenv("OPENAI_API_BASE"))
     return ChatOpenAI(
             model=os.getenv("MODEL_NAME"),
             temperature=0.1,
             api_key=os.getenv("OPENAI_API_KEY"),
             base_url=os.getenv("OPENAI_API_BASE"),
             streaming=False,
-        )
\ No newline at end of file
+            http_client=http_client,
+            http_async_client=http_async_client,
+            callbacks=instrumentation.llm_callbacks(),
+        )
@@ -0,0 +1,138 @@
+"""
+规划-并行执行模块
+为计算图的 "plan" 执行模式（见 graph.AgentWorkflow）提供计划的定义、校验与调度：
+  - planner 节点让模型调用 submit_plan 工具，一次性给出由若干工具步骤组成的有向无环图（DAG）；
+  - 依赖都已完成的步骤通过 LangGraph 的 Send 并行分发给 execute_step 节点，每一"波"完成后由 join 节点汇合；
+  - 全部步骤完成后由 synthesize 节点基于各步骤结果生成最终答复。
+一个需要 N 次独立检索的任务因此只需 2 次模型调用（规划 + 汇总），而不是 ReAct 循环中的 N + 1 次。
+
+步骤格式：{"id": "s1", "tool": 工具名, "args": {...}, "depends_on": ["s0", ...]}。
+字符串参数中的 "{s0}" 占位符会在执行前替换为该依赖步骤的结果（按 max_result_chars 截断）。
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+DEFAULT_PLANNER_SETTINGS = {
+    "default_execution_mode": "react",  # 请求未指定 execution_mode 时使用的模式："react" 或 "plan"
+    "max_steps": 8,                     # 单个计划最多的步骤数
+    "max_result_chars": 2000,           # 替换进后续步骤参数的依赖结果最大字符数
+}
+
+EXECUTION_MODES = ("react", "plan")
+
+PLAN_TOOL_NAME = "submit_plan"
+
+# 以 OpenAI 工具格式定义，直接传给 bind_tools
+PLAN_TOOL = {
+    "type": "function",
+    "function": {
+        "name": PLAN_TOOL_NAME,
+        "description": "提交执行计划：列出完成任务所需的工具调用步骤，没有依赖关系的步骤会被并行执行。",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "steps": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string", "description": "步骤编号，如 s1"},
+                            "tool": {"type": "string", "description": "要调用的工具名称"},
+                            "args": {"type": "object", "description": "工具参数；可用 {步骤编号} 引用依赖步骤的结果"},
+                            "depends_on": {"type": "array", "items": {"type": "string"}, "description": "依赖的步骤编号"},
+                        },
+                        "required": ["id", "tool", "args"],
+                    },
+                },
+            },
+            "required": ["steps"],
+        },
+    },
+}
+
+
+class PlanError(ValueError):
+    """计划不合法（工具不存在、编号重复、依赖不存在或存在环）。"""
+
+
+def parse_plan(args: Mapping[str, Any], tool_names: Iterable[str], max_steps: int = 8) -> List[Dict[str, Any]]:
+    """
+    校验 submit_plan 的参数并按拓扑顺序返回步骤列表。
+
+    Raises:
+        PlanError: 计划为空或不合法。
+    """
+    tool_names = set(tool_names)
+    raw_steps = args.get("steps") if isinstance(args, Mapping) else None
+    if not isinstance(raw_steps, list) or not raw_steps:
+        raise PlanError("计划为空")
+    if len(raw_steps) > max_steps:
+        raise PlanError(f"计划包含 {len(raw_steps)} 个步骤，超过上限 {max_steps}")
+
+    steps: Dict[str, Dict[str, Any]] = {}
+    for index, raw in enumerate(raw_steps):
+        if not isinstance(raw, Mapping):
+            raise PlanError(f"第 {index + 1} 个步骤格式错误")
+        step_id = str(raw.get("id") or f"s{index + 1}")
+        if step_id in steps:
+            raise PlanError(f"步骤编号重复: {step_id}")
+        if raw.get("tool") not in tool_names:
+            raise PlanError(f"步骤 {step_id} 使用了不存在的工具: {raw.get('tool')}")
+        steps[step_id] = {
+            "id": step_id,
+            "tool": raw["tool"],
+            "args": dict(raw.get("args") or {}),
+            "depends_on": [str(d) for d in raw.get("depends_on") or []],
+        }
+
+    for step in steps.values():
+        missing = [d for d in step["depends_on"] if d not in steps]
+        if missing:
+            raise PlanError(f"步骤 {step['id']} 依赖了不存在的步骤: {', '.join(missing)}")
+
+    # Kahn 拓扑排序，同时检测环
+    ordered, done = [], set()
+    pending = list(steps.values())
+    while pending:
+        ready = [s for s in pending if all(d in done for d in s["depends_on"])]
+        if not ready:
+            raise PlanError("步骤之间存在循环依赖: " + ", ".join(s["id"] for s in pending))
+        for step in ready:
+            ordered.append(step)
+            done.add(step["id"])
+        pending = [s for s in pending if s["id"] not in done]
+    return ordered
+
+
+def ready_steps(plan: List[Dict[str, Any]], results: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    """尚未执行、且依赖都已完成的步骤（即下一波可以并行执行的步骤）。"""
+    return [
+        step for step in plan
+        if step["id"] not in results and all(d in results for d in step["depends_on"])
+    ]
+
+
+def resolve_args(step: Dict[str, Any], results: Mapping[str, Any], max_result_chars: int = 2000) -> Dict[str, Any]:
+    """把参数中的 {步骤编号} 占位符替换为依赖步骤的结果。"""
+    if not step["depends_on"]:
+        return step["args"]
+    pattern = re.compile(r"\{(" + "|".join(re.escape(d) for d in step["depends_on"]) + r")\}")
+
+    def substitute(value: Any) -> Any:
+        if isinstance(value, str):
+            return pattern.sub(lambda m: str(results.get(m.group(1), ""))[:max_result_chars], value)
+        if isinstance(value, dict):
+            return {k: substitute(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [substitute(v) for v in value]
+        return value
+
+    return substitute(step["args"])
+
+
+def merge_step_results(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """AgentState.step_results 的合并函数：并行步骤各自写入自己的结果；写入 None 表示开始新计划、清空结果。"""
+    if right is None:
+        return {}
+    return {**(left or {}), **right}
@@ -0,0 +1,65 @@
+"""
+进程级并发限制模块
+ProcessLimiter 同时约束线程（同步调用）与协程（异步调用）的并发数，供工具执行（见 tool_executor.py）
+与多后端LLM路由的每后端并发上限（见 llm_router.py）使用。
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 异步路径等待进程级名额时的轮询间隔（秒）
+_POLL_MIN_SECONDS = 0.001
+_POLL_MAX_SECONDS = 0.05
+
+
+class ProcessLimiter:
+    """
+    进程级并发限制器。
+    基于 threading.BoundedSemaphore 实现，因此可以同时约束线程（同步调用）和不同事件循环中的协程。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._sem = threading.BoundedSemaphore(limit)
+
+    def __enter__(self):
+        self._sem.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._sem.release()
+
+    async def __aenter__(self):
+        # 名额已满时在事件循环中轮询（退避间隔逐步增大），不占用线程池的线程：
+        # 阻塞式等待会占满默认线程池，使同一进程中的 to_thread / run_in_executor 调用全部排队；
+        # 轮询等待被取消时也没有稍后才拿到的名额需要归还
+        delay = _POLL_MIN_SECONDS
+        while not self._sem.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _POLL_MAX_SECONDS)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._sem.release()
+
+
+_process_limiter: Optional[ProcessLimiter] = None
+_process_limiter_lock = threading.Lock()
+
+
+def get_process_limiter(limit: int) -> ProcessLimiter:
+    """
+    获取进程级共享的并发限制器（首次调用时按给定上限创建）。
+    之后传入的不同上限不会生效，只记录警告：已在使用的信号量无法安全地调整容量。
+    """
+    global _process_limiter
+    with _process_limiter_lock:
+        if _process_limiter is None:
+            _process_limiter = ProcessLimiter(limit)
+        elif limit != _process_limiter.limit:
+            logger.warning("进程级并发上限已按 %d 创建，忽略新的上限 %d", _process_limiter.limit, limit)
+        return _process_limiter
@@ -1,3 +1,12 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.messages import SystemMessage
+
 AGENT_SYSTEM_PROMPT = """
 # 身份：一个能干的、自主的通用AI助手
 
@@ -27,10 +36,111 @@ AGENT_SYSTEM_PROMPT = """
 这是你可以访问的动态信息，用于辅助你的决策。
 
 ## 上传文件清单
-这里存放着已经上传的文件的列表，可能会对你当前的任务有帮助。
+这里存放着已经上传的文件的列表（名称、路径、大小、类型与内容哈希），可能会对你当前的任务有帮助。
+需要文件内容时，请使用 search_uploaded_documents 检索相关片段，或用 read_uploaded_document 分段读取，不要一次性读取整个大文件。
 {{uploaded_file_paths}}
 
 ---
 
 现在，请开始你的工作。
-"""
\ No newline at end of file
+"""
+
+PLANNER_SYSTEM_PROMPT = """
+# 身份：任务规划器
+
+你负责为用户的最新请求制定执行计划。计划中的步骤会由系统并行执行，执行结果随后交给你汇总成最终答复。
+
+## 规划要求：
+
+1.  如果请求需要使用工具，请调用 submit_plan 一次性提交全部步骤，每个步骤是一次工具调用。
+2.  相互独立的步骤不要填写 depends_on，它们会被同时执行；只有确实需要前一步结果时才声明依赖，
+    并在参数中用 {步骤编号} 引用该结果（例如 "query": "{s1} 的最新进展"）。
+3.  步骤应尽量少而精，不要重复检索相同的内容。
+4.  如果不需要任何工具即可回答，请不要调用 submit_plan，直接回答用户。
+
+## 可用工具
+{{tools}}
+
+## 上传文件清单
+{{uploaded_file_paths}}
+"""
+
+SYNTHESIZE_PROMPT = "以上是按计划执行的各步骤结果。请综合这些结果，直接、完整地回答用户的请求；若结果不足以回答，请说明缺少的信息。"
+
+
+# --- 提示词组装 ---
+
+_PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+
+def _canonical_json(value: Any) -> str:
+    """稳定的JSON序列化：键排序、固定缩进，相同输入总是得到逐字节相同的文本。"""
+    return json.dumps(value, indent=2, ensure_ascii=False, sort_keys=True, default=str)
+
+
+class PromptTemplate:
+    """
+    预编译的 `{{name}}` 占位符模板。
+
+    模板在构造时只解析一次；渲染结果以输入的哈希为键做LRU缓存，并以同一个 SystemMessage 对象返回。
+    这样在一次对话的多个ReAct步骤之间系统提示词逐字节不变，可以命中服务端的前缀缓存（prefix caching），
+    同时固定的消息id也让token计数等下游缓存得以复用。
+    """
+
+    def __init__(self, template: str, name: str = "prompt", max_cache_entries: int = 256):
+        self.name = name
+        self.max_cache_entries = max_cache_entries
+        # 交替保存字面量片段与占位符名称：[literal, name, literal, name, ..., literal]
+        self._parts: List[str] = _PLACEHOLDER.split(template)
+        self.placeholders: Tuple[str, ...] = tuple(self._parts[1::2])
+        self._cache: "OrderedDict[str, SystemMessage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _format_value(value: Any) -> str:
+        if isinstance(value, str):
+            return value
+        return f"```json\n{_canonical_json(value)}\n```"
+
+    def _cache_key(self, values: Dict[str, Any]) -> str:
+        payload = _canonical_json({k: values.get(k) for k in self.placeholders})
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def render(self, **values: Any) -> SystemMessage:
+        key = self._cache_key(values)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+
+        pieces = list(self._parts)
+        for i in range(1, len(pieces), 2):
+            pieces[i] = self._format_value(values.get(pieces[i]))
+        message = SystemMessage(content="".join(pieces), id=f"{self.name}-{key[:16]}")
+
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = message
+            if len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return message
+
+
+agent_system_prompt = PromptTemplate(AGENT_SYSTEM_PROMPT, name="agent-system")
+
+
+def render_agent_system_prompt(uploaded_file_paths: Any) -> SystemMessage:
+    """渲染主Agent的系统提示词（带缓存）。返回的消息对象是共享的，调用方不应修改它。"""
+    return agent_system_prompt.render(uploaded_file_paths=uploaded_file_paths)
+
+
+planner_system_prompt = PromptTemplate(PLANNER_SYSTEM_PROMPT, name="planner-system")
+
+
+def render_planner_system_prompt(tools: Any, uploaded_file_paths: Any) -> SystemMessage:
+    """渲染规划器的系统提示词（带缓存）；tools 为 [{name, description, args}] 形式的工具清单。"""
+    return planner_system_prompt.render(tools=tools, uploaded_file_paths=uploaded_file_paths)
@@ -0,0 +1,319 @@
+"""
+配额与公平调度模块
+多个会话共用 ConfigManager 中配置的同一组模型与搜索密钥，本模块在 AgentWorkflow 之前加一层调度：
+  - 令牌桶限流（TokenBucket）：
+      * 每个租户：每分钟轮次数（服务模式准入时检查，超出返回 429）、每分钟 LLM token 数；
+      * 每个上游：每个模型每分钟 LLM token 数、每个工具上游（如 "search"）每分钟调用次数；
+    LLM token 在调用结束后按实际用量扣除（允许欠账），欠账期间该租户/上游的下一次调用先等待，
+    工具调用在执行前预占一个名额；
+  - 加权公平排队（FairQueue）：服务模式下待执行的轮次按租户排队，每次取出"已获得服务/权重"最少的租户的轮次，
+    轮次结束后按实际耗时计费，长时间的多工具循环因此不会饿死其他租户；
+  - 会话预算（merge_usage / budget_exceeded）：AgentState.usage 累计本会话的 token 与费用（包括上下文摘要与子Agent的调用），
+    超出预算时计算图路由到 budget_exhausted 节点，正常结束本轮而不是继续循环。
+    请求中的预算只能收紧配置的预算（effective_budget），调用方不能给自己调高或取消限制。
+
+租户由运行配置的 configurable["tenant_id"] 指定（服务模式取请求中的 tenant，界面为浏览器会话），未指定时为 thread_id。
+所有限额为 0 表示不限制；令牌桶与排队状态只保存在进程内。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Mapping, Optional
+
+from langchain_core.messages import AIMessage
+
+from instrumentation import instrumentation
+
+DEFAULT_QUOTA_SETTINGS = {
+    "enabled": True,
+    "tenant_turns_per_minute": 0,        # 每个租户每分钟可提交的轮次数（服务模式准入）
+    "tenant_llm_tokens_per_minute": 0,   # 每个租户每分钟的 LLM token 数（prompt + completion）
+    "llm_tokens_per_minute": 0,          # 每个模型（上游端点）每分钟的 LLM token 数，所有租户共享
+    "upstream_calls_per_minute": {},     # 工具上游每分钟调用次数，如 {"search": 60}
+    "tool_upstreams": {"tavily_search": "search"},  # 工具名 -> 上游名
+    "max_wait_seconds": 30.0,            # 单次等待限流的上限，超过时记录告警后继续执行
+    "tenant_weights": {},                # 公平排队的租户权重，默认 1
+    "thread_token_budget": 0,            # 每个会话累计 token 上限
+    "thread_cost_budget": 0.0,           # 每个会话累计费用上限（按模型配置中的 "pricing" 计算）
+}
+
+
+class TokenBucket:
+    """
+    令牌桶：平均每分钟 rate_per_minute 个令牌，容量默认为一分钟的量。
+    consume() 允许余额为负（事后按实际用量扣除），欠账按补充速率偿还。
+    """
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float = 0.0) -> float:
+        """余额达到 amount 还需要等待的秒数（不扣除）。"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (amount - self._tokens) / self.rate) if self._tokens < amount else 0.0
+
+    def consume(self, amount: float):
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """预占 amount 个令牌，返回需要等待的秒数。"""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class QuotaManager:
+    """
+    进程级的限流与预算策略（线程安全）。
+
+    Args:
+        settings: 覆盖 DEFAULT_QUOTA_SETTINGS 中的字段，默认读取 ConfigManager.runtime_configs["quotas"]。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        self.settings = {**DEFAULT_QUOTA_SETTINGS, **(settings or {})}
+        self._buckets: Dict[tuple, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, kind: str, name: str, rate: float) -> Optional[TokenBucket]:
+        if not self.settings["enabled"] or not rate:
+            return None
+        key = (kind, name)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate)
+            return bucket
+
+    def _capped(self, wait: float, what: str) -> float:
+        if wait > self.settings["max_wait_seconds"]:
+            instrumentation.inc("agent_quota_wait_capped_total", scope=what)
+            return self.settings["max_wait_seconds"]
+        return wait
+
+    # --- 轮次准入 ---
+
+    def admit_turn(self, tenant: str) -> float:
+        """租户提交一轮对话：允许时扣除名额并返回 0，否则返回建议的重试等待秒数。"""
+        bucket = self._bucket("tenant_turns", tenant, self.settings["tenant_turns_per_minute"])
+        if bucket is None:
+            return 0.0
+        wait = bucket.wait_time(1.0)
+        if wait > 0:
+            instrumentation.inc("agent_quota_rejected_total", scope="tenant_turns")
+            return wait
+        bucket.consume(1.0)
+        return 0.0
+
+    # --- LLM ---
+
+    def llm_wait(self, tenant: str, model: str) -> float:
+        """调用模型前需要等待的秒数：租户或模型上游的 token 额度处于欠账时，等到还清为止。"""
+        buckets = (
+            self._bucket("tenant_llm", tenant, self.settings["tenant_llm_tokens_per_minute"]),
+            self._bucket("llm", model, self.settings["llm_tokens_per_minute"]),
+        )
+        wait = max((b.wait_time() for b in buckets if b is not None), default=0.0)
+        if wait > 0:
+            instrumentation.observe("agent_quota_wait_seconds", wait, scope="llm")
+        return self._capped(wait, "llm")
+
+    def record_llm(self, tenant: str, model: str, tokens: int):
+        if not tokens:
+            return
+        for bucket in (
+            self._bucket("tenant_llm", tenant, self.settings["tenant_llm_tokens_per_minute"]),
+            self._bucket("llm", model, self.settings["llm_tokens_per_minute"]),
+        ):
+            if bucket is not None:
+                bucket.consume(tokens)
+
+    def acquire_llm(self, tenant: str, model: str):
+        wait = self.llm_wait(tenant, model)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire_llm(self, tenant: str, model: str):
+        wait = self.llm_wait(tenant, model)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # --- 工具上游 ---
+
+    def tool_wait(self, tool: str) -> float:
+        """为工具所属的上游预占一次调用，返回需要等待的秒数（工具不属于受限上游时为 0）。"""
+        upstream = self.settings["tool_upstreams"].get(tool)
+        if upstream is None:
+            return 0.0
+        bucket = self._bucket("upstream", upstream, (self.settings["upstream_calls_per_minute"] or {}).get(upstream, 0))
+        if bucket is None:
+            return 0.0
+        wait = bucket.reserve(1.0)
+        if wait > 0:
+            instrumentation.observe("agent_quota_wait_seconds", wait, scope=upstream)
+        return self._capped(wait, upstream)
+
+    def acquire_tool(self, tool: str):
+        wait = self.tool_wait(tool)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire_tool(self, tool: str):
+        wait = self.tool_wait(tool)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # --- 预算 ---
+
+    def default_budget(self) -> Dict[str, float]:
+        return {"tokens": self.settings["thread_token_budget"], "cost": self.settings["thread_cost_budget"]}
+
+    def weight(self, tenant: str) -> float:
+        return float((self.settings["tenant_weights"] or {}).get(tenant, 1.0))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = list(self._buckets.items())
+        return {f"{kind}:{name}": round(bucket.available, 1) for (kind, name), bucket in buckets}
+
+
+def tenant_of(config: Optional[Mapping[str, Any]]) -> str:
+    """从运行配置中取租户：configurable["tenant_id"]，未指定时为 thread_id。"""
+    configurable = (config or {}).get("configurable") or {}
+    return str(configurable.get("tenant_id") or configurable.get("thread_id") or "default")
+
+
+def merge_usage(left: Optional[Dict[str, float]], right: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """AgentState.usage 的合并函数：各项累加。"""
+    merged = dict(left or {})
+    for key, value in (right or {}).items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def usage_of(response: AIMessage, pricing: Optional[Mapping[str, float]] = None) -> Dict[str, float]:
+    """一次模型调用的用量（合并进 AgentState.usage）；费用按模型配置的 "pricing" 计算，模型级联的回复已自带费用。"""
+    usage = response.usage_metadata or {}
+    input_tokens, output_tokens = usage.get("input_tokens", 0) or 0, usage.get("output_tokens", 0) or 0
+    cascade = response.response_metadata.get("cascade")
+    if cascade:
+        # 模型级联（见 model_cascade.py）已按实际使用的各级模型的单价计算
+        cost = cascade["cost"]
+    else:
+        pricing = pricing or {}
+        cost = (input_tokens * pricing.get("input_per_million", 0.0) + output_tokens * pricing.get("output_per_million", 0.0)) / 1e6
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens, "cost": cost, "llm_calls": 1}
+
+
+def effective_budget(default: Optional[Mapping[str, float]], requested: Optional[Mapping[str, float]]) -> Dict[str, float]:
+    """
+    请求中的预算只能收紧配置的预算：各项取两者中较小的限制，0 或未设置表示不限制，
+    因此请求中为 0、负数或大于配置值的项不起作用。
+    """
+    budget = dict(default or {})
+    for key, value in (requested or {}).items():
+        if not value or value < 0:
+            continue
+        budget[key] = min(budget[key], value) if budget.get(key) else value
+    return budget
+
+
+def budget_exceeded(usage: Optional[Mapping[str, float]], budget: Optional[Mapping[str, float]]) -> Optional[str]:
+    """会话累计用量超过预算时返回原因（"token" 或 "费用"），否则返回 None；预算为 0 或未设置表示不限制。"""
+    usage, budget = usage or {}, budget or {}
+    if budget.get("tokens") and usage.get("total_tokens", 0) >= budget["tokens"]:
+        return "token"
+    if budget.get("cost") and usage.get("cost", 0.0) >= budget["cost"]:
+        return "费用"
+    return None
+
+
+class FairQueue:
+    """
+    按租户加权公平排队（start-time fair queuing 的简化版本），接口与 asyncio.Queue 的相应方法一致。
+
+    每个租户有一个虚拟时间（已获得的服务 / 权重）；get() 取出有待处理轮次的租户中虚拟时间最小者的最早轮次。
+    轮次结束后由调用方通过 charge() 按实际耗时计费。租户从空闲变为有待处理轮次时，
+    虚拟时间至少追到当前活跃租户的最小值，空闲期间不会积攒额度。只在事件循环线程中使用。
+    """
+
+    def __init__(self, maxsize: int = 0, weight=None):
+        self.maxsize = maxsize
+        self._weight = weight or (lambda tenant: 1.0)
+        self._queues: Dict[str, Deque[Any]] = {}
+        self._vtime: Dict[str, float] = {}
+        self._size = 0
+        self._items = asyncio.Semaphore(0)
+
+    def qsize(self) -> int:
+        return self._size
+
+    def put_nowait(self, job):
+        if self.maxsize and self._size >= self.maxsize:
+            raise asyncio.QueueFull
+        tenant = job.tenant
+        queue = self._queues.get(tenant)
+        if not queue:
+            floor = min((self._vtime[t] for t in self._queues), default=0.0)
+            self._vtime[tenant] = max(self._vtime.get(tenant, 0.0), floor)
+            queue = self._queues[tenant] = deque()
+        queue.append(job)
+        self._size += 1
+        self._items.release()
+
+    async def get(self):
+        await self._items.acquire()
+        tenant = min(self._queues, key=lambda t: self._vtime[t])
+        queue = self._queues[tenant]
+        job = queue.popleft()
+        if not queue:
+            del self._queues[tenant]
+        self._size -= 1
+        return job
+
+    def charge(self, tenant: str, cost: float):
+        """租户的一轮结束后按实际消耗（秒）推进其虚拟时间。"""
+        self._vtime[tenant] = self._vtime.get(tenant, 0.0) + cost / max(1e-6, self._weight(tenant))
+        if len(self._vtime) > 4 * max(64, len(self._queues)):
+            # 清理长期空闲租户的虚拟时间，它们重新活跃时从当前最小值开始
+            self._vtime = {t: v for t, v in self._vtime.items() if t in self._queues}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"queued_tenants": len(self._queues), "queued_by_tenant": {t: len(q) for t, q in self._queues.items()}}
+
+
+_quota_manager: Optional[QuotaManager] = None
+_quota_lock = threading.Lock()
+
+
+def get_quota_manager(settings: Optional[Dict[str, Any]] = None) -> QuotaManager:
+    """获取进程级共享的配额管理器（首次调用时按给定配置创建，未给出时读取 ConfigManager）。"""
+    global _quota_manager
+    with _quota_lock:
+        if _quota_manager is None:
+            if settings is None:
+                from configs import ConfigManager
+                settings = ConfigManager().get_runtime_config("quotas")
+            _quota_manager = QuotaManager(settings)
+        return _quota_manager
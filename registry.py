@@ -0,0 +1,95 @@
+"""
+工作流注册表模块
+在进程范围内按模型配置共享已编译的计算图、LLM客户端与检查点后端。
+
+每个会话不再单独构建 ChatOpenAI / 绑定工具 / 编译 StateGraph，而是从注册表获取同一个计算图，
+会话之间仅通过 `configurable.thread_id` 隔离对话状态。
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from configs import ConfigManager
+from models import get_http_pool_stats, get_router_stats
+
+
+class WorkflowRegistry:
+    """
+    按模型配置缓存已编译计算图的注册表（线程安全）。
+    所有计算图共享同一个检查点后端，因此同一 thread_id 在切换模型后仍能读取到历史状态。
+    """
+
+    def __init__(self, checkpointer_settings: Optional[Dict[str, Any]] = None):
+        self._lock = threading.Lock()
+        self._workflows: Dict[str, Any] = {}
+        self._checkpointer_settings = checkpointer_settings
+        self._checkpointer = None
+        self.stats = {"hits": 0, "misses": 0, "build_seconds": 0.0}
+
+    @staticmethod
+    def config_key(model_config: Dict[str, Any]) -> str:
+        """根据模型配置生成稳定的键；API密钥只参与哈希，不会以明文出现在键中。"""
+        canonical = json.dumps(model_config, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def checkpointer(self):
+        if self._checkpointer is None:
+            settings = self._checkpointer_settings
+            if settings is None:
+                settings = ConfigManager().get_runtime_config("checkpointer")
+            from checkpointer import create_checkpointer
+            self._checkpointer = create_checkpointer(settings)
+        return self._checkpointer
+
+    def get_workflow(self, model_config: Dict[str, Any]):
+        """获取（必要时构建）该模型配置对应的已编译计算图。"""
+        key = self.config_key(model_config)
+        with self._lock:
+            workflow = self._workflows.get(key)
+            if workflow is not None:
+                self.stats["hits"] += 1
+                return workflow
+
+            # 计算图模块（LangGraph、模型客户端、工具）在第一次构建时才导入，瘦客户端模式下完全不需要
+            from graph import create_agent_workflow
+            start = time.perf_counter()
+            workflow = create_agent_workflow(model_config, checkpointer=self.checkpointer)
+            self.stats["build_seconds"] += time.perf_counter() - start
+            self.stats["misses"] += 1
+            self._workflows[key] = workflow
+            return workflow
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回注册表命中情况、HTTP连接池复用统计与多后端路由的各后端状态。"""
+        return {
+            **self.stats,
+            "workflows": len(self._workflows),
+            "http_pool": get_http_pool_stats(),
+            "llm_router": get_router_stats(),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._workflows.clear()
+
+
+_registry: Optional[WorkflowRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> WorkflowRegistry:
+    """获取进程级单例注册表。"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = WorkflowRegistry()
+        return _registry
+
+
+def get_shared_workflow(model_config: Dict[str, Any]):
+    """便捷函数：从进程级注册表获取共享的已编译计算图。"""
+    return get_registry().get_workflow(model_config)
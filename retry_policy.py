@@ -0,0 +1,143 @@
+"""
+重试策略模块
+为计算图中的LLM调用提供统一的重试决策：
+  - 带抖动的指数退避：第 n 次重试等待 min(max_delay, base_delay * multiplier**n)，开启抖动时在 [0, 该值] 内均匀取值（full jitter），
+    避免大量会话在服务端限流后同时重试；
+  - 限流感知：调用因 429 等错误失败时，优先使用响应头中的 Retry-After / retry-after-ms / x-ratelimit-reset-* 作为等待时间；
+  - 截断续写：finish_reason 为 "length" 时不丢弃已生成（已付费）的内容，而是让模型从中断处继续，最多 max_continuations 次；
+  - 可重试判断：只有超时、连接错误、408/409/429 与 5xx 才会重试，参数错误等确定性失败直接结束。
+
+策略参数的默认值在 ConfigManager.runtime_configs["retry"] 中，可在模型配置的 "retry_policy" 字段中按模型覆盖。
+"""
+
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+DEFAULT_RETRY_POLICY = {
+    "max_retries": 3,            # 空回复、内容过滤、可重试错误的最大重试次数
+    "base_delay": 0.5,           # 首次重试的基础等待（秒）
+    "multiplier": 2.0,           # 每次重试等待时间的增长倍数
+    "max_delay": 20.0,           # 单次退避等待的上限（秒）
+    "jitter": True,              # 是否使用 full jitter
+    "max_continuations": 2,      # length 截断后最多续写的次数
+    "respect_retry_after": True, # 是否遵循限流响应头给出的等待时间
+    "max_retry_after": 60.0,     # 限流响应头等待时间的上限（秒）
+}
+
+# 需要重试的异常结束原因（不含 length：它优先走续写路径）
+RETRY_FINISH_REASONS = ("content_filter", "null", "retryable_error")
+
+_RETRYABLE_STATUS = {408, 409, 429}
+_RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "TimeoutException", "ConnectError", "ReadTimeout", "RemoteProtocolError"}
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+CONTINUE_PROMPT = "你上一条回复因长度限制被截断。请从中断处直接继续输出，不要重复已输出的内容，也不要添加任何说明。"
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """解析 OpenAI 风格的时长（如 "1s"、"6m0s"、"20ms"）或纯数字秒数。"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after_from_headers(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """从响应头中读取建议的等待时间（秒），没有相关响应头时返回 None。"""
+    if not headers:
+        return None
+    lowered = {str(k).lower(): v for k, v in dict(headers).items()}
+
+    if "retry-after-ms" in lowered:
+        try:
+            return float(lowered["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" in lowered:
+        value = lowered["retry-after"]
+        seconds = parse_duration(value)
+        if seconds is not None:
+            return seconds
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    # 没有 Retry-After 时，参考已耗尽配额的 x-ratelimit-reset-*
+    waits = []
+    for kind in ("requests", "tokens"):
+        remaining = lowered.get(f"x-ratelimit-remaining-{kind}")
+        reset = parse_duration(lowered.get(f"x-ratelimit-reset-{kind}", ""))
+        if reset is not None and remaining is not None and str(remaining).strip() == "0":
+            waits.append(reset)
+    return max(waits) if waits else None
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """判断一次LLM调用异常是否值得重试。"""
+    status = _status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def retry_after_from_error(error: BaseException) -> Optional[float]:
+    """从异常携带的HTTP响应中读取限流等待时间。"""
+    response = getattr(error, "response", None)
+    return retry_after_from_headers(getattr(response, "headers", None))
+
+
+class RetryPolicy:
+    """
+    单个模型的重试策略。
+
+    Args:
+        settings: 覆盖 DEFAULT_RETRY_POLICY 中的字段。
+        rng: 抖动使用的随机数生成器（便于测试时固定种子）。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, rng: Optional[random.Random] = None):
+        self.settings = {**DEFAULT_RETRY_POLICY, **(settings or {})}
+        self._rng = rng or random.Random()
+
+    @property
+    def max_retries(self) -> int:
+        return self.settings["max_retries"]
+
+    @property
+    def max_continuations(self) -> int:
+        return self.settings["max_continuations"]
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试（从0开始）的退避时间。"""
+        s = self.settings
+        ceiling = min(s["max_delay"], s["base_delay"] * (s["multiplier"] ** attempt))
+        return self._rng.uniform(0, ceiling) if s["jitter"] else ceiling
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """实际等待时间：服务端给出等待时间时取其与退避时间的较大值（受 max_retry_after 限制）。"""
+        wait = self.backoff(attempt)
+        if retry_after is not None and self.settings["respect_retry_after"]:
+            wait = max(wait, min(retry_after, self.settings["max_retry_after"]))
+        return wait
@@ -0,0 +1,480 @@
+"""
+无界面服务模块
+在 Streamlit 之外以 ASGI 应用的形式运行计算图，供多用户并发访问：
+  - 流式输出：POST /v1/turns 以 SSE（text/event-stream）逐条推送 StreamEvent，事件格式见 streaming.event_to_dict；
+  - 请求队列与准入控制：排队请求数超过 max_queue 时返回 503，单个 thread_id 的待处理轮次超过
+    max_pending_per_thread 时返回 429，两者都带 Retry-After 响应头；
+  - 背压：每个请求的事件缓冲区有上限，客户端读取变慢时计算图的流式迭代随之暂停，
+    超过 stall_timeout_seconds 仍未读取则放弃本轮；客户端断开连接时立即取消；
+  - 同一 thread_id 的轮次串行执行（后到的轮次等前一轮写完检查点再开始），不同 thread 之间并发；
+  - 固定数量的 worker 协程从队列取任务，用异步路径（astream）运行计算图；
+  - 租户（请求中的 "tenant" 或 X-Tenant-Id 请求头，默认为 thread_id）：待执行的轮次按租户加权公平排队，
+    租户每分钟的轮次数超限时返回 429；LLM token 与搜索调用的限流、会话预算在计算图内执行（见 quota.py）。
+
+应用本身只依赖标准库，可由任意 ASGI 服务器加载；直接运行时使用 uvicorn：
+    python server.py
+    uvicorn server:app --host 0.0.0.0 --port 8000
+
+会话接口：GET /v1/threads?limit=&offset= 按最近活动时间分页列出请求租户的会话（见 session_index.py，
+租户由 X-Tenant-Id 请求头或 tenant 参数指定，必填），
+GET /v1/threads/<thread_id>/messages?turns=N 从最新检查点读取该会话最近 N 轮消息，供客户端恢复会话。
+会话属于创建它的租户，其他租户读取或继续该会话时返回 404。
+
+其他接口：GET /healthz、GET /v1/stats（队列与注册表统计）、GET /metrics（Prometheus 指标）。
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import parse_qs, unquote
+
+from langchain_core.messages import HumanMessage, messages_to_dict
+
+from configs import ConfigManager
+from instrumentation import instrumentation
+from message_store import load_history
+from planner import EXECUTION_MODES
+from quota import FairQueue, get_quota_manager
+from registry import get_registry
+from session_index import get_session_index
+from streaming import astream_agent_turn, event_to_dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVER_SETTINGS = {
+    "workers": 8,                   # 同时运行的轮次数
+    "max_queue": 64,                # 排队等待的轮次上限
+    "max_pending_per_thread": 2,    # 单个 thread_id 排队+运行中的轮次上限
+    "queue_timeout_seconds": 60.0,  # 排队超过该时间的轮次直接失败
+    "stream_buffer": 256,           # 每个请求缓冲的事件数
+    "stall_timeout_seconds": 30.0,  # 客户端停止读取多久后放弃本轮
+    "heartbeat_seconds": 15.0,      # SSE 心跳间隔
+}
+
+
+class AdmissionError(Exception):
+    """请求未被准入（队列已满或该会话待处理轮次过多）。"""
+
+    def __init__(self, status: int, message: str, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+@dataclass
+class TurnJob:
+    """一轮待执行的对话。"""
+    thread_id: str
+    agent_input: Dict[str, Any]
+    model_config: Dict[str, Any]
+    events: asyncio.Queue
+    tenant: str = "default"
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    cancelled: bool = False
+    task: Optional[asyncio.Task] = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self.task is not None:
+            self.task.cancel()
+
+
+class TurnScheduler:
+    """
+    轮次调度器：按租户加权公平排队的有界队列 + 固定数量的 worker，并保证同一 thread_id 的轮次串行执行。
+    所有状态只在事件循环线程中修改，因此不需要加锁。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, quota=None):
+        self.settings = {**DEFAULT_SERVER_SETTINGS, **(settings or {})}
+        self.quota = quota or get_quota_manager()
+        self._queue: Optional[FairQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._running_threads: set = set()
+        self._waiting: Dict[str, Deque[TurnJob]] = {}
+        self._pending: Dict[str, int] = {}
+        # 轮次耗时的指数滑动平均，用于估计 Retry-After
+        self._avg_turn_seconds = 5.0
+        self.stats = {"accepted": 0, "rejected_queue": 0, "rejected_thread": 0, "rejected_tenant": 0, "completed": 0, "failed": 0, "cancelled": 0, "expired": 0}
+
+    # --- 生命周期 ---
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = FairQueue(maxsize=self.settings["max_queue"], weight=self.quota.weight)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"agent-worker-{i}") for i in range(self.settings["workers"])
+        ]
+        logger.info("服务已启动 %d 个 worker", len(self._workers))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # --- 准入 ---
+
+    def submit(self, job: TurnJob):
+        """准入检查并入队；不满足条件时抛出 AdmissionError。"""
+        self.start()
+        pending = self._pending.get(job.thread_id, 0)
+        if pending >= self.settings["max_pending_per_thread"]:
+            self.stats["rejected_thread"] += 1
+            raise AdmissionError(429, f"会话 {job.thread_id} 已有 {pending} 轮对话在处理中", retry_after=1.0)
+        if self._queue.qsize() >= self.settings["max_queue"]:
+            self.stats["rejected_queue"] += 1
+            raise AdmissionError(503, "服务繁忙，请稍后重试", retry_after=self._estimated_wait())
+        retry_after = self.quota.admit_turn(job.tenant)
+        if retry_after > 0:
+            self.stats["rejected_tenant"] += 1
+            raise AdmissionError(429, f"租户 {job.tenant} 提交的轮次过多", retry_after=retry_after)
+        self._queue.put_nowait(job)
+        self._pending[job.thread_id] = pending + 1
+        self.stats["accepted"] += 1
+
+    def _estimated_wait(self) -> float:
+        """粗略估计排队时间：按最近轮次的平均耗时与队列长度计算。"""
+        per_worker = self._queue.qsize() / max(1, self.settings["workers"])
+        return round(max(1.0, self._avg_turn_seconds * per_worker), 1)
+
+    # --- 执行 ---
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            thread_id = job.thread_id
+            if thread_id in self._running_threads:
+                # 同一会话的上一轮仍在执行：挂到该会话的等待队列，由正在执行的 worker 接着处理
+                self._waiting.setdefault(thread_id, deque()).append(job)
+                continue
+            self._running_threads.add(thread_id)
+            try:
+                while job is not None:
+                    await self._run(job)
+                    waiting = self._waiting.get(thread_id)
+                    job = waiting.popleft() if waiting else None
+                    if waiting is not None and not waiting:
+                        self._waiting.pop(thread_id, None)
+            finally:
+                self._running_threads.discard(thread_id)
+
+    async def _emit(self, job: TurnJob, item: Optional[Dict[str, Any]]):
+        """写入请求的事件缓冲区；缓冲区满时等待客户端读取（背压），超时则放弃本轮。"""
+        await asyncio.wait_for(job.events.put(item), timeout=self.settings["stall_timeout_seconds"])
+
+    async def _run(self, job: TurnJob):
+        waited = time.perf_counter() - job.enqueued_at
+        instrumentation.observe("agent_server_queue_seconds", waited)
+        started = time.perf_counter()
+        try:
+            if job.cancelled:
+                self.stats["cancelled"] += 1
+                return
+            if waited > self.settings["queue_timeout_seconds"]:
+                self.stats["expired"] += 1
+                await self._emit(job, {"kind": "error", "data": {"error": "排队超时", "status": 503}, "node": None})
+                return
+            job.task = asyncio.create_task(self._stream(job))
+            try:
+                await job.task
+                self._avg_turn_seconds = 0.8 * self._avg_turn_seconds + 0.2 * (time.perf_counter() - started)
+                self.stats["completed"] += 1
+                instrumentation.inc("agent_server_turns_total", status="completed")
+            except asyncio.CancelledError:
+                if not job.cancelled:
+                    raise
+                self.stats["cancelled"] += 1
+                instrumentation.inc("agent_server_turns_total", status="cancelled")
+            except asyncio.TimeoutError:
+                job.cancelled = True
+                self.stats["cancelled"] += 1
+                instrumentation.inc("agent_server_turns_total", status="stalled")
+                logger.warning("会话 %s 的客户端长时间未读取，已放弃本轮", job.thread_id)
+            except Exception as e:
+                self.stats["failed"] += 1
+                instrumentation.inc("agent_server_turns_total", status="failed")
+                logger.exception("会话 %s 的轮次执行失败", job.thread_id)
+                await self._emit(job, {"kind": "error", "data": {"error": repr(e), "status": 500}, "node": None})
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # 公平排队按轮次的实际耗时计费
+            self._queue.charge(job.tenant, time.perf_counter() - started)
+            self._pending[job.thread_id] = self._pending.get(job.thread_id, 1) - 1
+            if self._pending[job.thread_id] <= 0:
+                self._pending.pop(job.thread_id, None)
+            if not job.cancelled:
+                try:
+                    job.events.put_nowait(None)
+                except asyncio.QueueFull:
+                    pass
+
+    async def _stream(self, job: TurnJob):
+        workflow = get_registry().get_workflow(job.model_config)
+        config = {"configurable": {"thread_id": job.thread_id, "tenant_id": job.tenant}}
+        async for event in astream_agent_turn(workflow, job.agent_input, config):
+            await self._emit(job, event_to_dict(event))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running_threads": len(self._running_threads),
+            "waiting_threads": len(self._waiting),
+            **(self._queue.get_stats() if self._queue is not None else {}),
+            "quota_buckets": self.quota.get_stats(),
+        }
+
+
+# --- ASGI 应用 ---
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status: int, payload: Any, headers: Optional[List[tuple]] = None):
+    data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json; charset=utf-8"), (b"content-length", str(len(data)).encode())] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": data})
+
+
+class AgentServer:
+    """
+    ASGI 应用。
+
+    Args:
+        settings: 覆盖 DEFAULT_SERVER_SETTINGS，默认读取 ConfigManager.runtime_configs["server"]。
+        config_manager: 用于按名称解析请求中的 "model"。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, config_manager: Optional[ConfigManager] = None):
+        self.config_manager = config_manager or ConfigManager()
+        if settings is None:
+            settings = self.config_manager.get_runtime_config("server")
+        self.settings = {**DEFAULT_SERVER_SETTINGS, **(settings or {})}
+        self.scheduler = TurnScheduler(self.settings)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"].rstrip("/")
+        if method == "POST" and path == "/v1/turns":
+            await self._turn(scope, receive, send)
+        elif method == "GET" and path == "/healthz":
+            await _send_json(send, 200, {"status": "ok"})
+        elif method == "GET" and path == "/v1/threads":
+            await self._list_threads(scope, send)
+        elif method == "GET" and path.startswith("/v1/threads/") and path.endswith("/messages"):
+            await self._thread_messages(scope, send, unquote(path[len("/v1/threads/"):-len("/messages")]))
+        elif method == "GET" and path == "/v1/stats":
+            await _send_json(send, 200, {"scheduler": self.scheduler.get_stats(), "registry": get_registry().get_stats()})
+        elif method == "GET" and path == "/metrics":
+            data = instrumentation.export_prometheus().encode("utf-8")
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain; version=0.0.4")]})
+            await send({"type": "http.response.body", "body": data})
+        else:
+            await _send_json(send, 404, {"error": "not found"})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.scheduler.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.scheduler.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _model_config(self, name: Optional[str]) -> Dict[str, Any]:
+        if name and name not in self.config_manager.model_configs:
+            raise ValueError(f"未知的模型: {name}")
+        if name:
+            return {**self.config_manager.model_configs[name], "model": name}
+        return self.config_manager.get_current_config()
+
+    async def _turn(self, scope, receive, send):
+        """
+        请求体：{"message": 用户输入, "thread_id": 可选, "uploaded_file_paths": 可选, "model": 可选,
+                "execution_mode": 可选（"react" 或 "plan"，见 planner.py）, "tenant": 可选,
+                "budget": 可选（{"tokens", "cost"}，本会话的预算，只能低于配置的预算，见 quota.py）, "stream": 默认true}。
+        流式响应的每个SSE事件为 `data: {"kind", "data", "node"}`，最后一个事件为 done 或 error。
+        """
+        try:
+            body = json.loads(await _read_body(receive) or b"{}")
+            message = body["message"]
+            if not isinstance(message, str) or not message.strip():
+                raise ValueError("message 必须是非空字符串")
+            model_config = self._model_config(body.get("model"))
+            execution_mode = body.get("execution_mode")
+            if execution_mode is not None and execution_mode not in EXECUTION_MODES:
+                raise ValueError(f"未知的执行模式: {execution_mode}")
+            budget = body.get("budget")
+            if budget is not None:
+                budget = {key: float(budget[key]) for key in ("tokens", "cost") if key in budget}
+        except (ValueError, KeyError, TypeError) as e:
+            await _send_json(send, 400, {"error": f"请求格式错误: {e!r}"})
+            return
+
+        thread_id = body.get("thread_id") or str(uuid.uuid4())
+        tenant = self._tenant(scope, body.get("tenant")) or thread_id
+        # 会话属于创建它的租户：其他租户不能继续该会话（与不存在的会话不作区分）
+        if not await asyncio.to_thread(get_session_index().can_access, thread_id, tenant, True):
+            await _send_json(send, 404, {"error": "not found"})
+            return
+        job = TurnJob(
+            thread_id=thread_id,
+            agent_input={
+                "messages": [HumanMessage(content=message)],
+                "uploaded_file_paths": {"uploaded_file_paths": body.get("uploaded_file_paths") or []},
+                # 每轮都写入执行模式（None 表示使用模型的默认模式）：execution_mode 保存在检查点中，
+                # 只在指定时写入会让上一轮选择的模式延续到之后未指定模式的轮次
+                "execution_mode": execution_mode,
+                **({"budget": budget} if budget is not None else {}),
+            },
+            model_config=model_config,
+            events=asyncio.Queue(maxsize=self.settings["stream_buffer"]),
+            tenant=tenant,
+        )
+        try:
+            self.scheduler.submit(job)
+        except AdmissionError as e:
+            instrumentation.inc("agent_server_rejected_total", status=e.status)
+            await _send_json(send, e.status, {"error": str(e)}, headers=[(b"retry-after", str(int(e.retry_after + 0.999)).encode())])
+            return
+        await asyncio.to_thread(get_session_index().record_turn, thread_id, message, model_config.get("model"), tenant)
+
+        if body.get("stream", True):
+            await self._stream_response(job, receive, send)
+        else:
+            await self._json_response(job, send)
+
+    @staticmethod
+    def _query_int(scope, name: str, default: int) -> int:
+        values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(name)
+        try:
+            return max(0, int(values[0])) if values else default
+        except ValueError:
+            return default
+
+    @staticmethod
+    def _tenant(scope, explicit: Optional[str] = None) -> Optional[str]:
+        """请求所属的租户：显式给出的 tenant（请求体或查询参数）优先，其次为 X-Tenant-Id 请求头。"""
+        if explicit:
+            return str(explicit)
+        headers = dict(scope.get("headers") or [])
+        return headers.get(b"x-tenant-id", b"").decode("latin-1") or None
+
+    async def _list_threads(self, scope, send):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        tenant = self._tenant(scope, (query.get("tenant") or [None])[0])
+        if not tenant:
+            await _send_json(send, 400, {"error": "需要通过 X-Tenant-Id 请求头或 tenant 参数指定租户"})
+            return
+        limit = self._query_int(scope, "limit", 20)
+        offset = self._query_int(scope, "offset", 0)
+        threads = await asyncio.to_thread(get_session_index().list_sessions, tenant, limit, offset)
+        await _send_json(send, 200, {"threads": threads})
+
+    async def _thread_messages(self, scope, send, thread_id: str):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        tenant = self._tenant(scope, (query.get("tenant") or [None])[0]) or thread_id
+        if not await asyncio.to_thread(get_session_index().can_access, thread_id, tenant):
+            await _send_json(send, 404, {"error": "not found"})
+            return
+        turns = self._query_int(scope, "turns", self.config_manager.get_runtime_config("sessions").get("history_window_turns", 10))
+        unloaded_turns, messages = await asyncio.to_thread(load_history, get_registry().checkpointer, thread_id, turns)
+        await _send_json(send, 200, {"thread_id": thread_id, "unloaded_turns": unloaded_turns, "messages": messages_to_dict(messages)})
+
+    async def _stream_response(self, job: TurnJob, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-thread-id", job.thread_id.encode()),
+            ],
+        })
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    job.cancel()
+                    return
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            while True:
+                getter = asyncio.ensure_future(job.events.get())
+                done, _ = await asyncio.wait({getter, watcher}, timeout=self.settings["heartbeat_seconds"], return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    if watcher in done:
+                        return  # 客户端已断开，本轮已被取消
+                    await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+                    continue
+                item = getter.result()
+                if item is None:
+                    break
+                data = json.dumps(item, ensure_ascii=False, default=str)
+                await send({"type": "http.response.body", "body": f"data: {data}\n\n".encode("utf-8"), "more_body": True})
+                if item["kind"] in ("done", "error"):
+                    break
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        except (OSError, asyncio.CancelledError):
+            job.cancel()
+            raise
+        finally:
+            watcher.cancel()
+
+    async def _json_response(self, job: TurnJob, send):
+        events = []
+        while True:
+            item = await job.events.get()
+            if item is None:
+                break
+            if item["kind"] in ("ai_message", "tool_result", "done", "error"):
+                events.append(item)
+            if item["kind"] in ("done", "error"):
+                break
+        error = next((e["data"] for e in events if e["kind"] == "error"), None)
+        status = error.get("status", 500) if error else 200
+        await _send_json(send, status, {"thread_id": job.thread_id, "events": events})
+
+
+app = AgentServer()
+
+
+def main():
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("运行服务需要安装 uvicorn：pip install uvicorn（也可以用其他 ASGI 服务器加载 server:app）")
+    settings = ConfigManager().get_runtime_config("server")
+    uvicorn.run(app, host=settings.get("host", "127.0.0.1"), port=settings.get("port", 8000), log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+会话索引模块
+记录每个会话（thread_id）的标题、所用模型、轮次数与最近活动时间，供界面列出并恢复历史会话。
+对话内容本身只保存在检查点中（见 checkpointer.py），索引只保存用于列表展示的少量元数据。
+
+每个会话属于创建它的所有者（服务模式下为租户，Streamlit 界面中为浏览器会话的租户ID）：
+列出会话只返回该所有者的会话，恢复与继续会话前由调用方用 can_access 检查。
+
+索引保存在 SQLite 文件中（ConfigManager.runtime_configs["sessions"]["index_path"]），进程重启后依然有效；
+检查点后端按TTL淘汰的会话在列出时仍可能出现，恢复时会得到空历史。
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from configs import ConfigManager
+
+
+class SessionIndex:
+    """
+    会话索引（线程安全）。
+
+    Args:
+        path: SQLite 文件路径，":memory:" 表示只保存在内存中。
+        title_chars: 标题取首条用户消息的前多少个字符。
+    """
+
+    def __init__(self, path: str = "sessions.sqlite", title_chars: int = 40):
+        self.path = path
+        self.title_chars = title_chars
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "thread_id TEXT PRIMARY KEY, title TEXT, model TEXT, turns INTEGER, created_at REAL, updated_at REAL, owner TEXT)"
+        )
+        # 早期版本的索引没有 owner 列：补上该列，旧会话没有所有者，不会出现在任何人的列表中
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN owner TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_owner_updated_at ON sessions (owner, updated_at)")
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "SessionIndex":
+        """根据 ConfigManager.runtime_configs["sessions"] 创建索引。"""
+        settings = settings or {}
+        return cls(settings.get("index_path", "sessions.sqlite"), title_chars=settings.get("title_chars", 40))
+
+    _COLUMNS = "thread_id, title, model, turns, created_at, updated_at, owner"
+
+    @staticmethod
+    def _row_to_dict(row) -> Dict[str, Any]:
+        thread_id, title, model, turns, created_at, updated_at, owner = row
+        return {
+            "thread_id": thread_id, "title": title, "model": model, "turns": turns,
+            "created_at": created_at, "updated_at": updated_at, "owner": owner,
+        }
+
+    def record_turn(self, thread_id: str, prompt: str, model: Optional[str] = None, owner: Optional[str] = None):
+        """登记一轮对话：新会话以本轮输入作为标题并归属 owner，已有会话累加轮次并更新活动时间与模型（所有者不变）。"""
+        title = " ".join(prompt.split())[:self.title_chars] or "(空消息)"
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO sessions ({self._COLUMNS}) VALUES (?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET turns = turns + 1, updated_at = excluded.updated_at, "
+                "model = COALESCE(excluded.model, model)",
+                (thread_id, title, model, now, now, owner),
+            )
+
+    def get(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._COLUMNS} FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def can_access(self, thread_id: str, owner: Optional[str], allow_new: bool = False) -> bool:
+        """
+        owner 能否读取或继续该会话：会话已登记时必须属于 owner（没有所有者的旧会话不属于任何人）；
+        未登记的会话只在 allow_new 时允许（以该ID开始新会话）。
+        """
+        meta = self.get(thread_id)
+        if meta is None:
+            return allow_new
+        return owner is not None and meta["owner"] == owner
+
+    def list_sessions(self, owner: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """按最近活动时间倒序分页列出 owner 的会话。"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM sessions WHERE owner = ? ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (owner, limit, offset),
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def remove(self, thread_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+        return cursor.rowcount > 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, turns = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(turns), 0) FROM sessions").fetchone()
+        return {"sessions": count, "turns": turns}
+
+
+_index: Optional[SessionIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_session_index() -> SessionIndex:
+    """获取进程级共享的会话索引（首次调用时按配置创建）。"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SessionIndex.from_settings(ConfigManager().get_runtime_config("sessions"))
+        return _index
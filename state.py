@@ -1,7 +1,11 @@
-from typing import List, TypedDict, Annotated, Any
+from typing import Dict, List, TypedDict, Annotated, Any, Optional
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
 
+from planner import merge_step_results
+from tool_ledger import merge_tool_ledger
+from quota import merge_usage
+
 class AgentState(TypedDict):
     """
     定义Agent在工作流中传递的状态。
@@ -20,7 +24,29 @@ class AgentState(TypedDict):
 
         finish_reason: 上一次LLM调用的finish_reason，用于路由决策，是实现鲁棒性的关键。
         
-        retry_count: 用于追踪discard_and_retry节点连续调用次数的计数器。
+        retry_count: 用于追踪discard_and_retry节点连续调用次数的计数器，得到正常回复后归零。
+
+        retry_after: 上一次调用因限流等原因失败时，服务端建议的等待秒数（来自响应头）。
+
+        continuation_count: 当前回复因 length 截断后已续写的次数。
+
+        context_summary: 较早轮次的滚动摘要，由 manage_context 节点增量维护，代替原始消息发送给模型。
+
+        context_cutoff_id: 摘要截止点，即第一条仍以原文发送给模型的消息id。
+
+        execution_mode: 本轮的执行模式，"react"（默认的 agent ⇄ tools 循环）或 "plan"（规划后并行执行，见 planner.py），
+                        随每次请求的输入传入。
+
+        plan: planner 节点生成的步骤列表（按拓扑顺序）。
+
+        step_results: 已完成步骤的结果 {步骤编号: 结果文本}，由并行的 execute_step 节点合并写入。
+
+        usage: 本会话累计的模型用量 {input_tokens, output_tokens, total_tokens, cost, llm_calls}，每次模型调用后累加。
+
+        budget: 本会话的预算 {"tokens": 上限, "cost": 上限}，可随请求输入传入，只能收紧配置的预算（见 quota.effective_budget）。
+        usage 包括上下文摘要与子Agent（经工具 artifact 返回）的模型调用。
+
+        tool_ledger: 本会话的工具调用记账 {调用哈希: 记录}，跨轮次保留；相同的调用直接重放记录的结果（见 tool_ledger.py）。
     """
     messages: Annotated[List[BaseMessage], add_messages]
     
@@ -30,4 +56,23 @@ class AgentState(TypedDict):
 
     # --- 以下是用于增强鲁棒性的内部状态，建议保留 ---
     finish_reason: str
-    retry_count: int
\ No newline at end of file
+    retry_count: int
+    retry_after: Optional[float]
+    continuation_count: int
+
+    # --- 上下文窗口管理（见 context_manager.py） ---
+    context_summary: str
+    context_cutoff_id: str
+
+    # --- 规划-并行执行模式（见 planner.py） ---
+    # 本轮的执行模式，调用方每轮都应写入（None 表示使用模型的默认模式），否则会沿用检查点中上一轮的值
+    execution_mode: Optional[str]
+    plan: List[Dict[str, Any]]
+    step_results: Annotated[Dict[str, Any], merge_step_results]
+
+    # --- 用量与会话预算（见 quota.py） ---
+    usage: Annotated[Dict[str, float], merge_usage]
+    budget: Dict[str, float]
+
+    # --- 工具调用记账（见 tool_ledger.py） ---
+    tool_ledger: Annotated[Dict[str, Any], merge_tool_ledger]
@@ -0,0 +1,247 @@
+"""
+流式事件模块
+将LangGraph计算图的多模式流（messages + updates）归一化为UI友好的事件序列，
+使聊天面板可以逐token渲染答复、实时展示工具调用参数的生成过程，并在工具执行完成后立即展示结果。
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage, message_to_dict, messages_from_dict
+
+from instrumentation import instrumentation
+
+# 只有这些节点产生的LLM token会被当作主Agent的输出流式展示（planner/synthesize 见规划-并行执行模式）
+STREAMING_NODES = ("agent", "planner", "synthesize")
+# messages: LLM token；updates: 节点写入的完整消息；custom: 工具内部推送的事件（如子Agent输出）
+STREAM_MODES = ["messages", "updates", "custom"]
+
+
+@dataclass
+class StreamEvent:
+    """
+    流式事件。
+
+    Attributes:
+        kind: 事件类型，取值如下：
+              "token"           —— 主Agent答复的增量文本；
+              "reasoning"       —— 思考过程（reasoning_content）的增量文本；
+              "tool_call_delta" —— 工具调用参数的增量，data为当前累积的 {index: {name, id, args}}；
+              "ai_message"      —— 一条完整的AIMessage（节点执行完成）；
+              "tool_result"     —— 一条完整的ToolMessage；
+              "sub_agent_delta" —— 子Agent输出的增量，data为 {stream_id, task, delta}；
+              "done"            —— 本轮结束，data为TurnMetrics；
+              "error"           —— 本轮失败（仅服务模式，见 server.py），data为 {"error", "status"}。
+        data: 事件负载。
+        node: 产生该事件的计算图节点名称。
+    """
+    kind: str
+    data: Any
+    node: Optional[str] = None
+
+
+@dataclass
+class TurnMetrics:
+    """单轮对话的流式指标，时间单位均为秒。"""
+    started_at: float = field(default_factory=time.perf_counter)
+    time_to_first_token: Optional[float] = None
+    total_time: Optional[float] = None
+    token_events: int = 0
+    llm_steps: int = 0
+    llm_steps_escalated: int = 0
+    tool_results: int = 0
+    tool_bytes_saved: int = 0
+    tool_tokens_saved: int = 0
+    tool_calls_memoized: int = 0
+    tool_seconds_saved: float = 0.0
+
+    def mark_token(self):
+        self.token_events += 1
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self.started_at
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.started_at
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "total_time": self.total_time,
+            "token_events": self.token_events,
+            "llm_steps": self.llm_steps,
+            "llm_steps_escalated": self.llm_steps_escalated,
+            "tool_results": self.tool_results,
+            "tool_bytes_saved": self.tool_bytes_saved,
+            "tool_tokens_saved": self.tool_tokens_saved,
+            "tool_calls_memoized": self.tool_calls_memoized,
+            "tool_seconds_saved": self.tool_seconds_saved,
+        }
+
+
+def _reasoning_delta(chunk: AIMessageChunk) -> str:
+    reasoning = chunk.additional_kwargs.get("reasoning_content") or chunk.additional_kwargs.get("reasoning")
+    return reasoning if isinstance(reasoning, str) else ""
+
+
+def _iter_node_messages(update: Dict[str, Any]) -> Iterator[tuple]:
+    """从 updates 模式的负载中取出 (节点名, 消息)。"""
+    for node, values in (update or {}).items():
+        if not isinstance(values, dict):
+            continue
+        for msg in values.get("messages", []) or []:
+            yield node, msg
+
+
+class _TurnEventBuilder:
+    """把计算图的 (mode, payload) 流转换为 StreamEvent，供同步与异步两种迭代方式共用。"""
+
+    def __init__(self):
+        self.metrics = TurnMetrics()
+        # 按消息id累积工具调用增量: {message_id: {index: {"name", "id", "args"}}}
+        self.pending_tool_calls: Dict[str, Dict[int, Dict[str, str]]] = {}
+
+    def handle(self, mode: str, payload: Any) -> Iterator[StreamEvent]:
+        metrics = self.metrics
+        if mode == "messages":
+            chunk, metadata = payload
+            node = metadata.get("langgraph_node")
+            if node not in STREAMING_NODES or not isinstance(chunk, AIMessageChunk):
+                return
+
+            reasoning = _reasoning_delta(chunk)
+            if reasoning:
+                metrics.mark_token()
+                yield StreamEvent("reasoning", reasoning, node)
+            if isinstance(chunk.content, str) and chunk.content:
+                metrics.mark_token()
+                yield StreamEvent("token", chunk.content, node)
+
+            if chunk.tool_call_chunks:
+                calls = self.pending_tool_calls.setdefault(chunk.id or "", {})
+                for tc in chunk.tool_call_chunks:
+                    index = tc.get("index") or 0
+                    entry = calls.setdefault(index, {"name": "", "id": "", "args": ""})
+                    entry["name"] += tc.get("name") or ""
+                    entry["id"] = tc.get("id") or entry["id"]
+                    entry["args"] += tc.get("args") or ""
+                metrics.mark_token()
+                yield StreamEvent("tool_call_delta", {i: dict(v) for i, v in calls.items()}, node)
+
+        elif mode == "updates":
+            for node, msg in _iter_node_messages(payload):
+                if isinstance(msg, AIMessage):
+                    metrics.llm_steps += 1
+                    if (msg.response_metadata.get("cascade") or {}).get("tier") == "large":
+                        metrics.llm_steps_escalated += 1
+                    self.pending_tool_calls.pop(msg.id or "", None)
+                    yield StreamEvent("ai_message", msg, node)
+                elif isinstance(msg, ToolMessage):
+                    metrics.tool_results += 1
+                    compaction = msg.additional_kwargs.get("compaction") or {}
+                    metrics.tool_bytes_saved += compaction.get("saved_bytes", 0)
+                    metrics.tool_tokens_saved += compaction.get("saved_tokens", 0)
+                    memoized = msg.additional_kwargs.get("memoized")
+                    if memoized:
+                        metrics.tool_calls_memoized += 1
+                        metrics.tool_seconds_saved += memoized.get("saved_seconds", 0.0)
+                    yield StreamEvent("tool_result", msg, node)
+
+        elif mode == "custom":
+            if isinstance(payload, dict) and payload.get("type") == "sub_agent_delta":
+                yield StreamEvent("sub_agent_delta", payload, "tools")
+
+    def done(self) -> StreamEvent:
+        metrics = self.metrics
+        metrics.finish()
+        instrumentation.observe("agent_turn_seconds", metrics.total_time)
+        if metrics.time_to_first_token is not None:
+            instrumentation.observe("agent_turn_ttft_seconds", metrics.time_to_first_token)
+        return StreamEvent("done", metrics)
+
+
+def stream_agent_turn(runnable, agent_input: Dict[str, Any], config: Dict[str, Any]) -> Iterator[StreamEvent]:
+    """
+    以流式方式执行一轮Agent对话，并产出归一化的 StreamEvent。
+
+    - "messages" 流提供LLM的token与工具调用增量（来自 `_call_model` 中的流式模型调用）；
+    - "updates" 流提供每个节点完成后写入状态的完整消息（AIMessage / ToolMessage）；
+    - "custom" 流提供工具执行期间推送的增量（如子Agent的输出）。
+
+    最后一个事件总是 "done"，其中包含首token时延等指标。
+    """
+    builder = _TurnEventBuilder()
+    for mode, payload in runnable.stream(agent_input, config=config, stream_mode=STREAM_MODES):
+        yield from builder.handle(mode, payload)
+    yield builder.done()
+
+
+async def astream_agent_turn(runnable, agent_input: Dict[str, Any], config: Dict[str, Any]) -> AsyncIterator[StreamEvent]:
+    """stream_agent_turn 的异步版本，基于 astream 运行计算图（工具调用在事件循环中并发执行）。"""
+    builder = _TurnEventBuilder()
+    async for mode, payload in runnable.astream(agent_input, config=config, stream_mode=STREAM_MODES):
+        for event in builder.handle(mode, payload):
+            yield event
+    yield builder.done()
+
+
+class SubAgentStreams:
+    """
+    按 stream_id 分别累积子Agent输出的增量（"sub_agent_delta" 事件）。多个子Agent可能并发输出，
+    每个流使用 new_view() 创建的独立显示区域（如 Streamlit 的占位符，需支持 empty()），不与主Agent的回复文本混在一起。
+    子Agent的完整输出随工具结果展示，主Agent继续输出时由调用方 clear() 清除实时预览。
+    """
+
+    def __init__(self, new_view: Callable[[], Any]):
+        self._new_view = new_view
+        self._streams: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """累积一条增量，返回该流的 {"view", "task", "text"}。"""
+        stream = self._streams.get(data["stream_id"])
+        if stream is None:
+            stream = self._streams[data["stream_id"]] = {"view": self._new_view(), "task": data.get("task", ""), "text": ""}
+        stream["text"] += data["delta"]
+        return stream
+
+    def clear(self):
+        for stream in self._streams.values():
+            stream["view"].empty()
+        self._streams.clear()
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+
+def collect_messages(events: Iterator[StreamEvent]) -> List[Any]:
+    """辅助函数：消费事件流并仅返回完整消息列表（用于非UI场景或调试）。"""
+    return [e.data for e in events if e.kind in ("ai_message", "tool_result")]
+
+
+# --- 跨进程传输（服务模式的SSE事件，见 server.py / api_client.py） ---
+
+def event_to_dict(event: StreamEvent) -> Dict[str, Any]:
+    """把 StreamEvent 转为可JSON序列化的字典；消息使用 LangChain 的标准字典格式，以便客户端原样还原。"""
+    data = event.data
+    if event.kind in ("ai_message", "tool_result"):
+        data = message_to_dict(data)
+    elif event.kind == "done":
+        data = data.as_dict()
+    elif event.kind == "tool_call_delta":
+        data = {str(k): v for k, v in data.items()}
+    return {"kind": event.kind, "data": data, "node": event.node}
+
+
+def event_from_dict(payload: Dict[str, Any]) -> StreamEvent:
+    """event_to_dict 的逆操作。"""
+    kind, data = payload["kind"], payload.get("data")
+    if kind in ("ai_message", "tool_result"):
+        data = messages_from_dict([data])[0]
+    elif kind == "done":
+        metrics = TurnMetrics()
+        for key, value in (data or {}).items():
+            setattr(metrics, key, value)
+        data = metrics
+    elif kind == "tool_call_delta":
+        data = {int(k): v for k, v in (data or {}).items()}
+    return StreamEvent(kind, data, payload.get("node"))
@@ -2,16 +2,23 @@ import streamlit as st
 import uuid
 import json
 import time
-from pathlib import Path
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-from dotenv import load_dotenv
 
 # --- 核心Agent组件 ---
-from graph import create_agent_workflow
+from registry import get_shared_workflow, get_registry
+from streaming import SubAgentStreams, stream_agent_turn
+from tools.web_search import get_search_cache
+from message_store import MessageStore, load_history
+from session_index import get_session_index
+from instrumentation import instrumentation
 from configs import ConfigManager
+from upload_store import get_upload_store
+from quota import get_quota_manager
+from api_client import AgentServerClient, AgentServerError
+from tools.document_tools import get_document_index
 
-# --- 加载环境变量 ---
-load_dotenv()
+# 记录本次rerun的开始时间，用于统计渲染耗时
+_rerun_started = time.perf_counter()
 
 # --- 页面配置 ---
 st.set_page_config(page_title="通用ReAct Agent模板", page_icon="🤖", layout="wide")
@@ -23,23 +30,81 @@ if "config_manager" not in st.session_state:
     st.session_state.config_manager = ConfigManager()
 config_manager = st.session_state.config_manager
 
-def reset_session():
-    """重置会话状态，但保留模型选择。"""
+# 设置了 AGENT_SERVER_URL 时，界面只作为 server.py 的瘦客户端
+_server_url = config_manager.get_runtime_config("server").get("url")
+_session_settings = config_manager.get_runtime_config("sessions")
+
+# 界面只保留最近的若干轮对话（更早的轮次在检查点中），点击展开时每次多加载这么多轮
+VISIBLE_TURNS = _session_settings.get("history_window_turns", 10)
+
+@st.cache_resource
+def get_agent_client(base_url):
+    """瘦客户端在进程内共享（复用同一个连接池）。"""
+    return AgentServerClient(base_url)
+
+agent_client = get_agent_client(_server_url) if _server_url else None
+
+def load_session_window(session_id, turns):
+    """
+    从检查点（瘦客户端模式下经由服务端）读取会话最近 turns 轮，构建只保存该窗口的 MessageStore。
+    会话未登记或不属于当前租户时返回 None。
+    """
+    tenant_id = st.session_state.tenant_id
+    if agent_client is not None:
+        try:
+            unloaded_turns, messages = agent_client.get_history(session_id, turns, tenant=tenant_id)
+        except AgentServerError as e:
+            if e.status == 404:
+                return None
+            raise
+    else:
+        if not get_session_index().can_access(session_id, tenant_id):
+            return None
+        unloaded_turns, messages = load_history(get_registry().checkpointer, session_id, turns)
+    return MessageStore.from_history(messages, unloaded_turns, max_turns=turns)
+
+def reset_session(session_id=None):
+    """
+    重置会话状态，但保留模型选择与租户ID；给出 session_id 时恢复该会话（历史从检查点读取），
+    该会话不属于当前租户时改为开始新会话。
+    """
     model_to_keep = st.session_state.get("model_selector")
+    tenant_id = st.session_state.tenant_id
     for key in list(st.session_state.keys()):
         del st.session_state[key]
     
     if model_to_keep:
         st.session_state.model_selector = model_to_keep
+    st.session_state.tenant_id = tenant_id
     st.session_state.config_manager = ConfigManager()
     
-    st.session_state.session_id = str(uuid.uuid4())
-    st.session_state.messages = []
-    st.session_state.uploaded_file_paths = []
-    st.session_state.agent_runnable = create_agent_workflow(config_manager.get_current_config())
+    message_store = load_session_window(session_id, VISIBLE_TURNS) if session_id else None
+    if message_store is None:
+        session_id = None
+    # 会话ID写入页面URL（?session=...），刷新页面或服务重启后可按ID恢复
+    st.session_state.session_id = session_id or str(uuid.uuid4())
+    st.query_params["session"] = st.session_state.session_id
+    st.session_state.visible_turns = VISIBLE_TURNS
+    st.session_state.render_timings = []
+    if session_id:
+        st.session_state.message_store = message_store
+        st.session_state.uploaded_file_paths = get_upload_store().list_files(session_id)
+    else:
+        st.session_state.message_store = MessageStore(max_turns=VISIBLE_TURNS)
+        st.session_state.uploaded_file_paths = []
+    # 计算图与LLM客户端在进程内按模型配置共享，会话之间仅通过 thread_id 隔离
+    # 瘦客户端模式下计算图在服务端运行，本地不再构建
+    st.session_state.agent_runnable = None if _server_url else get_shared_workflow(config_manager.get_current_config())
+
+# 配额按租户计算：每个浏览器会话是一个租户，新建/切换对话不会重置（见 quota.py）
+# 租户同时是会话的所有者（历史会话列表只列出本租户的会话），写入页面URL（?tenant=...），刷新页面后保持不变
+if "tenant_id" not in st.session_state:
+    st.session_state.tenant_id = st.query_params.get("tenant") or str(uuid.uuid4())
+st.query_params["tenant"] = st.session_state.tenant_id
 
-if "session_id" not in st.session_state:
-    reset_session()
+_requested_session = st.query_params.get("session")
+if "session_id" not in st.session_state or (_requested_session and _requested_session != st.session_state.session_id):
+    reset_session(_requested_session)
 
 # --- 渲染函数 ---
 
@@ -50,73 +115,140 @@ def render_tool_call(tool_call):
         st.json(tool_call['args'])
 
 def render_tool_message(msg):
-    """【非流式】渲染单条工具消息。"""
+    """【非流式】渲染单条工具消息（JSON解析结果由 MessageStore 按消息id缓存）。"""
     with st.expander(f"📋 工具结果: `{msg.name}`", expanded=False):
-        try:
-            st.json(json.loads(msg.content))
-        except (json.JSONDecodeError, TypeError):
-            st.code(msg.content, language='text')
+        compaction = msg.additional_kwargs.get("compaction") or {}
+        if compaction.get("saved_bytes"):
+            st.caption(f"发送给模型的是压缩后的结果（节省约 {compaction['saved_tokens']} tokens），以下为完整结果")
+        memoized = msg.additional_kwargs.get("memoized")
+        if memoized:
+            st.caption(f"♻️ 复用了本会话中相同调用的结果（未重新执行，节省约 {memoized.get('saved_seconds', 0):.2f}s）")
+        is_json, payload = st.session_state.message_store.tool_payload(msg)
+        if is_json:
+            st.json(payload)
+        else:
+            st.code(payload, language='text')
 
-def render_message_history():
-    """【非流式】渲染完整的消息历史。"""
-    for msg in st.session_state.messages:
-        if isinstance(msg, HumanMessage):
-            with st.chat_message("user"):
+def render_message(msg):
+    """【非流式】渲染单条历史消息。"""
+    if isinstance(msg, HumanMessage):
+        with st.chat_message("user"):
+            st.markdown(msg.content)
+
+    elif isinstance(msg, AIMessage):
+        with st.chat_message("assistant"):
+            if msg.content:
                 st.markdown(msg.content)
+            if msg.tool_calls:
+                for tc in msg.tool_calls:
+                    render_tool_call(tc)
+    elif isinstance(msg, ToolMessage):
+        with st.chat_message("assistant"):
+             render_tool_message(msg)
 
-        elif isinstance(msg, AIMessage):
-            with st.chat_message("assistant"):
-                if msg.content:
-                    st.markdown(msg.content)
-                if msg.tool_calls:
-                    for tc in msg.tool_calls:
-                        render_tool_call(tc)
-        elif isinstance(msg, ToolMessage):
-            with st.chat_message("assistant"):
-                 render_tool_message(msg)
-
-def process_agent_response(agent_input, config):
-    """处理Agent的响应并更新UI。"""
-    # 使用同步调用获取完整响应
-    # response = st.session_state.agent_runnable.stream(agent_input, config=config, stream_mode = "messages")
-    response = st.session_state.agent_runnable.invoke(agent_input, config=config)
-    # LangGraph返回的是AgentState对象，直接访问'messages'字段
-    if "messages" in response:
-        # 获取新增加的消息（排除用户的原始输入）
-        existing_msg_count = len(st.session_state.messages)
-        new_messages = response["messages"][existing_msg_count:]
-        
-        for msg in new_messages:
-            if isinstance(msg, AIMessage):
-                # 思考过程处理
+def render_message_history():
+    """【非流式】渲染消息历史：只渲染最近的若干轮，更早的轮次折叠，按需逐批展开。"""
+    store = st.session_state.message_store
+    hidden, turns = store.split_turns(st.session_state.visible_turns)
+    if hidden:
+        if st.button(f"⬆️ 显示更早的对话（还有 {hidden} 轮）", key="expand_history"):
+            st.session_state.visible_turns += VISIBLE_TURNS
+            if store.unloaded_turns:
+                # 更早的轮次不在窗口中，从检查点加载更大的窗口
+                st.session_state.message_store = load_session_window(st.session_state.session_id, st.session_state.visible_turns)
+            else:
+                store.max_turns = st.session_state.visible_turns
+            st.rerun()
+    for turn in turns:
+        for msg in turn:
+            render_message(msg)
+
+def render_reasoning(reasoning):
+    """渲染思考过程（reasoning）。"""
+    st.markdown("#### 🤔 思考过程")
+    if isinstance(reasoning, (dict, list)):
+        st.json(reasoning)
+    else:
+        st.code(str(reasoning), language='text')
+
+def process_agent_response(events):
+    """以流式方式处理Agent的响应（StreamEvent 序列，本地计算图或服务模式均可），逐token更新UI。"""
+    # 每个LLM步骤使用一组新的占位符，token到达时原地刷新
+    step = {}
+
+    def new_step():
+        if step:
+            step["sub_agents"].clear()
+        container = st.chat_message("assistant")
+        step.clear()
+        step.update(
+            container=container,
+            reasoning=container.empty(),
+            text=container.empty(),
+            tools=container.empty(),
+            reasoning_buf="",
+            text_buf="",
+            # 子Agent的输出按 stream_id 各自显示，不写入主Agent的 text_buf
+            sub_agents=SubAgentStreams(container.empty),
+        )
+
+    new_step()
+    for event in events:
+        if event.kind == "reasoning":
+            step["reasoning_buf"] += event.data
+            step["reasoning"].code(step["reasoning_buf"], language='text')
+
+        elif event.kind == "token":
+            if step["sub_agents"]:
+                step["sub_agents"].clear()
+                step["tools"].empty()
+            step["text_buf"] += event.data
+            step["text"].markdown(step["text_buf"] + "▌")
+
+        elif event.kind == "tool_call_delta":
+            names = ", ".join(f"`{c['name']}`" for c in event.data.values() if c["name"])
+            step["tools"].caption(f"🔧 正在生成工具调用: {names}")
+
+        elif event.kind == "sub_agent_delta":
+            stream = step["sub_agents"].add(event.data)
+            step["tools"].caption(f"🤖 {len(step['sub_agents'])} 个子Agent处理中")
+            stream["view"].markdown(f"🤖 *{stream['task'][:40]}*\n\n{stream['text']}▌")
+
+        elif event.kind == "ai_message":
+            msg = event.data
+            # 用完整消息替换流式占位内容
+            step["tools"].empty()
+            with step["container"]:
                 reasoning = msg.additional_kwargs.get("reasoning") or msg.additional_kwargs.get("reasoning_content")
                 if reasoning:
-                    with st.chat_message("assistant"):
-                        st.markdown("#### 🤔 思考过程")
-                        if isinstance(reasoning, (dict, list)):
-                            st.json(reasoning)
-                        else:
-                            st.code(str(reasoning), language='text')
-
-                # 正常答复
+                    with step["reasoning"].container():
+                        render_reasoning(reasoning)
                 if msg.content:
-                    with st.chat_message("assistant"):
-                        st.markdown(msg.content, unsafe_allow_html=True)
-
-                # 工具调用
-                if msg.tool_calls:
-                    for tc in msg.tool_calls:
-                        with st.chat_message("assistant"):
-                            render_tool_call(tc)
+                    step["text"].markdown(msg.content, unsafe_allow_html=True)
+                else:
+                    step["text"].empty()
+                for tc in msg.tool_calls:
+                    render_tool_call(tc)
+            st.session_state.message_store.add(msg)
+            new_step()
 
-            # 工具消息返回
-            elif isinstance(msg, ToolMessage):
-                with st.chat_message("assistant"):
-                    render_tool_message(msg)
+        elif event.kind == "tool_result":
+            with step["container"]:
+                render_tool_message(event.data)
+            st.session_state.message_store.add(event.data)
 
-            # 将消息添加到session state中
-            if msg not in st.session_state.messages:
-                st.session_state.messages.append(msg)
+        elif event.kind == "done":
+            step["sub_agents"].clear()
+            metrics = event.data
+            ttft = metrics.time_to_first_token
+            with step["container"]:
+                st.caption(
+                    f"⏱️ 首token: {ttft:.2f}s · 总耗时: {metrics.total_time:.2f}s · LLM步骤: {metrics.llm_steps}"
+                    + (f" · 工具结果压缩: -{metrics.tool_tokens_saved} tokens" if metrics.tool_tokens_saved else "")
+                    + (f" · 复用工具结果: {metrics.tool_calls_memoized} 次/-{metrics.tool_seconds_saved:.2f}s" if metrics.tool_calls_memoized else "")
+                    if ttft is not None else f"⏱️ 总耗时: {metrics.total_time:.2f}s"
+                )
+            st.session_state.last_turn_metrics = metrics.as_dict()
 
 # --- 侧边栏 ---
 with st.sidebar:
@@ -143,59 +275,152 @@ with st.sidebar:
         reset_session()
         st.rerun()
 
+    # 执行模式：ReAct 循环，或先规划再并行执行各步骤（见 planner.py），对之后的每次提问生效
+    execution_modes = {"react": "ReAct 循环（逐步调用工具）", "plan": "规划后并行执行"}
+    default_mode = config_manager.get_current_config().get("execution_mode") or config_manager.get_runtime_config("planner").get("default_execution_mode", "react")
+    st.radio(
+        "执行模式:",
+        options=list(execution_modes),
+        format_func=lambda x: execution_modes[x],
+        index=list(execution_modes).index(default_mode) if default_mode in execution_modes else 0,
+        key="execution_mode_selector",
+    )
+
     # 文件上传区域
     st.divider()
     st.header("文件上传 (可选)")
     
-    upload_dir = Path(f"temp_uploads/{st.session_state.session_id}")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
+    upload_store = get_upload_store()
+
     uploaded_files = st.file_uploader(
-        "上传文件，Agent将在下次提问时感知到它们", 
+        "上传文件，Agent将在下次提问时感知到它们",
         accept_multiple_files=True,
         key=f"file_uploader_{st.session_state.session_id}"
     )
-    
+
     if uploaded_files:
-        current_files = st.session_state.get("uploaded_file_paths", [])
-        new_files_added = False
-        for uploaded_file in uploaded_files:
-            file_path = upload_dir / uploaded_file.name
-            if str(file_path) not in current_files:
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                current_files.append(str(file_path))
-                new_files_added = True
-        
-        if new_files_added:
-            st.session_state.uploaded_file_paths = current_files
-            st.success(f"已成功上传/更新 {len(uploaded_files)} 个文件。")
+        # 每次rerun都会重新给出全部已选文件，按 file_id 只处理新增的上传；超出配额的上传不记为已处理
+        ingested = st.session_state.setdefault("ingested_upload_ids", set())
+        stored, errors = upload_store.put_new(st.session_state.session_id, uploaded_files, ingested)
+        for error in errors:
+            st.error(error)
+
+        if stored:
+            st.session_state.uploaded_file_paths = upload_store.list_files(st.session_state.session_id)
+            st.success(f"已成功上传/更新 {stored} 个文件。")
 
     if st.session_state.get("uploaded_file_paths"):
         st.write("📋 **已上传文件清单:**")
-        for i, file_path in enumerate(st.session_state.uploaded_file_paths):
-            st.markdown(f"&nbsp;&nbsp;`{i + 1}. {Path(file_path).name}`")
+        for i, meta in enumerate(st.session_state.uploaded_file_paths):
+            st.markdown(f"&nbsp;&nbsp;`{i + 1}. {meta['name']}` ({meta['size'] / 1024:.1f} KB)")
     
+    # 共享资源复用情况
+    with st.expander("📈 资源复用统计", expanded=False):
+        st.json(get_registry().get_stats())
+        if agent_client is None:
+            st.caption("会话索引")
+            st.json(get_session_index().get_stats())
+        st.caption("上传存储")
+        st.json(upload_store.get_stats())
+        st.caption("文档索引")
+        st.json(get_document_index().get_stats())
+        search_cache = get_search_cache()
+        if search_cache is not None:
+            st.caption("搜索缓存")
+            st.json(search_cache.get_stats())
+        timings = st.session_state.get("render_timings") or []
+        if timings:
+            st.caption("历史渲染耗时（最近一次rerun）")
+            st.json(timings[-1])
+
+    # 节点耗时、LLM token与工具时延等运行指标（见 instrumentation.py）
+    if instrumentation.enabled:
+        with st.expander("📊 运行指标", expanded=False):
+            snapshot = instrumentation.export_json(max_spans=0)
+            st.json({"counters": snapshot["counters"], "histograms": snapshot["histograms"]})
+            st.download_button(
+                "导出 Prometheus 指标",
+                data=instrumentation.export_prometheus(),
+                file_name="agent_metrics.prom",
+                mime="text/plain",
+            )
+
+    # 历史会话：按最近活动时间分页列出，点击即从检查点恢复
+    st.divider()
+    st.header("历史会话")
+    st.caption(f"当前会话: `{st.session_state.session_id[:8]}`（刷新页面或通过链接中的 ?session= 可恢复）")
+    page_size = _session_settings.get("list_page_size", 10)
+    page = st.session_state.get("session_list_page", 0)
+    # 多取一条用于判断是否还有下一页
+    if agent_client is not None:
+        sessions = agent_client.list_threads(st.session_state.tenant_id, page_size + 1, page * page_size)
+    else:
+        sessions = get_session_index().list_sessions(st.session_state.tenant_id, page_size + 1, page * page_size)
+    for meta in sessions[:page_size]:
+        is_current = meta["thread_id"] == st.session_state.session_id
+        label = f"{'▶ ' if is_current else ''}{meta['title']} · {meta['turns']} 轮"
+        if st.button(label, key=f"resume_{meta['thread_id']}", use_container_width=True, disabled=is_current):
+            reset_session(meta["thread_id"])
+            st.rerun()
+    prev_col, next_col = st.columns(2)
+    if page > 0 and prev_col.button("⬅️ 上一页", use_container_width=True):
+        st.session_state.session_list_page = page - 1
+        st.rerun()
+    if len(sessions) > page_size and next_col.button("下一页 ➡️", use_container_width=True):
+        st.session_state.session_list_page = page + 1
+        st.rerun()
+
     # 重开对话button
     st.divider()
     if st.button("🔄 新的对话", use_container_width=True):
         reset_session()
         st.rerun()
 
-# 渲染历史消息
+# 渲染历史消息，并记录 rerun 耗时与历史长度的关系
 render_message_history()
+st.session_state.render_timings = (st.session_state.render_timings + [{
+    "messages": len(st.session_state.message_store),
+    "turns": st.session_state.message_store.turn_count,
+    "rerun_ms": round((time.perf_counter() - _rerun_started) * 1000, 2),
+}])[-50:]
 
 # 接收用户的新输入
 if prompt := st.chat_input("请输入您的问题..."):
-    st.session_state.messages.append(HumanMessage(content=prompt))
+    # 本地模式在此检查租户的轮次限额（服务模式由服务端准入时检查并返回 429）
+    retry_after = 0 if agent_client is not None else get_quota_manager().admit_turn(st.session_state.tenant_id)
+    if retry_after > 0:
+        st.warning(f"提交过于频繁，请 {retry_after:.0f} 秒后重试")
+        st.stop()
+    st.session_state.message_store.add(HumanMessage(content=prompt))
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    agent_input = {
-        "messages": [HumanMessage(content=prompt)],
-        "uploaded_file_paths": {"uploaded_file_paths": st.session_state.get("uploaded_file_paths", [])}
-    }
-    config = {"configurable": {"thread_id": st.session_state.session_id}}
-    
-    # 使用同步方式处理Agent响应
-    process_agent_response(agent_input, config)
+    # 刷新文件清单（同时更新访问时间，仍在使用的上传不会被TTL回收）
+    if st.session_state.get("uploaded_file_paths"):
+        st.session_state.uploaded_file_paths = get_upload_store().list_files(st.session_state.session_id)
+
+    uploaded_file_paths = st.session_state.get("uploaded_file_paths", [])
+    if agent_client is not None:
+        # 瘦客户端模式：计算图在 server.py 中运行（上传存储需与服务端共享同一目录）
+        events = agent_client.stream_turn(
+            st.session_state.session_id, prompt, uploaded_file_paths,
+            model=config_manager.get_current_model_name(), execution_mode=st.session_state.execution_mode_selector,
+            tenant=st.session_state.tenant_id,
+        )
+    else:
+        get_session_index().record_turn(
+            st.session_state.session_id, prompt, config_manager.get_current_model_name(), st.session_state.tenant_id,
+        )
+        agent_input = {
+            "messages": [HumanMessage(content=prompt)],
+            "uploaded_file_paths": {"uploaded_file_paths": uploaded_file_paths},
+            "execution_mode": st.session_state.execution_mode_selector,
+        }
+        config = {"configurable": {"thread_id": st.session_state.session_id, "tenant_id": st.session_state.tenant_id}}
+        events = stream_agent_turn(st.session_state.agent_runnable, agent_input, config)
+
+    # 流式处理Agent响应
+    try:
+        process_agent_response(events)
+    except AgentServerError as e:
+        st.error(f"服务返回错误（{e.status}）：{e}" + (f"，请 {e.retry_after:.0f} 秒后重试" if e.retry_after else ""))
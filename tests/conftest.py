@@ -0,0 +1,150 @@
+"""
+测试公共设置：所有测试完全离线运行。
+LLM 由 benchmarks/fake_llm_server.py 的假模型服务扮演，搜索使用假后端，检查点使用内存后端。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from typing import Optional, Sequence
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 必须在导入 configs / graph 之前设置：各子系统在第一次使用时按环境变量创建
+os.environ["SEARCH_BACKEND"] = "fake"
+os.environ["SEARCH_CACHE_ENABLED"] = "false"
+os.environ["CHECKPOINTER_BACKEND"] = "memory"
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+# 上传存储、文档索引与会话索引写入临时目录，不触碰工作目录中的数据
+_DATA_DIR = tempfile.mkdtemp(prefix="agent-tests-")
+os.environ["UPLOAD_STORE_ROOT"] = os.path.join(_DATA_DIR, "uploads")
+os.environ["DOCUMENT_INDEX_PATH"] = os.path.join(_DATA_DIR, "doc_index.sqlite")
+os.environ["SESSION_INDEX_PATH"] = os.path.join(_DATA_DIR, "sessions.sqlite")
+
+from benchmarks.fake_llm_server import FakeLLMServer, FakeLLMSettings  # noqa: E402
+
+# 只给出一段文本答复的脚本（不调用工具）
+ANSWER = "这是一段用于测试的模拟答复，包含若干个token。"
+ANSWER_SCRIPT = [{"content": ANSWER, "finish_reason": "stop"}]
+
+
+@pytest.fixture
+def fake_llm():
+    """返回一个工厂：fake_llm(**FakeLLMSettings字段) 启动假模型服务，测试结束时统一关闭。"""
+    servers = []
+
+    def start(**settings):
+        settings = {"first_token_latency": 0.0, "tokens_per_second": 0.0, **settings}
+        server = FakeLLMServer(FakeLLMSettings(**settings)).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def make_workflow():
+    """返回一个工厂：make_workflow(server, **模型配置覆盖) 用假模型服务构建真实的计算图。"""
+
+    def build(server, checkpointer=None, **overrides):
+        from configs import ConfigManager
+        from graph import create_agent_workflow
+
+        model_config = ConfigManager().get_current_config()
+        model_config.update({"model": "fake-model", "base_url": server.base_url, "api_key": "fake", **overrides})
+        return create_agent_workflow(model_config, checkpointer=checkpointer)
+
+    return build
+
+
+@pytest.fixture
+def make_agent_workflow():
+    """
+    返回一个工厂：make_agent_workflow(tools, **ToolExecutor参数) 构建 AgentWorkflow 对象（不调用模型），
+    工具节点换成使用给定工具的 ToolExecutor，用于直接测试规划-并行执行等节点方法。
+    """
+
+    def build(tools, **executor_settings):
+        from graph import AgentWorkflow
+        from langgraph.checkpoint.memory import InMemorySaver
+        from tool_executor import ToolExecutor
+
+        workflow = AgentWorkflow(
+            {"model_name": "fake-model", "base_url": "http://127.0.0.1:9/v1", "api_key": "fake", "tools": ["sub_agent_executor"]},
+            checkpointer=InMemorySaver(),
+        )
+        workflow.tool_node = ToolExecutor(tools, **executor_settings)
+        return workflow
+
+    return build
+
+
+# --- 服务模式（server.py）：在进程内直接调用 ASGI 应用 ---
+
+async def asgi_request(app, method: str, path: str, body: Optional[dict] = None, headers: Sequence[tuple] = ()):
+    """向 ASGI 应用发送一个请求，返回 (状态码, 响应体)；响应体为 JSON 时解析为对象。"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": query.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+    }
+    payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.Event().wait()  # 客户端不主动断开
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+    data = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    try:
+        return status, json.loads(data)
+    except ValueError:
+        return status, data.decode("utf-8")
+
+
+@pytest.fixture
+def agent_server(fake_llm):
+    """返回一个工厂：agent_server(**FakeLLMSettings字段) 创建使用假模型服务的 AgentServer，模型名为 "fake-model"。"""
+
+    def build(server_settings: Optional[dict] = None, model_overrides: Optional[dict] = None, **llm_settings):
+        from configs import ConfigManager
+        from server import AgentServer
+
+        llm = fake_llm(**llm_settings)
+        config_manager = ConfigManager()
+        config_manager.model_configs["fake-model"] = {
+            **config_manager.get_current_config(), "base_url": llm.base_url, "api_key": "fake", **(model_overrides or {}),
+        }
+        config_manager.model_configs["fake-model"].pop("model", None)
+        return AgentServer({"workers": 2, **(server_settings or {})}, config_manager=config_manager)
+
+    return build
+
+
+async def stop_server(server, timeout: float = 10.0):
+    """等待已受理的轮次全部执行完（包括 done 之后的收尾）再停止 worker。"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        stats = server.scheduler.get_stats()
+        if not stats["running_threads"] and not stats["queued"]:
+            break
+        await asyncio.sleep(0.01)
+    await server.scheduler.stop()
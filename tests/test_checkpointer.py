@@ -0,0 +1,108 @@
+"""检查点后端：消息通道写入增量后，裁剪旧检查点不会删掉增量链依赖的完整列表，读回的状态与写入一致。"""
+
+import os
+import tempfile
+import uuid
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+from checkpoint_serde import delta_base
+from checkpointer import BoundedMemorySaver, SQLiteCheckpointSaver
+
+MAX_CHECKPOINTS = 2
+MAX_DELTA_CHAIN = 3
+
+
+def _turn(i: int) -> list:
+    call_id = f"call_{i}"
+    return [
+        HumanMessage(content=f"问题 {i}", id=str(uuid.uuid4())),
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "tavily_search", "args": {"query": f"q{i}"}, "id": call_id}],
+            response_metadata={"finish_reason": "tool_calls"},
+            id=str(uuid.uuid4()),
+        ),
+        ToolMessage(content=f"检索结果 {i}", tool_call_id=call_id, name="tavily_search", id=str(uuid.uuid4())),
+        AIMessage(content=f"回答 {i}", id=str(uuid.uuid4())),
+    ]
+
+
+def _put(saver, config: dict, history: list, version, step: int):
+    version = saver.get_next_version(version, None)
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": list(history), "context_summary": f"摘要 {step}"}
+    checkpoint["channel_versions"] = {"messages": version, "context_summary": version}
+    config = saver.put(config, checkpoint, {"source": "loop", "step": step}, {"messages": version, "context_summary": version})
+    return config, version
+
+
+def _message_blob_types(saver, thread_id: str) -> list:
+    if isinstance(saver, BoundedMemorySaver):
+        return [saver.blobs[key][0] for key in saver.blobs if key[0] == thread_id and key[2] == "messages"]
+    rows = saver.conn.execute("SELECT type FROM blobs WHERE thread_id = ? AND channel = 'messages'", (thread_id,))
+    return [type_ for (type_,) in rows]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def saver(request):
+    settings = {"max_checkpoints_per_thread": MAX_CHECKPOINTS, "max_delta_chain": MAX_DELTA_CHAIN}
+    if request.param == "memory":
+        yield BoundedMemorySaver(max_bytes=None, **settings)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = SQLiteCheckpointSaver(os.path.join(tmp, "checkpoints.sqlite"), **settings)
+        yield saver
+        saver.close()
+
+
+def test_delta_round_trip_survives_pruning(saver):
+    thread_id = str(uuid.uuid4())
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    history, version, saw_delta = [], None, False
+    for step in range(10):
+        history.extend(_turn(step))
+        config, version = _put(saver, config, history, version, step)
+
+        values = saver.get_tuple({"configurable": {"thread_id": thread_id}}).checkpoint["channel_values"]
+        assert values["messages"] == history
+        assert values["context_summary"] == f"摘要 {step}"
+
+        types = _message_blob_types(saver, thread_id)
+        saw_delta = saw_delta or any(delta_base(t) is not None for t in types)
+        # 保留的检查点 + 增量链依赖的完整列表，其余的blob均已删除
+        assert len(types) <= MAX_CHECKPOINTS + MAX_DELTA_CHAIN
+
+    assert saw_delta
+    retained = list(saver.list({"configurable": {"thread_id": thread_id}}))
+    assert len(retained) == MAX_CHECKPOINTS
+    for checkpoint_tuple in retained:
+        messages = checkpoint_tuple.checkpoint["channel_values"]["messages"]
+        assert messages == history[:len(messages)]
+
+
+def test_sqlite_delta_chain_readable_after_reopen():
+    thread_id = str(uuid.uuid4())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoints.sqlite")
+        saver = SQLiteCheckpointSaver(path, max_checkpoints_per_thread=MAX_CHECKPOINTS, max_delta_chain=MAX_DELTA_CHAIN)
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        history, version = [], None
+        for step in range(5):
+            history.extend(_turn(step))
+            config, version = _put(saver, config, history, version, step)
+        saver.close()
+
+        reopened = SQLiteCheckpointSaver(path, max_checkpoints_per_thread=MAX_CHECKPOINTS, max_delta_chain=MAX_DELTA_CHAIN)
+        try:
+            checkpoint = reopened.get_tuple({"configurable": {"thread_id": thread_id}}).checkpoint
+            assert checkpoint["channel_values"]["messages"] == history
+            # 重启后继续写入：新进程不知道已有的增量链，写入完整列表后仍可正确读回
+            history.extend(_turn(5))
+            _put(reopened, config, history, version, 5)
+            checkpoint = reopened.get_tuple({"configurable": {"thread_id": thread_id}}).checkpoint
+            assert checkpoint["channel_values"]["messages"] == history
+        finally:
+            reopened.close()
@@ -0,0 +1,61 @@
+"""上传文档工具：只能按名称或哈希访问当前会话（thread_id）引用的文件。"""
+
+import io
+import json
+
+from tools.document_tools import document_read_tool, document_search_tool
+from upload_store import get_upload_store
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def _call(tool, args: dict, thread_id: str) -> dict:
+    result = tool.invoke(args, config=_config(thread_id))
+    return json.loads(result) if isinstance(result, str) else result
+
+
+def test_owner_can_read_by_name_and_hash_prefix():
+    meta = get_upload_store().put("docs-owner", "notes.txt", io.BytesIO("机密笔记：项目代号 AURORA。".encode("utf-8")))
+
+    by_name = _call(document_read_tool, {"file": "notes.txt"}, "docs-owner")
+    by_prefix = _call(document_read_tool, {"file": meta["sha256"][:8]}, "docs-owner")
+
+    assert "AURORA" in json.dumps(by_name, ensure_ascii=False)
+    assert "AURORA" in json.dumps(by_prefix, ensure_ascii=False)
+
+
+def test_other_session_cannot_read_by_hash():
+    meta = get_upload_store().put("docs-a", "secret.txt", io.BytesIO("另一个会话的机密内容 ZEPHYR。".encode("utf-8")))
+
+    for key in (meta["sha256"][:8], meta["sha256"], meta["path"], "secret.txt"):
+        result = _call(document_read_tool, {"file": key}, "docs-b")
+        assert "error" in result and "ZEPHYR" not in json.dumps(result, ensure_ascii=False)
+
+    search = _call(document_search_tool, {"query": "ZEPHYR", "files": [meta["sha256"][:8]]}, "docs-b")
+    assert "ZEPHYR" not in json.dumps(search, ensure_ascii=False)
+
+
+def test_document_results_are_not_replayed_from_ledger():
+    from langchain_core.messages import AIMessage
+
+    from tool_executor import ToolExecutor
+    from tool_ledger import ToolCallLedger
+
+    store = get_upload_store()
+    tools = [document_read_tool, document_search_tool]
+    executor = ToolExecutor(tools, ledger=ToolCallLedger(tool_metadata={t.name: t.metadata for t in tools}))
+    state = {"messages": [], "tool_ledger": {}}
+
+    def read(call_id: str) -> str:
+        call = {"name": "read_uploaded_document", "args": {"file": "report.txt"}, "id": call_id}
+        update = executor.execute({**state, "messages": [AIMessage(content="", tool_calls=[call])]}, _config("docs-memo"))
+        state["tool_ledger"].update(update.get("tool_ledger") or {})
+        return update["messages"][0].content
+
+    store.put("docs-memo", "report.txt", io.BytesIO("第一版报告 ALPHA。".encode("utf-8")))
+    assert "ALPHA" in read("call_1")
+    # 同名文件换了内容：相同参数的调用必须重新执行
+    store.put("docs-memo", "report.txt", io.BytesIO("第二版报告 BRAVO。".encode("utf-8")))
+    assert "BRAVO" in read("call_2")
@@ -0,0 +1,31 @@
+"""运行指标与追踪：并发协程的span父子关系、Prometheus 标签转义。"""
+
+import asyncio
+
+from instrumentation import Instrumentation
+
+
+def test_concurrent_coroutines_keep_their_own_parent_span():
+    inst = Instrumentation()
+
+    async def request(name: str):
+        with inst.span(f"{name}.outer"):
+            await asyncio.sleep(0.01)  # 让另一个协程的 span 在此期间开始
+            with inst.span(f"{name}.inner"):
+                await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(request("a"), request("b"))
+
+    asyncio.run(run())
+    spans = {s["name"]: s for s in inst.export_json()["spans"]}
+    for name in ("a", "b"):
+        assert spans[f"{name}.outer"]["parent_id"] is None
+        assert spans[f"{name}.inner"]["parent_id"] == spans[f"{name}.outer"]["span_id"]
+
+
+def test_prometheus_label_values_are_escaped():
+    inst = Instrumentation()
+    inst.inc("agent_tool_calls_total", tool='say "hi"\\now\nnext')
+    line = next(l for l in inst.export_prometheus().splitlines() if l.startswith("agent_tool_calls_total{"))
+    assert line == 'agent_tool_calls_total{tool="say \\"hi\\"\\\\now\\nnext"} 1'
@@ -0,0 +1,89 @@
+"""LLMRouter：配置多个后端时，流式token只被转发一次（同步与异步路径）；流式对冲按首个增量的时延触发。"""
+
+import asyncio
+import time
+import uuid
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from llm_router import DEFAULT_ROUTER_SETTINGS, LLMRouter, RouterBackend
+
+from streaming import astream_agent_turn, stream_agent_turn
+from tests.conftest import ANSWER, ANSWER_SCRIPT
+
+
+def _router_workflow(fake_llm, make_workflow):
+    primary = fake_llm(script=ANSWER_SCRIPT)
+    secondary = fake_llm(script=ANSWER_SCRIPT)
+    return make_workflow(primary, backends=[
+        {"name": "primary", "base_url": primary.base_url},
+        {"name": "secondary", "base_url": secondary.base_url},
+    ])
+
+
+def _turn_input():
+    agent_input = {"messages": [HumanMessage(content="你好")], "uploaded_file_paths": {"uploaded_file_paths": []}}
+    return agent_input, {"configurable": {"thread_id": f"test-router-{uuid.uuid4().hex[:8]}"}}
+
+
+def _streamed_text(events) -> str:
+    return "".join(e.data for e in events if e.kind == "token")
+
+
+def test_sync_stream_emits_each_token_once(fake_llm, make_workflow):
+    workflow = _router_workflow(fake_llm, make_workflow)
+    events = list(stream_agent_turn(workflow, *_turn_input()))
+    assert _streamed_text(events) == ANSWER
+
+
+def test_async_stream_emits_each_token_once(fake_llm, make_workflow):
+    workflow = _router_workflow(fake_llm, make_workflow)
+
+    async def run():
+        return [event async for event in astream_agent_turn(workflow, *_turn_input())]
+
+    events = asyncio.run(run())
+    final = [e.data for e in events if e.kind == "ai_message"][-1]
+    assert _streamed_text(events) == ANSWER == final.content
+    assert final.response_metadata.get("router_backend") in ("primary", "secondary")
+
+
+class _TimedModel(BaseChatModel):
+    """按给定时延产出增量的模型：first_delay 后产出首个增量，之后每隔 chunk_delay 产出一个。"""
+
+    first_delay: float = 0.0
+    chunk_delay: float = 0.0
+    chunks: int = 5
+
+    @property
+    def _llm_type(self) -> str:
+        return "timed-fake"
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_delay)
+        for i in range(self.chunks):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content="字"))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_delay + self.chunk_delay * (self.chunks - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="字" * self.chunks))])
+
+
+def test_stream_hedge_uses_first_chunk_latency():
+    primary = RouterBackend("primary", _TimedModel(first_delay=0.01, chunk_delay=0.06, chunks=10))
+    secondary = RouterBackend("secondary", _TimedModel())
+    router = LLMRouter(backends=[primary, secondary], settings={**DEFAULT_ROUTER_SETTINGS, "min_hedge_seconds": 0.0})
+
+    # 预热：首个增量约 0.01s，完整响应约 0.55s
+    assert "".join(c.content for c in router.stream("你好")) == "字" * 10
+    assert router._hedge_delay(primary, streaming=True) < 0.1
+    assert router._hedge_delay(primary) > 0.5
+
+    # 主后端的首个增量变慢（0.3s）：按首个增量的 p95 对冲，次优后端胜出；按完整响应的 p95 则不会对冲
+    primary.model.first_delay = 0.3
+    assert "".join(c.content for c in router.stream("你好")) == "字" * 5
+    assert secondary.counters["hedges"] == 1 and secondary.counters["hedge_wins"] == 1
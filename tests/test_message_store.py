@@ -0,0 +1,69 @@
+"""message_store.load_history：只读取最近若干轮，结果与从完整检查点切分一致。"""
+
+import os
+import tempfile
+import uuid
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+from checkpoint_serde import LazyMessage
+from checkpointer import BoundedMemorySaver, SQLiteCheckpointSaver
+from message_store import load_history, split_history
+
+
+def _turn(i: int) -> list:
+    call_id = f"call_{i}"
+    return [
+        HumanMessage(content=f"问题 {i}", id=str(uuid.uuid4())),
+        AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": f"q{i}"}, "id": call_id}], id=str(uuid.uuid4())),
+        ToolMessage(content=f"检索结果 {i}", tool_call_id=call_id, name="tavily_search", id=str(uuid.uuid4())),
+        AIMessage(content=f"回答 {i}", id=str(uuid.uuid4())),
+    ]
+
+
+def _write_session(saver, thread_id: str, turns: int) -> list:
+    """每轮写一个检查点（消息通道为增量链），返回完整历史。"""
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    history, version = [], None
+    for i in range(turns):
+        history.extend(_turn(i))
+        version = saver.get_next_version(version, None)
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"messages": list(history)}
+        checkpoint["channel_versions"] = {"messages": version}
+        config = saver.put(config, checkpoint, {"source": "loop", "step": i}, {"messages": version})
+    return history
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def saver(request):
+    if request.param == "memory":
+        yield BoundedMemorySaver(max_checkpoints_per_thread=5, max_bytes=None, max_delta_chain=3)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = SQLiteCheckpointSaver(os.path.join(tmp, "checkpoints.sqlite"), max_checkpoints_per_thread=5, max_delta_chain=3)
+        yield saver
+        saver.close()
+
+
+def test_load_history_matches_full_split(saver):
+    thread_id = str(uuid.uuid4())
+    history = _write_session(saver, thread_id, 12)
+
+    unloaded_turns, window = load_history(saver, thread_id, 3)
+    assert (unloaded_turns, window) == split_history(history, 3) == (9, history[-12:])
+    assert not any(isinstance(m, LazyMessage) for m in window)
+    assert load_history(saver, thread_id, 20) == (0, history)
+    assert load_history(saver, "no-such-thread", 3) == (0, [])
+
+
+def test_lazy_channel_read_defers_message_construction(saver):
+    thread_id = str(uuid.uuid4())
+    history = _write_session(saver, thread_id, 6)
+
+    lazy = saver.get_channel_value({"configurable": {"thread_id": thread_id}}, "messages", lazy_messages=True)
+    assert all(isinstance(m, LazyMessage) for m in lazy)
+    assert [m.message_class for m in lazy] == [type(m) for m in history]
+    assert [m.decode() for m in lazy] == history
@@ -0,0 +1,123 @@
+"""规划-并行执行：计划校验的各个失败分支、按波次选出可执行步骤、依赖结果替换，以及经由计算图节点的两波执行。"""
+
+import pytest
+from langchain_core.tools import StructuredTool
+
+from planner import PlanError, merge_step_results, parse_plan, ready_steps, resolve_args
+
+TOOLS = ["search", "fetch"]
+
+
+def search(query: str) -> str:
+    """返回带查询词的检索结果。"""
+    return f"结果[{query}]"
+
+
+def _step(step_id, tool="search", depends_on=(), **args):
+    return {"id": step_id, "tool": tool, "args": args or {"query": step_id}, "depends_on": list(depends_on)}
+
+
+@pytest.mark.parametrize("args, match", [
+    ({}, "计划为空"),
+    ({"steps": []}, "计划为空"),
+    ({"steps": "s1"}, "计划为空"),
+    (None, "计划为空"),
+    ({"steps": [_step(f"s{i}") for i in range(4)]}, "超过上限 3"),
+    ({"steps": [_step("s1"), "s2"]}, "第 2 个步骤格式错误"),
+    ({"steps": [_step("s1"), _step("s1")]}, "步骤编号重复: s1"),
+    # 未给出编号的步骤按位置编号，与显式编号冲突时同样报错
+    ({"steps": [{"tool": "search", "args": {}}, _step("s1")]}, "步骤编号重复: s1"),
+    ({"steps": [_step("s1", tool="shell")]}, "不存在的工具: shell"),
+    ({"steps": [_step("s1", depends_on=["s0", "s9"])]}, "依赖了不存在的步骤: s0, s9"),
+    ({"steps": [_step("s1", depends_on=["s2"]), _step("s2", depends_on=["s1"]), _step("s3")]}, "循环依赖: s1, s2"),
+    ({"steps": [_step("s1", depends_on=["s1"])]}, "循环依赖: s1"),
+])
+def test_parse_plan_rejects_invalid_plans(args, match):
+    with pytest.raises(PlanError, match=match):
+        parse_plan(args, TOOLS, max_steps=3)
+
+
+def test_parse_plan_orders_steps_topologically():
+    plan = parse_plan({"steps": [
+        {"id": "s3", "tool": "fetch", "args": {"url": "{s2}"}, "depends_on": ["s2"]},
+        {"id": "s2", "tool": "search", "args": {"query": "{s1}"}, "depends_on": ["s1"]},
+        {"id": "s1", "tool": "search", "args": {"query": "上海天气"}},
+        {"tool": "search"},
+    ]}, TOOLS)
+    assert [s["id"] for s in plan] == ["s1", "s4", "s2", "s3"]
+    assert plan[1] == {"id": "s4", "tool": "search", "args": {}, "depends_on": []}
+
+
+@pytest.mark.parametrize("results, expected", [
+    ({}, ["s1", "s2"]),
+    ({"s1": "a"}, ["s2"]),
+    ({"s1": "a", "s2": "b"}, ["s3"]),
+    ({"s1": "a", "s2": "b", "s3": "c"}, ["s4"]),
+    ({"s1": "a", "s2": "b", "s3": "c", "s4": "d"}, []),
+])
+def test_ready_steps(results, expected):
+    plan = [_step("s1"), _step("s2"), _step("s3", depends_on=["s1", "s2"]), _step("s4", depends_on=["s3"])]
+    assert [s["id"] for s in ready_steps(plan, results)] == expected
+
+
+@pytest.mark.parametrize("args, results, expected", [
+    ({"query": "{s1} 的天气"}, {"s1": "上海"}, {"query": "上海 的天气"}),
+    # 嵌套的 dict/list 中的占位符也会被替换，非字符串保持不变
+    ({"q": ["{s1}", {"k": "{s2}"}], "n": 3}, {"s1": "a", "s2": "b"}, {"q": ["a", {"k": "b"}], "n": 3}),
+    # 依赖结果按 max_result_chars 截断
+    ({"query": "{s1}"}, {"s1": "x" * 10}, {"query": "xxxx"}),
+    # 非依赖步骤的占位符保持原样
+    ({"query": "{s1} {s9}"}, {"s1": "a", "s9": "z"}, {"query": "a {s9}"}),
+    # 依赖结果不存在时替换为空字符串
+    ({"query": "[{s2}]"}, {"s1": "a"}, {"query": "[]"}),
+])
+def test_resolve_args(args, results, expected):
+    step = {"id": "s3", "tool": "search", "args": args, "depends_on": ["s1", "s2"]}
+    assert resolve_args(step, results, max_result_chars=4) == expected
+
+
+def test_resolve_args_without_dependencies_returns_args():
+    step = _step("s1", query="{s0}")
+    assert resolve_args(step, {"s0": "a"}) is step["args"]
+
+
+def test_merge_step_results():
+    assert merge_step_results(None, {"s1": "a"}) == {"s1": "a"}
+    assert merge_step_results({"s1": "a"}, {"s2": "b"}) == {"s1": "a", "s2": "b"}
+    assert merge_step_results({"s1": "a"}, None) == {}
+
+
+def test_two_wave_plan_through_dispatch(make_agent_workflow):
+    """s1、s2 在第一波并行执行，s3 在第二波读取二者的结果，全部完成后进入汇总。"""
+    workflow = make_agent_workflow([StructuredTool.from_function(func=search, name="search")])
+    plan = parse_plan({"steps": [
+        {"id": "s1", "tool": "search", "args": {"query": "北京"}},
+        {"id": "s2", "tool": "search", "args": {"query": "上海"}},
+        {"id": "s3", "tool": "search", "args": {"query": "{s1} vs {s2}"}, "depends_on": ["s1", "s2"]},
+    ]}, ["search"])
+    for step in plan:
+        step["call_id"] = f"plan_test_{step['id']}"
+    state = {"messages": [], "plan": plan, "step_results": {}}
+
+    waves = []
+    while True:
+        route = workflow._dispatch_steps(state)
+        if route == "synthesize":
+            break
+        waves.append([send.arg["call"] for send in route])
+        assert all(send.node == "execute_step" for send in route)
+        for send in route:
+            update = workflow._execute_step(send.arg)
+            state["step_results"] = merge_step_results(state["step_results"], update["step_results"])
+            assert update["messages"][0].tool_call_id == send.arg["call"]["id"]
+
+    assert [[call["id"] for call in wave] for wave in waves] == [
+        ["plan_test_s1", "plan_test_s2"],
+        ["plan_test_s3"],
+    ]
+    assert waves[1][0]["args"] == {"query": "结果[北京] vs 结果[上海]"}
+    assert state["step_results"] == {
+        "s1": "结果[北京]",
+        "s2": "结果[上海]",
+        "s3": "结果[结果[北京] vs 结果[上海]]",
+    }
@@ -0,0 +1,55 @@
+"""会话预算：请求只能收紧配置的预算；自己调用模型的工具的用量计入会话。"""
+
+import asyncio
+import uuid
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool
+
+from quota import effective_budget
+from tests.conftest import asgi_request, stop_server
+from tool_executor import ToolExecutor
+
+
+def test_request_budget_can_only_lower_configured_budget():
+    default = {"tokens": 1000, "cost": 0.0}
+    assert effective_budget(default, {"tokens": 10 ** 9}) == {"tokens": 1000, "cost": 0.0}
+    assert effective_budget(default, {"tokens": 0, "cost": -1}) == default
+    assert effective_budget(default, {"tokens": 10, "cost": 0.5}) == {"tokens": 10, "cost": 0.5}
+    assert effective_budget(default, None) == default
+
+
+def test_request_cannot_raise_server_budget(agent_server):
+    server = agent_server(model_overrides={"budget": {"tokens": 1}})
+    thread_id = f"test-budget-{uuid.uuid4().hex[:8]}"
+
+    async def turn(message):
+        body = {
+            "message": message, "thread_id": thread_id, "model": "fake-model", "stream": False,
+            "budget": {"tokens": 10 ** 9},
+        }
+        status, payload = await asgi_request(server, "POST", "/v1/turns", body)
+        assert status == 200
+        return [e["node"] for e in payload["events"] if e["kind"] == "ai_message"]
+
+    async def run():
+        try:
+            await turn("第一问")  # 本轮用完了 1 个 token 的预算
+            return await turn("第二问")
+        finally:
+            await stop_server(server)
+
+    assert asyncio.run(run()) == ["budget_exhausted"]
+
+
+def test_tool_artifact_usage_is_added_to_state():
+    def ask_expert(question: str):
+        """模拟内部调用了模型的工具。"""
+        return "专家的回答", {"usage": {"total_tokens": 30, "cost": 0.01, "llm_calls": 1}}
+
+    tool = StructuredTool.from_function(func=ask_expert, name="ask_expert", response_format="content_and_artifact")
+    executor = ToolExecutor([tool])
+    calls = [{"name": "ask_expert", "args": {"question": str(i)}, "id": f"call_{i}"} for i in range(2)]
+    update = executor.execute({"messages": [AIMessage(content="", tool_calls=calls)]})
+    assert [m.content for m in update["messages"]] == ["专家的回答"] * 2
+    assert update["usage"] == {"total_tokens": 60, "cost": 0.02, "llm_calls": 2}
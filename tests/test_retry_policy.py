@@ -0,0 +1,177 @@
+"""重试策略：LLM调用后的路由、退避与限流等待、响应头解析、截断续写的合并与计数器重置。"""
+
+import random
+import uuid
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import END
+
+from graph import AgentWorkflow, route_after_llm_call
+from retry_policy import RetryPolicy, parse_duration, retry_after_from_headers
+
+POLICY = RetryPolicy({"max_retries": 2, "max_continuations": 2})
+TOOL_CALL = {"name": "tavily_search", "args": {"query": "上海天气"}, "id": "call_1"}
+
+
+def _state(finish_reason, content="部分内容", tool_calls=(), **counters) -> dict:
+    message = AIMessage(content=content, tool_calls=list(tool_calls), id="ai-1")
+    return {"messages": [HumanMessage(content="问题", id="h-1"), message], "finish_reason": finish_reason, **counters}
+
+
+@pytest.mark.parametrize("state, expected", [
+    # 截断的文本回复：续写
+    (_state("length"), "continue_generation"),
+    (_state("length", continuation_count=1), "continue_generation"),
+    # 续写次数用尽：结束本轮（保留已生成的内容），而不是重试
+    (_state("length", continuation_count=2), END),
+    (_state("length", continuation_count=2, retry_count=0), END),
+    # 截断的工具调用参数无法续写：重试，而不是续写
+    (_state("length", tool_calls=[TOOL_CALL]), "discard_and_retry"),
+    (_state("length", content="", tool_calls=[TOOL_CALL], retry_count=2), END),
+    # 截断且没有任何内容：按空回复重试
+    (_state("length", content=""), "discard_and_retry"),
+    # 空回复、内容过滤、可重试的调用异常：重试，次数用尽后结束
+    (_state("stop", content=""), "discard_and_retry"),
+    (_state("stop", content="", retry_count=2), END),
+    (_state("content_filter"), "discard_and_retry"),
+    (_state("null"), "discard_and_retry"),
+    (_state("retryable_error", retry_count=1), "discard_and_retry"),
+    (_state("retryable_error", retry_count=2), END),
+    # 不可重试的错误直接结束
+    (_state("error"), END),
+    # 正常回复
+    (_state("tool_calls", content="", tool_calls=[TOOL_CALL]), "tools"),
+    (_state("stop"), END),
+])
+def test_route_after_llm_call(state, expected):
+    assert route_after_llm_call(state, POLICY) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1s", 1.0),
+    ("6m0s", 360.0),
+    ("20ms", 0.02),
+    ("1h", 3600.0),
+    ("1.5s", 1.5),
+    ("2", 2.0),
+    (" 0.5 ", 0.5),
+    ("", None),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_duration(value, expected):
+    result = parse_duration(value)
+    assert result is None if expected is None else result == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    (None, None),
+    ({}, None),
+    ({"Retry-After-Ms": "1500"}, 1.5),
+    # retry-after-ms 优先于 retry-after
+    ({"retry-after-ms": "200", "retry-after": "10"}, 0.2),
+    ({"Retry-After": "3"}, 3.0),
+    ({"retry-after": "1m30s"}, 90.0),
+    # 无法解析的 retry-after-ms 回退到 retry-after
+    ({"retry-after-ms": "x", "retry-after": "4"}, 4.0),
+    # 已过去的HTTP日期不产生负的等待时间
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+    # 配额耗尽时取各项重置时间的最大值；未耗尽的配额不参与
+    ({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s",
+      "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "6m0s"}, 360.0),
+    ({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s",
+      "x-ratelimit-remaining-tokens": "100", "x-ratelimit-reset-tokens": "6m0s"}, 2.0),
+    ({"x-ratelimit-remaining-requests": "5", "x-ratelimit-reset-requests": "2s"}, None),
+    ({"x-ratelimit-reset-requests": "2s"}, None),
+])
+def test_retry_after_from_headers(headers, expected):
+    result = retry_after_from_headers(headers)
+    assert result is None if expected is None else result == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("settings, attempt, retry_after, expected", [
+    ({}, 0, None, 0.5),
+    ({}, 1, None, 1.0),
+    ({}, 3, None, 4.0),
+    # 退避受 max_delay 限制
+    ({}, 10, None, 20.0),
+    # 服务端的等待时间较大时使用它，较小时仍按退避等待
+    ({}, 0, 5.0, 5.0),
+    ({}, 3, 1.0, 4.0),
+    # 服务端的等待时间受 max_retry_after 限制
+    ({}, 0, 600.0, 60.0),
+    ({"max_retry_after": 10.0}, 0, 30.0, 10.0),
+    # 不遵循响应头时只按退避等待
+    ({"respect_retry_after": False}, 0, 5.0, 0.5),
+    ({"base_delay": 1.0, "multiplier": 3.0}, 2, None, 9.0),
+])
+def test_retry_policy_delay(settings, attempt, retry_after, expected):
+    policy = RetryPolicy({"jitter": False, **settings})
+    assert policy.delay(attempt, retry_after) == pytest.approx(expected)
+
+
+def test_retry_policy_jitter_within_backoff():
+    policy = RetryPolicy(rng=random.Random(0))
+    for attempt in range(6):
+        ceiling = min(20.0, 0.5 * 2 ** attempt)
+        assert all(0 <= policy.backoff(attempt) <= ceiling for _ in range(50))
+    # 抖动不会让等待时间低于服务端要求
+    assert all(policy.delay(0, 3.0) == 3.0 for _ in range(50))
+
+
+def test_merge_continuation_keeps_id_and_concatenates_content():
+    partial = AIMessage(content="前半段，", response_metadata={"finish_reason": "length"}, id="ai-1")
+    response = AIMessage(
+        content="后半段。", tool_calls=[TOOL_CALL], additional_kwargs={"k": "v"},
+        response_metadata={"finish_reason": "tool_calls"},
+        usage_metadata={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15}, id="ai-2",
+    )
+    merged = AgentWorkflow._merge_continuation(partial, response)
+    assert merged.id == "ai-1"
+    assert merged.content == "前半段，后半段。"
+    assert merged.tool_calls == response.tool_calls
+    assert merged.additional_kwargs == {"k": "v"}
+    assert merged.response_metadata["finish_reason"] == "tool_calls"
+    assert merged.usage_metadata["total_tokens"] == 15
+
+
+@pytest.mark.parametrize("counters, expected", [
+    ({}, {}),
+    ({"retry_count": 0, "continuation_count": 0}, {}),
+    ({"retry_count": 3}, {"retry_count": 0, "continuation_count": 0, "retry_after": None}),
+    ({"continuation_count": 2, "retry_after": 5.0}, {"retry_count": 0, "continuation_count": 0, "retry_after": None}),
+])
+def test_reset_counters(counters, expected):
+    assert AgentWorkflow._reset_counters({"messages": [], **counters}) == expected
+
+
+def test_manage_context_resets_counters_after_tool_results(make_agent_workflow):
+    """上一次调用以放弃重试结束后，新的工具结果进入 agent 节点前计数器被清零。"""
+    workflow = make_agent_workflow([])
+    state = {
+        "messages": [
+            HumanMessage(content="问题", id="h-1"),
+            AIMessage(content="", tool_calls=[TOOL_CALL], id="ai-1"),
+            ToolMessage(content="结果", tool_call_id="call_1", id="t-1"),
+        ],
+        "retry_count": 3, "continuation_count": 2, "retry_after": 1.0,
+    }
+    update = workflow._manage_context(state)
+    assert update["retry_count"] == 0 and update["continuation_count"] == 0 and update["retry_after"] is None
+
+
+def test_truncated_answer_kept_when_continuations_run_out(fake_llm, make_workflow):
+    """模型每次都因 length 截断：续写 max_continuations 次后结束本轮，已生成的内容拼接保留在同一条消息中。"""
+    server = fake_llm(script=[{"content": "片段", "finish_reason": "length"}])
+    workflow = make_workflow(server, retry_policy={"max_continuations": 2, "jitter": False, "base_delay": 0.0})
+    state = workflow.invoke(
+        {"messages": [HumanMessage(content="写一篇长文")]},
+        {"configurable": {"thread_id": f"test-retry-{uuid.uuid4().hex[:8]}"}},
+    )
+    answers = [m for m in state["messages"] if isinstance(m, AIMessage)]
+    assert len(answers) == 1
+    assert answers[0].content == "片段片段片段"
+    assert state["finish_reason"] == "length"
+    assert state["continuation_count"] == 2
+    assert server.stats["requests"] == 3
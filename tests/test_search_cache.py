@@ -0,0 +1,89 @@
+"""搜索缓存：归一化后的精确命中、TTL过期、不缓存错误结果、其余参数隔离，磁盘条目定期清理并有上限。"""
+
+import os
+import sqlite3
+import tempfile
+
+from langchain_core.tools import StructuredTool
+
+import tools.search_cache as search_cache
+from tools.fake_search import FakeSearchTool
+from tools.search_cache import CachedSearchTool, SearchCache
+
+
+def _cached_tool(cache=None):
+    backend = FakeSearchTool(latency_seconds=0.0)
+    return backend, CachedSearchTool(backend, cache or SearchCache())
+
+
+def _disk_rows(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_normalized_query_hits_exact_cache():
+    backend, tool = _cached_tool()
+    first = tool.invoke({"query": "LangGraph 是什么？"})
+    second = tool.invoke({"query": "  ｌａｎｇｇｒａｐｈ   是什么 "})
+    assert second == first
+    assert backend.calls == 1
+    assert tool.cache.get_stats()["exact_hits"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search_cache.time, "time", lambda: now[0])
+    cache = SearchCache(ttl_seconds=60)
+    cache.put("tavily_search", {"query": "天气"}, {"results": []})
+    assert cache.get("tavily_search", {"query": "天气"})[0]
+
+    now[0] += 61
+    assert cache.get("tavily_search", {"query": "天气"}) == (False, None)
+
+
+def test_error_results_are_not_cached():
+    calls = []
+
+    def flaky_search(query: str) -> dict:
+        """总是返回错误的搜索。"""
+        calls.append(query)
+        return {"error": "rate limited"}
+
+    tool = CachedSearchTool(StructuredTool.from_function(func=flaky_search, name="tavily_search"), SearchCache())
+    tool.invoke({"query": "天气"})
+    tool.invoke({"query": "天气"})
+    assert len(calls) == 2
+
+
+def test_other_arguments_are_isolated():
+    backend, tool = _cached_tool()
+    tool.invoke({"query": "英伟达", "topic": "news"})
+    tool.invoke({"query": "英伟达", "topic": "finance"})
+    tool.invoke({"query": "英伟达", "topic": "news", "search_depth": "advanced"})
+    assert backend.calls == 3
+    tool.invoke({"query": "英伟达", "topic": "finance"})
+    assert backend.calls == 3
+
+
+def test_disk_cache_is_purged_and_capped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search_cache.time, "time", lambda: now[0])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search_cache.sqlite")
+        cache = SearchCache(ttl_seconds=60, path=path, max_disk_entries=3, purge_interval_seconds=0)
+        for i in range(5):
+            now[0] += 1
+            cache.put("tavily_search", {"query": f"查询 {i}"}, {"results": [i]})
+        assert _disk_rows(path) == 3
+        # 最早写入的条目被淘汰
+        reopened = SearchCache(ttl_seconds=60, path=path)
+        assert not reopened.get("tavily_search", {"query": "查询 0"})[0]
+        assert reopened.get("tavily_search", {"query": "查询 4"})[0]
+
+        # 过期条目在之后的写入时清除
+        now[0] += 120
+        cache.put("tavily_search", {"query": "新查询"}, {"results": []})
+        assert _disk_rows(path) == 1
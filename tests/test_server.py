@@ -0,0 +1,80 @@
+"""服务模式（server.py）的请求处理。"""
+
+import asyncio
+import uuid
+
+from tests.conftest import asgi_request, stop_server
+
+
+def _turn(server, thread_id: str, message, **fields):
+    body = {"message": message, "thread_id": thread_id, "model": "fake-model", "stream": False, **fields}
+    return asgi_request(server, "POST", "/v1/turns", body)
+
+
+def _ai_nodes(payload) -> list:
+    return [e["node"] for e in payload["events"] if e["kind"] == "ai_message"]
+
+
+def test_execution_mode_does_not_persist_across_turns(agent_server):
+    server = agent_server()
+    thread_id = f"test-mode-{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        try:
+            status, plan_turn = await _turn(server, thread_id, "第一问", execution_mode="plan")
+            assert status == 200 and "planner" in _ai_nodes(plan_turn)
+            status, next_turn = await _turn(server, thread_id, "第二问")
+            assert status == 200
+            assert "planner" not in _ai_nodes(next_turn) and "agent" in _ai_nodes(next_turn)
+        finally:
+            await stop_server(server)
+
+    asyncio.run(run())
+
+    from registry import get_registry
+    saved = get_registry().checkpointer.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+    assert saved.checkpoint["channel_values"].get("execution_mode") is None
+
+
+def test_threads_are_scoped_to_owning_tenant(agent_server):
+    server = agent_server()
+    thread_id = f"test-owner-{uuid.uuid4().hex[:8]}"
+    owner, other = f"tenant-{uuid.uuid4().hex[:8]}", f"tenant-{uuid.uuid4().hex[:8]}"
+
+    def listed(payload) -> list:
+        return [t["thread_id"] for t in payload["threads"]]
+
+    async def run():
+        try:
+            status, _ = await _turn(server, thread_id, "第一问", tenant=owner)
+            assert status == 200
+
+            status, threads = await asgi_request(server, "GET", "/v1/threads", headers=[("X-Tenant-Id", owner)])
+            assert status == 200 and thread_id in listed(threads)
+            status, history = await asgi_request(server, "GET", f"/v1/threads/{thread_id}/messages?tenant={owner}")
+            assert status == 200 and history["messages"]
+
+            status, threads = await asgi_request(server, "GET", f"/v1/threads?tenant={other}")
+            assert status == 200 and thread_id not in listed(threads)
+            status, _ = await asgi_request(server, "GET", f"/v1/threads/{thread_id}/messages", headers=[("X-Tenant-Id", other)])
+            assert status == 404
+            status, _ = await _turn(server, thread_id, "冒用会话", tenant=other)
+            assert status == 404
+            status, _ = await asgi_request(server, "GET", "/v1/threads")
+            assert status == 400
+        finally:
+            await stop_server(server)
+
+    asyncio.run(run())
+
+
+def test_invalid_message_is_rejected_with_400(agent_server):
+    server = agent_server()
+
+    async def run():
+        try:
+            return [(await _turn(server, f"test-bad-{uuid.uuid4().hex[:8]}", message))[0] for message in (None, 42, ["你好"], "  ")]
+        finally:
+            await stop_server(server)
+
+    assert asyncio.run(run()) == [400, 400, 400, 400]
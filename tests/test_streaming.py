@@ -0,0 +1,42 @@
+"""子Agent的流式输出按 stream_id 分别累积，不与主Agent的回复文本混在一起。"""
+
+from streaming import StreamEvent, SubAgentStreams
+
+
+class _View:
+    def __init__(self):
+        self.cleared = False
+
+    def empty(self):
+        self.cleared = True
+
+
+def test_concurrent_sub_agent_streams_are_kept_apart():
+    views = []
+
+    def new_view():
+        views.append(_View())
+        return views[-1]
+
+    streams = SubAgentStreams(new_view)
+    text_buf = ""
+    events = [
+        StreamEvent("sub_agent_delta", {"stream_id": "s1", "task": "总结资料一", "delta": "资料一"}),
+        StreamEvent("sub_agent_delta", {"stream_id": "s2", "task": "总结资料二", "delta": "资料二"}),
+        StreamEvent("sub_agent_delta", {"stream_id": "s1", "task": "总结资料一", "delta": "的要点"}),
+        StreamEvent("token", "综合两份资料"),
+    ]
+    for event in events:
+        if event.kind == "sub_agent_delta":
+            stream = streams.add(event.data)
+        elif event.kind == "token":
+            text_buf += event.data
+
+    assert len(streams) == 2 and len(views) == 2
+    assert stream["text"] == "资料一的要点" and stream["task"] == "总结资料一"
+    assert streams.add({"stream_id": "s2", "delta": "的要点"})["text"] == "资料二的要点"
+    assert text_buf == "综合两份资料"
+
+    streams.clear()
+    assert len(streams) == 0
+    assert all(view.cleared for view in views)
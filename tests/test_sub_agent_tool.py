@@ -0,0 +1,71 @@
+"""子Agent执行器：统计计数只在持有锁时更新；子Agent按调用方工作流的模型配置选择模型、限流键与单价。"""
+
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+import tools.sub_agent_tool as sub_agent_tool
+from tools.sub_agent_tool import SubAgentExecutor
+
+
+def _fake_subagent_model(seen=None):
+    """替换 get_subagent_model：记录收到的模型配置，返回带用量信息的固定回复。"""
+
+    def build(model_config=None):
+        if seen is not None:
+            seen.append(model_config)
+        return RunnableLambda(lambda prompt: AIMessage(
+            content=f"完成: {prompt.to_string()}",
+            usage_metadata={"input_tokens": 1000, "output_tokens": 1000, "total_tokens": 2000},
+        ))
+
+    return build
+
+
+class _LockedStats(dict):
+    """写入时检查执行器的锁已被持有。"""
+
+    def __init__(self, lock, stats):
+        super().__init__(stats)
+        self.lock = lock
+
+    def __setitem__(self, key, value):
+        assert self.lock.locked(), f"stats[{key!r}] 在锁外更新"
+        super().__setitem__(key, value)
+
+
+def test_stats_updated_under_lock(monkeypatch):
+    monkeypatch.setattr(sub_agent_tool, "get_subagent_model", _fake_subagent_model())
+    executor = SubAgentExecutor({"stream": False})
+    executor.stats = _LockedStats(executor._lock, executor.stats)
+
+    executor.run("任务 A")
+    executor.run("任务 A")
+    asyncio.run(executor.arun("任务 B"))
+    executor.batch(["任务 A", "任务 C"])
+    asyncio.run(executor.abatch(["任务 D"]))
+
+    stats = executor.get_stats()
+    assert stats["calls"] == 6
+    assert stats["cache_hits"] == 2
+    assert stats["llm_calls"] == 4
+
+
+def test_sub_agent_uses_workflow_model_config(monkeypatch, fake_llm, make_workflow):
+    seen = []
+    monkeypatch.setattr(sub_agent_tool, "get_subagent_model", _fake_subagent_model(seen))
+    monkeypatch.setattr(sub_agent_tool, "sub_agent_executor", SubAgentExecutor({"stream": False}))
+    server = fake_llm(script=[
+        {"tool_calls": [{"name": "sub_agent_executor", "args": {"sub_task_description": "总结资料"}}]},
+        {"content": "完成", "finish_reason": "stop"},
+    ])
+    pricing = {"input_per_million": 1000.0, "output_per_million": 1000.0}
+    workflow = make_workflow(server, model="workflow-model", pricing=pricing, tools=["sub_agent_executor"])
+
+    state = workflow.invoke({"messages": [HumanMessage(content="请总结")]}, {"configurable": {"thread_id": "sub-agent-model"}})
+
+    assert [c["model_name"] for c in seen] == ["workflow-model"]
+    assert seen[0]["pricing"] == pricing
+    # 子Agent的 2000 tokens 按工作流的单价计费：(1000 + 1000) * 1000 / 1e6
+    assert state["usage"]["cost"] >= 2.0
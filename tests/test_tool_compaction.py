@@ -0,0 +1,94 @@
+"""工具结果去重：引用的原结果不在提示词中时换回原内容；完整结果在 SQLite 存储中跨进程保留。"""
+
+import os
+import tempfile
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+import tool_compaction
+from context_manager import ContextWindowManager
+from tool_compaction import PayloadStore, SQLitePayloadStore, ToolResultCompactor
+
+RESULT = "上海今日天气：多云，最高气温 24 度，东南风 3 级。"
+
+
+def _turn(i: int, result: str) -> list:
+    call_id = f"call_{i}"
+    return [
+        HumanMessage(content=f"问题 {i}", id=f"h{i}"),
+        AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": "上海天气"}, "id": call_id}], id=f"a{i}"),
+        ToolMessage(content=result, tool_call_id=call_id, name="tavily_search", id=f"t{i}"),
+        AIMessage(content=f"回答 {i}", id=f"r{i}"),
+    ]
+
+
+def _session(compactor: ToolResultCompactor) -> list:
+    """第 0 轮与第 2 轮的工具结果相同，第 2 轮的结果被去重为引用。"""
+    messages = []
+    for i, result in enumerate([RESULT, "无关结果", RESULT]):
+        turn = _turn(i, result)
+        turn[2] = compactor.compact([turn[2]], messages)[0]
+        messages.extend(turn)
+    return messages
+
+
+def test_duplicate_reference_kept_when_original_is_sent():
+    messages = _session(ToolResultCompactor(store=PayloadStore()))
+    assert messages[10].additional_kwargs["duplicate_of"] == "call_0"
+
+    prompt = ContextWindowManager({"keep_recent_messages": 100}).build_prompt(SystemMessage(content="sys"), messages)
+    tool_contents = [m.content for m in prompt if isinstance(m, ToolMessage)]
+    assert tool_contents[0] == RESULT
+    assert "call_0" in tool_contents[2]
+
+
+def test_duplicate_expanded_when_original_is_summarized():
+    messages = _session(ToolResultCompactor(store=PayloadStore()))
+    # 前两轮已并入摘要，原结果不再发送给模型
+    prompt = ContextWindowManager().build_prompt(SystemMessage(content="sys"), messages, summary="摘要", cutoff_id="h2")
+    tool_messages = [m for m in prompt if isinstance(m, ToolMessage)]
+    assert [m.tool_call_id for m in tool_messages] == ["call_2"]
+    assert tool_messages[0].content == RESULT
+    # 状态中的消息不被修改
+    assert "call_0" in messages[10].content
+
+
+def test_duplicate_expanded_when_original_is_truncated():
+    long_result = "检索结果 " * 2000
+    compactor = ToolResultCompactor({"max_chars": 100000}, store=PayloadStore())
+    messages = []
+    for i, result in enumerate([long_result, "无关结果", long_result]):
+        turn = _turn(i, result)
+        turn[2] = compactor.compact([turn[2]], messages)[0]
+        messages.extend(turn)
+
+    manager = ContextWindowManager({"keep_recent_messages": 4, "tool_result_max_tokens": 200})
+    prompt = manager.build_prompt(SystemMessage(content="sys"), messages)
+    tool_messages = [m for m in prompt if isinstance(m, ToolMessage)]
+    assert "已省略" in tool_messages[0].content
+    assert tool_messages[2].content == long_result
+
+
+def test_sqlite_payload_store_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payloads.sqlite")
+        store = SQLitePayloadStore(path, max_entries=4)
+        payload_id = store.put(RESULT)
+
+        reopened = SQLitePayloadStore(path, max_entries=4)
+        assert reopened.get(payload_id) == RESULT
+        assert reopened.get("missing") is None
+
+
+def test_sqlite_payload_store_evicts_least_recently_used(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(tool_compaction.time, "time", lambda: next(clock))
+    store = SQLitePayloadStore(":memory:", max_entries=2)
+    store._TRIM_INTERVAL = 1
+    first = store.put("a")
+    second = store.put("b")
+    store.get(first)
+    store.put("c")
+    assert len(store) == 2
+    assert store.get(first) == "a"
+    assert store.get(second) is None
@@ -0,0 +1,40 @@
+"""进程级并发限制：异步路径等待名额时不占用事件循环的默认线程池；共享限制器的上限不一致时记录警告。"""
+
+import asyncio
+import logging
+
+import process_limiter
+from process_limiter import ProcessLimiter, get_process_limiter
+
+
+def test_async_waiters_do_not_block_default_executor():
+    limiter = ProcessLimiter(1)
+
+    async def hold(entered: list):
+        async with limiter:
+            entered.append(1)
+
+    async def run():
+        entered = []
+        async with limiter:
+            waiters = [asyncio.create_task(hold(entered)) for _ in range(64)]
+            await asyncio.sleep(0.05)
+            # 64 个协程在等待名额，线程池仍可立即执行其他任务
+            assert await asyncio.wait_for(asyncio.to_thread(lambda: "ok"), timeout=2) == "ok"
+            assert not entered
+        await asyncio.wait_for(asyncio.gather(*waiters), timeout=5)
+        return len(entered)
+
+    assert asyncio.run(run()) == 64
+
+
+def test_shared_limiter_warns_on_different_limit(monkeypatch, caplog):
+    monkeypatch.setattr(process_limiter, "_process_limiter", None)
+    with caplog.at_level(logging.WARNING, logger="process_limiter"):
+        limiter = get_process_limiter(4)
+        assert get_process_limiter(4) is limiter
+        assert not caplog.records
+
+        assert get_process_limiter(8) is limiter
+    assert limiter.limit == 4
+    assert [r.getMessage() for r in caplog.records] == ["进程级并发上限已按 4 创建，忽略新的上限 8"]
@@ -0,0 +1,101 @@
+"""工具调用记账：被去重为引用的结果在重放时仍是可用的完整（压缩后）结果。"""
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import StructuredTool
+
+from context_manager import ContextWindowManager
+from planner import resolve_args
+from tool_compaction import PayloadStore, ToolResultCompactor
+from tool_executor import ToolExecutor
+from tool_ledger import ToolCallLedger, merge_tool_ledger
+
+PAYLOAD = "上海今日天气：多云，最高气温 24 度，东南风 3 级。"
+
+
+def weather(city: str) -> str:
+    """所有城市返回相同的结果，使之后的调用被去重。"""
+    return PAYLOAD
+
+
+def _tool():
+    return StructuredTool.from_function(func=weather, name="weather")
+
+
+def _executor_settings() -> dict:
+    return {
+        "result_processor": ToolResultCompactor(store=PayloadStore()),
+        "ledger": ToolCallLedger(tool_metadata={"weather": {}}),
+    }
+
+
+def _run(executor: ToolExecutor, state: dict, call_id: str, city: str) -> dict:
+    """在 state 上执行一次工具调用（一个完整轮次），返回更新后的 state。"""
+    question = HumanMessage(content=f"{city}天气", id=f"h-{call_id}")
+    request = AIMessage(content="", tool_calls=[{"name": "weather", "args": {"city": city}, "id": call_id}], id=f"a-{call_id}")
+    messages = state["messages"] + [question, request]
+    update = executor.execute({"messages": messages, "tool_ledger": state["tool_ledger"]})
+    answer = AIMessage(content="好的", id=f"r-{call_id}")
+    return {
+        "messages": messages + update["messages"] + [answer],
+        "tool_ledger": merge_tool_ledger(state["tool_ledger"], update.get("tool_ledger")),
+    }
+
+
+def _session(executor: ToolExecutor) -> dict:
+    """c0 执行；c1 参数不同但结果相同，被去重为引用；c2 与 c1 参数相同，从记账重放。"""
+    state = {"messages": [], "tool_ledger": {}}
+    for call_id, city in (("c0", "上海"), ("c1", "沪"), ("c2", "沪")):
+        state = _run(executor, state, call_id, city)
+    return state
+
+
+def _tool_message(state: dict, call_id: str) -> ToolMessage:
+    return next(m for m in state["messages"] if isinstance(m, ToolMessage) and m.tool_call_id == call_id)
+
+
+def test_replay_after_dedupe_returns_original_content():
+    state = _session(ToolExecutor([_tool()], **_executor_settings()))
+
+    assert _tool_message(state, "c1").additional_kwargs["duplicate_of"] == "c0"
+    replay = _tool_message(state, "c2")
+    assert replay.additional_kwargs["memoized"]["from"] == "c1"
+    assert replay.content == PAYLOAD
+    assert "duplicate_of" not in replay.additional_kwargs
+
+
+def test_replayed_result_visible_after_original_is_summarized():
+    state = _session(ToolExecutor([_tool()], **_executor_settings()))
+
+    # c0 所在的轮次已并入摘要
+    prompt = ContextWindowManager().build_prompt(SystemMessage(content="sys"), state["messages"], summary="摘要", cutoff_id="h-c1")
+    contents = {m.tool_call_id: m.content for m in prompt if isinstance(m, ToolMessage)}
+    assert contents == {"c1": PAYLOAD, "c2": PAYLOAD}
+
+
+def test_unresolved_reference_keeps_duplicate_of_on_replay():
+    ledger = ToolCallLedger(tool_metadata={"weather": {}})
+    call = {"name": "weather", "args": {"city": "沪"}, "id": "c1"}
+    reference = ToolMessage(
+        content="与之前的工具调用（tool_call_id=c0）结果完全相同，请直接参考该结果。",
+        tool_call_id="c1", name="weather", additional_kwargs={"duplicate_of": "c0"},
+    )
+    # 找不到 c0 时记录引用本身，重放时恢复 duplicate_of，由构造提示词时展开
+    entries = ledger.record({}, [call], {"c1": reference}, {"c1": 0.1})
+    replayed, _ = ledger.replay(entries, [{**call, "id": "c2"}])
+    assert replayed["c2"].additional_kwargs["duplicate_of"] == "c0"
+
+
+def test_plan_step_reads_replayed_result(make_agent_workflow):
+    workflow = make_agent_workflow([_tool()], **_executor_settings())
+    state = _session(workflow.tool_node)
+
+    plan = [
+        {"id": "s1", "call_id": "p_s1", "tool": "weather", "args": {"city": "沪"}, "depends_on": []},
+        {"id": "s2", "call_id": "p_s2", "tool": "weather", "args": {"city": "{s1}"}, "depends_on": ["s1"]},
+    ]
+    (send,) = workflow._dispatch_steps({**state, "plan": plan, "step_results": {}})
+    assert send.arg["tool_ledger"]
+    update = workflow._execute_step(send.arg)
+    assert update["messages"][0].additional_kwargs["memoized"]["from"] == "c1"
+    assert update["step_results"] == {"s1": PAYLOAD}
+    assert resolve_args(plan[1], update["step_results"]) == {"city": PAYLOAD}
@@ -0,0 +1,30 @@
+"""工具预取：预取的调用与在 tools 节点中执行时看到相同的会话（thread_id、tenant_id）。"""
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
+
+from tool_executor import ToolExecutor
+
+
+def test_prefetched_call_runs_with_session_config():
+    runs = []
+
+    def whoami(config: RunnableConfig = None) -> str:
+        """返回调用所在的会话与租户。"""
+        configurable = (config or {}).get("configurable") or {}
+        runs.append(configurable)
+        return f"{configurable.get('thread_id')}/{configurable.get('tenant_id')}"
+
+    tool = StructuredTool.from_function(func=whoami, name="whoami")
+    executor = ToolExecutor([tool], prefetch_settings={"enabled": True, "tools": ["whoami"]})
+    config = {"configurable": {"thread_id": "prefetch-thread", "tenant_id": "prefetch-tenant"}}
+    call = {"name": "whoami", "args": {}, "id": "call_1"}
+
+    tracker = executor.prefetcher.track(None, config)
+    tracker.feed(AIMessageChunk(content="", tool_call_chunks=[{"name": "whoami", "args": "{}", "id": "call_1", "index": 0}]))
+    tracker.settle([call])
+    update = executor.execute({"messages": [AIMessage(content="", tool_calls=[call])]}, config)
+
+    assert update["messages"][0].content == "prefetch-thread/prefetch-tenant"
+    assert len(runs) == 1  # 结果来自预取，没有在 tools 节点中再执行一次
@@ -0,0 +1,37 @@
+"""上传存储：超出配额的上传不记为已处理，配额释放后再次提交时写入。"""
+
+import io
+import tempfile
+
+from upload_store import UploadStore
+
+
+class _Upload(io.BytesIO):
+    """模拟 Streamlit 的 UploadedFile（带 name 与 file_id）。"""
+
+    def __init__(self, name: str, data: bytes, file_id: str):
+        super().__init__(data)
+        self.name = name
+        self.file_id = file_id
+
+
+def test_rejected_upload_is_retried_after_quota_frees():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = UploadStore(tmp, session_quota_bytes=1000)
+        ingested = set()
+        first = _Upload("a.txt", b"a" * 600, "id-a")
+        second = _Upload("b.txt", b"b" * 600, "id-b")
+
+        stored, errors = store.put_new("s", [first, second], ingested)
+        assert stored == 1 and len(errors) == 1
+        assert ingested == {"id-a"}
+
+        # 同一次选择在下次 rerun 时再次提交：已写入的跳过，被拒绝的重试
+        stored, errors = store.put_new("s", [first, second], ingested)
+        assert (stored, len(errors)) == (0, 1)
+
+        store.remove("s", "a.txt")
+        stored, errors = store.put_new("s", [first, second], ingested)
+        assert (stored, errors) == (1, [])
+        assert ingested == {"id-a", "id-b"}
+        assert [meta["name"] for meta in store.list_files("s")] == ["b.txt"]
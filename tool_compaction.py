@@ -0,0 +1,254 @@
+"""
+工具结果压缩模块
+工具结果写入消息历史之前的处理阶段（在 tools 节点内执行，见 tool_executor.ToolExecutor）。
+工具结果会在之后的每次LLM调用中重复发送，因此在进入状态之前先做压缩：
+  - 去掉样板字段：如搜索结果中的 images、raw_content、response_time、favicon 等；
+  - 抽取：列表最多保留 max_items 项，每个字符串字段最多保留 item_max_chars 个字符；
+  - 限长：压缩后仍超过 max_chars 的结果保留首尾、省略中间；
+  - 去重：与本会话中已有的工具结果内容完全相同时，只保留一句引用；
+  - 完整结果按内容哈希保存在 PayloadStore 中，ToolMessage 只记录引用id（additional_kwargs["payload_id"]），
+    UI 展开工具结果时按id取回原文，检查点中不再保存完整结果。
+    配置了 store_path 时（使用 sqlite 检查点后端时默认开启）完整结果保存在 SQLite 文件中，进程重启后仍能取回；
+    否则只保存在进程内存中，重启后只能看到压缩后的内容。
+
+去重只影响写入状态的内容：构造提示词时，被引用的结果已并入摘要或被截断的，引用会换回原结果的内容（见 context_manager.py）。
+
+压缩前后的字节数与token数会记入指标（agent_tool_result_bytes_saved_total 等），并汇总到每轮的 TurnMetrics。
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, ToolMessage
+
+from configs import ConfigManager
+from context_manager import count_text_tokens
+from instrumentation import instrumentation
+
+DEFAULT_COMPACTION_SETTINGS = {
+    "enabled": True,
+    "max_chars": 4000,         # 单条工具结果压缩后的最大字符数
+    "max_items": 5,            # JSON 列表最多保留的项数
+    "item_max_chars": 800,     # JSON 中单个字符串字段最多保留的字符数
+    "dedupe": True,            # 与本会话已有结果相同时只保留引用
+    "drop_fields": ["images", "raw_content", "response_time", "favicon", "follow_up_questions", "request_id", "auto_parameters"],
+    "store_max_entries": 2048, # 保存的完整结果条数（LRU）
+    "store_path": "",          # 完整结果的 SQLite 文件路径，为空时只保存在进程内存中
+}
+
+
+class PayloadStore:
+    """按内容哈希保存完整工具结果的进程内存储（线程安全，LRU淘汰）。"""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def make_id(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:24]
+
+    def put(self, content: str) -> str:
+        payload_id = self.make_id(content)
+        with self._lock:
+            self._entries[payload_id] = content
+            self._entries.move_to_end(payload_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload_id
+
+    def get(self, payload_id: str) -> Optional[str]:
+        with self._lock:
+            content = self._entries.get(payload_id)
+            if content is not None:
+                self._entries.move_to_end(payload_id)
+            return content
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLitePayloadStore(PayloadStore):
+    """
+    保存在 SQLite 文件中的 PayloadStore，进程重启后检查点中的 payload_id 仍然有效。
+    超过 max_entries 时按最近访问时间淘汰，淘汰每 _TRIM_INTERVAL 次写入批量执行一次。
+    """
+
+    _TRIM_INTERVAL = 64
+
+    def __init__(self, path: str, max_entries: int = 2048):
+        super().__init__(max_entries)
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS payloads (payload_id TEXT PRIMARY KEY, content TEXT, accessed_at REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS payloads_accessed_at ON payloads (accessed_at)")
+        self._puts = 0
+
+    def put(self, content: str) -> str:
+        payload_id = self.make_id(content)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO payloads (payload_id, content, accessed_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(payload_id) DO UPDATE SET accessed_at = excluded.accessed_at",
+                (payload_id, content, time.time()),
+            )
+            self._puts += 1
+            if self._puts % self._TRIM_INTERVAL == 0:
+                self._trim()
+        return payload_id
+
+    def _trim(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM payloads").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM payloads WHERE payload_id IN (SELECT payload_id FROM payloads ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def get(self, payload_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM payloads WHERE payload_id = ?", (payload_id,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE payloads SET accessed_at = ? WHERE payload_id = ?", (time.time(), payload_id))
+        return row[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM payloads").fetchone()[0]
+
+
+def create_payload_store(settings: Optional[Dict[str, Any]] = None) -> PayloadStore:
+    """根据 ConfigManager.runtime_configs["tool_compaction"] 创建完整结果的存储。"""
+    settings = {**DEFAULT_COMPACTION_SETTINGS, **(settings or {})}
+    if settings["store_path"]:
+        return SQLitePayloadStore(settings["store_path"], settings["store_max_entries"])
+    return PayloadStore(settings["store_max_entries"])
+
+
+def _prune(value: Any, settings: Dict[str, Any]) -> Any:
+    """递归去掉样板字段与空值，截断过长的列表与字符串。"""
+    drop = settings["drop_fields"]
+    if isinstance(value, dict):
+        return {
+            k: _prune(v, settings) for k, v in value.items()
+            if k not in drop and v not in (None, "", [], {})
+        }
+    if isinstance(value, list):
+        kept = [_prune(v, settings) for v in value[:settings["max_items"]]]
+        if len(value) > settings["max_items"]:
+            kept.append(f"...[另有 {len(value) - settings['max_items']} 项已省略]")
+        return kept
+    if isinstance(value, str) and len(value) > settings["item_max_chars"]:
+        return value[:settings["item_max_chars"]] + "…"
+    return value
+
+
+def _cap(text: str, max_chars: int) -> str:
+    """保留首尾、省略中间。"""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 3 // 4
+    tail = max_chars - head
+    return f"{text[:head]}\n...[已省略 {len(text) - max_chars} 个字符，完整结果可在界面中展开查看]\n{text[-tail:]}"
+
+
+class ToolResultCompactor:
+    """
+    工具结果压缩器。
+
+    Args:
+        settings: 覆盖 DEFAULT_COMPACTION_SETTINGS 中的字段。
+        store: 保存完整结果的存储，默认使用进程级共享的 payload_store。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, store: Optional[PayloadStore] = None):
+        self.settings = {**DEFAULT_COMPACTION_SETTINGS, **(settings or {})}
+        self.store = store or payload_store
+
+    def compact_text(self, text: str) -> str:
+        """压缩单条结果的文本：JSON 先裁剪字段，再整体限长。"""
+        stripped = text.strip()
+        if stripped[:1] in ("{", "["):
+            try:
+                pruned = _prune(json.loads(stripped), self.settings)
+                text = json.dumps(pruned, ensure_ascii=False, separators=(",", ":"))
+            except (json.JSONDecodeError, TypeError):
+                pass
+        return _cap(text, self.settings["max_chars"])
+
+    @staticmethod
+    def _seen_payloads(history: Sequence[BaseMessage]) -> Dict[str, str]:
+        """本会话中已有工具结果的 payload_id -> tool_call_id。"""
+        seen = {}
+        for message in history:
+            if isinstance(message, ToolMessage):
+                payload_id = message.additional_kwargs.get("payload_id")
+                if payload_id and message.additional_kwargs.get("duplicate_of") is None:
+                    seen.setdefault(payload_id, message.tool_call_id)
+        return seen
+
+    def compact(self, messages: List[ToolMessage], history: Sequence[BaseMessage] = ()) -> List[ToolMessage]:
+        """压缩一批工具结果；history 为当前状态中的消息，用于跨调用去重。"""
+        if not self.settings["enabled"]:
+            return messages
+        seen = self._seen_payloads(history) if self.settings["dedupe"] else {}
+        result = []
+        for message in messages:
+            if not isinstance(message.content, str) or getattr(message, "status", None) == "error":
+                result.append(message)
+                continue
+            original = message.content
+            payload_id = self.store.make_id(original)
+            duplicate_of = seen.get(payload_id)
+            if duplicate_of is not None:
+                content = f"与之前的工具调用（tool_call_id={duplicate_of}）结果完全相同，请直接参考该结果。"
+            else:
+                content = self.compact_text(original)
+                seen[payload_id] = message.tool_call_id
+            if content != original:
+                self.store.put(original)
+
+            saved_bytes = len(original.encode("utf-8")) - len(content.encode("utf-8"))
+            saved_tokens = count_text_tokens(original) - count_text_tokens(content) if saved_bytes > 0 else 0
+            instrumentation.inc("agent_tool_result_bytes_saved_total", max(saved_bytes, 0), tool=message.name)
+            instrumentation.inc("agent_tool_result_tokens_saved_total", max(saved_tokens, 0), tool=message.name)
+            if duplicate_of is not None:
+                instrumentation.inc("agent_tool_result_duplicates_total", tool=message.name)
+
+            additional_kwargs = {
+                **message.additional_kwargs,
+                "payload_id": payload_id,
+                "compaction": {
+                    "original_bytes": len(original.encode("utf-8")),
+                    "saved_bytes": max(saved_bytes, 0),
+                    "saved_tokens": max(saved_tokens, 0),
+                },
+            }
+            if duplicate_of is not None:
+                additional_kwargs["duplicate_of"] = duplicate_of
+            result.append(message.model_copy(update={"content": content, "additional_kwargs": additional_kwargs}))
+        return result
+
+
+payload_store = create_payload_store(ConfigManager().get_runtime_config("tool_compaction"))
+
+
+def full_tool_content(message: ToolMessage) -> str:
+    """取回工具结果的完整内容（未压缩或原文已被淘汰时返回消息中的内容）。"""
+    payload_id = message.additional_kwargs.get("payload_id")
+    if payload_id:
+        content = payload_store.get(payload_id)
+        if content is not None:
+            return content
+    return message.content
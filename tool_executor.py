@@ -0,0 +1,201 @@
+"""
+并发工具执行模块
+替代LangGraph预置的ToolNode，在同一条AIMessage包含多个工具调用时并发执行它们，
+使单轮的墙钟时间接近各工具耗时的最大值而不是总和。
+
+执行完成的工具结果在写入状态之前交给可选的 result_processor（见 tool_compaction.ToolResultCompactor）压缩。
+配置了 ledger（见 tool_ledger.ToolCallLedger）时，会话中已执行过的相同调用直接重放状态中记录的结果，不再执行。
+开启预取（见 tool_prefetch.py）时，agent 节点在模型生成过程中已开始执行的调用由本节点认领结果，而不是重新执行。
+工具在 ToolMessage.artifact 中返回的 {"usage": ...}（如子Agent的模型调用）合并进 AgentState.usage，计入会话预算。
+
+并发度受两级限制：
+  - 每轮（单个tools节点执行）最多同时运行 max_per_turn 个工具调用；
+  - 整个进程最多同时运行 max_per_process 个工具调用（所有会话、同步/异步路径共享）。
+"""
+
+import asyncio
+import contextvars
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+
+from instrumentation import instrumentation
+from process_limiter import get_process_limiter
+from quota import merge_usage
+
+
+class ToolExecutor:
+    """
+    工具执行节点：读取最后一条AIMessage中的工具调用并并发执行，返回对应的ToolMessage列表。
+    同时提供同步（execute）与异步（aexecute）两个入口，分别供 invoke/stream 与 ainvoke/astream 使用。
+    """
+
+    def __init__(self, tools: Sequence[BaseTool], max_per_turn: int = 4, max_per_process: int = 16, result_processor=None, ledger=None,
+                 prefetch_settings: Optional[Dict[str, Any]] = None, quota=None, tool_configurable: Optional[Dict[str, Any]] = None):
+        self.tools_by_name: Dict[str, BaseTool] = {t.name: t for t in tools}
+        # 调用工具时合并到 config["configurable"] 中的值：工具是进程级共享的，
+        # 需要知道所属工作流的信息（如子Agent使用的模型配置）时从这里读取
+        self.tool_configurable = tool_configurable or {}
+        self.result_processor = result_processor
+        self.ledger = ledger
+        # 可选的 quota.QuotaManager：受限上游（如搜索）的工具在拿并发名额之前先等待限流
+        self.quota = quota
+        self.max_per_turn = max(1, max_per_turn)
+        self.process_limiter = get_process_limiter(max(1, max_per_process))
+        self.prefetcher = None
+        if prefetch_settings and prefetch_settings.get("enabled"):
+            from tool_prefetch import ToolPrefetcher
+            self.prefetcher = ToolPrefetcher(self._run_one, prefetch_settings, ledger=ledger, max_per_message=self.max_per_turn)
+
+    # --- 辅助方法 ---
+
+    def _tool_config(self, config: Optional[RunnableConfig]) -> Optional[RunnableConfig]:
+        if not self.tool_configurable:
+            return config
+        config = dict(config or {})
+        config["configurable"] = {**(config.get("configurable") or {}), **self.tool_configurable}
+        return config
+
+    @staticmethod
+    def _tool_calls(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+        last_message = state["messages"][-1]
+        if not isinstance(last_message, AIMessage):
+            return []
+        return list(last_message.tool_calls)
+
+    @staticmethod
+    def _error_message(call: Dict[str, Any], error: Exception) -> ToolMessage:
+        # 与ToolNode的默认行为保持一致：把异常作为工具结果返回给模型，而不是中断整个计算图
+        return ToolMessage(
+            content=f"Error: {error!r}\n 请修正参数后重试。",
+            name=call["name"],
+            tool_call_id=call["id"],
+            status="error",
+        )
+
+    def _unknown_tool_message(self, call: Dict[str, Any]) -> ToolMessage:
+        return ToolMessage(
+            content=f"Error: 工具 `{call['name']}` 不存在，可用工具: {', '.join(self.tools_by_name)}",
+            name=call["name"],
+            tool_call_id=call["id"],
+            status="error",
+        )
+
+    @staticmethod
+    def _as_tool_message(call: Dict[str, Any], output: Any) -> ToolMessage:
+        if isinstance(output, ToolMessage):
+            return output
+        return ToolMessage(content=str(output), name=call["name"], tool_call_id=call["id"])
+
+    @staticmethod
+    def _record(call: Dict[str, Any], message: ToolMessage, started: float) -> Tuple[ToolMessage, float]:
+        """记录工具时延（从拿到并发名额开始计时，不含排队等待），返回 (消息, 耗时)。"""
+        elapsed = time.perf_counter() - started
+        status = getattr(message, "status", "success") or "success"
+        instrumentation.observe("agent_tool_seconds", elapsed, tool=call["name"])
+        instrumentation.inc("agent_tool_calls_total", tool=call["name"], status=status)
+        return message, elapsed
+
+    def _replay(self, state: Dict[str, Any], calls: List[Dict[str, Any]]) -> Tuple[Dict[str, ToolMessage], Dict[str, Any], List[Dict[str, Any]]]:
+        """拆分出可以从记账中重放的调用，返回 (重放的消息, 记账更新, 需要执行的调用)。"""
+        if self.ledger is None:
+            return {}, {}, calls
+        replayed, ledger_update = self.ledger.replay(state.get("tool_ledger"), calls)
+        return replayed, ledger_update, [call for call in calls if call["id"] not in replayed]
+
+    def _claim_prefetched(self, pending: List[Dict[str, Any]]) -> Dict[str, Future]:
+        return self.prefetcher.claim(pending) if self.prefetcher is not None and pending else {}
+
+    @staticmethod
+    def _in_order(pending: List[Dict[str, Any]], results: Dict[str, Tuple[ToolMessage, float]]) -> List[Tuple[ToolMessage, float]]:
+        return [results[call["id"]] for call in pending]
+
+    def _finish(self, state: Dict[str, Any], calls: List[Dict[str, Any]], replayed: Dict[str, ToolMessage],
+                ledger_update: Dict[str, Any], executed: List[Dict[str, Any]], results: List[Tuple[ToolMessage, float]]) -> Dict[str, Any]:
+        messages = [message for message, _ in results]
+        if self.result_processor is not None and messages:
+            # 重放的结果已经是压缩后的内容，只压缩本次实际执行的结果
+            messages = self.result_processor.compact(messages, state.get("messages", []))
+        by_id = {**replayed, **{call["id"]: message for call, message in zip(executed, messages)}}
+        update: Dict[str, Any] = {"messages": [by_id[call["id"]] for call in calls]}
+        # 自己调用模型的工具（如子Agent）在 artifact 中返回用量，计入会话预算；重放的结果不再计费
+        usage = {}
+        for message in messages:
+            if isinstance(message.artifact, dict) and message.artifact.get("usage"):
+                usage = merge_usage(usage, message.artifact["usage"])
+        if usage:
+            update["usage"] = usage
+        if self.ledger is not None:
+            seconds = {call["id"]: elapsed for call, (_, elapsed) in zip(executed, results)}
+            ledger_update = {**ledger_update, **self.ledger.record(state.get("tool_ledger"), executed, by_id, seconds, state.get("messages", []))}
+            if ledger_update:
+                update["tool_ledger"] = ledger_update
+        return update
+
+    # --- 同步路径 ---
+
+    def _run_one(self, call: Dict[str, Any], config: Optional[RunnableConfig]) -> Tuple[ToolMessage, float]:
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return self._unknown_tool_message(call), 0.0
+        if self.quota is not None:
+            self.quota.acquire_tool(call["name"])
+        with self.process_limiter:
+            started = time.perf_counter()
+            try:
+                message = self._as_tool_message(call, tool.invoke({**call, "type": "tool_call"}, self._tool_config(config)))
+            except Exception as e:
+                message = self._error_message(call, e)
+            return self._record(call, message, started)
+
+    def execute(self, state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+        calls = self._tool_calls(state)
+        replayed, ledger_update, pending = self._replay(state, calls)
+        prefetched = self._claim_prefetched(pending)
+        to_run = [call for call in pending if call["id"] not in prefetched]
+        if len(to_run) <= 1:
+            results = {call["id"]: self._run_one(call, config) for call in to_run}
+        else:
+            # 每个线程复制一份上下文，保证LangGraph的运行时上下文（回调、流写入器等）能够传递到工具内部
+            with ThreadPoolExecutor(max_workers=min(self.max_per_turn, len(to_run))) as pool:
+                futures = {
+                    call["id"]: pool.submit(contextvars.copy_context().run, self._run_one, call, config)
+                    for call in to_run
+                }
+                results = {call_id: f.result() for call_id, f in futures.items()}
+        results.update({call_id: f.result() for call_id, f in prefetched.items()})
+        return self._finish(state, calls, replayed, ledger_update, pending, self._in_order(pending, results))
+
+    # --- 异步路径 ---
+
+    async def _arun_one(self, call: Dict[str, Any], config: Optional[RunnableConfig], turn_sem: asyncio.Semaphore) -> Tuple[ToolMessage, float]:
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return self._unknown_tool_message(call), 0.0
+        if self.quota is not None:
+            await self.quota.aacquire_tool(call["name"])
+        async with turn_sem, self.process_limiter:
+            started = time.perf_counter()
+            try:
+                message = self._as_tool_message(call, await tool.ainvoke({**call, "type": "tool_call"}, self._tool_config(config)))
+            except Exception as e:
+                message = self._error_message(call, e)
+            return self._record(call, message, started)
+
+    async def aexecute(self, state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+        calls = self._tool_calls(state)
+        replayed, ledger_update, pending = self._replay(state, calls)
+        prefetched = self._claim_prefetched(pending)
+        turn_sem = asyncio.Semaphore(self.max_per_turn)
+
+        async def run(call):
+            if call["id"] in prefetched:
+                return await asyncio.wrap_future(prefetched[call["id"]])
+            return await self._arun_one(call, config, turn_sem)
+
+        results = await asyncio.gather(*(run(call) for call in pending))
+        return self._finish(state, calls, replayed, ledger_update, pending, list(results))
@@ -0,0 +1,186 @@
+"""
+工具调用记账模块
+在会话状态（AgentState.tool_ledger）中按"工具名 + 规范化参数"记录已执行过的工具调用及其结果。
+同一会话中再次出现相同的调用时（同一轮ReAct循环内或之后的轮次），ToolExecutor 直接重放记录的结果，不再执行工具：
+  - 按工具开启/关闭：非幂等的工具可在工具的 metadata 中声明 {"memoize": False}，或在配置的 "exclude" 中列出；
+    配置了 "include" 时只有列出的工具参与记账；
+  - 每条记录有TTL（可按工具覆盖），过期的记录在下次写入时清除；出错的调用不记录；
+  - 重放的 ToolMessage 在 additional_kwargs["memoized"] 中注明来源调用与节省的时间，
+    并计入指标 agent_tool_memo_hits_total / agent_tool_memo_saved_seconds_total。
+
+记录随检查点持久化，记录的是压缩后的结果（与模型此前看到的内容一致），因此每个会话的额外占用有限（max_entries）。
+被去重为引用的结果（见 tool_compaction.py）记录被引用结果的内容，重放的结果不依赖之后可能并入摘要的原结果；
+找不到被引用的结果时记录引用本身，重放时恢复 additional_kwargs["duplicate_of"]，由构造提示词时展开。
+"""
+
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, ToolMessage
+
+from instrumentation import instrumentation
+
+DEFAULT_LEDGER_SETTINGS = {
+    "enabled": True,
+    "ttl_seconds": 600.0,   # 记录的默认有效期
+    "max_entries": 128,     # 每个会话最多保留的记录数，超出时淘汰最早的记录
+    "include": None,        # 只对这些工具记账（None 表示所有未排除的工具）
+    "exclude": [],          # 从不记账的工具（非幂等，或结果必须实时获取）
+    "tools": {},            # 按工具覆盖：{工具名: {"memoize": bool, "ttl_seconds": float}}
+}
+
+
+def call_key(name: str, args: Any) -> str:
+    """工具调用的记账键：工具名与按键排序的参数JSON的哈希。"""
+    canonical = json.dumps(args, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{name}\n{canonical}".encode("utf-8")).hexdigest()[:24]
+
+
+def merge_tool_ledger(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """AgentState.tool_ledger 的合并函数：值为 None 的键表示删除该记录，写入 None 表示清空。"""
+    if right is None:
+        return {}
+    merged = dict(left or {})
+    for key, entry in right.items():
+        if entry is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = entry
+    return merged
+
+
+class ToolCallLedger:
+    """
+    工具调用记账策略：判断哪些调用可以重放，生成重放消息与状态更新。记录本身保存在状态中，本类不持有会话数据。
+
+    Args:
+        settings: 覆盖 DEFAULT_LEDGER_SETTINGS 中的字段。
+        tool_metadata: {工具名: 工具的 metadata}，用于读取工具自身声明的 memoize / memoize_ttl_seconds。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, tool_metadata: Optional[Mapping[str, Mapping[str, Any]]] = None):
+        self.settings = {**DEFAULT_LEDGER_SETTINGS, **(settings or {})}
+        self.tool_metadata = {name: dict(meta or {}) for name, meta in (tool_metadata or {}).items()}
+
+    def ttl(self, tool: str) -> Optional[float]:
+        """该工具记录的有效期；返回 None 表示该工具不参与记账。"""
+        if not self.settings["enabled"]:
+            return None
+        include = self.settings["include"]
+        if include is not None and tool not in include:
+            return None
+        if tool in (self.settings["exclude"] or ()):
+            return None
+        override = (self.settings["tools"] or {}).get(tool, {})
+        metadata = self.tool_metadata.get(tool, {})
+        if override.get("memoize", metadata.get("memoize", True)) is False:
+            return None
+        return float(override.get("ttl_seconds", metadata.get("memoize_ttl_seconds", self.settings["ttl_seconds"])))
+
+    def _valid(self, entry: Optional[Dict[str, Any]], now: float) -> bool:
+        if not entry:
+            return False
+        ttl = self.ttl(entry["tool"])
+        return ttl is not None and now - entry["created_at"] <= ttl
+
+    def lookup(self, ledger: Optional[Mapping[str, Any]], call: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """返回 (记账键, 未过期的记录)；不可重放时返回 None。"""
+        if not ledger or self.ttl(call["name"]) is None:
+            return None
+        key = call_key(call["name"], call.get("args"))
+        entry = ledger.get(key)
+        if not self._valid(entry, time.time()):
+            return None
+        return key, entry
+
+    def replay(self, ledger: Optional[Mapping[str, Any]], calls: List[Dict[str, Any]]) -> Tuple[Dict[str, ToolMessage], Dict[str, Any]]:
+        """
+        为可重放的调用生成 ToolMessage。
+
+        Returns:
+            ({tool_call_id: 重放的消息}, 记账更新（命中次数）)。
+        """
+        replayed, update = {}, {}
+        for call in calls:
+            found = self.lookup(ledger, call)
+            if found is None:
+                continue
+            key, entry = found
+            replayed[call["id"]] = ToolMessage(
+                content=entry["content"],
+                name=call["name"],
+                tool_call_id=call["id"],
+                additional_kwargs={
+                    **({"payload_id": entry["payload_id"]} if entry.get("payload_id") else {}),
+                    **({"duplicate_of": entry["duplicate_of"]} if entry.get("duplicate_of") else {}),
+                    "memoized": {"from": entry["tool_call_id"], "saved_seconds": entry["seconds"]},
+                },
+            )
+            update[key] = {**entry, "hits": entry.get("hits", 0) + 1}
+            instrumentation.inc("agent_tool_memo_hits_total", tool=call["name"])
+            instrumentation.inc("agent_tool_memo_saved_seconds_total", entry["seconds"], tool=call["name"])
+        return replayed, update
+
+    @staticmethod
+    def _originals(messages: Mapping[str, ToolMessage], history: Sequence[BaseMessage]) -> Dict[str, ToolMessage]:
+        """{tool_call_id: 未被去重的工具结果}，用于把去重后的引用换回被引用结果的内容。"""
+        return {
+            m.tool_call_id: m for m in [*history, *messages.values()]
+            if isinstance(m, ToolMessage) and not m.additional_kwargs.get("duplicate_of")
+        }
+
+    def record(self, ledger: Optional[Mapping[str, Any]], calls: List[Dict[str, Any]], messages: Mapping[str, ToolMessage],
+               seconds: Mapping[str, float], history: Sequence[BaseMessage] = ()) -> Dict[str, Any]:
+        """
+        登记本次实际执行的调用，同时清除过期记录并把记录数限制在 max_entries 以内。
+
+        Args:
+            calls: 实际执行的工具调用。
+            messages: {tool_call_id: 写入状态的（已压缩的）ToolMessage}。
+            seconds: {tool_call_id: 执行耗时}。
+            history: 当前状态中的消息，用于查找去重结果所引用的原结果。
+        """
+        if not self.settings["enabled"]:
+            return {}
+        now = time.time()
+        update: Dict[str, Any] = {}
+        originals = None
+        for call in calls:
+            message = messages.get(call["id"])
+            if message is None or getattr(message, "status", None) == "error" or self.ttl(call["name"]) is None:
+                continue
+            content, duplicate_of = message.content, message.additional_kwargs.get("duplicate_of")
+            if duplicate_of is not None:
+                if originals is None:
+                    originals = self._originals(messages, history)
+                original = originals.get(duplicate_of)
+                if original is not None:
+                    content, duplicate_of = original.content, None
+            update[call_key(call["name"], call.get("args"))] = {
+                "tool": call["name"],
+                "tool_call_id": call["id"],
+                "content": content,
+                "duplicate_of": duplicate_of,
+                "payload_id": message.additional_kwargs.get("payload_id"),
+                "created_at": now,
+                "seconds": round(seconds.get(call["id"], 0.0), 4),
+                "hits": 0,
+            }
+        if not update:
+            return {}
+
+        recorded = len(update)
+        alive = []
+        for key, entry in (ledger or {}).items():
+            if key in update:
+                continue
+            if self._valid(entry, now):
+                alive.append((entry["created_at"], key))
+            else:
+                update[key] = None
+        overflow = len(alive) + recorded - self.settings["max_entries"]
+        for _, key in sorted(alive)[:max(0, overflow)]:
+            update[key] = None
+        return update
@@ -0,0 +1,196 @@
+"""
+工具预取模块（推测执行）
+agent 节点默认等到完整的 AIMessage 生成后才路由到 tools 节点，工具执行与模型生成是串行的。
+开启预取后，agent 节点以流式方式读取模型输出：某个工具调用的参数在流中一旦完整（参数JSON可以解析），
+就在后台线程中开始执行该工具，同时模型继续生成消息的其余部分（后续的工具调用等）。
+随后 tools 节点通过 ToolExecutor 认领（claim）这些已在执行或已完成的结果，而不是重新执行。
+
+只有显式列出的工具（默认只有 tavily_search）会被预取，因为最终消息与流中看到的不一致时结果会被丢弃，
+工具可能已经执行过一次——非幂等的工具不应出现在列表中。以下情况预取结果会被丢弃：
+  - 最终消息中没有该调用，或同一调用id的工具名/参数不同；
+  - 本次调用出错或以需要重试/续写的 finish_reason 结束（不会进入 tools 节点）；
+  - 超过 max_age_seconds 仍未被认领（例如计算图被中断）。
+
+预取的工具调用使用 agent 节点运行配置中标识会话的字段（thread_id、tenant_id 等，见 _PREFETCH_CONFIG_KEYS），
+依赖会话的工具（如上传文档工具、按租户限流的子Agent）因此与在 tools 节点中执行时看到相同的会话；
+回调与流写入器不会传给后台线程。
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableConfig
+
+from instrumentation import instrumentation
+from tool_ledger import call_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFETCH_SETTINGS = {
+    "enabled": False,
+    "tools": ["tavily_search"],  # 允许预取的工具（必须是幂等的）
+    "max_workers": 4,            # 预取线程数（工具执行仍受进程级并发上限约束）
+    "max_age_seconds": 120.0,    # 预取结果最长保留时间，超时未认领则丢弃
+}
+
+# 传给预取调用的运行配置字段：只有标识会话与租户的字段
+_PREFETCH_CONFIG_KEYS = ("thread_id", "checkpoint_ns", "tenant_id")
+
+
+def prefetch_config(config: Optional[RunnableConfig]) -> RunnableConfig:
+    """从 agent 节点的运行配置中取出预取调用使用的部分。"""
+    configurable = (config or {}).get("configurable") or {}
+    return {"configurable": {k: configurable[k] for k in _PREFETCH_CONFIG_KEYS if k in configurable}}
+
+
+class _Prefetch:
+    __slots__ = ("call", "key", "future", "started")
+
+    def __init__(self, call: Dict[str, Any], future: Future):
+        self.call = call
+        self.key = call_key(call["name"], call["args"])
+        self.future = future
+        self.started = time.perf_counter()
+
+
+class ToolPrefetcher:
+    """
+    预取调度器，每个 ToolExecutor（即每个已编译的计算图）持有一个，在共享该计算图的会话之间共用：agent 节点通过 track() 在生成过程中提交预取，tools 节点通过 claim() 认领。
+
+    Args:
+        run_one: 执行单个工具调用的函数 (call, config) -> (ToolMessage, 耗时)，即 ToolExecutor._run_one。
+        settings: 覆盖 DEFAULT_PREFETCH_SETTINGS 中的字段。
+        ledger: 可选的 tool_ledger.ToolCallLedger；记账中已有有效结果的调用不再预取。
+        max_per_message: 单条消息最多预取的调用数（与 ToolExecutor 的每轮并发上限一致，预取不会突破该上限）。
+    """
+
+    def __init__(self, run_one: Callable, settings: Optional[Dict[str, Any]] = None, ledger=None, max_per_message: int = 4):
+        self.settings = {**DEFAULT_PREFETCH_SETTINGS, **(settings or {})}
+        self.tools = set(self.settings["tools"] or ())
+        self.ledger = ledger
+        self.max_per_message = max(1, max_per_message)
+        self._run_one = run_one
+        self._pool = ThreadPoolExecutor(max_workers=max(1, self.settings["max_workers"]), thread_name_prefix="tool-prefetch")
+        self._inflight: Dict[str, _Prefetch] = {}
+        self._lock = threading.Lock()
+
+    def track(self, ledger_state: Optional[Mapping[str, Any]] = None, config: Optional[RunnableConfig] = None) -> "PrefetchTracker":
+        """为一次模型调用创建跟踪器；config 为 agent 节点的运行配置。"""
+        return PrefetchTracker(self, ledger_state, prefetch_config(config))
+
+    def eligible(self, call: Dict[str, Any], ledger_state: Optional[Mapping[str, Any]]) -> bool:
+        if call["name"] not in self.tools:
+            return False
+        return self.ledger is None or self.ledger.lookup(ledger_state, call) is None
+
+    def submit(self, call: Dict[str, Any], config: Optional[RunnableConfig] = None):
+        """在后台开始执行一个参数已完整的工具调用；config 见 prefetch_config。"""
+        self._expire()
+        # 预取在独立线程中运行，不继承 agent 节点的运行上下文（回调、流写入器），结果只在被认领后写入状态
+        future = self._pool.submit(self._run_one, call, config)
+        with self._lock:
+            self._inflight[call["id"]] = _Prefetch(call, future)
+        instrumentation.inc("agent_tool_prefetch_total", tool=call["name"], outcome="started")
+        logger.debug("预取工具调用 %s(%s)", call["name"], call["id"])
+
+    def discard(self, call_ids) -> None:
+        for call_id in call_ids:
+            with self._lock:
+                prefetch = self._inflight.pop(call_id, None)
+            if prefetch is not None:
+                prefetch.future.cancel()
+                instrumentation.inc("agent_tool_prefetch_total", tool=prefetch.call["name"], outcome="discarded")
+
+    def settle(self, launched: List[str], final_calls: List[Dict[str, Any]]) -> None:
+        """模型调用结束后，丢弃与最终工具调用不一致的预取（final_calls 为空表示全部丢弃）。"""
+        final = {call["id"]: call_key(call["name"], call.get("args")) for call in final_calls}
+        with self._lock:
+            stale = [
+                call_id for call_id in launched
+                if call_id in self._inflight and final.get(call_id) != self._inflight[call_id].key
+            ]
+        self.discard(stale)
+
+    def claim(self, calls: List[Dict[str, Any]]) -> Dict[str, Future]:
+        """认领与给定工具调用一致（调用id、工具名与参数都相同）的预取，返回 {tool_call_id: Future}。"""
+        claimed = {}
+        now = time.perf_counter()
+        with self._lock:
+            for call in calls:
+                prefetch = self._inflight.get(call["id"])
+                if prefetch is None or prefetch.key != call_key(call["name"], call.get("args")) or prefetch.future.cancelled():
+                    continue
+                del self._inflight[call["id"]]
+                claimed[call["id"]] = prefetch.future
+                # 与模型生成重叠的时间：认领时已完成则为整个执行时间，否则为已经执行的时间
+                overlap = now - prefetch.started
+                if prefetch.future.done():
+                    overlap = min(overlap, prefetch.future.result()[1])
+                instrumentation.inc("agent_tool_prefetch_total", tool=call["name"], outcome="used")
+                instrumentation.inc("agent_tool_prefetch_saved_seconds_total", overlap, tool=call["name"])
+        return claimed
+
+    def _expire(self):
+        deadline = time.perf_counter() - self.settings["max_age_seconds"]
+        with self._lock:
+            expired = [call_id for call_id, p in self._inflight.items() if p.started < deadline]
+        self.discard(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"inflight": len(self._inflight), "tools": sorted(self.tools)}
+
+
+class PrefetchTracker:
+    """
+    跟踪一次模型调用的流式输出：按 index 累积工具调用增量，参数完整时提交预取。
+    模型调用结束后必须调用 settle()，否则已提交的预取只能等到过期才被丢弃。
+    """
+
+    def __init__(self, prefetcher: ToolPrefetcher, ledger_state: Optional[Mapping[str, Any]] = None,
+                 config: Optional[RunnableConfig] = None):
+        self.prefetcher = prefetcher
+        self.ledger_state = ledger_state
+        self.config = config
+        self._partial: Dict[int, Dict[str, str]] = {}
+        self._done = set()
+        self.launched: List[str] = []
+
+    def feed(self, chunk: AIMessageChunk) -> None:
+        for tc in chunk.tool_call_chunks:
+            index = tc.get("index") or 0
+            entry = self._partial.setdefault(index, {"name": "", "id": "", "args": ""})
+            entry["name"] += tc.get("name") or ""
+            entry["id"] = tc.get("id") or entry["id"]
+            entry["args"] += tc.get("args") or ""
+            if index in self._done:
+                continue
+            call = self._complete_call(entry)
+            if call is None:
+                continue
+            self._done.add(index)
+            if len(self.launched) < self.prefetcher.max_per_message and self.prefetcher.eligible(call, self.ledger_state):
+                self.prefetcher.submit(call, self.config)
+                self.launched.append(call["id"])
+
+    @staticmethod
+    def _complete_call(entry: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """参数JSON可以完整解析时返回工具调用：对象的右括号之后，同一调用的参数不会再有增量。"""
+        if not entry["id"] or not entry["name"] or not entry["args"].rstrip().endswith("}"):
+            return None
+        try:
+            args = json.loads(entry["args"])
+        except ValueError:
+            return None
+        if not isinstance(args, dict):
+            return None
+        return {"name": entry["name"], "args": args, "id": entry["id"]}
+
+    def settle(self, final_calls: Optional[List[Dict[str, Any]]]) -> None:
+        if self.launched:
+            self.prefetcher.settle(self.launched, final_calls or [])
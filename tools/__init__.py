@@ -0,0 +1,45 @@
+"""
+工具注册表
+按名称登记Agent可用的工具及其所在模块，工具在第一次被请求时才导入模块并构建，
+因此导入计算图不会连带导入 langchain_tavily 等较重的依赖。
+
+新增工具时在 TOOL_PROVIDERS 中登记 "工具名": "模块:属性"，属性可以是工具对象，也可以是返回工具对象的无参函数。
+"""
+
+import importlib
+import threading
+from typing import Dict, List, Sequence
+
+TOOL_PROVIDERS: Dict[str, str] = {
+    "tavily_search": "tools.web_search:get_search_tool",
+    "sub_agent_executor": "tools.sub_agent_tool:sub_agent_executor_tool",
+    "sub_agent_batch_executor": "tools.sub_agent_tool:sub_agent_batch_tool",
+    "search_uploaded_documents": "tools.document_tools:document_search_tool",
+    "read_uploaded_document": "tools.document_tools:document_read_tool",
+}
+
+# 模型配置未指定 "tools" 时启用的工具
+DEFAULT_AGENT_TOOLS = tuple(TOOL_PROVIDERS)
+
+_loaded: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def get_tool(name: str):
+    """按名称获取工具（首次调用时导入所在模块）。"""
+    with _lock:
+        tool = _loaded.get(name)
+        if tool is not None:
+            return tool
+        if name not in TOOL_PROVIDERS:
+            raise KeyError(f"未注册的工具: {name}，可用工具: {', '.join(TOOL_PROVIDERS)}")
+        module_name, attr = TOOL_PROVIDERS[name].split(":")
+        target = getattr(importlib.import_module(module_name), attr)
+        # 登记的可能是工具对象，也可能是创建工具的函数
+        tool = target if hasattr(target, "invoke") else target()
+        _loaded[name] = tool
+        return tool
+
+
+def get_tools(names: Sequence[str]) -> List[object]:
+    return [get_tool(name) for name in names]
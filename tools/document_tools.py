@@ -0,0 +1,454 @@
+"""
+上传文档检索工具
+让Agent读取用户上传的文件，而不是把整份文件塞进提示词：
+  - 惰性切块：某个文件第一次被检索或读取时才解析，按行流式读取并切成带重叠的文本块；
+  - 持久化索引：切块结果、词频与（可选的）向量保存在SQLite中，以内容哈希为键，
+    相同内容只建一次索引，进程重启后无需重建；
+  - 检索：BM25 打分，启用向量且安装了 NumPy 时与余弦相似度加权融合，只返回 top-k 个文本块；
+  - 分页读取：按块顺序读取文件的某一段，每次最多返回 max_read_chunks 块。
+
+工具参数中的文件可以是系统提示词"上传文件清单"里的文件名、完整哈希或哈希前缀；
+三者都只在当前会话（configurable.thread_id）引用的文件中解析。
+"""
+
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
+
+from configs import ConfigManager
+from tools.search_cache import hashing_embedding
+from upload_store import get_upload_store
+
+try:  # NumPy 为可选依赖，仅用于向量检索
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_ASCII_WORD = re.compile(r"[a-z0-9_]+")
+_CJK_RUN = re.compile(r"[㐀-䶿一-鿿]+")
+_TEXT_MIME_TYPES = {"application/json", "application/xml", "application/javascript", "application/x-yaml", "application/x-sh"}
+
+# BM25 参数
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """英文/数字按单词切分，中文按相邻二字切分（单字词保留单字）。"""
+    text = (text or "").lower()
+    tokens = _ASCII_WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def iter_document_text(path: str, mime_type: str) -> Iterator[str]:
+    """逐段产出文件文本：文本类文件按行，PDF 按页（需要安装 pypdf）。"""
+    if mime_type == "application/pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ValueError("读取PDF需要安装 pypdf：pip install pypdf")
+        for page in PdfReader(path).pages:
+            yield (page.extract_text() or "") + "\n"
+        return
+    if not (mime_type.startswith("text/") or mime_type in _TEXT_MIME_TYPES):
+        raise ValueError(f"暂不支持读取该类型的文件: {mime_type}")
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from f
+
+
+def iter_chunks(segments: Iterator[str], chunk_chars: int = 1200, overlap: int = 150) -> Iterator[str]:
+    """把文本段流式拼接成约 chunk_chars 个字符的块，相邻块之间保留 overlap 个字符的重叠。"""
+    buffer = ""
+    for segment in segments:
+        buffer += segment
+        while len(buffer) >= chunk_chars:
+            # 尽量在换行处断开，避免把一句话切成两半
+            cut = buffer.rfind("\n", chunk_chars // 2, chunk_chars)
+            cut = cut + 1 if cut > 0 else chunk_chars
+            chunk = buffer[:cut]
+            if chunk.strip():
+                yield chunk
+            buffer = buffer[max(cut - overlap, 0):] if cut > overlap else buffer[cut:]
+    if buffer.strip():
+        yield buffer
+
+
+class DocumentIndex:
+    """
+    以内容哈希为键的文档块索引（线程安全）。
+
+    Args:
+        path: SQLite索引文件路径。
+        chunk_chars: 每块的目标字符数。
+        chunk_overlap: 相邻块的重叠字符数。
+        embeddings: 是否为每块计算向量（仅在安装了 NumPy 时生效）。
+        embedding_weight: 融合打分时向量相似度的权重，其余为归一化后的 BM25 分数。
+        cache_docs: 内存中缓存的已加载文档数（LRU）。
+    """
+
+    def __init__(
+        self,
+        path: str = "temp_uploads/doc_index.sqlite",
+        chunk_chars: int = 1200,
+        chunk_overlap: int = 150,
+        embeddings: bool = True,
+        embedding_weight: float = 0.3,
+        cache_docs: int = 32,
+    ):
+        self.chunk_chars = max(200, chunk_chars)
+        self.chunk_overlap = max(0, min(chunk_overlap, self.chunk_chars // 2))
+        self.embeddings = embeddings and np is not None
+        self.embedding_weight = embedding_weight if self.embeddings else 0.0
+        self.cache_docs = cache_docs
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        # sha256 -> (每块词频列表, 每块长度列表, 向量矩阵或None)
+        self._cache: "OrderedDict[str, Tuple[List[Counter], List[int], Any]]" = OrderedDict()
+        self.stats = {"indexed_docs": 0, "indexed_chunks": 0, "index_seconds": 0.0, "queries": 0, "query_seconds": 0.0}
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (sha256 TEXT PRIMARY KEY, chunk_chars INTEGER, chunks INTEGER, indexed_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "sha256 TEXT, idx INTEGER, text TEXT, terms TEXT, embedding BLOB, PRIMARY KEY (sha256, idx))"
+        )
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "DocumentIndex":
+        settings = settings or {}
+        return cls(
+            path=settings.get("index_path", "temp_uploads/doc_index.sqlite"),
+            chunk_chars=settings.get("chunk_chars", 1200),
+            chunk_overlap=settings.get("chunk_overlap", 150),
+            embeddings=settings.get("embeddings", True),
+            embedding_weight=settings.get("embedding_weight", 0.3),
+            cache_docs=settings.get("cache_docs", 32),
+        )
+
+    # --- 建索引 ---
+
+    def _indexed_chunks(self, sha256: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT chunks, chunk_chars FROM docs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None or row[1] != self.chunk_chars:
+            return None
+        return row[0]
+
+    def ensure_indexed(self, meta: Dict[str, Any]) -> int:
+        """确保文件已切块建索引（惰性，首次调用时构建），返回块数。"""
+        sha256 = meta["sha256"]
+        count = self._indexed_chunks(sha256)
+        if count is not None:
+            return count
+        with self._lock:
+            build_lock = self._build_locks.setdefault(sha256, threading.Lock())
+        with build_lock:
+            # 等待期间其他线程可能已经建好
+            count = self._indexed_chunks(sha256)
+            if count is not None:
+                return count
+            start = time.perf_counter()
+            rows = []
+            chunks = iter_chunks(iter_document_text(meta["path"], meta["mime_type"]), self.chunk_chars, self.chunk_overlap)
+            for idx, text in enumerate(chunks):
+                terms = Counter(tokenize(text))
+                embedding = None
+                if self.embeddings:
+                    embedding = np.asarray(hashing_embedding(text), dtype=np.float32).tobytes()
+                rows.append((sha256, idx, text, json.dumps(terms, ensure_ascii=False), embedding))
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.execute("DELETE FROM chunks WHERE sha256 = ?", (sha256,))
+                self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)", (sha256, self.chunk_chars, len(rows), time.time())
+                )
+                self._conn.execute("COMMIT")
+                self._cache.pop(sha256, None)
+                self._build_locks.pop(sha256, None)
+                self.stats["indexed_docs"] += 1
+                self.stats["indexed_chunks"] += len(rows)
+                self.stats["index_seconds"] += time.perf_counter() - start
+            logger.debug("文档 %s 已切分为 %d 块", meta.get("name"), len(rows))
+            return len(rows)
+
+    def _load(self, sha256: str) -> Tuple[List[Counter], List[int], Any]:
+        """加载某个文档的词频与向量（不含正文），结果按LRU缓存在内存中。"""
+        with self._lock:
+            cached = self._cache.get(sha256)
+            if cached is not None:
+                self._cache.move_to_end(sha256)
+                return cached
+            rows = self._conn.execute(
+                "SELECT terms, embedding FROM chunks WHERE sha256 = ? ORDER BY idx", (sha256,)
+            ).fetchall()
+        term_counts = [Counter(json.loads(terms)) for terms, _ in rows]
+        lengths = [sum(c.values()) for c in term_counts]
+        vectors = None
+        if self.embeddings and rows and all(emb is not None for _, emb in rows):
+            vectors = np.vstack([np.frombuffer(emb, dtype=np.float32) for _, emb in rows])
+        entry = (term_counts, lengths, vectors)
+        with self._lock:
+            self._cache[sha256] = entry
+            while len(self._cache) > self.cache_docs:
+                self._cache.popitem(last=False)
+        return entry
+
+    # --- 检索与读取 ---
+
+    def search(self, query: str, docs: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
+        """在给定的文件中检索与 query 最相关的 top_k 个文本块。"""
+        start = time.perf_counter()
+        query_terms = tokenize(query)
+        candidates = []  # (文档元数据, 块序号, 词频, 长度, 向量)
+        for meta in docs:
+            self.ensure_indexed(meta)
+            term_counts, lengths, vectors = self._load(meta["sha256"])
+            for idx, (terms, length) in enumerate(zip(term_counts, lengths)):
+                candidates.append((meta, idx, terms, length, None if vectors is None else vectors[idx]))
+        if not candidates:
+            return []
+
+        # BM25：文档频率在本次检索的全部块上统计
+        n = len(candidates)
+        avg_len = sum(c[3] for c in candidates) / n or 1.0
+        df = Counter()
+        for _, _, terms, _, _ in candidates:
+            df.update(t for t in set(query_terms) if t in terms)
+        idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in set(query_terms)}
+        scores = []
+        for _, _, terms, length, _ in candidates:
+            score = 0.0
+            for t in query_terms:
+                tf = terms.get(t, 0)
+                if tf:
+                    score += idf[t] * tf * (_BM25_K1 + 1) / (tf + _BM25_K1 * (1 - _BM25_B + _BM25_B * length / avg_len))
+            scores.append(score)
+
+        if self.embedding_weight > 0 and all(c[4] is not None for c in candidates):
+            best = max(scores) or 1.0
+            query_vec = np.asarray(hashing_embedding(query), dtype=np.float32)
+            cosines = np.vstack([c[4] for c in candidates]) @ query_vec
+            w = self.embedding_weight
+            scores = [(1 - w) * s / best + w * float(cos) for s, cos in zip(scores, cosines)]
+
+        ranked = sorted(range(n), key=scores.__getitem__, reverse=True)[:top_k]
+        ranked = [i for i in ranked if scores[i] > 0]
+        texts = self._texts([(candidates[i][0]["sha256"], candidates[i][1]) for i in ranked])
+        results = [
+            {
+                "file": candidates[i][0]["name"],
+                "sha256": candidates[i][0]["sha256"],
+                "chunk": candidates[i][1],
+                "score": round(scores[i], 4),
+                "text": text,
+            }
+            for i, text in zip(ranked, texts)
+        ]
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["query_seconds"] += time.perf_counter() - start
+        return results
+
+    def _texts(self, keys: List[Tuple[str, int]]) -> List[str]:
+        with self._lock:
+            return [
+                (self._conn.execute("SELECT text FROM chunks WHERE sha256 = ? AND idx = ?", key).fetchone() or [""])[0]
+                for key in keys
+            ]
+
+    def read(self, meta: Dict[str, Any], start_chunk: int = 0, max_chunks: int = 3) -> Dict[str, Any]:
+        """按顺序读取文件中从 start_chunk 开始的若干块。"""
+        total = self.ensure_indexed(meta)
+        start_chunk = max(0, start_chunk)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, text FROM chunks WHERE sha256 = ? AND idx >= ? ORDER BY idx LIMIT ?",
+                (meta["sha256"], start_chunk, max(1, max_chunks)),
+            ).fetchall()
+        next_chunk = rows[-1][0] + 1 if rows else None
+        return {
+            "file": meta["name"],
+            "sha256": meta["sha256"],
+            "total_chunks": total,
+            "chunks": [{"chunk": idx, "text": text} for idx, text in rows],
+            "next_chunk": next_chunk if next_chunk is not None and next_chunk < total else None,
+        }
+
+    def prune(self, keep: Optional[set] = None) -> int:
+        """删除内容已被上传存储回收的索引；keep 为仍然存在的哈希集合，为 None 时按文件是否存在判断。"""
+        store = get_upload_store()
+        with self._lock:
+            hashes = [row[0] for row in self._conn.execute("SELECT sha256 FROM docs").fetchall()]
+        stale = [h for h in hashes if (h not in keep if keep is not None else not store.blob_path(h).exists())]
+        with self._lock:
+            for sha256 in stale:
+                self._conn.execute("DELETE FROM chunks WHERE sha256 = ?", (sha256,))
+                self._conn.execute("DELETE FROM docs WHERE sha256 = ?", (sha256,))
+                self._cache.pop(sha256, None)
+        return len(stale)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["docs"] = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+            stats["cached_docs"] = len(self._cache)
+        stats["embeddings"] = self.embeddings
+        return stats
+
+
+_settings = ConfigManager().get_runtime_config("documents")
+_index: Optional[DocumentIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_document_index() -> DocumentIndex:
+    """进程内共享的文档索引，首次使用时创建。"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DocumentIndex.from_settings(_settings)
+            _index.prune()
+        return _index
+
+
+# --- 文件解析 ---
+
+def _session_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+
+def _resolve(file: str, config: Optional[RunnableConfig]) -> Optional[Dict[str, Any]]:
+    """
+    按文件名、完整哈希或哈希前缀解析文件，只在当前会话（thread_id）引用的文件中查找：
+    内容按哈希跨会话去重存储，不能按哈希直接读取其他会话上传的内容。
+    """
+    session_id = _session_id(config)
+    return get_upload_store().resolve(session_id, file) if session_id else None
+
+
+# --- 工具定义 ---
+
+class DocumentSearchInput(BaseModel):
+    """定义文档检索工具的输入格式。"""
+    query: str = Field(description="要在上传文件中检索的问题或关键词。")
+    files: Optional[List[str]] = Field(
+        default=None,
+        description="限定检索的文件（文件名或内容哈希，见上传文件清单）；不填则检索当前会话的全部上传文件。",
+    )
+    top_k: int = Field(default=5, description="返回的相关文本块数量。")
+
+
+class DocumentReadInput(BaseModel):
+    """定义文档读取工具的输入格式。"""
+    file: str = Field(description="要读取的文件（文件名或内容哈希，见上传文件清单）。")
+    start_chunk: int = Field(default=0, description="从第几块开始读取（从0开始，可使用上次结果中的 next_chunk）。")
+    max_chunks: int = Field(default=3, description="本次最多读取的块数。")
+
+
+DOCUMENT_SEARCH_DESCRIPTION = """
+在用户上传的文件中检索与问题相关的内容，只返回最相关的若干文本块（含文件名、块序号与相关度）。
+回答与上传文件有关的问题时优先使用此工具，而不是要求读取整个文件。
+"""
+
+DOCUMENT_READ_DESCRIPTION = """
+按顺序分段读取用户上传的某个文件，每次返回若干文本块以及文件总块数；需要继续读取时把 start_chunk 设为结果中的 next_chunk。
+适合通读较短的文件，或在检索结果附近查看上下文。
+"""
+
+
+def search_uploaded_documents(
+    query: str,
+    files: Optional[List[str]] = None,
+    top_k: int = 5,
+    config: RunnableConfig = None,
+) -> Dict[str, Any]:
+    """检索上传文件，返回 top-k 个相关文本块。"""
+    store = get_upload_store()
+    missing = []
+    if files:
+        docs = []
+        for file in files:
+            meta = _resolve(file, config)
+            if meta is None:
+                missing.append(file)
+            else:
+                docs.append(meta)
+    else:
+        session_id = _session_id(config)
+        docs = store.list_files(session_id) if session_id else []
+    if not docs:
+        return {"error": "没有找到可检索的上传文件", "missing": missing}
+
+    unreadable = []
+    index = get_document_index()
+    readable = []
+    for meta in docs:
+        try:
+            index.ensure_indexed(meta)
+            readable.append(meta)
+        except (ValueError, OSError) as e:
+            unreadable.append({"file": meta["name"], "error": str(e)})
+    top_k = max(1, min(top_k, _settings.get("max_top_k", 20)))
+    result = {"query": query, "results": index.search(query, readable, top_k)}
+    if missing:
+        result["missing"] = missing
+    if unreadable:
+        result["unreadable"] = unreadable
+    return result
+
+
+def read_uploaded_document(
+    file: str,
+    start_chunk: int = 0,
+    max_chunks: int = 3,
+    config: RunnableConfig = None,
+) -> Dict[str, Any]:
+    """分段读取某个上传文件。"""
+    meta = _resolve(file, config)
+    if meta is None:
+        return {"error": f"没有找到上传文件: {file}"}
+    try:
+        return get_document_index().read(meta, start_chunk, min(max_chunks, _settings.get("max_read_chunks", 5)))
+    except (ValueError, OSError) as e:
+        return {"error": str(e), "file": meta["name"]}
+
+
+# 结果取决于会话当前的上传文件（新上传的文件、同名文件换了内容），相同参数不能重放记账中的旧结果（见 tool_ledger.py）
+document_search_tool = StructuredTool.from_function(
+    func=search_uploaded_documents,
+    name="search_uploaded_documents",
+    description=DOCUMENT_SEARCH_DESCRIPTION.strip(),
+    args_schema=DocumentSearchInput,
+    metadata={"memoize": False},
+)
+
+document_read_tool = StructuredTool.from_function(
+    func=read_uploaded_document,
+    name="read_uploaded_document",
+    description=DOCUMENT_READ_DESCRIPTION.strip(),
+    args_schema=DocumentReadInput,
+    metadata={"memoize": False},
+)
@@ -0,0 +1,73 @@
+"""
+离线搜索后端
+一个与 tavily_search 接口兼容的本地假搜索工具，返回确定性的结果并可模拟网络延迟。
+用于离线开发、缓存测试和性能基准测试（设置环境变量 SEARCH_BACKEND=fake 即可替换真实的Tavily）。
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+
+class FakeSearchInput(BaseModel):
+    """与 TavilySearch 的主要参数保持一致。"""
+    query: str = Field(description="搜索查询")
+    search_depth: Optional[str] = Field(default=None, description="basic 或 advanced")
+    topic: Optional[str] = Field(default=None, description="general、news 或 finance")
+
+
+class FakeSearchTool(BaseTool):
+    """
+    假搜索工具。
+
+    Attributes:
+        latency_seconds: 每次调用模拟的网络延迟。
+        results_per_query: 每次返回的结果条数。
+        content_chars: 每条结果正文的大致字符数。
+        calls: 实际执行的调用次数（用于验证缓存是否生效）。
+    """
+
+    name: str = "tavily_search"
+    description: str = (
+        "A search engine optimized for comprehensive, accurate, and trusted results. "
+        "Useful for when you need to answer questions about current events. Input should be a search query."
+    )
+    args_schema: type = FakeSearchInput
+    latency_seconds: float = 0.3
+    results_per_query: int = 5
+    content_chars: int = 600
+    calls: int = 0
+
+    def _build_response(self, query: str) -> Dict[str, Any]:
+        seed = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        results = []
+        for i in range(self.results_per_query):
+            results.append({
+                "url": f"https://example.com/{seed[:8]}/{i}",
+                "title": f"{query} - 结果 {i + 1}",
+                "content": (f"关于「{query}」的模拟内容 {seed[i:i + 6]}。" * (self.content_chars // 20 + 1))[: self.content_chars],
+                "score": round(1.0 - i * 0.1, 2),
+                "raw_content": None,
+            })
+        return {
+            "query": query,
+            "follow_up_questions": None,
+            "answer": None,
+            "images": [],
+            "results": results,
+            "response_time": self.latency_seconds,
+        }
+
+    def _run(self, query: str, search_depth: Optional[str] = None, topic: Optional[str] = None) -> Dict[str, Any]:
+        self.calls += 1
+        time.sleep(self.latency_seconds)
+        return self._build_response(query)
+
+    async def _arun(self, query: str, search_depth: Optional[str] = None, topic: Optional[str] = None) -> Dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(self.latency_seconds)
+        return self._build_response(query)
@@ -0,0 +1,293 @@
+"""
+搜索结果缓存
+为搜索类工具（如 tavily_search）提供缓存层，减少对外部搜索API的重复调用。
+
+缓存分为三层：
+  1. 精确缓存：对查询做归一化（大小写、全半角、空白、首尾标点）后与其余参数一起哈希，带TTL与LRU淘汰；
+  2. 近似缓存（可选）：提供 embed_fn 时，对未精确命中的查询做向量相似度检索，超过阈值即视为命中；
+  3. 磁盘存储（可选）：提供 path 时，缓存写入SQLite文件，进程重启后依然有效。
+     写入时每隔 purge_interval_seconds 清理一次过期条目，并把磁盘上的条目数限制在 max_disk_entries 以内（按写入时间淘汰）。
+"""
+
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.tools import BaseTool
+
+try:  # NumPy 为可选依赖，仅用于加速近似检索
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+_PUNCT_EDGES = re.compile(r"^[\s\W_]+|[\s\W_]+$", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询：NFKC（全角转半角）、小写、合并空白、去掉首尾标点。"""
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    text = _WHITESPACE.sub(" ", text)
+    return _PUNCT_EDGES.sub("", text)
+
+
+def hashing_embedding(text: str, dim: int = 256) -> List[float]:
+    """
+    不依赖模型的轻量向量化：字符二元组哈希到固定维度并归一化。
+    适合识别措辞略有差异的重复查询；需要语义级匹配时请传入真正的 embedding 函数。
+    """
+    # 去掉空白，使 "langgraph 是什么" 与 "langgraph是什么" 得到相同的二元组
+    text = _WHITESPACE.sub("", normalize_query(text))
+    vec = [0.0] * dim
+    for i in range(max(len(text) - 1, 1)):
+        gram = text[i:i + 2]
+        h = int(hashlib.md5(gram.encode("utf-8")).hexdigest()[:8], 16)
+        vec[h % dim] += 1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class SearchCache:
+    """
+    搜索结果缓存（线程安全）。
+
+    Args:
+        ttl_seconds: 缓存条目的有效期。
+        max_entries: 内存中最多保留的条目数，超出后按LRU淘汰。
+        path: SQLite文件路径；为 None 时只使用内存。
+        max_disk_entries: 磁盘上最多保留的条目数，超出后淘汰最早写入的条目。
+        purge_interval_seconds: 写入时顺带清理过期条目的最小间隔。
+        embed_fn: 可选的向量化函数，启用近似命中。
+        similarity_threshold: 近似命中的余弦相似度阈值。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 2048,
+        path: Optional[str] = None,
+        embed_fn: Optional[Callable[[str], Sequence[float]]] = None,
+        similarity_threshold: float = 0.92,
+        max_disk_entries: int = 20000,
+        purge_interval_seconds: float = 300.0,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.purge_interval_seconds = purge_interval_seconds
+        self._last_purge = 0.0
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        # key -> (created_at, value, extra_args_key, embedding)
+        self._entries: "OrderedDict[str, Tuple[float, Any, str, Optional[Sequence[float]]]]" = OrderedDict()
+        self.stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "backend_calls": 0,
+            "backend_seconds": 0.0,
+            "hit_seconds": 0.0,
+        }
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, query TEXT, args_key TEXT, value TEXT, created_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS search_cache_created_at ON search_cache (created_at)")
+
+    # --- 键 ---
+
+    @staticmethod
+    def _args_key(tool_name: str, args: Dict[str, Any]) -> str:
+        """除 query 外的其他参数（如 search_depth、topic）必须完全一致才能复用结果。"""
+        extra = {k: v for k, v in args.items() if k != "query" and v is not None}
+        return tool_name + "|" + json.dumps(extra, sort_keys=True, ensure_ascii=False, default=str)
+
+    def make_key(self, tool_name: str, args: Dict[str, Any]) -> str:
+        raw = self._args_key(tool_name, args) + "|" + normalize_query(str(args.get("query", "")))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- 读写 ---
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl_seconds
+
+    def _lookup_semantic(self, args_key: str, embedding: Sequence[float]) -> Optional[Any]:
+        candidates = [
+            (key, entry) for key, entry in self._entries.items()
+            if entry[2] == args_key and entry[3] is not None and not self._expired(entry[0])
+        ]
+        if not candidates:
+            return None
+        if np is not None:
+            matrix = np.asarray([entry[3] for _, entry in candidates], dtype=float)
+            query = np.asarray(embedding, dtype=float)
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+            scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+            best = int(scores.argmax())
+            best_score = float(scores[best])
+        else:
+            def cosine(a, b):
+                dot = sum(x * y for x, y in zip(a, b))
+                na = math.sqrt(sum(x * x for x in a)) or 1.0
+                nb = math.sqrt(sum(y * y for y in b)) or 1.0
+                return dot / (na * nb)
+            scored = [cosine(entry[3], embedding) for _, entry in candidates]
+            best = max(range(len(scored)), key=scored.__getitem__)
+            best_score = scored[best]
+        if best_score >= self.similarity_threshold:
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            return entry[1]
+        return None
+
+    def get(self, tool_name: str, args: Dict[str, Any]) -> Tuple[bool, Any]:
+        """查询缓存，返回 (是否命中, 结果)。"""
+        start = time.perf_counter()
+        key = self.make_key(tool_name, args)
+        args_key = self._args_key(tool_name, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                self.stats["hit_seconds"] += time.perf_counter() - start
+                return True, entry[1]
+
+        if self._conn is not None:
+            with self._lock:
+                row = self._conn.execute("SELECT value, created_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row and not self._expired(row[1]):
+                value = json.loads(row[0])
+                self._remember(key, args_key, value, str(args.get("query", "")), row[1])
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self.stats["hit_seconds"] += time.perf_counter() - start
+                return True, value
+
+        if self.embed_fn is not None:
+            embedding = self.embed_fn(str(args.get("query", "")))
+            with self._lock:
+                value = self._lookup_semantic(args_key, embedding)
+                if value is not None:
+                    self.stats["semantic_hits"] += 1
+                    self.stats["hit_seconds"] += time.perf_counter() - start
+                    return True, value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return False, None
+
+    def _remember(self, key: str, args_key: str, value: Any, query: str, created_at: float):
+        embedding = self.embed_fn(query) if self.embed_fn is not None else None
+        with self._lock:
+            self._entries[key] = (created_at, value, args_key, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, tool_name: str, args: Dict[str, Any], value: Any):
+        key = self.make_key(tool_name, args)
+        now = time.time()
+        self._remember(key, self._args_key(tool_name, args), value, str(args.get("query", "")), now)
+        if self._conn is not None:
+            try:
+                payload = json.dumps(value, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                return
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, normalize_query(str(args.get("query", ""))), self._args_key(tool_name, args), payload, now),
+                )
+        # 与 BoundedMemorySaver 的TTL扫描一样按间隔顺带执行，避免每次写入都扫描
+        if now - self._last_purge >= self.purge_interval_seconds:
+            self._last_purge = now
+            self.purge_expired()
+
+    def record_backend_call(self, seconds: float):
+        with self._lock:
+            self.stats["backend_calls"] += 1
+            self.stats["backend_seconds"] += seconds
+
+    def purge_expired(self) -> int:
+        """清理过期条目（内存与磁盘），并把磁盘上的条目数限制在 max_disk_entries 以内，返回清理的内存条目数。"""
+        with self._lock:
+            expired = [k for k, entry in self._entries.items() if self._expired(entry[0])]
+            for key in expired:
+                del self._entries[key]
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM search_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()
+                if count > self.max_disk_entries:
+                    self._conn.execute(
+                        "DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache ORDER BY created_at LIMIT ?)",
+                        (count - self.max_disk_entries,),
+                    )
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["semantic_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["avg_backend_latency"] = stats["backend_seconds"] / stats["backend_calls"] if stats["backend_calls"] else 0.0
+        stats["avg_hit_latency"] = stats["hit_seconds"] / hits if hits else 0.0
+        return stats
+
+
+class CachedSearchTool(BaseTool):
+    """
+    包装任意搜索工具的缓存代理。
+    名称、描述和参数格式与被包装的工具完全一致，因此对模型透明。
+    """
+
+    inner: BaseTool
+    cache: Any
+
+    def __init__(self, inner: BaseTool, cache: SearchCache, **kwargs):
+        super().__init__(
+            name=inner.name,
+            description=inner.description,
+            args_schema=inner.args_schema,
+            inner=inner,
+            cache=cache,
+            **kwargs,
+        )
+
+    def _run(self, **kwargs) -> Any:
+        hit, value = self.cache.get(self.name, kwargs)
+        if hit:
+            return value
+        start = time.perf_counter()
+        value = self.inner.invoke(kwargs)
+        self.cache.record_backend_call(time.perf_counter() - start)
+        if not (isinstance(value, dict) and value.get("error")):
+            self.cache.put(self.name, kwargs, value)
+        return value
+
+    async def _arun(self, **kwargs) -> Any:
+        hit, value = self.cache.get(self.name, kwargs)
+        if hit:
+            return value
+        start = time.perf_counter()
+        value = await self.inner.ainvoke(kwargs)
+        self.cache.record_backend_call(time.perf_counter() - start)
+        if not (isinstance(value, dict) and value.get("error")):
+            self.cache.put(self.name, kwargs, value)
+        return value
@@ -1,6 +1,21 @@
-from langchain_core.tools import tool
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
+from configs import ConfigManager
 from models import get_subagent_model
+from quota import get_quota_manager, merge_usage, tenant_of, usage_of
+
+logger = logging.getLogger(__name__)
 
 # --- Sub-Agent Executor Tool ---
 # "Sub-Agent" (子Agent) 是一种强大的模式，它允许一个主Agent将一个复杂的、
@@ -15,30 +30,320 @@ from models import get_subagent_model
 # 这个文件提供了一个Sub-Agent工具的框架和占位符。
 # 您需要用自己实现的真实Agent或Chain来替换下面的示例逻辑。
 
+SUB_AGENT_PROMPT = "你是一个专家，请完成以下任务: {task}"
+
+
 class SubAgentInput(BaseModel):
     """定义Sub-Agent工具的输入格式。"""
     sub_task_description: str = Field(description="需要子Agent完成的具体任务描述。")
 
 
-@tool("sub_agent_executor", args_schema=SubAgentInput)
-def sub_agent_executor_tool(sub_task_description: str) -> str:
+class SubAgentBatchInput(BaseModel):
+    """定义Sub-Agent批量工具的输入格式。"""
+    sub_task_descriptions: List[str] = Field(description="多个相互独立、可以并行处理的子任务描述。")
+
+
+SUB_AGENT_DESCRIPTION = """
+调用一个专门的子Agent来处理一个复杂的、独立的子任务。
+当主Agent遇到一个需要深度专业知识或多步推理才能解决的问题时，可以使用此工具。
+例如，可以用它来执行代码、分析复杂文档、或进行多轮的专业领域对话。
+"""
+
+SUB_AGENT_BATCH_DESCRIPTION = """
+一次性把多个相互独立的子任务交给子Agent并行处理，返回每个子任务的结果。
+当需要对多个对象分别做同样的分析（例如分别总结多篇资料）时，使用此工具比多次调用 sub_agent_executor 更快。
+"""
+
+
+class SubAgentExecutor:
     """
-    调用一个专门的子Agent来处理一个复杂的、独立的子任务。
-    当主Agent遇到一个需要深度专业知识或多步推理才能解决的问题时，可以使用此工具。
-    例如，可以用它来执行代码、分析复杂文档、或进行多轮的专业领域对话。
+    Sub-Agent子系统。
+
+    - 按调用方工作流的模型配置（见 ToolExecutor 的 tool_configurable）选择子Agent模型，
+      每个模型配置长期复用同一个Chain（提示词模板 + 模型客户端），不再在每次调用时重新构建；
+    - 以 (模型, 提示词模板, 任务描述) 的哈希为键缓存子任务结果（内容寻址），相同子任务直接复用；
+    - batch/abatch 接口并发执行多个子任务，并受 max_concurrency 限制；
+    - 可选地把子Agent的输出以 custom 流事件实时推送给父计算图（stream_mode="custom"）；
+    - 模型调用与主Agent一样按租户与模型上游限流（见 quota.py），run/arun/batch/abatch 同时返回本次调用的用量，
+      由工具以 artifact 返回、ToolExecutor 计入会话预算（缓存命中不产生用量）。
     """
-    print(f"--- Sub-Agent Tool ---")
-    print(f"接收到子任务: {sub_task_description}")
-
-    # 1. 定义你的Sub-Agent (这里用一个简单的LLM Chain作为例子)
-    from langchain_openai import ChatOpenAI
-    from langchain_core.prompts import ChatPromptTemplate
-    #
-    prompt = ChatPromptTemplate.from_template("你是一个专家，请完成以下任务: {task}")
-    llm = get_subagent_model()
-    sub_agent_chain = prompt | llm
-    response = sub_agent_chain.invoke({"task": sub_task_description})
-    result = f"子任务 '{sub_task_description}' 已由Sub-Agent处理完成。处理结果：[{response.content}]"
-    
-    print(f"Sub-Agent返回结果: {result}")
-    return result
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.cache_ttl_seconds = settings.get("cache_ttl_seconds", 3600)
+        self.cache_max_entries = settings.get("cache_max_entries", 512)
+        self.max_concurrency = settings.get("max_concurrency", 4)
+        self.stream = settings.get("stream", True)
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"calls": 0, "cache_hits": 0, "llm_calls": 0, "llm_seconds": 0.0}
+
+    # --- Chain 与缓存 ---
+
+    def model(self, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+        """
+        返回调用方工作流对应的子Agent模型 {chain, model_name, model_key, pricing}，按模型配置懒加载并复用。
+        工作流的模型配置由 ToolExecutor 放在 config["configurable"]["model_config"] 中，
+        不在计算图中调用时使用 ConfigManager 的当前模型。
+        """
+        model_config = ((config or {}).get("configurable") or {}).get("model_config") or ConfigManager().get_current_config()
+        digest = hashlib.sha256(json.dumps(model_config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        with self._lock:
+            model = self._models.get(digest)
+            if model is None:
+                # 1. 定义你的Sub-Agent (这里用一个简单的LLM Chain作为例子)
+                from langchain_core.prompts import ChatPromptTemplate
+                llm = get_subagent_model(model_config)
+                model = self._models[digest] = {
+                    "chain": ChatPromptTemplate.from_template(SUB_AGENT_PROMPT) | llm,
+                    "model_name": getattr(llm, "model_name", None),
+                    # 与主Agent使用相同的限流键与单价（见 graph.AgentWorkflow）
+                    "model_key": model_config.get("model_name") or model_config.get("model") or "default",
+                    "pricing": model_config.get("pricing") or {},
+                }
+            return model
+
+    @staticmethod
+    def cache_key(task: str, model: Dict[str, Any]) -> str:
+        raw = f"{model['model_key']}\x00{model['model_name']}\x00{SUB_AGENT_PROMPT}\x00{task.strip()}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            created_at, content = entry
+            if time.time() - created_at > self.cache_ttl_seconds:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return content
+
+    def _cache_put(self, key: str, content: str):
+        with self._lock:
+            self._cache[key] = (time.time(), content)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    # --- 流式推送 ---
+
+    @staticmethod
+    def _stream_writer():
+        """在计算图内运行时返回 custom 流写入器，否则返回 None。"""
+        try:
+            from langgraph.config import get_stream_writer
+            return get_stream_writer()
+        except Exception:
+            return None
+
+    # --- 执行 ---
+
+    def _record(self, seconds: float, count: int = 1):
+        with self._lock:
+            self.stats["llm_calls"] += count
+            self.stats["llm_seconds"] += seconds
+
+    @staticmethod
+    def _usage(tenant: str, model: Dict[str, Any], responses: List[AIMessage]) -> Dict[str, float]:
+        """按实际用量扣除租户与模型上游的 token 额度，返回合并后的用量。"""
+        usage: Dict[str, float] = {}
+        for response in responses:
+            usage = merge_usage(usage, usage_of(response, model["pricing"]))
+        get_quota_manager().record_llm(tenant, model["model_key"], usage.get("total_tokens", 0))
+        return usage
+
+    def run(self, task: str, config: Optional[RunnableConfig] = None) -> Tuple[str, Dict[str, float]]:
+        """同步执行单个子任务，返回 (子Agent的输出文本, 本次调用的用量)。"""
+        with self._lock:
+            self.stats["calls"] += 1
+        model = self.model(config)
+        key = self.cache_key(task, model)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached, {}
+
+        tenant = tenant_of(config)
+        get_quota_manager().acquire_llm(tenant, model["model_key"])
+        start = time.perf_counter()
+        writer = self._stream_writer() if self.stream else None
+        if writer is not None:
+            stream_id = str(uuid.uuid4())
+            response = None
+            for chunk in model["chain"].stream({"task": task}):
+                response = chunk if response is None else response + chunk
+                if chunk.content:
+                    writer({"type": "sub_agent_delta", "stream_id": stream_id, "task": task, "delta": chunk.content})
+        else:
+            response = model["chain"].invoke({"task": task})
+        self._record(time.perf_counter() - start)
+        content = response.content if response is not None else ""
+        self._cache_put(key, content)
+        return content, self._usage(tenant, model, [response] if response is not None else [])
+
+    async def arun(self, task: str, config: Optional[RunnableConfig] = None) -> Tuple[str, Dict[str, float]]:
+        """异步执行单个子任务。"""
+        with self._lock:
+            self.stats["calls"] += 1
+        model = self.model(config)
+        key = self.cache_key(task, model)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached, {}
+
+        tenant = tenant_of(config)
+        await get_quota_manager().aacquire_llm(tenant, model["model_key"])
+        start = time.perf_counter()
+        writer = self._stream_writer() if self.stream else None
+        if writer is not None:
+            stream_id = str(uuid.uuid4())
+            response = None
+            async for chunk in model["chain"].astream({"task": task}):
+                response = chunk if response is None else response + chunk
+                if chunk.content:
+                    writer({"type": "sub_agent_delta", "stream_id": stream_id, "task": task, "delta": chunk.content})
+        else:
+            response = await model["chain"].ainvoke({"task": task})
+        self._record(time.perf_counter() - start)
+        content = response.content if response is not None else ""
+        self._cache_put(key, content)
+        return content, self._usage(tenant, model, [response] if response is not None else [])
+
+    def _split_cached(self, tasks: List[str], model: Dict[str, Any]):
+        """把批量任务分为已缓存的结果和需要执行的（去重后的）任务。"""
+        with self._lock:
+            self.stats["calls"] += len(tasks)
+        keys = [self.cache_key(t, model) for t in tasks]
+        results: Dict[str, str] = {}
+        pending: Dict[str, str] = {}
+        for task, key in zip(tasks, keys):
+            if key in results or key in pending:
+                continue
+            cached = self._cache_get(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = task
+        return keys, results, pending
+
+    def _collect(self, tenant: str, model: Dict[str, Any], pending: Dict[str, str], outputs: List[Any],
+                 results: Dict[str, str]) -> Dict[str, float]:
+        """把批量执行的输出写入结果与缓存，返回成功调用的合并用量。"""
+        responses = []
+        for key, output in zip(pending, outputs):
+            if isinstance(output, Exception):
+                results[key] = f"子任务执行失败: {output!r}"
+            else:
+                results[key] = output.content
+                self._cache_put(key, output.content)
+                responses.append(output)
+        return self._usage(tenant, model, responses)
+
+    def batch(self, tasks: List[str], max_concurrency: Optional[int] = None,
+              config: Optional[RunnableConfig] = None) -> Tuple[List[str], Dict[str, float]]:
+        """并发执行多个子任务（线程池），返回 (与输入顺序一致的结果列表, 本次调用的合并用量)。"""
+        model = self.model(config)
+        keys, results, pending = self._split_cached(tasks, model)
+        usage: Dict[str, float] = {}
+        if pending:
+            tenant = tenant_of(config)
+            get_quota_manager().acquire_llm(tenant, model["model_key"])
+            start = time.perf_counter()
+            outputs = model["chain"].batch(
+                [{"task": t} for t in pending.values()],
+                config={"max_concurrency": max_concurrency or self.max_concurrency},
+                return_exceptions=True,
+            )
+            self._record(time.perf_counter() - start, len(pending))
+            usage = self._collect(tenant, model, pending, outputs, results)
+        return [results[k] for k in keys], usage
+
+    async def abatch(self, tasks: List[str], max_concurrency: Optional[int] = None,
+                     config: Optional[RunnableConfig] = None) -> Tuple[List[str], Dict[str, float]]:
+        """batch 的异步版本，基于 Chain.abatch 在事件循环中并发执行。"""
+        model = self.model(config)
+        keys, results, pending = self._split_cached(tasks, model)
+        usage: Dict[str, float] = {}
+        if pending:
+            tenant = tenant_of(config)
+            await get_quota_manager().aacquire_llm(tenant, model["model_key"])
+            start = time.perf_counter()
+            outputs = await model["chain"].abatch(
+                [{"task": t} for t in pending.values()],
+                config={"max_concurrency": max_concurrency or self.max_concurrency},
+                return_exceptions=True,
+            )
+            self._record(time.perf_counter() - start, len(pending))
+            usage = self._collect(tenant, model, pending, outputs, results)
+        return [results[k] for k in keys], usage
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "cache_entries": len(self._cache)}
+
+
+sub_agent_executor = SubAgentExecutor(ConfigManager().get_runtime_config("sub_agent"))
+
+
+def _format_result(sub_task_description: str, content: str) -> str:
+    # 任务描述已在工具调用参数中，结果里不再重复，避免每次LLM调用都多发送一遍
+    logger.debug("Sub-Agent返回结果（子任务: %s）: %s", sub_task_description, content)
+    return content
+
+
+def _format_batch(tasks: List[str], contents: List[str]) -> str:
+    # 按调用参数中的顺序编号，不重复任务描述
+    return "\n\n".join(f"### 子任务 {i + 1}\n{content}" for i, content in enumerate(contents))
+
+
+# 工具以 content_and_artifact 返回：内容交给模型，artifact 中的用量由 ToolExecutor 计入会话预算
+
+def run_sub_agent(sub_task_description: str, config: RunnableConfig = None):
+    """同步执行子任务。"""
+    logger.debug("Sub-Agent接收到子任务: %s", sub_task_description)
+    content, usage = sub_agent_executor.run(sub_task_description, config)
+    return _format_result(sub_task_description, content), {"usage": usage}
+
+
+async def arun_sub_agent(sub_task_description: str, config: RunnableConfig = None):
+    """异步执行子任务，在异步计算图中不会阻塞事件循环，可与其他工具调用并发。"""
+    logger.debug("Sub-Agent(async)接收到子任务: %s", sub_task_description)
+    content, usage = await sub_agent_executor.arun(sub_task_description, config)
+    return _format_result(sub_task_description, content), {"usage": usage}
+
+
+def run_sub_agent_batch(sub_task_descriptions: List[str], config: RunnableConfig = None):
+    """同步并发执行一批子任务。"""
+    logger.debug("Sub-Agent批量任务数: %d", len(sub_task_descriptions))
+    contents, usage = sub_agent_executor.batch(sub_task_descriptions, config=config)
+    return _format_batch(sub_task_descriptions, contents), {"usage": usage}
+
+
+async def arun_sub_agent_batch(sub_task_descriptions: List[str], config: RunnableConfig = None):
+    """异步并发执行一批子任务。"""
+    logger.debug("Sub-Agent(async)批量任务数: %d", len(sub_task_descriptions))
+    contents, usage = await sub_agent_executor.abatch(sub_task_descriptions, config=config)
+    return _format_batch(sub_task_descriptions, contents), {"usage": usage}
+
+
+# 同时提供同步与异步实现：invoke 走 func，ainvoke 走 coroutine
+sub_agent_executor_tool = StructuredTool.from_function(
+    func=run_sub_agent,
+    coroutine=arun_sub_agent,
+    name="sub_agent_executor",
+    description=SUB_AGENT_DESCRIPTION.strip(),
+    args_schema=SubAgentInput,
+    response_format="content_and_artifact",
+)
+
+sub_agent_batch_tool = StructuredTool.from_function(
+    func=run_sub_agent_batch,
+    coroutine=arun_sub_agent_batch,
+    name="sub_agent_batch_executor",
+    description=SUB_AGENT_BATCH_DESCRIPTION.strip(),
+    args_schema=SubAgentBatchInput,
+    response_format="content_and_artifact",
+)
@@ -1,10 +1,75 @@
+"""
+网页搜索工具
+底层搜索后端（默认 Tavily，SEARCH_BACKEND=fake 时为离线假后端）与搜索缓存都在第一次获取时才创建：
+导入本模块不会导入 langchain_tavily，也不会校验 TAVILY_API_KEY。
+"""
+
 import os
-from langchain_tavily import TavilySearch  
-from dotenv import load_dotenv
-load_dotenv()
+import threading
+
+from configs import ConfigManager
+from tools.search_cache import CachedSearchTool, SearchCache, hashing_embedding
+
+
+def _create_search_backend(backend: str):
+    """根据 SEARCH_BACKEND 创建底层搜索工具："tavily"（默认）或离线的 "fake"。"""
+    if backend == "fake":
+        from tools.fake_search import FakeSearchTool
+        return FakeSearchTool()
+    from langchain_tavily import TavilySearch
+    return TavilySearch(tavily_api_key=os.getenv("TAVILY_API_KEY"))
+
+
+def _create_search_cache(settings: dict) -> SearchCache:
+    return SearchCache(
+        ttl_seconds=settings.get("ttl_seconds", 3600),
+        max_entries=settings.get("max_entries", 2048),
+        path=settings.get("path"),
+        embed_fn=hashing_embedding if settings.get("semantic") else None,
+        similarity_threshold=settings.get("similarity_threshold", 0.92),
+        max_disk_entries=settings.get("max_disk_entries", 20000),
+        purge_interval_seconds=settings.get("purge_interval_seconds", 300.0),
+    )
+
+
+_lock = threading.Lock()
+_search_backend = None
+_search_cache = None
+_search_cache_loaded = False
+_search_tool = None
+
+
+def get_search_backend():
+    """底层搜索工具（进程内单例）。"""
+    global _search_backend
+    with _lock:
+        if _search_backend is None:
+            _search_backend = _create_search_backend(os.getenv("SEARCH_BACKEND", "tavily").lower())
+        return _search_backend
+
+
+def get_search_cache():
+    """搜索缓存（进程内单例）；配置中关闭缓存时返回 None。"""
+    global _search_cache, _search_cache_loaded
+    with _lock:
+        if not _search_cache_loaded:
+            settings = ConfigManager().get_runtime_config("search_cache")
+            _search_cache = _create_search_cache(settings) if settings.get("enabled", True) else None
+            _search_cache_loaded = True
+        return _search_cache
+
+
+def get_search_tool():
+    """对外暴露的搜索工具：名称与参数和 TavilySearch 完全一致，命中缓存时不访问搜索API。"""
+    global _search_tool
+    if _search_tool is None:
+        backend, cache = get_search_backend(), get_search_cache()
+        tool = CachedSearchTool(backend, cache) if cache else backend
+        with _lock:
+            if _search_tool is None:
+                _search_tool = tool
+    return _search_tool
 
-tavily_api_key = os.getenv("TAVILY_API_KEY")
-tavily_tool = TavilySearch(tavily_api_key=tavily_api_key)  
 
 # --- 使用示例 ---
 if __name__ == '__main__':
@@ -14,7 +79,7 @@ if __name__ == '__main__':
     
     try:
         # .invoke() 方法用于执行工具
-        results = tavily_tool.invoke({"query": query})
+        results = get_search_tool().invoke({"query": query})
         
         print("\n搜索结果:")
         print(results)
@@ -0,0 +1,341 @@
+"""
+上传文件存储模块
+以内容寻址的方式保存用户上传的文件，替代原先整块写入 temp_uploads/<session_id>/ 的做法：
+  - 流式写入：按 chunk_size 分块从上传对象读取，边写临时文件边计算 SHA-256，不在内存中拼接整个文件；
+  - 跨会话去重：文件内容保存在 <root>/blobs/<sha256前两位>/<sha256>，内容相同的上传只保留一份，
+    每个会话只记录一条 (会话, 文件名) -> 哈希 的引用；
+  - 配额：限制单文件大小、单会话总量与整个存储的总量，超出时抛出 UploadQuotaError；
+  - TTL 回收：超过 ttl_seconds 未被访问的引用会被清除，没有引用的内容随后删除（gc）。
+
+元数据（引用与内容索引）保存在 <root>/index.sqlite 中，进程重启后依然有效。
+交给 Agent 的是每个文件的元数据（名称、路径、大小、类型、哈希），工具按需读取文件内容。
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Set, Tuple
+
+from configs import ConfigManager
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+# 无法从扩展名判断类型时，按文件头识别的常见格式
+_MAGIC_TYPES = (
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"PK\x03\x04", "application/zip"),
+)
+
+
+class UploadQuotaError(Exception):
+    """上传超出单文件、会话或存储总量的配额。"""
+
+
+def _sniff_mime_type(name: str, head: bytes) -> str:
+    """先按扩展名判断类型，再按文件头识别，最后区分文本与二进制。"""
+    mime_type, _ = mimetypes.guess_type(name)
+    if mime_type:
+        return mime_type
+    for magic, magic_type in _MAGIC_TYPES:
+        if head.startswith(magic):
+            return magic_type
+    if b"\x00" in head:
+        return "application/octet-stream"
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # 分块边界可能截断多字节字符，只要错误出现在末尾几个字节就仍视为文本
+        if e.start < len(head) - 3:
+            return "application/octet-stream"
+    return "text/plain"
+
+
+class UploadStore:
+    """
+    内容寻址的上传文件存储（线程安全）。
+
+    Args:
+        root: 存储根目录。
+        chunk_size: 流式读取上传内容的块大小（字节）。
+        max_file_bytes: 单个文件的大小上限。
+        session_quota_bytes: 单个会话引用的文件总大小上限（同一内容在会话内只计一次）。
+        total_quota_bytes: 所有内容（去重后）的总大小上限。
+        ttl_seconds: 引用多久未被访问后可被回收。
+        gc_interval_seconds: 写入时顺带执行 gc 的最小间隔。
+    """
+
+    def __init__(
+        self,
+        root: str = "temp_uploads",
+        chunk_size: int = _MB,
+        max_file_bytes: int = 50 * _MB,
+        session_quota_bytes: int = 200 * _MB,
+        total_quota_bytes: int = 2048 * _MB,
+        ttl_seconds: float = 7 * 24 * 3600,
+        gc_interval_seconds: float = 600.0,
+    ):
+        self.root = Path(root)
+        self.chunk_size = max(4096, int(chunk_size))
+        self.max_file_bytes = max_file_bytes
+        self.session_quota_bytes = session_quota_bytes
+        self.total_quota_bytes = total_quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.gc_interval_seconds = gc_interval_seconds
+        self._blob_dir = self.root / "blobs"
+        self._tmp_dir = self.root / "tmp"
+        self._blob_dir.mkdir(parents=True, exist_ok=True)
+        self._tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._last_gc = 0.0
+        self.stats = {"uploads": 0, "dedup_hits": 0, "bytes_written": 0, "bytes_deduplicated": 0, "rejected": 0, "gc_blobs": 0}
+
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "sha256 TEXT PRIMARY KEY, size INTEGER, mime_type TEXT, created_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs ("
+            "session_id TEXT, name TEXT, sha256 TEXT, uploaded_at REAL, last_access REAL, "
+            "PRIMARY KEY (session_id, name))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS refs_sha256 ON refs (sha256)")
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "UploadStore":
+        """根据 ConfigManager.runtime_configs["upload_store"] 创建存储。"""
+        settings = settings or {}
+        return cls(
+            root=settings.get("root", "temp_uploads"),
+            chunk_size=int(settings.get("chunk_size_kb", 1024) * 1024),
+            max_file_bytes=int(settings.get("max_file_mb", 50) * _MB),
+            session_quota_bytes=int(settings.get("session_quota_mb", 200) * _MB),
+            total_quota_bytes=int(settings.get("total_quota_mb", 2048) * _MB),
+            ttl_seconds=settings.get("ttl_seconds", 7 * 24 * 3600),
+            gc_interval_seconds=settings.get("gc_interval_seconds", 600.0),
+        )
+
+    # --- 路径与元数据 ---
+
+    def blob_path(self, sha256: str) -> Path:
+        return self._blob_dir / sha256[:2] / sha256
+
+    def _metadata(self, name: str, sha256: str, size: int, mime_type: str, uploaded_at: float) -> Dict[str, Any]:
+        return {
+            "name": name,
+            "path": str(self.blob_path(sha256)),
+            "size": size,
+            "mime_type": mime_type,
+            "sha256": sha256,
+            "uploaded_at": round(uploaded_at, 3),
+        }
+
+    def _session_usage(self, session_id: str, exclude_name: Optional[str] = None) -> int:
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs WHERE sha256 IN "
+            "(SELECT sha256 FROM refs WHERE session_id = ? AND name != ?)",
+            (session_id, exclude_name or ""),
+        ).fetchone()
+        return int(row[0])
+
+    def _total_usage(self) -> int:
+        return int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0])
+
+    # --- 写入 ---
+
+    def put(self, session_id: str, name: str, stream: BinaryIO) -> Dict[str, Any]:
+        """
+        把上传内容流式写入存储，并登记为该会话下名为 name 的文件（同名文件会被替换）。
+
+        Args:
+            session_id: 会话ID。
+            name: 原始文件名（只保留最后一级，防止路径穿越）。
+            stream: 支持 read(n) 的二进制文件对象。
+
+        Returns:
+            文件元数据：name、path、size、mime_type、sha256、uploaded_at。
+        """
+        name = Path(name).name or "unnamed"
+        if hasattr(stream, "seek"):
+            stream.seek(0)
+
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        fd, tmp_name = tempfile.mkstemp(dir=self._tmp_dir, prefix="upload-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        with self._lock:
+                            self.stats["rejected"] += 1
+                        raise UploadQuotaError(
+                            f"文件 {name} 超过单文件上限 {self.max_file_bytes / _MB:.1f} MB"
+                        )
+                    if len(head) < 8192:
+                        head += chunk[:8192 - len(head)]
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            sha256 = digest.hexdigest()
+            mime_type = _sniff_mime_type(name, head)
+
+            with self._lock:
+                now = time.time()
+                exists = self._conn.execute("SELECT size FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+                already_in_session = self._conn.execute(
+                    "SELECT 1 FROM refs WHERE session_id = ? AND sha256 = ? AND name != ?", (session_id, sha256, name)
+                ).fetchone()
+                if not already_in_session and self._session_usage(session_id, exclude_name=name) + size > self.session_quota_bytes:
+                    self.stats["rejected"] += 1
+                    raise UploadQuotaError(f"会话上传总量超过上限 {self.session_quota_bytes / _MB:.1f} MB")
+                if not exists and self._total_usage() + size > self.total_quota_bytes:
+                    self._gc_locked(now)
+                    if self._total_usage() + size > self.total_quota_bytes:
+                        self.stats["rejected"] += 1
+                        raise UploadQuotaError(f"上传存储总量超过上限 {self.total_quota_bytes / _MB:.1f} MB")
+
+                target = self.blob_path(sha256)
+                if exists and target.exists():
+                    self.stats["dedup_hits"] += 1
+                    self.stats["bytes_deduplicated"] += size
+                else:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp_name, target)
+                    self.stats["bytes_written"] += size
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)", (sha256, size, mime_type, now)
+                    )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?, ?)", (session_id, name, sha256, now, now)
+                )
+                self.stats["uploads"] += 1
+                if now - self._last_gc > self.gc_interval_seconds:
+                    self._gc_locked(now)
+            return self._metadata(name, sha256, size, mime_type, now)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+    def put_new(self, session_id: str, uploaded_files: Iterable[Any], ingested: Set[str]) -> Tuple[int, List[str]]:
+        """
+        写入尚未处理过的上传（按 file_id 判断，Streamlit 每次 rerun 都会重新给出全部已选文件）。
+        只有写入成功的 file_id 才记入 ingested；超出配额的上传不记录，下次调用时重试（例如删除其他文件之后）。
+
+        Returns:
+            (成功写入的数量, 失败原因列表)
+        """
+        stored, errors = 0, []
+        for uploaded_file in uploaded_files:
+            if uploaded_file.file_id in ingested:
+                continue
+            try:
+                self.put(session_id, uploaded_file.name, uploaded_file)
+            except UploadQuotaError as e:
+                errors.append(str(e))
+                continue
+            ingested.add(uploaded_file.file_id)
+            stored += 1
+        return stored, errors
+
+    # --- 查询 ---
+
+    def list_files(self, session_id: str, touch: bool = True) -> List[Dict[str, Any]]:
+        """列出会话下的全部文件元数据（按上传时间排序），默认同时刷新访问时间。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.name, r.sha256, b.size, b.mime_type, r.uploaded_at FROM refs r "
+                "JOIN blobs b ON b.sha256 = r.sha256 WHERE r.session_id = ? ORDER BY r.uploaded_at",
+                (session_id,),
+            ).fetchall()
+            if touch and rows:
+                self._conn.execute("UPDATE refs SET last_access = ? WHERE session_id = ?", (time.time(), session_id))
+        return [self._metadata(*row) for row in rows]
+
+    def resolve(self, session_id: str, key: str) -> Optional[Dict[str, Any]]:
+        """按文件名、完整哈希或哈希前缀（至少8位）查找会话中的文件。"""
+        key = (key or "").strip()
+        for meta in self.list_files(session_id, touch=False):
+            if key in (meta["name"], meta["sha256"], meta["path"]):
+                return meta
+            if len(key) >= 8 and meta["sha256"].startswith(key):
+                return meta
+        return None
+
+    # --- 删除与回收 ---
+
+    def remove(self, session_id: str, name: Optional[str] = None) -> int:
+        """删除会话中的一个文件引用（name 为 None 时删除全部），内容在 gc 时回收。"""
+        with self._lock:
+            if name is None:
+                cursor = self._conn.execute("DELETE FROM refs WHERE session_id = ?", (session_id,))
+            else:
+                cursor = self._conn.execute("DELETE FROM refs WHERE session_id = ? AND name = ?", (session_id, name))
+            return cursor.rowcount
+
+    def _gc_locked(self, now: float) -> int:
+        self._last_gc = now
+        self._conn.execute("DELETE FROM refs WHERE last_access < ?", (now - self.ttl_seconds,))
+        orphans = [
+            row[0] for row in self._conn.execute(
+                "SELECT sha256 FROM blobs WHERE sha256 NOT IN (SELECT DISTINCT sha256 FROM refs)"
+            ).fetchall()
+        ]
+        for sha256 in orphans:
+            try:
+                self.blob_path(sha256).unlink()
+            except FileNotFoundError:
+                pass
+            self._conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        # 清理异常退出遗留的临时文件
+        for leftover in self._tmp_dir.glob("upload-*"):
+            try:
+                if now - leftover.stat().st_mtime > 3600:
+                    leftover.unlink()
+            except OSError:
+                pass
+        self.stats["gc_blobs"] += len(orphans)
+        if orphans:
+            logger.debug("上传存储回收了 %d 个文件", len(orphans))
+        return len(orphans)
+
+    def gc(self) -> int:
+        """清除过期引用并删除无人引用的内容，返回删除的内容数。"""
+        with self._lock:
+            return self._gc_locked(time.time())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["blobs"] = self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+            stats["refs"] = self._conn.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+            stats["total_bytes"] = self._total_usage()
+        return stats
+
+
+_store: Optional[UploadStore] = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store() -> UploadStore:
+    """进程内共享的上传存储，首次使用时按运行时配置创建。"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UploadStore.from_settings(ConfigManager().get_runtime_config("upload_store"))
+        return _store